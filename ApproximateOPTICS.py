@@ -0,0 +1,446 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Approximate OPTICS of very large low-dimensional data sets on data bubbles.
+
+The points are binned into a grid of cells which are a fraction of eps wide, and every non-empty cell is
+summarized by a data bubble: the mean of its points (the representative), their number, and their extent (the
+root mean square distance between two points of the bubble). OPTICS then orders the bubbles instead of the
+points, with the distances between bubbles and their core distances estimated from the bubble summaries, and
+the ordering of bubbles is expanded back to an ordering of all points.
+
+Source paper: Breunig, M.M., Kriegel, H.P., Kroger, P. and Sander, J., 2001. Data bubbles: Quality preserving
+    performance boosting for hierarchical clustering. In ACM SIGMOD Record (Vol. 30, No. 2, pp. 79-90).
+
+The points of a bubble are assumed to be spread uniformly, so the distance from a point to its k-th nearest
+neighbor in a bubble of n points is estimated as (k/n)^(1/dims)*extent. The core distance of a bubble is the 
+weighted k-nearest neighbor distance over the bubbles around it (see bubbleCoreDistances), and the points 
+inside a bubble are reached from each other with its core distance, or like the bubble itself if that is 
+closer (see expandOrdering). With a finer grid (a larger resolution) the bubbles are smaller and the distances
+between them closer to the distances between points, and with bubbles of one point the result is the same as
+from the exact OPTICS. Every bubble costs more to order than a point of the exact OPTICS, as the neighborhoods
+of bubbles are kept in memory, so the speedup comes from having many fewer bubbles than points.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import time
+
+import numpy as np
+
+# Compiled extension, the spatial indices are not available in the NumPy implementation
+from OPTICSExtension import loadExtension
+loadExtension('cyOPTICS', required=True)
+from cyOPTICS import computeNeighborGraph, filterNeighborGraph, coreDistancesFromGraph, runCyOPTICSSparse, \
+    dataBounds, resolveFloatType, loadInput, checkReturnFormat, INT_TYPE
+
+from OPTICSResult import OPTICSResult
+
+
+# Value of undefined distances
+UNDEFINED = -1
+
+# Default number of grid cells per eps along every axis
+DEFAULT_RESOLUTION = 2
+
+# Number of input rows binned at once, so no temporary copies of the whole input are made
+BINNING_CHUNK_SIZE = 1048576
+
+# Largest number of grid cells which can be addressed by an int64 key
+MAX_GRID_CELLS = 2**62
+
+
+
+def binPoints(input_list, cell_size):
+    """ Bins the points into grid cells and summarizes every non-empty cell by a data bubble.
+
+    Arguments:
+        input_list: [ndarray] 2D numpy array containing the input data (1 datum per row)
+        cell_size: [float] width of a grid cell
+
+    Return:
+        (bubbles, counts, representatives, extents):
+            - bubbles: [ndarray] int64 index of the bubble of every point
+            - counts: [ndarray] int64 number of points in every bubble
+            - representatives: [ndarray] float64 2D array with the mean of the points of every bubble
+            - extents: [ndarray] float64 root mean square distance between two points of every bubble, 0 for 
+                bubbles of one point
+    """
+
+    input_list_size, dims = input_list.shape
+
+    points_min, points_max = dataBounds(input_list)
+    cells_n = np.floor((points_max - points_min)/cell_size).astype(np.int64) + 1
+
+    if np.prod(cells_n.astype(np.float64)) >= MAX_GRID_CELLS:
+        raise ValueError('The grid has too many cells, use a smaller resolution!')
+
+    strides = np.ones(dims, dtype=np.int64)
+    for axis in range(dims - 2, -1, -1):
+        strides[axis] = strides[axis + 1]*cells_n[axis + 1]
+
+    # Compute the key of the cell of every point
+    keys = np.zeros(input_list_size, dtype=np.int64)
+    for start in range(0, input_list_size, BINNING_CHUNK_SIZE):
+
+        chunk = np.asarray(input_list[start:start + BINNING_CHUNK_SIZE], dtype=np.float64)
+        cells = np.floor((chunk - points_min)/cell_size).astype(np.int64)
+
+        # Points on the upper bound stay in the last cell
+        np.minimum(cells, cells_n - 1, out=cells)
+
+        keys[start:start + BINNING_CHUNK_SIZE] = np.dot(cells, strides)
+
+    # Every non-empty cell is a bubble
+    _, first, bubbles, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    del keys
+
+    # Number the bubbles in the order of their first points, so bubbles of single points keep the order of 
+    # the input (see collapseDuplicates)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    bubbles = rank[bubbles.reshape(-1)]
+    counts = counts[order]
+    first = first[order]
+    bubbles_size = len(counts)
+
+    # Sum the coordinates and the squared distances from the origin of the points in every bubble, the 
+    # coordinates are taken relative to the lower bound of the data to reduce the rounding errors
+    sums = np.zeros((bubbles_size, dims))
+    square_sums = np.zeros(bubbles_size)
+
+    for start in range(0, input_list_size, BINNING_CHUNK_SIZE):
+
+        chunk = np.asarray(input_list[start:start + BINNING_CHUNK_SIZE], dtype=np.float64) - points_min
+        chunk_bubbles = bubbles[start:start + BINNING_CHUNK_SIZE]
+
+        for axis in range(dims):
+            sums[:, axis] += np.bincount(chunk_bubbles, weights=chunk[:, axis], minlength=bubbles_size)
+
+        square_sums += np.bincount(chunk_bubbles, weights=np.einsum('ij,ij->i', chunk, chunk), 
+            minlength=bubbles_size)
+
+    means = sums/counts[:, np.newaxis]
+
+    # The mean squared distance between two points is 2*n/(n - 1) times the mean squared distance from the 
+    # mean of the bubble
+    variances = np.maximum(square_sums/counts - np.einsum('ij,ij->i', means, means), 0)
+    extents = np.sqrt(2*variances*counts/np.maximum(counts - 1, 1))
+    extents[counts == 1] = 0
+
+    # Bubbles of one point are represented by the point itself, without the rounding of the mean
+    representatives = means + points_min
+    single = np.flatnonzero(counts == 1)
+    representatives[single] = input_list[first[single]]
+
+    return bubbles, counts, representatives, extents
+
+
+
+def nnDistance(k, counts, extents, dims):
+    """ Estimates the distance from a point of a bubble to its k-th nearest neighbor in the bubble, assuming
+        its points are spread uniformly.
+
+    Arguments:
+        k: [ndarray] number of neighbors
+        counts: [ndarray] numbers of points in the bubbles
+        extents: [ndarray] extents of the bubbles
+        dims: [int] number of dimensions
+
+    Return:
+        [ndarray] estimated distances
+    """
+
+    return (np.asarray(k, dtype=np.float64)/counts)**(1.0/dims)*extents
+
+
+
+def bubbleDistances(indptr, indices, distances, counts, extents, dims):
+    """ Computes the distances between neighboring bubbles from the distances between their representatives.
+        The distance between two bubbles which do not overlap is the gap between them plus the nearest 
+        neighbor distances in both of them, and the distance between overlapping bubbles is the larger of 
+        their nearest neighbor distances.
+
+    Arguments:
+        indptr: [ndarray] row offsets of the CSR graph of bubbles
+        indices: [ndarray] neighbor indices
+        distances: [ndarray] distances between the representatives of neighbors
+        counts: [ndarray] numbers of points in the bubbles
+        extents: [ndarray] extents of the bubbles
+        dims: [int] number of dimensions
+
+    Return:
+        [ndarray] float64 distances between the bubbles, in the order of the graph edges
+    """
+
+    rows = np.repeat(np.arange(len(counts), dtype=INT_TYPE), np.diff(indptr))
+
+    nn_distances = nnDistance(1, counts, extents, dims)
+
+    gaps = distances - (extents[rows] + extents[indices])
+    overlapping = gaps < 0
+
+    bubble_distances = gaps + nn_distances[rows] + nn_distances[indices]
+    bubble_distances[overlapping] = np.maximum(nn_distances[rows], nn_distances[indices])[overlapping]
+
+    return bubble_distances
+
+
+
+def bubbleCoreDistances(indptr, indices, distances, counts, extents, dims, min_pts, n_jobs=1):
+    """ Estimates the core distances of bubbles from the distances between bubbles. As in the weighted core 
+        distance of collapsed duplicates (see cyOPTICS.weightedCoreDistance), the points of the bubble and of
+        its neighbors are counted in the order of the distances until they add up to min_pts. If the bubble 
+        has min_pts points itself, its core distance is the distance to the (min_pts - 1)-th nearest neighbor
+        in the bubble. Otherwise, the core distance is the distance to the neighbor C at which the count is
+        reached, plus the distance from the nearest point of C to the (k - 1)-th nearest point of C, where k
+        is the number of points still needed from C (see nnDistance). Bubbles of one point have exact core
+        distances.
+
+    Arguments:
+        indptr: [ndarray] row offsets of the CSR graph of bubbles within eps
+        indices: [ndarray] neighbor indices
+        distances: [ndarray] distances between the bubbles, see bubbleDistances
+        counts: [ndarray] numbers of points in the bubbles
+        extents: [ndarray] extents of the bubbles
+        dims: [int] number of dimensions
+        min_pts: [int] minimum points in the cluster
+
+    Keyword arguments:
+        n_jobs: [int] number of threads used for finding the weighted core distances, -1 uses all cores 
+            (default 1)
+
+    Return:
+        core_distances: [ndarray] float64 core distances, -1 for bubbles with fewer than min_pts points 
+            within eps
+    """
+
+    # Distances at which the points add up to min_pts, the bubbles with enough points of their own have 0
+    weighted_distances = coreDistancesFromGraph(indptr, distances, min_pts, n_jobs=n_jobs, indices=indices, 
+        weights=counts)
+
+    core_distances = np.zeros(len(counts)) + UNDEFINED
+
+    # Bubbles with enough points of their own
+    large = counts >= min_pts
+    core_distances[large] = nnDistance(min_pts - 1, counts[large], extents[large], dims)
+
+    # The points of the other core bubbles add up to min_pts at a neighbor at the weighted core distance, so 
+    # only the neighbors up to it are needed
+    limits = np.where(large | (weighted_distances == UNDEFINED), -np.inf, weighted_distances)
+    rows = np.repeat(np.arange(len(counts), dtype=INT_TYPE), np.diff(indptr))
+    entries = np.flatnonzero(distances <= limits[rows])
+    rows = rows[entries]
+
+    # Number of points in every bubble and its neighbors closer than the weighted core distance
+    closer = distances[entries] < limits[rows]
+    counted = counts + np.bincount(rows[closer], weights=counts[indices[entries[closer]]], 
+        minlength=len(counts)).astype(np.int64)
+
+    # Count the neighbors at the weighted core distance in the order of their indices, until the points add 
+    # up to min_pts
+    entries = entries[~closer]
+    rows = rows[~closer]
+    order = np.lexsort((indices[entries], rows))
+    entries = entries[order]
+    rows = rows[order]
+
+    neighbor_counts = counts[indices[entries]]
+    cumulative = np.cumsum(neighbor_counts)
+    row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(entries) else entries
+    cumulative -= np.repeat(cumulative[row_starts] - neighbor_counts[row_starts], 
+        np.diff(np.r_[row_starts, len(entries)]))
+    cumulative += counted[rows]
+
+    reached = np.flatnonzero(cumulative >= min_pts)
+    reached = reached[np.r_[True, rows[reached][1:] != rows[reached][:-1]]] if len(reached) else reached
+
+    # The core distance is the distance to the nearest point of that neighbor, plus the distance from it to
+    # the rest of the points which are still needed
+    needed = min_pts - (cumulative[reached] - neighbor_counts[reached])
+    reached_bubbles = indices[entries[reached]]
+
+    core_distances[rows[reached]] = distances[entries[reached]] + nnDistance(needed - 1, 
+        counts[reached_bubbles], extents[reached_bubbles], dims)
+
+    return core_distances
+
+
+
+def expandOrdering(bubble_result, bubbles, counts, core_distances, dtype):
+    """ Expands the ordering of bubbles into the ordering of their points. The points of every bubble follow 
+        each other in the order of the input. The first point of a bubble gets the reachability distance and
+        the predecessor of the bubble. The other points get their reachability distances within the bubble:
+        the core distance of the bubble from its first point, or the reachability distance of the bubble from
+        its predecessor if that is smaller or the bubble is not a core bubble. Points of bubbles which are 
+        neither reached nor core bubbles are not reached. Bubbles of one point give the same ordering as the 
+        points.
+
+    Arguments:
+        bubble_result: [OPTICSResult] ordering of the bubbles
+        bubbles: [ndarray] index of the bubble of every point
+        counts: [ndarray] numbers of points in the bubbles
+        core_distances: [ndarray] core distances of the bubbles
+        dtype: [dtype] type of the returned distances
+
+    Return:
+        [OPTICSResult] ordering of the points, the core distance of every point is the one of its bubble
+    """
+
+    bubble_order = bubble_result.ordering
+
+    # Position of every bubble in the ordering
+    ranks = np.empty(len(bubble_order), dtype=np.int64)
+    ranks[bubble_order] = np.arange(len(bubble_order))
+
+    ordering = np.argsort(ranks[bubbles], kind='stable').astype(INT_TYPE)
+
+    # Position of the first point of every bubble in the ordering of points
+    first_positions = np.zeros(len(bubble_order), dtype=np.int64)
+    first_positions[1:] = np.cumsum(counts[bubble_order])[:-1]
+
+    first_points = np.empty(len(bubble_order), dtype=INT_TYPE)
+    first_points[bubble_order] = ordering[first_positions]
+
+    ordered_bubbles = bubbles[ordering]
+
+    # Reachability distances and predecessors of the bubbles, the predecessors as first points of bubbles
+    bubble_reachability = np.zeros(len(bubble_order)) + UNDEFINED
+    bubble_reachability[bubble_order] = bubble_result.reachability
+
+    bubble_predecessors = np.zeros(len(bubble_order), dtype=np.int64) + UNDEFINED
+    bubble_predecessors[bubble_order] = bubble_result.predecessor
+    reached = bubble_predecessors != UNDEFINED
+    bubble_predecessors[reached] = first_points[bubble_predecessors[reached]]
+
+    # Points inside a bubble can be reached from the predecessor of the bubble, or from the first point of the
+    # bubble with its core distance if it is a core bubble, whichever is closer
+    from_first = (core_distances != UNDEFINED) & (~reached | (core_distances < bubble_reachability))
+    inner_reachability = np.where(from_first, core_distances, bubble_reachability)
+    inner_predecessors = np.where(from_first, first_points, bubble_predecessors)
+
+    reachability = inner_reachability[ordered_bubbles].astype(dtype)
+    predecessor = inner_predecessors[ordered_bubbles].astype(INT_TYPE)
+
+    # The first points are reached like their bubbles
+    reachability[first_positions] = bubble_result.reachability
+    predecessor[first_positions] = bubble_predecessors[bubble_order]
+
+    core_distance = core_distances[ordered_bubbles].astype(dtype)
+
+    return OPTICSResult(ordering, reachability, core_distance, predecessor)
+
+
+
+def runApproximateOPTICS(input_list, eps, min_pts, resolution=DEFAULT_RESOLUTION, n_jobs=1, 
+    return_format='point_list', dtype=None, stats=None):
+    """ Runs approximate OPTICS on data bubbles of the points in grid cells. The result has the same format 
+        as the result of runOPTICS, so it can be given to gradientClustering unchanged.
+
+    Arguments:
+        input_list: [ndarray] 2D numpy array containing the input data, or a path to a .npy file with it
+        eps: [float] epsilon parameter - maximum distance between points
+        min_pts: [int] minimum points in the cluster
+
+    Keyword arguments:
+        resolution: [float] number of grid cells per eps along every axis, which trades the accuracy for 
+            speed. Larger values give smaller bubbles and a more accurate result. With one point per cell the
+            result is the same as from runOPTICS, but slower, as the neighborhoods of all bubbles are kept in 
+            memory, so resolutions at which most cells have one point or none are not useful (default 
+            DEFAULT_RESOLUTION).
+        n_jobs: [int] number of threads used for finding the neighborhoods of bubbles, -1 uses all cores 
+            (default 1)
+        return_format: [str] 'point_list' (default) or 'columnar', see runOPTICS
+        dtype: [dtype] np.float32 or np.float64, type of the returned values, see runOPTICS. The bubbles are 
+            always computed in float64.
+        stats: [OPTICSStats] if given, the times of the stages (bubbles, index, neighbor_graph, 
+            core_distances, ordering of the bubbles and expansion) are recorded in it (None by default)
+
+    Return:
+        The same as runOPTICS with the euclidean metric.
+    """
+
+    checkReturnFormat(return_format)
+
+    if min_pts < 2:
+        raise ValueError('min_pts must be at least 2!')
+
+    if resolution <= 0:
+        raise ValueError('The resolution must be positive!')
+
+    input_list = np.asarray(loadInput(input_list))
+
+    if input_list.ndim != 2:
+        raise ValueError('The input data must be a 2D array!')
+
+    dtype = resolveFloatType(dtype, input_list.dtype)
+    dims = input_list.shape[1]
+
+    if not len(input_list):
+        result = OPTICSResult(np.zeros(0, dtype=INT_TYPE), np.zeros(0, dtype=dtype), np.zeros(0, dtype=dtype),
+            np.zeros(0, dtype=INT_TYPE))
+
+    else:
+
+        # Summarize the points by bubbles
+        t1 = time.perf_counter()
+        bubbles, counts, representatives, extents = binPoints(input_list, eps/resolution)
+
+        if stats is not None:
+            stats.record('bubbles', time=time.perf_counter() - t1, points=len(input_list), 
+                bubbles=len(counts))
+
+        # Bubbles can be within eps of each other when their representatives are further apart, by at most
+        # the sum of their extents
+        indptr, indices, distances = computeNeighborGraph(representatives, eps + 2*np.max(extents), 
+            n_jobs=n_jobs, dtype=np.float64, stats=stats)
+
+        t1 = time.perf_counter()
+
+        distances = bubbleDistances(indptr, indices, distances, counts, extents, dims)
+        indptr, indices, distances = filterNeighborGraph(indptr, indices, distances, eps)
+        core_distances = bubbleCoreDistances(indptr, indices, distances, counts, extents, dims, min_pts, 
+            n_jobs=n_jobs)
+
+        if stats is not None:
+            stats.record('core_distances', time=time.perf_counter() - t1)
+
+        # Order the bubbles
+        bubble_result = runCyOPTICSSparse(indptr, indices, distances, eps, min_pts, 
+            core_distances=core_distances, return_format='columnar', dtype=np.float64, stats=stats)
+
+        # Expand the ordering of bubbles to the points
+        t1 = time.perf_counter()
+        result = expandOrdering(bubble_result, bubbles, counts, core_distances, dtype)
+
+        if stats is not None:
+            stats.record('expansion', time=time.perf_counter() - t1)
+
+    result.header = {'eps': eps, 'min_pts': min_pts, 'metric': 'euclidean', 'resolution': resolution}
+
+    if return_format == 'columnar':
+        return result
+
+    return result.toPointList(np.asarray(input_list, dtype=dtype))
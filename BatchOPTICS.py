@@ -0,0 +1,283 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" OPTICS and the gradient clustering of many small independent data sets in a pool of threads.
+
+The data sets are packed into one array of points with offsets, i.e. the data set k are the rows
+offsets[k]:offsets[k + 1]. They are split into tasks of consecutive data sets with about the same number of
+points. Every thread orders the data sets of its task straight into the packed result arrays (see
+cyOPTICS.orderBatch), then extracts, filters and merges their clusters and labels their points (see
+cyGradientClustering.gradientBatch). Both kernels run without the GIL and allocate their work buffers once per
+task, so the threads work on their data sets at the same time, and the per-call overhead of runOPTICS is
+avoided.
+
+The results are packed in the same way: the ordering, reachability, core distances, predecessors and labels
+use the offsets of the input, and the clusters of all data sets are concatenated into one array of intervals
+with their own offsets. Indices in the results (ordering, predecessors, cluster intervals) are local to their
+data set, so every data set gets the same result as if it was clustered alone.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Compiled extensions, the batch kernels are not available in the NumPy implementation
+from OPTICSExtension import loadExtension
+loadExtension('cyOPTICS', required=True)
+loadExtension('cyGradientClustering', required=True)
+from cyOPTICS import orderBatch, numThreads, resolveFloatType, INT_TYPE
+from cyGradientClustering import gradientBatch
+
+from OPTICSResult import OPTICSResult
+from GradientClustering import checkNesting, CLUSTER_INTERVAL_TYPE
+
+
+# Number of tasks per thread, smaller tasks balance the work of threads better if the data sets differ in size
+TASKS_PER_THREAD = 4
+
+
+
+def packDataSets(input_list, offsets=None, dtype=None):
+    """ Packs the data sets into one C-ordered array of points with offsets.
+
+    Arguments:
+        input_list: [list or ndarray] list of 2D arrays, one per data set, or a 2D array with the points of all
+            data sets
+
+    Keyword arguments:
+        offsets: [ndarray] offsets of the data sets, of size B + 1, needed if the data sets are given as one
+            array (default None)
+        dtype: [dtype] np.float32 or np.float64, precision of the computation, see runOPTICS
+
+    Return:
+        (points, offsets): C-ordered 2D array of the points in the computation dtype, and int64 offsets
+    """
+
+    # Concatenate the list of data sets
+    if offsets is None:
+
+        if isinstance(input_list, np.ndarray):
+            raise ValueError('The offsets of the data sets are needed if the points are given as one array!')
+
+        data_sets = [np.asarray(data_set) for data_set in input_list]
+
+        if any(data_set.ndim != 2 for data_set in data_sets):
+            raise ValueError('Every data set must be a 2D array!')
+
+        if len(set(data_set.shape[1] for data_set in data_sets)) > 1:
+            raise ValueError('All data sets must have the same number of columns!')
+
+        dtype = resolveFloatType(dtype, np.result_type(*data_sets) if data_sets else np.float64)
+
+        offsets = np.zeros(len(data_sets) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(data_set) for data_set in data_sets])
+
+        points = np.concatenate(data_sets).astype(dtype, copy=False) if data_sets else np.zeros((0, 1),
+            dtype=dtype)
+
+        return np.ascontiguousarray(points), offsets
+
+
+    points = np.asarray(input_list)
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+
+    if points.ndim != 2:
+        raise ValueError('The input data must be a 2D array!')
+
+    if (offsets.ndim != 1) or (offsets.shape[0] < 1) or (offsets[0] != 0) or (offsets[-1] != len(points)) \
+        or np.any(np.diff(offsets) < 0):
+        raise ValueError('The offsets must increase from 0 to the number of points!')
+
+    return np.ascontiguousarray(points, dtype=resolveFloatType(dtype, points.dtype)), offsets
+
+
+
+def batchTasks(offsets, n_tasks):
+    """ Splits the data sets into ranges of consecutive data sets with about the same number of points.
+
+    Arguments:
+        offsets: [ndarray] offsets of the data sets
+        n_tasks: [int] number of ranges
+
+    Return:
+        [list] (start, end) ranges of data sets, without empty ranges
+    """
+
+    # Every range ends at the first data set which reaches its share of the points
+    shares = np.linspace(0, offsets[-1], n_tasks + 1)[1:-1]
+    bounds = np.unique(np.minimum(np.concatenate([[0], np.searchsorted(offsets[1:], shares, side='left') + 1,
+        [len(offsets) - 1]]), len(offsets) - 1))
+
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+
+class BatchResult(object):
+    """ Packed results of runBatchOPTICS. All arrays of points use the offsets of the input data sets, and
+        all indices are local to their data set:
+            - offsets: [ndarray] int64 offsets of the data sets, of size B + 1
+            - ordering: [ndarray] int32 indices of the points of every data set in the OPTICS order
+            - reachability: [ndarray] reachability distances in the OPTICS order, -1 if undefined
+            - core_distance: [ndarray] core distances in the OPTICS order, -1 if undefined
+            - predecessor: [ndarray] int32 predecessors in the OPTICS order, -1 if undefined
+            - labels: [ndarray] int32 cluster labels of the points in the input order, -1 for noise
+            - clusters: [ndarray] cluster intervals of all data sets, positions in the OPTICS order of their
+                data set (see GradientClustering.clusterIntervals)
+            - cluster_offsets: [ndarray] int64 offsets of the clusters of every data set, of size B + 1
+    """
+
+    def __init__(self, offsets, ordering, reachability, core_distance, predecessor, labels, clusters,
+        cluster_offsets):
+        """ Initilization function, see the class description for the arguments. """
+
+        self.offsets = offsets
+        self.ordering = ordering
+        self.reachability = reachability
+        self.core_distance = core_distance
+        self.predecessor = predecessor
+        self.labels = labels
+        self.clusters = clusters
+        self.cluster_offsets = cluster_offsets
+
+
+    def __len__(self):
+
+        return len(self.offsets) - 1
+
+
+    def getResult(self, k):
+        """ Returns the OPTICS result of the data set k, as views of the packed arrays. """
+
+        lo, hi = self.offsets[k], self.offsets[k + 1]
+
+        return OPTICSResult(self.ordering[lo:hi], self.reachability[lo:hi], self.core_distance[lo:hi],
+            self.predecessor[lo:hi])
+
+
+    def getClusters(self, k):
+        """ Returns the cluster intervals of the data set k. """
+
+        return self.clusters[self.cluster_offsets[k]:self.cluster_offsets[k + 1]]
+
+
+    def getLabels(self, k):
+        """ Returns the cluster labels of the points of the data set k, in the input order. """
+
+        return self.labels[self.offsets[k]:self.offsets[k + 1]]
+
+
+
+def clusterBatch(points, offsets, start, end, eps, min_pts, t, w, max_points_ratio,
+    cluster_similarity_threshold, nesting, index, metric, result):
+    """ Orders and clusters the data sets from start to end (not included), writing into the packed arrays of
+        the result. See runBatchOPTICS for the description of arguments.
+
+    Return:
+        (starts, ends, counts): int64 arrays with the starts and ends of the clusters of the data sets, and the
+            number of clusters of every data set
+    """
+
+    # Order all data sets of the range without the GIL
+    orderBatch(points, offsets, start, end, eps, min_pts, index, metric, result.ordering, result.reachability,
+        result.core_distance, result.predecessor)
+
+    # Extract the clusters and label the points of all data sets without the GIL
+    return gradientBatch(result.reachability, result.ordering, offsets, start, end, min_pts, t, w,
+        max_points_ratio, cluster_similarity_threshold, nesting == 'largest', result.labels)
+
+
+
+def runBatchOPTICS(input_list, eps, min_pts, offsets=None, t=150, w=0.025, max_points_ratio=0.5,
+    cluster_similarity_threshold=0.7, nesting='smallest', index='auto', metric='euclidean', n_jobs=1,
+    dtype=None):
+    """ Runs OPTICS and the gradient clustering on many independent data sets in a pool of threads. Every
+        data set gets the same ordering, clusters and labels as OPTICSModel would give it alone.
+
+    Arguments:
+        input_list: [list or ndarray] list of 2D arrays, one per data set, or a 2D array with the points of all
+            data sets, split by the offsets
+        eps: [float] epsilon parameter - maximum distance between points
+        min_pts: [int] minimum points in the cluster, also used by the gradient clustering
+
+    Keyword arguments:
+        offsets: [ndarray] offsets of the data sets in the input array, of size B + 1, the data set k are the
+            rows offsets[k]:offsets[k + 1] (None if the data sets are given as a list)
+        t: [float] angle of minimum inflection index in deg, see gradientClustering (default 150)
+        w: [float] distance between data points in the reachability plot, see gradientClustering
+            (default 0.025)
+        max_points_ratio: [float] clusters larger than this fraction of the points of their data set are
+            rejected, see filterLargeClusters (default 0.5)
+        cluster_similarity_threshold: [float] minimum ratio of common points of merged clusters, see
+            mergeSimilarClusters (default 0.7)
+        nesting: [str] which of the clusters containing a point gives its label, see intervalLabels
+            (default 'smallest')
+        index: [str] spatial index used for eps-range neighbor queries, see runOPTICS
+        metric: [str] distance metric, see runOPTICS
+        n_jobs: [int] number of threads, -1 uses all cores (default 1)
+        dtype: [dtype] np.float32 or np.float64, precision of the computation, see runOPTICS
+
+    Return:
+        [BatchResult] packed orderings, clusters and labels of all data sets
+    """
+
+    if min_pts < 2:
+        raise ValueError('min_pts must be at least 2!')
+
+    checkNesting(nesting)
+
+    points, offsets = packDataSets(input_list, offsets=offsets, dtype=dtype)
+    size = len(points)
+
+    result = BatchResult(offsets, np.zeros(size, dtype=INT_TYPE), np.zeros(size, dtype=points.dtype),
+        np.zeros(size, dtype=points.dtype), np.zeros(size, dtype=INT_TYPE), np.zeros(size, dtype=np.int32),
+        None, None)
+
+    threads = numThreads(n_jobs)
+    tasks = batchTasks(offsets, threads*TASKS_PER_THREAD)
+
+    def runTask(task):
+        return clusterBatch(points, offsets, task[0], task[1], eps, min_pts, t, w, max_points_ratio,
+            cluster_similarity_threshold, nesting, index, metric, result)
+
+    # Run the tasks in the pool, a single thread runs them directly
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            task_clusters = list(pool.map(runTask, tasks))
+
+    else:
+        task_clusters = [runTask(task) for task in tasks]
+
+    # Pack the clusters of all data sets, the tasks cover the data sets in order
+    starts, ends, counts = [np.concatenate([task[column] for task in task_clusters] + [np.zeros(0, 
+        dtype=np.int64)]) for column in range(3)]
+
+    result.clusters = np.zeros(len(starts), dtype=CLUSTER_INTERVAL_TYPE)
+    result.clusters['start'] = starts
+    result.clusters['end'] = ends
+
+    result.cluster_offsets = np.zeros(len(offsets), dtype=np.int64)
+    result.cluster_offsets[1:] = np.cumsum(counts)
+
+    return result
@@ -23,8 +23,15 @@
 from __future__ import print_function, absolute_import, division
 
 import copy
+import time
 import numpy as np
-import matplotlib.pyplot as plt
+
+# Compiled extension, or the Python implementation if it is not available (see OPTICSExtension)
+from OPTICSExtension import loadExtension
+if loadExtension('cyGradientClustering') is not None:
+    from cyGradientClustering import gradientStartPoints, mergeIntervalsOnce, StartPointStack
+else:
+    from npGradientClustering import gradientStartPoints, mergeIntervalsOnce, StartPointStack
 
 ### Define constants which tell what is the UNDEFINED value in the reachability plot
 
@@ -39,6 +46,14 @@ NEW_UNDEFINED = 2**31 - 1
 
 ###
 
+# Clusters found by the gradient method are contiguous in the OPTICS ordering, so they can be stored as intervals
+# of point indices, from start to end (not included)
+CLUSTER_INTERVAL_TYPE = np.dtype([('start', np.int64), ('end', np.int64)])
+
+# Policies which choose the label of a point which is in more than one cluster (see intervalLabels)
+NESTING_POLICIES = ('smallest', 'largest')
+
+
 
 class ReachabilityVector(object):
     """Init the vector between two points in the reachability diagram. """
@@ -115,12 +130,110 @@ def gradientDeterminant(reach_list, y, w):
 
 
 
-def gradientClustering(reach_list, min_pts, t, w):
+def inflectionIndices(reach_list, w):
+    """ Calculates the inflection indices of all points in the reachability diagram, except the first and the
+        last one. The values are the same as the ones given by inflectionIndex, up to rounding.
+
+    Arguments:
+        reach_list: [ndarray] 1D numpy array containing reachability distance values of individual data points
+        w: [float] distance between data points in the reachability plot
+
+    Returns:
+        [ndarray] inflection indices of points 1 to len(reach_list) - 2
+
+    """
+
+    # Reachabilities of the previous, current and the next points
+    x_r = reach_list[:-2]
+    y_r = reach_list[1:-1]
+    z_r = reach_list[2:]
+
+    # Magnitudes of the vectors between adjecent points, which are always computed in double precision
+    prev_diff = np.asarray(y_r - x_r, dtype=np.float64)
+    next_diff = np.asarray(z_r - y_r, dtype=np.float64)
+    prev_abs = np.sqrt(w*w + prev_diff*prev_diff)
+    next_abs = np.sqrt(w*w + next_diff*next_diff)
+
+    return (-w**2 + (x_r - y_r)*(z_r - y_r))/(prev_abs*next_abs)
+
+
+
+def gradientDeterminants(reach_list, w):
+    """ Calculates the gradient determinants of all points in the reachability diagram, except the first and
+        the last one. The values are the same as the ones given by gradientDeterminant.
+
+    Arguments:
+        reach_list: [ndarray] 1D numpy array containing reachability distance values of individual data points
+        w: [float] distance between data points in the reachability plot
+
+    Returns:
+        [ndarray] gradient determinants of points 1 to len(reach_list) - 2
+
+    """
+
+    # Reachabilities of the previous, current and the next points
+    x_r = reach_list[:-2]
+    y_r = reach_list[1:-1]
+    z_r = reach_list[2:]
+
+    return w*(y_r - x_r) - w*(z_r - y_r)
+
+
+
+def clusterIntervals(clusters):
+    """ Converts a list of clusters to an array of intervals. 
+
+    Arguments:
+        clusters: [list] a list of clusters, each cluster is a range or an ascending list of consecutive point
+            indices
+
+    Return:
+        intervals: [ndarray] structured array of the CLUSTER_INTERVAL_TYPE type, with the start and the end (not
+            included) of every cluster. Empty clusters are stored as (0, 0).
+
+    """
+
+    intervals = np.zeros(len(clusters), dtype=CLUSTER_INTERVAL_TYPE)
+
+    for i, cluster in enumerate(clusters):
+
+        # Skip empty clusters
+        if len(cluster) == 0:
+            continue
+
+        # Ranges are converted without going through their points
+        if isinstance(cluster, range) and (cluster.step == 1):
+            intervals[i] = (cluster.start, cluster.stop)
+            continue
+
+        members = np.asarray(cluster)
+
+        # Only clusters of consecutive points can be stored as intervals
+        if (members.ndim != 1) or np.any(np.diff(members) != 1):
+            raise ValueError('Cluster {:d} is not a range of consecutive point indices!'.format(i))
+
+        intervals[i] = (members[0], members[len(members) - 1] + 1)
+
+    return intervals
+
+
+
+def isClusterIntervals(clusters):
+    """ Returns True if the clusters are given as an array of intervals (see clusterIntervals). """
+
+    return isinstance(clusters, np.ndarray) and (clusters.dtype.names == CLUSTER_INTERVAL_TYPE.names)
+
+
+
+def gradientClustering(reach_list, min_pts, t, w, intervals=False, stats=None):
     """ Extracts clusters from the reachability diagram by using the gradient method. 
     
     Source paper: Brecheisen, S., Kriegel, H.P., Kroger, P. and Pfeifle, M., 2004, April. 
         Visually Mining through Cluster Hierarchies. In SDM (pp. 400-411).
 
+    The inflection indices and gradient determinants are computed for all points at once, and the start 
+    point stack is run in Cython (cyGradientClustering.pyx). The input array is not modified.
+
     Arguments:
         reach_list: [ndarray] 1D numpy array containing reachability distance values of individual data points
         min_pts: [int] minimum number of points used for clustering
@@ -129,116 +242,179 @@ def gradientClustering(reach_list, min_pts, t, w):
         w: [float] distance between data points in the reachability plot, this value influences the
             sensitivity of the gradient clustering procedure, a value of 0.025 should work fine
 
+    Keyword arguments:
+        intervals: [bool] if True, the clusters are returned as an array of (start, end) intervals (see 
+            clusterIntervals), instead of a list (False by default)
+        stats: [OPTICSStats] if given, the time of the gradient_clustering stage, the times of finding the 
+            inflection points and of the start point stack, and the numbers of points, inflection points and 
+            clusters are recorded in it (None by default)
+
     Return:
         set_of_clusters: [list] a list of found clusters
-            - note: individual cluster is just a list of point indices belonging to a specific cluster
+            - note: individual cluster is just a range of point indices belonging to a specific cluster
 
     """
 
-    # Replace all UNDEFINED values in the reach_list with infinites
+    t1 = time.perf_counter()
+
+    # Replace all UNDEFINED values in a copy of the reach_list with infinites
+    reach_list = np.array(reach_list)
     reach_list[reach_list == UNDEFINED] = NEW_UNDEFINED
 
     # Covert t from degrees to cosinus value
     t = np.cos(np.radians(t))
 
-    # Input data size
-    reach_list_size = len(reach_list)
+    # Find the inflection points (the first and the last point are never checked)
+    inflection_points = np.flatnonzero(inflectionIndices(reach_list, w) > t) + 1
 
-    # Init the last endpoint
-    last_endpoint = reach_list_size - 1
+    # Check if the next vectors deviate to the right in the inflection points
+    right_turns = gradientDeterminants(reach_list, w)[inflection_points - 1] > 0
 
-    # Init the empty working lists
-    start_pts = []
-    set_of_clusters = []
-    curr_cluster = []
+    # The start point stack compares the reachabilities in their own precision, other types are compared as 
+    # doubles
+    if reach_list.dtype not in (np.float32, np.float64):
+        reach_list = reach_list.astype(np.float64)
 
-    # Add the first point to the start_pts
-    start_pts.append(0)
+    t2 = time.perf_counter()
 
-    # Go through all the remaining points
-    for i in range(1, reach_list_size - 1):
+    set_of_clusters = gradientStartPoints(reach_list, inflection_points.astype(np.intp), 
+        right_turns.view(np.uint8), min_pts)
 
-        # Check if the point is an inflection point
-        if inflectionIndex(reach_list, i, w) > t:
+    if intervals:
+        set_of_clusters = clusterIntervals(set_of_clusters)
 
-            # Check if the next vector deviates to the right
-            if gradientDeterminant(reach_list, i, w) > 0:
+    if stats is not None:
+        t3 = time.perf_counter()
+        stats.record('gradient_clustering', time=t3 - t1, inflection_time=t2 - t1, stack_time=t3 - t2, 
+            points=len(reach_list), inflection_points=len(inflection_points), clusters=len(set_of_clusters))
 
-                # Check if the current cluster size is larger than the minimum number of points required
-                if len(curr_cluster) >= min_pts:
+    return set_of_clusters
 
-                    # Add the cluster to a list of clusters
-                    set_of_clusters.append(curr_cluster)
 
-                # Reset the current cluster
-                curr_cluster = []
 
-                # Check if the list of start points is not empty
-                if start_pts:
+class GradientStream(object):
+    """ Gradient clustering of a reachability diagram which is given in consecutive parts, e.g. as the OPTICS 
+        ordering produces them (see cyOPTICS.iterCyOPTICS). Clusters are returned as soon as they are found,
+        and all together they are the same as the ones from gradientClustering, in the same order. Only the 
+        last two reachability distances and the start point stack are kept between the parts.
+    """
 
-                    # Check if the last point in the start_pts has a smaller reachability distance than the 
-                    # current point, if so, remove the last point
-                    if reach_list[start_pts[-1]] <= reach_list[i]:
-                        start_pts.pop()
+    def __init__(self, reach_list_size, min_pts, t, w):
+        """ Initilization function for the stream.
 
-                # Check if the list of start points is not empty
-                if start_pts:
+        Arguments:
+            reach_list_size: [int] number of points in the whole reachability diagram
+            min_pts: [int] minimum number of points used for clustering
+            t: [float] angle of minimum inflection index in the inflection point, see gradientClustering
+            w: [float] distance between data points in the reachability plot, see gradientClustering
 
-                    # While the last point in the start_pts has a smaller reachability distance than the current
-                    # point, keep removing points from the end and add them to a list of clusters
-                    while reach_list[start_pts[-1]] < reach_list[i]:
-                        
-                        temp_cluster = range(start_pts[-1], last_endpoint)
+        """
 
-                        # Check if the temporary cluster size is larger than the minimum number of points required
-                        if len(temp_cluster) >= min_pts:
-                            set_of_clusters.append(temp_cluster)
+        self.reach_list_size = reach_list_size
+        self.w = w
 
-                        # Remove the last start point from the list of start points
-                        start_pts.pop()
+        # Covert t from degrees to cosinus value
+        self.t = np.cos(np.radians(t))
 
-                    # Lastly, add another cluster at the end, if it is not empty
-                    temp_cluster = range(start_pts[-1], last_endpoint)
-                    
-                    if len(temp_cluster) >= min_pts:
-                        
-                        # Add a new cluster
-                        set_of_clusters.append(range(start_pts[-1], last_endpoint))
+        self.stack = StartPointStack(min_pts, reach_list_size)
 
-                # If the current point is a starting point, add it to the list
-                if reach_list[i+1] < reach_list[i]:
-                    start_pts.append(i)
+        # The last distances of the previous parts, and the index of the first one in the diagram
+        self.carry = None
+        self.offset = 0
 
+        # Number of points given so far
+        self.count = 0
 
 
-            # The next vector deviates to the left, marking an endpoint
-            else:
+    def update(self, reach_chunk):
+        """ Adds the next part of the reachability diagram.
 
-                # If the current point is the endpoint and goes up, then take all points from the last start 
-                # point to this one as a current cluster
-                if reach_list[i+1] > reach_list[i]:
+        Arguments:
+            reach_chunk: [ndarray] 1D numpy array of consecutive reachability distances
 
-                    # Keep track of the lastest endpoint (add 1 for the python peculiarities, as otherwise the 
-                    # last point would not be included in the list)
-                    last_endpoint = i + 1
+        Return:
+            [ndarray] intervals of clusters which were found (see clusterIntervals), possibly empty
+        """
 
+        # Replace all UNDEFINED values in a copy of the part with infinites
+        reach_chunk = np.array(reach_chunk)
+        reach_chunk[reach_chunk == UNDEFINED] = NEW_UNDEFINED
 
-                    curr_cluster = range(start_pts[-1], last_endpoint)
+        self.count += len(reach_chunk)
 
+        if self.count > self.reach_list_size:
+            raise ValueError('The reachability diagram has more than {:d} points!'.format(self.reach_list_size))
 
-    # Add clusters at the end of plot, while start points has any members
-    while start_pts:
-        
-        # Take points from the last point in the start pooints to the last point
-        curr_cluster = range(start_pts[-1], reach_list_size)
+        # The inflection index of a point depends on its neighbors, so the points at the end of the previous 
+        # part are checked now
+        if self.carry is not None:
+            reach_chunk = np.concatenate([self.carry, reach_chunk])
 
+        if not len(reach_chunk):
+            return clusterIntervals([])
 
-        if (reach_list[start_pts[-1]] > reach_list[-1]) and (len(curr_cluster) >= min_pts):
-            set_of_clusters.append(curr_cluster)
+        # Find the inflection points and the directions of gradients in them, as in gradientClustering
+        inflection_points = np.flatnonzero(inflectionIndices(reach_chunk, self.w) > self.t) + 1
+        right_turns = gradientDeterminants(reach_chunk, self.w)[inflection_points - 1] > 0
 
-        start_pts.pop()
+        # Keep the last two points for the next part
+        self.carry = reach_chunk[-2:]
 
-    return set_of_clusters
+        if reach_chunk.dtype not in (np.float32, np.float64):
+            reach_chunk = reach_chunk.astype(np.float64)
+
+        clusters = self.stack.update(reach_chunk, self.offset, (inflection_points + self.offset).astype(np.intp),
+            right_turns.view(np.uint8))
+
+        self.offset += len(reach_chunk) - len(self.carry)
+
+        return clusterIntervals(clusters)
+
+
+    def finish(self):
+        """ Returns the clusters at the end of the reachability diagram, after all of its parts were given.
+
+        Return:
+            [ndarray] intervals of the remaining clusters (see clusterIntervals)
+        """
+
+        if self.count != self.reach_list_size:
+            raise ValueError('Only {:d} of {:d} points of the reachability diagram were given!'.format(
+                self.count, self.reach_list_size))
+
+        last_reach = self.carry[-1] if self.carry is not None else UNDEFINED
+
+        return clusterIntervals(self.stack.finish(last_reach))
+
+
+
+def iterGradientClustering(reach_chunks, reach_list_size, min_pts, t, w):
+    """ Extracts clusters from a stream of consecutive parts of the reachability diagram, see GradientStream.
+
+    Arguments:
+        reach_chunks: [iterable] 1D numpy arrays of consecutive reachability distances
+        reach_list_size: [int] number of points in the whole reachability diagram
+        min_pts: [int] minimum number of points used for clustering
+        t: [float] angle of minimum inflection index in the inflection point, see gradientClustering
+        w: [float] distance between data points in the reachability plot, see gradientClustering
+
+    Return:
+        [generator] arrays of cluster intervals (see clusterIntervals), as they are found
+    """
+
+    stream = GradientStream(reach_list_size, min_pts, t, w)
+
+    for reach_chunk in reach_chunks:
+
+        intervals = stream.update(reach_chunk)
+
+        if len(intervals):
+            yield intervals
+
+    intervals = stream.finish()
+
+    if len(intervals):
+        yield intervals
 
 
 
@@ -247,16 +423,26 @@ def filterLargeClusters(clusters, input_size, cluster_fraction_thresh):
 
     Arguments:
         clusters: [list] a python list containing found clusters in the reachability diagram plot (optional)
-            - note: individual cluster is just a list of point indices belonging to a specific cluster
+            - note: individual cluster is just a list of point indices belonging to a specific cluster, the
+                clusters can also be given as an array of intervals (see clusterIntervals)
         input_size: [int] total number of all data points used for clustering
         cluster_fraction_thresheld: [float] a number that defines the maximum ratio of the largest acceptable
             cluster size and the total number of all points used for clustering
 
     Return:
-        filtered_clusters: [list] a list of clusters where the largle clusters were removed
+        filtered_clusters: [list] a list of clusters where the largle clusters were removed, or an array of 
+            intervals if the clusters were given as intervals
 
     """
 
+    # The size of every interval is known without going through its points
+    if isClusterIntervals(clusters):
+
+        sizes = clusters['end'] - clusters['start']
+
+        return clusters[(sizes < cluster_fraction_thresh*input_size) & (sizes > 0)]
+
+
     filtered_clusters = []
 
     # Go through every cluster and check if it is too big
@@ -271,39 +457,186 @@ def filterLargeClusters(clusters, input_size, cluster_fraction_thresh):
 
 
 
-def mergeSimilarClusters(clusters, similarity_threshold):
+def intervalSizeOrder(intervals):
+    """ Returns the order of intervals by descending size, the same as reversed(sorted(clusters, key=len)). """
+
+    order = np.argsort(intervals['end'] - intervals['start'], kind='stable')
+
+    return order[::-1]
+
+
+
+def mergeSimilarIntervals(intervals, similarity_threshold, sources=None, stats=None):
+    """ Merge clusters given as intervals which have a minimum ratio of shared points compared to the other 
+        clusters. The clusters are merged in the same way as in mergeSimilarClusters, but the intersection
+        of two clusters is computed from the interval bounds, and only clusters which are large enough to be
+        similar are compared (see cyGradientClustering.mergeIntervalsOnce).
+
+    Arguments:
+        intervals: [ndarray] clusters as an array of intervals (see clusterIntervals)
+        similarity_threshold: [float] a minimum ratio between the intersection of two clusters and the 
+            members of the larger cluster
+
+    Keyword arguments:
+        sources: [list] if a list is given, the index of the input cluster is appended to it for every 
+            returned cluster which was not merged, -1 for merged clusters
+        stats: [OPTICSStats] if given, the number of merging iterations is recorded in the merge_clusters 
+            stage (None by default)
+
+    Return:
+        intervals: [ndarray] an array of merged clusters, sorted by descending size
+
+    Raises ValueError if two clusters which do not overlap or touch would be merged, as their union is not an
+    interval. This can only happen with a similarity_threshold of 0 or less, with which clusters given as lists
+    are merged as in the original implementation.
+
+    """
+
+    # Sort clusters by descending size, and keep the indices of the input clusters (the clusters are sorted 
+    # again at the beginning of every iteration, which reverses the order of clusters of the same size)
+    interval_sources = intervalSizeOrder(intervals).astype(np.int64)
+    intervals = intervals[interval_sources]
+
+    # Number of clusters in the previous and the current iteration
+    previous_count = len(intervals)
+    merged_count = 0
+    iterations = 0
+
+    # Run the filtering until the number of merged clusters does not change
+    while previous_count != merged_count:
+
+        iterations += 1
+
+        # Sort clusters by descending size 
+        order = intervalSizeOrder(intervals)
+        intervals = intervals[order]
+        interval_sources = interval_sources[order]
+
+        starts, ends, interval_sources = mergeIntervalsOnce(np.ascontiguousarray(intervals['start']), 
+            np.ascontiguousarray(intervals['end']), interval_sources, similarity_threshold)
+
+        intervals = np.empty(len(starts), dtype=CLUSTER_INTERVAL_TYPE)
+        intervals['start'] = starts
+        intervals['end'] = ends
+
+        previous_count = merged_count
+        merged_count = len(intervals)
+
+
+    if stats is not None:
+        stats.record('merge_clusters', iterations=iterations)
+
+    # Sort clusters by descending size
+    order = intervalSizeOrder(intervals)
+
+    if sources is not None:
+        sources.extend(interval_sources[order].tolist())
+
+    return intervals[order]
+
+
+
+def mergeSimilarClusters(clusters, similarity_threshold, stats=None):
     """ Merge clusters which have a minimum ratio of shared points compared to the other clusters.
     
     Arguments:
         clusters: [list] a python list containing found clusters in the reachability diagram plot (optional)
-            - note: individual cluster is just a list of point indices belonging to a specific cluster
+            - note: individual cluster is just a list of point indices belonging to a specific cluster, the
+                clusters can also be given as an array of intervals (see clusterIntervals)
         similarity_threshold: [float] a minimum ratio between the intersection of two clusters and the 
             members of the larger cluster
 
+    Keyword arguments:
+        stats: [OPTICSStats] if given, the time of the merge_clusters stage, the numbers of clusters before 
+            and after merging, and the number of merging iterations are recorded in it (None by default)
+
+    Return:
+        clusters: [list] a list of merged clusters, or an array of intervals if the clusters were given as
+            intervals
+
+    With a similarity_threshold of 0 or less, all pairs of clusters are similar, also the clusters which do 
+    not share any point. Clusters given as lists are merged into lists with gaps, while for clusters given as
+    intervals a ValueError is raised if such clusters would be merged (see mergeSimilarIntervals), as their
+    union cannot be stored as an interval.
+
+    """
+
+    t1 = time.perf_counter()
+
+    if isClusterIntervals(clusters):
+        merged_clusters = mergeSimilarIntervals(clusters, similarity_threshold, stats=stats)
+
+    else:
+        merged_clusters = mergeSimilarLists(clusters, similarity_threshold, stats=stats)
+
+    if stats is not None:
+        stats.record('merge_clusters', time=time.perf_counter() - t1, input_clusters=len(clusters), 
+            clusters=len(merged_clusters))
+
+    return merged_clusters
+
+
+
+def mergeSimilarLists(clusters, similarity_threshold, stats=None):
+    """ Merge clusters given as lists of points, see mergeSimilarClusters. Clusters of consecutive points 
+        are merged as intervals (see mergeSimilarIntervals).
+
+    Arguments:
+        clusters: [list] a python list of clusters, every cluster is a list of point indices
+        similarity_threshold: [float] a minimum ratio between the intersection of two clusters and the 
+            members of the larger cluster
+
+    Keyword arguments:
+        stats: [OPTICSStats] if given, the number of merging iterations is recorded in the merge_clusters 
+            stage (None by default)
+
     Return:
         clusters: [list] a list of merged clusters
 
     """
 
-    # Sort clusters by ascending size 
+    # Clusters of consecutive points are merged as intervals (with a similarity threshold of 0 or less, clusters 
+    # which are apart could be merged, which cannot be represented by an interval)
+    if similarity_threshold > 0:
+
+        try:
+            intervals = clusterIntervals(clusters)
+
+        except ValueError:
+            intervals = None
+
+        if intervals is not None:
+
+            sources = []
+            intervals = mergeSimilarIntervals(intervals, similarity_threshold, sources=sources, stats=stats)
+
+            # Clusters which were not merged are copied from the input, merged clusters are new lists
+            return [copy.copy(clusters[source]) if source >= 0 else list(range(start, end)) 
+                for source, start, end in zip(sources, intervals['start'], intervals['end'])]
+
+
+    # Sort clusters by descending size 
     clusters = list(reversed(sorted(clusters, key=len)))
 
-    # Init the filtering lists
-    previous_iteration_clusters = clusters
-    merged_clusters = []
+    # Number of clusters in the previous and the current iteration
+    previous_count = len(clusters)
+    merged_count = 0
+    iterations = 0
 
-    # Run the filtering until the final list of merged clusters does not change
-    while len(previous_iteration_clusters) != len(merged_clusters):
+    # Run the filtering until the number of merged clusters does not change
+    while previous_count != merged_count:
 
-        # Sort clusters by ascending size 
+        iterations += 1
+
+        # Sort clusters by descending size 
         clusters = list(reversed(sorted(clusters, key=len)))
 
-        # Init the list of clusters to skip
-        skip_list = []
+        # Sets of points and sizes of clusters are computed once per iteration
+        cluster_sets = [set(cluster) for cluster in clusters]
+        sizes = [len(cluster) for cluster in clusters]
 
-        # Deep copy the results of previous interations into the variable that holds info about clusters from
-        # the previous iteration
-        previous_iteration_clusters = copy.deepcopy(merged_clusters)
+        # Init the flags of clusters to skip
+        skip = [False]*len(clusters)
 
         merged_clusters = []
 
@@ -312,42 +645,33 @@ def mergeSimilarClusters(clusters, similarity_threshold):
         for i, cluster1 in enumerate(clusters):
 
             # Skip if the cluster was already processed
-            if i in skip_list:
+            if skip[i]:
                 continue
 
+            # The cluster i is the bigger one in all following pairs, as the clusters are sorted by size
+            min_intersect = similarity_threshold*sizes[i]
+
             found_similar = False
-            for j, cluster2 in enumerate(clusters):
+            for j in range(i + 1, len(clusters)):
 
-                # Skip if the same cluster and all previous up until cluster1
-                if j <= i:
-                    continue
+                # The intersection cannot be larger than the smaller cluster, so none of the following clusters
+                # can be similar enough
+                if sizes[j] < min_intersect:
+                    break
 
                 # Skip if already processed
-                if j in skip_list:
+                if skip[j]:
                     continue
 
-                # Find the number of common points between clusters
-                intersect_points = len(set(cluster1).intersection(cluster2))
-
-                # Find the bigger cluster
-                if len(cluster1) > len(cluster2):
-                    bigger_size = len(cluster1)
-                else:
-                    bigger_size = len(cluster2)
-
-
                 # Check for the intersection ratio, i.e. the ratio of common points and the point number of
                 # the bigger cluster
-                if (intersect_points >= similarity_threshold*bigger_size):
+                if len(cluster_sets[i] & cluster_sets[j]) >= min_intersect:
 
                     # Merge two clusters into one
-                    new_merged_cluster = sorted(list(set(set(cluster1) | set(cluster2))))
-
-                    # Put the merged cluster to the list of merged clusters
-                    merged_clusters.append(new_merged_cluster)
+                    merged_clusters.append(sorted(cluster_sets[i] | cluster_sets[j]))
 
-                    # Put the index of the removed cluster to the list of those clusters to be skipped
-                    skip_list.append(j)
+                    # Mark the merged cluster to be skipped
+                    skip[j] = True
 
                     # Mark that a similar cluster has been found
                     found_similar = True
@@ -356,12 +680,17 @@ def mergeSimilarClusters(clusters, similarity_threshold):
 
             # If the current cluster was not merged to any other, out it back to the list of all clusters
             if not found_similar:
-                merged_clusters.append(cluster1)
+                merged_clusters.append(copy.copy(cluster1))
+
+        previous_count = merged_count
+        merged_count = len(merged_clusters)
 
-        # Copy the resulting list to the list of final clusters
-        clusters = copy.deepcopy(merged_clusters)
+        clusters = merged_clusters
 
 
+    if stats is not None:
+        stats.record('merge_clusters', iterations=iterations)
+
     # Sort clusters by descending size
     clusters = list(reversed(sorted(clusters, key=len)))
 
@@ -369,21 +698,114 @@ def mergeSimilarClusters(clusters, similarity_threshold):
 
 
 
+def checkNesting(nesting):
+    """ Raises a ValueError if the nesting policy is not supported (see NESTING_POLICIES). """
+
+    if nesting not in NESTING_POLICIES:
+        raise ValueError("Unknown nesting policy '{:s}', use one of: {:s}".format(str(nesting),
+            ', '.join(NESTING_POLICIES)))
+
+
+
+def intervalLabels(clusters, start, end, nesting='smallest'):
+    """ Assigns a flat cluster label to the points at the given positions of the OPTICS ordering. Clusters 
+        found by the gradient method can be nested, and merged clusters can overlap, so a point in more than
+        one cluster gets the label chosen by the nesting policy.
+
+    Arguments:
+        clusters: [list or ndarray] a list of clusters (ranges or lists of contiguous points) or an array of
+            cluster intervals
+        start: [int] position of the first point in the ordering
+        end: [int] position after the last point
+
+    Keyword arguments:
+        nesting: [str] which of the clusters containing a point gives its label:
+            - 'smallest': the smallest cluster, i.e. the innermost one in the cluster hierarchy (default)
+            - 'largest': the largest cluster, i.e. the outermost one
+            Of equally large clusters the one which is listed first is taken.
+
+    Return:
+        labels: [ndarray] int32 array with the index of the cluster of every point, or -1 for points which are
+            not in any cluster
+    """
+
+    checkNesting(nesting)
+
+    if not isClusterIntervals(clusters):
+        clusters = clusterIntervals(clusters)
+
+    labels = np.zeros(end - start, dtype=np.int32) + UNDEFINED
+
+    starts = clusters['start']
+    ends = clusters['end']
+    sizes = ends - starts
+
+    # Take the clusters which overlap the given positions
+    overlapping = np.flatnonzero((starts < end) & (ends > start) & (sizes > 0))
+
+    # Label the points so that the cluster chosen by the policy is written last, e.g. from the largest cluster
+    # to the smallest, so the smaller ones overwrite the larger ones
+    size_order = -sizes[overlapping] if nesting == 'smallest' else sizes[overlapping]
+
+    for k in overlapping[np.lexsort((-overlapping, size_order))]:
+        labels[max(starts[k], start) - start:min(ends[k], end) - start] = k
+
+    return labels
+
+
+
+def clusterLabels(clusters, ordering, nesting='smallest'):
+    """ Assigns a flat cluster label to every input point, from the clusters found in the OPTICS ordering.
+
+    Arguments:
+        clusters: [list or ndarray] a list of clusters (ranges or lists of contiguous points) or an array of
+            cluster intervals, in the OPTICS ordering, e.g. from gradientClustering or mergeSimilarClusters
+        ordering: [ndarray or OPTICSResult] indices of the input points in the OPTICS order, or the columnar 
+            result of runOPTICS
+
+    Keyword arguments:
+        nesting: [str] which of the clusters containing a point gives its label, see intervalLabels 
+            (default 'smallest')
+
+    Return:
+        labels: [ndarray] int32 array with the index of the cluster of every input point, in the order of the 
+            input data, or -1 for points which are not in any cluster
+    """
+
+    ordering = np.asarray(getattr(ordering, 'ordering', ordering))
+
+    labels = np.empty(len(ordering), dtype=np.int32)
+    labels[ordering] = intervalLabels(clusters, 0, len(ordering), nesting=nesting)
+
+    return labels
+
+
+
 def plotClusteringReachability(reach_list, clusters=[]):
     """ Plot the reachability diagram and the detected clusters (clusters are optional). 
     
     Arguments:
         reach_list: [ndarray] 1D numpy array containing reachability distance values of individual data points
         clusters: [list] a python list containing found clusters in the reachability diagram plot (optional)
-            - note: individual cluster is just a list of point indices belonging to a specific cluster
+            - note: individual cluster is just a list of point indices belonging to a specific cluster, the
+                clusters can also be given as an array of intervals (see clusterIntervals)
 
     Return:
         None
 
     """
 
-    # Replace all UNDEFINED values in the reach_list with infinites
-    reach_list[reach_list == UNDEFINED] = NEW_UNDEFINED
+    # Matplotlib is only imported when plotting, so it is not needed for clustering
+    import matplotlib.pyplot as plt
+
+    # Plot intervals as ranges of points
+    if isClusterIntervals(clusters):
+        clusters = [range(start, end) for start, end in zip(clusters['start'], clusters['end'])]
+
+    # Replace all UNDEFINED values in the reach_list with infinites (the input can be a read-only 
+    # memory-mapped array, so it is not modified)
+    reach_list = np.asarray(reach_list)
+    reach_list = np.where(reach_list == UNDEFINED, NEW_UNDEFINED, reach_list)
 
     NUM_COLORS = len(clusters) + 1
 
@@ -0,0 +1,443 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Incremental OPTICS, which keeps its state between batches of inserted and deleted points, and only
+repairs the parts of it which the changes reach.
+
+The state consists of the spatial index, the eps-neighborhoods of all points (see
+cyOPTICS.computeNeighborGraph), their core distances and the last ordering. When points are inserted or
+deleted, only the neighborhoods and core distances of the changed points and of the points within eps of them
+are computed again. Inserted points are indexed in a small separate index, and deleted points are only masked
+out, until there are enough of them that the main index is rebuilt.
+
+The ordering is repaired by keeping the runs which the changes cannot reach. A run of the ordering (the points
+between two points with an undefined reachability distance) can only take points which are within eps of its
+core points, so the runs form groups which are connected by neighbors with at least one core point, and the
+ordering of every group does not depend on the other groups. Every run starts at the lowest unprocessed index,
+so the whole ordering is the runs of all groups sorted by their first points. Only the groups which contain a
+changed point, or a neighbor of one, are ordered again, with the points of the other groups marked as
+processed. Their runs are then merged with the kept runs by the first points, and the result is identical to
+running OPTICS again on the updated data. Changes spread over all clusters still reach most of the points, so
+the saving mostly comes from not searching for the neighborhoods again, while changes in a few clusters only
+order those clusters again.
+
+All neighborhoods are kept in memory, as with runOPTICS with n_jobs > 1.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+
+# Compiled extension, the spatial indices are not available in the NumPy implementation
+from OPTICSExtension import loadExtension
+loadExtension('cyOPTICS', required=True)
+from cyOPTICS import buildIndex, queryNeighborhoods, spliceNeighborGraph, coreDistancesFromGraph, \
+    runCyOPTICSSparse, resolveFloatType, loadInput
+
+from OPTICSResult import OPTICSResult, RESULT_ARRAYS
+
+
+# The main spatial index is rebuilt when the number of points inserted or deleted since it was built exceeds
+# this fraction of the number of points
+REBUILD_RATIO = 0.25
+
+# Value of undefined distances and indices
+UNDEFINED = -1
+
+
+
+def rowEntries(indptr, rows):
+    """ Returns the positions of all entries of the given rows of a CSR graph.
+
+    Arguments:
+        indptr: [ndarray] row offsets of the graph
+        rows: [ndarray] indices of the rows
+
+    Return:
+        [ndarray] positions of the entries in the indices and distances arrays, row by row
+    """
+
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(np.sum(counts), dtype=np.int64)
+
+
+
+def concatenateRows(*graphs):
+    """ Joins the rows of several graphs in the CSR format into one graph, one after another. """
+
+    indptr = [np.zeros(1, dtype=np.int64)]
+    offset = 0
+
+    for graph in graphs:
+        indptr.append(graph[0][1:] + offset)
+        offset += graph[0][-1]
+
+    return np.concatenate(indptr), np.concatenate([graph[1] for graph in graphs]), \
+        np.concatenate([graph[2] for graph in graphs])
+
+
+
+def mergeRuns(result):
+    """ Sorts the runs of an ordering by their first points, i.e. puts them in the order in which OPTICS starts
+        them. A run goes from a point with an undefined reachability distance to the next one.
+
+    Arguments:
+        result: [OPTICSResult] ordering whose runs are in a different order
+
+    Return:
+        [OPTICSResult] ordering with the runs sorted, with the same header
+    """
+
+    reachability = np.asarray(result.reachability)
+
+    # Positions of the runs, and the runs in the order of their first points
+    starts = np.flatnonzero(reachability == UNDEFINED)
+    runs = np.argsort(np.asarray(result.ordering)[starts], kind='stable')
+
+    # Positions of all points in the sorted runs
+    order = rowEntries(np.r_[starts, len(reachability)], runs)
+
+    return OPTICSResult(*[np.asarray(getattr(result, name))[order] for name in RESULT_ARRAYS], 
+        header=result.header)
+
+
+
+class IncrementalOPTICS(object):
+    """ OPTICS ordering of a data set which changes in small batches. The points are indexed in the order in
+        which they would be in the input of a full run: deleting points shifts the indices of the following
+        points down, and inserted points are appended at the end.
+    """
+
+    def __init__(self, input_list, eps, min_pts, index='auto', metric='euclidean', n_jobs=1, dtype=None,
+        rebuild_ratio=REBUILD_RATIO):
+        """ Initilization function, which runs OPTICS on the initial data.
+
+        Arguments:
+            input_list: [ndarray] 2D numpy array containing the input data, or a path to a .npy file with it
+            eps: [float] epsilon parameter - maximum distance between points
+            min_pts: [int] minimum points in the cluster
+
+        Keyword arguments:
+            index: [str] spatial index used for eps-range neighbor queries, see runOPTICS
+            metric: [str] distance metric, see runOPTICS
+            n_jobs: [int] number of threads used for finding neighborhoods and core distances, -1 uses all
+                cores (default 1)
+            dtype: [dtype] np.float32 or np.float64, precision of the computation, see runOPTICS
+            rebuild_ratio: [float] the main spatial index is rebuilt when the number of points inserted or
+                deleted since it was built exceeds this fraction of all points (default REBUILD_RATIO)
+
+        """
+
+        input_list = np.asarray(loadInput(input_list))
+
+        if input_list.ndim != 2:
+            raise ValueError('The input data must be a 2D array!')
+
+        if min_pts < 2:
+            raise ValueError('min_pts must be at least 2!')
+
+        self.eps = eps
+        self.min_pts = min_pts
+        self.index = index
+        self.metric = metric
+        self.n_jobs = n_jobs
+        self.dtype = resolveFloatType(dtype, input_list.dtype)
+        self.dims = input_list.shape[1]
+        self.rebuild_ratio = rebuild_ratio
+
+        # Number of points which were ordered again in the last update
+        self.repaired = 0
+
+        # The data is copied, as it is changed by the updates
+        self.rebuildIndex(np.array(input_list, dtype=self.dtype, order='C'))
+
+        # Find the neighborhoods of all points
+        if len(self):
+            self.graph = queryNeighborhoods(self.base_index, self.base_points, self.base_points,
+                skip=np.arange(len(self)), n_jobs=self.n_jobs)
+
+        else:
+            self.graph = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                np.zeros(0, dtype=self.dtype))
+
+        self.core_distances = coreDistancesFromGraph(self.graph[0], self.graph[2], min_pts, n_jobs=n_jobs)
+
+        self.result = self.order()
+        self.repaired = len(self)
+
+
+    def __len__(self):
+
+        return len(self.storage_ids)
+
+
+    def rebuildIndex(self, points):
+        """ Builds the main spatial index on the given points, which become the current data. """
+
+        self.base_points = points
+        self.base_index = buildIndex(points, self.eps, index=self.index, metric=self.metric) if len(points) \
+            else None
+
+        # Points inserted since the main index was built, with their own index
+        self.delta_points = np.zeros((0, self.dims), dtype=self.dtype)
+        self.delta_index = None
+
+        # Points are stored in the main points and then in the inserted points. The storage index of every
+        # current point, and the current index of every stored point (-1 for deleted points) are kept.
+        self.storage_ids = np.arange(len(points), dtype=np.int64)
+        self.current_ids = np.arange(len(points), dtype=np.int64)
+
+
+    def storedPoints(self, storage_ids):
+        """ Returns the coordinates of the points with the given storage indices, which have to be sorted. """
+
+        split = np.searchsorted(storage_ids, len(self.base_points))
+
+        return np.concatenate([self.base_points[storage_ids[:split]],
+            self.delta_points[storage_ids[split:] - len(self.base_points)]])
+
+
+    @property
+    def points(self):
+        """ Coordinates of the current points. """
+
+        return self.storedPoints(self.storage_ids)
+
+
+    def findNeighbors(self, queries, storage_ids):
+        """ Finds the eps-neighborhoods of the given points among the current points.
+
+        Arguments:
+            queries: [ndarray] coordinates of the query points
+            storage_ids: [ndarray] storage index of every query point, which is left out of its neighborhood
+
+        Return:
+            (indptr, indices, distances): [tuple of ndarrays] neighborhoods in the CSR format, with the current
+                indices of the neighbors
+        """
+
+        base_size = len(self.base_points)
+        parts = []
+
+        # Find the neighbors among the main points and among the inserted points
+        for spatial_index, points, offset in ((self.base_index, self.base_points, 0),
+            (self.delta_index, self.delta_points, base_size)):
+
+            if spatial_index is None:
+                continue
+
+            skip = np.where((storage_ids >= offset) & (storage_ids < offset + len(points)),
+                storage_ids - offset, UNDEFINED)
+
+            indptr, indices, distances = queryNeighborhoods(spatial_index, points, queries, skip=skip,
+                n_jobs=self.n_jobs)
+
+            rows = np.repeat(np.arange(len(queries)), np.diff(indptr))
+            parts.append((rows, self.current_ids[indices + offset], distances))
+
+        if not parts:
+            return np.zeros(len(queries) + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), \
+                np.zeros(0, dtype=self.dtype)
+
+        rows, indices, distances = [np.concatenate(values) for values in zip(*parts)]
+
+        # Leave out the deleted points and group the neighbors by the query point
+        kept = np.flatnonzero(indices != UNDEFINED)
+        kept = kept[np.argsort(rows[kept], kind='stable')]
+
+        indptr = np.zeros(len(queries) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[kept], minlength=len(queries)), out=indptr[1:])
+
+        return indptr, indices[kept].astype(np.int32), distances[kept]
+
+
+    def order(self, prefix=None):
+        """ Runs the ordering on the current neighborhoods, continuing after the given prefix of the ordering.
+        """
+
+        result = runCyOPTICSSparse(*self.graph, eps=self.eps, min_pts=self.min_pts,
+            core_distances=self.core_distances, n_jobs=self.n_jobs, return_format='columnar', dtype=self.dtype,
+            prefix=prefix)
+
+        result.header = {'eps': self.eps, 'min_pts': self.min_pts, 'metric': self.metric, 'index': self.index}
+
+        return result
+
+
+    def update(self, insert=None, delete=None):
+        """ Inserts and deletes a batch of points and repairs the ordering. The points are deleted first, and
+            the inserted points are appended after the remaining points.
+
+        Keyword arguments:
+            insert: [ndarray] 2D numpy array containing the coordinates of inserted points
+            delete: [ndarray] indices of deleted points, before the update
+
+        Return:
+            [OPTICSResult] ordering of the updated data, the same as from runOPTICS with the 'columnar' return
+                format on the updated data (see the points attribute)
+        """
+
+        old_size = len(self)
+
+        # Check the input
+        if delete is None:
+            delete = []
+
+        delete = np.unique(np.asarray(delete, dtype=np.int64))
+
+        if delete.size and ((delete[0] < 0) or (delete[-1] >= old_size)):
+            raise IndexError('The indices of deleted points must be between 0 and N - 1!')
+
+        if insert is None:
+            insert = np.zeros((0, self.dims))
+
+        insert = np.ascontiguousarray(insert, dtype=self.dtype)
+
+        if (insert.ndim != 2) or (insert.shape[1] != self.dims):
+            raise ValueError('The inserted points must be a 2D array with {:d} columns!'.format(self.dims))
+
+        if (not delete.size) and (not insert.size):
+            self.repaired = 0
+            return self.result
+
+        indptr, indices, _ = self.graph
+
+        # The neighborhoods of deleted points and of their neighbors change
+        changed = np.zeros(old_size, dtype=bool)
+        changed[delete] = True
+        changed[indices[rowEntries(indptr, delete)]] = True
+
+        # Compute the new indices of the remaining points
+        kept_ids = np.delete(np.arange(old_size), delete)
+        kept_size = len(kept_ids)
+        new_size = kept_size + len(insert)
+
+        remap = np.zeros(old_size, dtype=np.int64) + UNDEFINED
+        remap[kept_ids] = np.arange(kept_size)
+
+        # Remove the deleted points from the storage and add the inserted points to it
+        self.current_ids[self.storage_ids[delete]] = UNDEFINED
+        self.storage_ids = np.r_[self.storage_ids[kept_ids],
+            len(self.current_ids) + np.arange(len(insert), dtype=np.int64)]
+        self.current_ids = np.r_[self.current_ids, np.zeros(len(insert), dtype=np.int64)]
+        self.current_ids[self.storage_ids] = np.arange(new_size)
+        self.delta_points = np.concatenate([self.delta_points, insert])
+
+        # Rebuild the main index if too many points were inserted or deleted since it was built, otherwise only
+        # index the inserted points
+        if len(self.delta_points) + (len(self.current_ids) - new_size) > self.rebuild_ratio*new_size:
+
+            self.rebuildIndex(self.points)
+
+        elif len(insert):
+            self.delta_index = buildIndex(self.delta_points, self.eps, index=self.index, metric=self.metric)
+
+        # Find the neighborhoods of inserted points, the remaining points near them also change
+        inserted_rows = self.findNeighbors(insert, self.storage_ids[kept_size:])
+        near = inserted_rows[1][inserted_rows[1] < kept_size]
+        changed[kept_ids[near]] = True
+
+        # Find the neighborhoods of changed remaining points again
+        changed_new = np.ones(new_size, dtype=bool)
+        changed_new[:kept_size] = changed[kept_ids]
+        affected = np.flatnonzero(changed_new[:kept_size])
+        affected_rows = self.findNeighbors(self.storedPoints(self.storage_ids[affected]),
+            self.storage_ids[affected])
+
+        # Copy the neighborhoods and core distances of the other points
+        rows = concatenateRows(affected_rows, inserted_rows)
+        sources = np.zeros(new_size, dtype=np.int64) + UNDEFINED
+        sources[:kept_size] = np.where(changed_new[:kept_size], UNDEFINED, kept_ids)
+
+        self.graph = spliceNeighborGraph(self.graph, sources, remap, rows)
+
+        core_distances = np.zeros(new_size, dtype=self.core_distances.dtype)
+        core_distances[~changed_new] = self.core_distances[sources[~changed_new]]
+        core_distances[changed_new] = coreDistancesFromGraph(rows[0], rows[2], self.min_pts, n_jobs=self.n_jobs)
+        self.core_distances = core_distances
+
+        # Keep the runs which the changes do not reach, with the new indices of their points
+        reached = self.reachedPoints(np.flatnonzero(changed_new))
+
+        result = self.result
+        ordering = np.asarray(result.ordering)
+        kept = (remap[ordering] != UNDEFINED)
+        kept[kept] = ~reached[remap[ordering[kept]]]
+
+        predecessor = np.asarray(result.predecessor)[kept]
+        prefix = OPTICSResult(remap[ordering[kept]], np.asarray(result.reachability)[kept],
+            np.asarray(result.core_distance)[kept], np.where(predecessor != UNDEFINED, remap[predecessor], 
+            UNDEFINED))
+
+        # Order the other points and merge their runs with the kept ones
+        self.result = mergeRuns(self.order(prefix=prefix))
+        self.repaired = new_size - len(prefix)
+
+        return self.result
+
+
+    def reachedPoints(self, seeds):
+        """ Finds the points whose runs of the ordering can change, i.e. the changed points and their neighbors,
+            and all points which are connected to them by neighbors with at least one core point.
+
+        Arguments:
+            seeds: [ndarray] indices of the changed points
+
+        Return:
+            [ndarray] boolean mask of the reached points
+        """
+
+        indptr, indices, _ = self.graph
+        core = self.core_distances != UNDEFINED
+
+        # The changed points and all of their neighbors are reached
+        reached = np.zeros(len(self), dtype=bool)
+        reached[seeds] = True
+        reached[indices[rowEntries(indptr, seeds)]] = True
+        frontier = np.flatnonzero(reached)
+
+        # Follow the neighbors of core points, and the core neighbors of other points
+        while len(frontier):
+
+            sources = np.repeat(frontier, indptr[frontier + 1] - indptr[frontier])
+            neighbors = indices[rowEntries(indptr, frontier)]
+
+            neighbors = neighbors[(core[sources] | core[neighbors]) & ~reached[neighbors]]
+            frontier = np.unique(neighbors)
+            reached[frontier] = True
+
+        return reached
+
+
+    def insert(self, points):
+        """ Inserts a batch of points, see update. """
+
+        return self.update(insert=points)
+
+
+    def delete(self, indices):
+        """ Deletes a batch of points, see update. """
+
+        return self.update(delete=indices)
@@ -0,0 +1,112 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Loading of the compiled Cython extensions (cyOPTICS and cyGradientClustering).
+
+The extensions are normally compiled ahead of time, when the package is installed (pip install .) or built in
+place (python setup.py build_ext --inplace), see setup.py, and nothing is compiled on import. For development
+in a source checkout without a build, setting the environment variable OPTICS_USE_PYXIMPORT to 1 compiles the
+.pyx files on import with pyximport, which needs Cython and a C compiler. If an extension cannot be imported,
+runOPTICS and GradientClustering fall back to the NumPy implementations in npOPTICS.py and
+npGradientClustering.py with a warning, while the modules which need the spatial indices of the extension raise
+an ImportError.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import warnings
+import importlib
+
+
+# Environment variable which enables compiling the extensions on import
+USE_PYXIMPORT_VARIABLE = 'OPTICS_USE_PYXIMPORT'
+
+# Directory with the .pyx sources of the extensions
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Errors of the extensions which could not be loaded, by the extension name
+LOAD_ERRORS = {}
+
+
+
+def installPyximport():
+    """ Installs the pyximport import hook, which compiles .pyx files on import. """
+
+    import numpy as np
+    import pyximport
+
+    pyximport.install(setup_args={'include_dirs':[np.get_include()]})
+
+
+
+def loadExtension(name, required=False):
+    """ Imports a compiled Cython extension. If it is not built, it is compiled with pyximport only if
+        OPTICS_USE_PYXIMPORT is set to 1.
+
+    Arguments:
+        name: [str] name of the extension module, e.g. 'cyOPTICS'
+
+    Keyword arguments:
+        required: [bool] if True, an ImportError is raised if the extension cannot be loaded, otherwise a
+            warning is issued and None is returned (default False)
+
+    Return:
+        [module] the extension module, or None if it is not available and not required
+    """
+
+    if name in sys.modules:
+        return sys.modules[name]
+
+    # Import the extension compiled ahead of time
+    try:
+        return importlib.import_module(name)
+
+    except ImportError as e:
+        error = e
+
+    # Compile the extension on import if it was asked for and its source is available
+    source = os.path.join(SOURCE_DIR, name + '.pyx')
+    if (name not in LOAD_ERRORS) and os.path.isfile(source) \
+        and (os.environ.get(USE_PYXIMPORT_VARIABLE, '0') not in ('', '0')):
+
+        try:
+            installPyximport()
+            return importlib.import_module(name)
+
+        # Compilation can fail in many ways, e.g. without Cython, a compiler or a writable build directory
+        except Exception as e:
+            error = e
+
+    LOAD_ERRORS[name] = error
+
+    if required:
+        raise ImportError("The compiled extension '{:s}' is not available, install the package with "
+            "'pip install .', build it with 'python setup.py build_ext --inplace' or set {:s}=1 to compile it "
+            "on import ({:s})".format(name, USE_PYXIMPORT_VARIABLE, str(error)))
+
+    warnings.warn("The compiled extension '{:s}' is not available, the slower NumPy implementation is used "
+        "instead ({:s})".format(name, str(error)), RuntimeWarning)
+
+    return None
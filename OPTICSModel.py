@@ -0,0 +1,198 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" OPTICS clustering of a data set into flat cluster labels, which keeps the spatial index and the core
+distances, so new points can be assigned to the clusters without clustering the data again.
+
+A new point is assigned in the same way as OPTICS would reach it: of all core points within eps of it, the one
+from which its reachability distance (the larger of the core distance and the distance to the point) is the
+smallest gives it its label. Of equal reachability distances, the core point which comes first in the OPTICS
+ordering is taken, as OPTICS keeps the predecessor which was processed first. Points without any core point
+within eps are noise, and points identical to a fitted point get its label. The clusters and the labels of the
+fitted points do not change.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+
+# Compiled extension, the spatial indices are not available in the NumPy implementation
+from OPTICSExtension import loadExtension
+loadExtension('cyOPTICS', required=True)
+from cyOPTICS import buildIndex, nearestCorePoints, prepareOrdering, runOrdering, resolveFloatType, loadInput
+
+from GradientClustering import gradientClustering, filterLargeClusters, mergeSimilarClusters, clusterLabels, \
+    clusterIntervals, checkNesting
+
+
+# Value of undefined distances and labels
+UNDEFINED = -1
+
+
+
+def rowKeys(points):
+    """ Returns the rows of a 2D array as single values, which are equal if the coordinates are equal. """
+
+    # Adding zero turns negative zeros into zeros, which are equal but have different bytes
+    points = np.ascontiguousarray(points + points.dtype.type(0))
+
+    return points.view(np.dtype((np.void, points.dtype.itemsize*points.shape[1]))).ravel()
+
+
+
+class OPTICSModel(object):
+    """ OPTICS ordering, gradient clusters and flat labels of a data set, which can assign cluster labels to
+        new points.
+    """
+
+    def __init__(self, input_list, eps, min_pts, t=150, w=0.025, max_points_ratio=0.5,
+        cluster_similarity_threshold=0.7, nesting='smallest', index='auto', metric='euclidean', n_jobs=1,
+        dtype=None):
+        """ Initilization function, which runs OPTICS and extracts the clusters.
+
+        Arguments:
+            input_list: [ndarray] 2D numpy array containing the input data, or a path to a .npy file with it
+            eps: [float] epsilon parameter - maximum distance between points
+            min_pts: [int] minimum points in the cluster, also used by the gradient clustering
+
+        Keyword arguments:
+            t: [float] angle of minimum inflection index in deg, see gradientClustering (default 150)
+            w: [float] distance between data points in the reachability plot, see gradientClustering
+                (default 0.025)
+            max_points_ratio: [float] clusters larger than this fraction of all points are rejected, see
+                filterLargeClusters (default 0.5)
+            cluster_similarity_threshold: [float] minimum ratio of common points of merged clusters, see
+                mergeSimilarClusters (default 0.7)
+            nesting: [str] which of the clusters containing a point gives its label, see intervalLabels
+                (default 'smallest')
+            index: [str] spatial index used for eps-range neighbor queries, see runOPTICS
+            metric: [str] distance metric, see runOPTICS
+            n_jobs: [int] number of threads used for finding neighborhoods, -1 uses all cores (default 1)
+            dtype: [dtype] np.float32 or np.float64, precision of the computation, see runOPTICS
+
+        """
+
+        checkNesting(nesting)
+
+        input_list = np.asarray(loadInput(input_list))
+
+        if input_list.ndim != 2:
+            raise ValueError('The input data must be a 2D array!')
+
+        self.eps = eps
+        self.min_pts = min_pts
+        self.metric = metric
+        self.n_jobs = n_jobs
+        self.dtype = resolveFloatType(dtype, input_list.dtype)
+
+        # The index is queried with the points in the computation dtype
+        self.points = np.ascontiguousarray(input_list, dtype=self.dtype)
+
+        # The spatial index of the ordering is kept for assigning new points
+        self.spatial_index = buildIndex(self.points, eps, index=index, metric=metric) if len(self.points) \
+            else None
+
+        _, state = prepareOrdering(self.points, eps, min_pts, index=index, metric=metric, n_jobs=n_jobs,
+            dtype=self.dtype, spatial_index=self.spatial_index)
+        runOrdering(state)
+
+        self.result = state.getResult()
+        self.result.header = {'eps': eps, 'min_pts': min_pts, 'metric': metric, 'index': index}
+
+        # Core distances and positions in the OPTICS ordering in the order of the input points
+        self.core_distances = np.empty(len(self.points), dtype=self.result.core_distance.dtype)
+        self.core_distances[self.result.ordering] = self.result.core_distance
+
+        self.positions = np.empty(len(self.points), dtype=np.int32)
+        self.positions[self.result.ordering] = np.arange(len(self.points), dtype=np.int32)
+
+        # Fitted points sorted by their coordinates, so identical new points can be found
+        self.point_keys = rowKeys(self.points)
+        self.sorted_points = np.argsort(self.point_keys, kind='stable').astype(np.int32)
+        self.point_keys = self.point_keys[self.sorted_points]
+
+        # Extract the clusters and label the points
+        if len(self.points):
+            clusters = gradientClustering(self.result.reachability, min_pts, t, w, intervals=True)
+            clusters = filterLargeClusters(clusters, len(self.points), max_points_ratio)
+            self.clusters = mergeSimilarClusters(clusters, cluster_similarity_threshold)
+
+        else:
+            self.clusters = clusterIntervals([])
+
+        self.labels = clusterLabels(self.clusters, self.result, nesting=nesting)
+
+
+    def __len__(self):
+
+        return len(self.points)
+
+
+    def predict(self, new_points, return_reachability=False):
+        """ Assigns cluster labels to new points, without changing the clusters. Every point gets the label of
+            the core point within eps from which its reachability distance is the smallest (of equal distances
+            the core point which comes first in the OPTICS ordering), or -1 if there is no core point within 
+            eps. Points identical to a fitted point get its label, so the fitted points keep their labels.
+
+        Arguments:
+            new_points: [ndarray] 2D numpy array containing the coordinates of the new points
+
+        Keyword arguments:
+            return_reachability: [bool] if True, the reachability distances of the points are also returned
+                (False by default)
+
+        Return:
+            labels: [ndarray] int32 array with the cluster label of every new point, -1 for noise
+            if return_reachability is True:
+                (labels, reachability): the reachability distance of every new point is -1 if it is noise
+        """
+
+        new_points = np.asarray(new_points)
+
+        if (new_points.ndim != 2) or (new_points.shape[1] != self.points.shape[1]):
+            raise ValueError('The new points must be a 2D array with {:d} columns!'.format(
+                self.points.shape[1]))
+
+        labels = np.zeros(len(new_points), dtype=np.int32) + UNDEFINED
+        reachability = np.zeros(len(new_points), dtype=self.core_distances.dtype) + UNDEFINED
+
+        # Without fitted points, all new points are noise
+        if self.spatial_index is not None:
+
+            nearest, reachability = nearestCorePoints(self.spatial_index, self.points, new_points,
+                self.core_distances, n_jobs=self.n_jobs, priority=self.positions)
+
+            # Points get the labels of their nearest core points
+            reached = nearest != UNDEFINED
+            labels[reached] = self.labels[nearest[reached]]
+
+            # Points identical to fitted points get their labels (of duplicates, the first fitted point)
+            new_keys = rowKeys(np.ascontiguousarray(new_points, dtype=self.dtype))
+            found = np.minimum(np.searchsorted(self.point_keys, new_keys), len(self.point_keys) - 1)
+            identical = self.point_keys[found] == new_keys
+            labels[identical] = self.labels[self.sorted_points[found[identical]]]
+
+        if return_reachability:
+            return labels, reachability
+
+        return labels
@@ -0,0 +1,164 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Streaming pipeline from the input data to flat cluster labels, in which every stage passes NumPy chunks to
+the next one.
+
+The OPTICS ordering yields the ordered points in chunks as soon as they are ordered (cyOPTICS.iterCyOPTICS),
+the gradient clustering consumes the reachability distances chunk by chunk and returns clusters as soon as
+they are found (GradientClustering.GradientStream), and when the ordering is finished, the clusters are
+filtered and merged and the labels of the points are produced in chunks of the ordering. Only the ordering
+and the labels are kept for all points (both can be memory-mapped files), the rest of the results is passed on
+in chunks.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+
+# Compiled extension, the spatial indices are not available in the NumPy implementation
+from OPTICSExtension import loadExtension
+loadExtension('cyOPTICS', required=True)
+from cyOPTICS import iterCyOPTICS, loadInput, ORDERING_CHUNK_SIZE
+
+from OPTICSResult import allocateArray
+from GradientClustering import GradientStream, filterLargeClusters, mergeSimilarClusters, intervalLabels, \
+    clusterIntervals, checkNesting
+
+
+
+def iterLabels(ordering, clusters, chunk_size=ORDERING_CHUNK_SIZE, nesting='smallest'):
+    """ Yields the flat cluster labels of the points in chunks of the OPTICS ordering, see intervalLabels.
+
+    Arguments:
+        ordering: [ndarray] indices of points in the OPTICS order
+        clusters: [list or ndarray] clusters in the OPTICS order, e.g. from gradientClustering
+
+    Keyword arguments:
+        chunk_size: [int] number of points in a chunk (default ORDERING_CHUNK_SIZE)
+        nesting: [str] which of the clusters containing a point gives its label, see intervalLabels 
+            (default 'smallest')
+
+    Return:
+        [generator] (rows, labels) tuples, with the indices of the points in the input data and their labels
+    """
+
+    for start in range(0, len(ordering), chunk_size):
+
+        end = min(start + chunk_size, len(ordering))
+
+        yield np.asarray(ordering[start:end]), intervalLabels(clusters, start, end, nesting=nesting)
+
+
+
+def streamOPTICS(input_list, eps, min_pts, t=150, w=0.025, max_points_ratio=0.5,
+    cluster_similarity_threshold=0.7, index='auto', metric='euclidean', n_jobs=1, dtype=None,
+    chunk_size=ORDERING_CHUNK_SIZE, output_dir=None, nesting='smallest'):
+    """ Runs OPTICS, the gradient clustering and the cluster postprocessing as a pipeline of chunks, and
+        yields the results of every stage as soon as they are available, so the consumers can start before
+        OPTICS finishes.
+
+    Arguments:
+        input_list: [ndarray] 2D numpy array containing the input data, or a path to a .npy file with it
+        eps: [float] epsilon parameter - maximum distance between points
+        min_pts: [int] minimum points in the cluster, also used by the gradient clustering
+
+    Keyword arguments:
+        t: [float] angle of minimum inflection index in deg, see gradientClustering (default 150)
+        w: [float] distance between data points in the reachability plot, see gradientClustering
+            (default 0.025)
+        max_points_ratio: [float] clusters larger than this fraction of all points are rejected, see
+            filterLargeClusters (default 0.5)
+        cluster_similarity_threshold: [float] minimum ratio of common points of merged clusters, see
+            mergeSimilarClusters (default 0.7)
+        index: [str] spatial index used for eps-range neighbor queries, see runOPTICS
+        metric: [str] distance metric, see runOPTICS
+        n_jobs: [int] number of threads used for finding neighborhoods, see runOPTICS
+        dtype: [dtype] np.float32 or np.float64, precision of the computation, see runOPTICS
+        chunk_size: [int] number of points in the ordering and label chunks (default ORDERING_CHUNK_SIZE)
+        output_dir: [str] if given, the ordering and the labels of all points are kept in memory-mapped
+            ordering.npy and labels.npy files in this directory, instead of in memory
+        nesting: [str] which of the clusters containing a point gives its label, see intervalLabels 
+            (default 'smallest')
+
+    Return:
+        [generator] (stage, value) tuples, in the order in which they are produced:
+            - ('ordering', OPTICSResult): the next chunk of the ordering
+            - ('clusters', ndarray): intervals of newly found clusters in the OPTICS order, before they are
+                filtered and merged (see clusterIntervals)
+            - ('labels', (rows, labels)): after the ordering is finished, labels of the next chunk of ordered
+                points, with the indices of the points in the input data (see intervalLabels). The labels are
+                indices of the filtered and merged clusters, -1 for noise. They are also written to the
+                labels array of all points, which is the value of the last item.
+            - ('done', (ordering, clusters, labels)): the whole ordering, the intervals of the final clusters
+                and the labels of all input points
+    """
+
+    checkNesting(nesting)
+
+    input_list = loadInput(input_list)
+    input_list_size = len(input_list)
+
+    # The ordering is kept to map the clusters back to the input points
+    ordering = allocateArray((input_list_size, ), np.int32, output_dir, 'ordering')
+
+    gradient_stream = GradientStream(input_list_size, min_pts, t, w)
+    found_clusters = []
+    ordered_count = 0
+
+    # Order the points, and look for clusters in every chunk of the ordering
+    for chunk in iterCyOPTICS(input_list, eps, min_pts, index=index, metric=metric, n_jobs=n_jobs,
+        dtype=dtype, chunk_size=chunk_size):
+
+        ordering[ordered_count:ordered_count + len(chunk)] = chunk.ordering
+        ordered_count += len(chunk)
+
+        yield 'ordering', chunk
+
+        intervals = gradient_stream.update(chunk.reachability)
+
+        if len(intervals):
+            found_clusters.append(intervals)
+            yield 'clusters', intervals
+
+    intervals = gradient_stream.finish()
+
+    if len(intervals):
+        found_clusters.append(intervals)
+        yield 'clusters', intervals
+
+    # Remove very large clusters and merge similar clusters, which needs all clusters
+    clusters = np.concatenate([clusterIntervals([])] + found_clusters)
+    clusters = filterLargeClusters(clusters, input_list_size, max_points_ratio)
+    clusters = mergeSimilarClusters(clusters, cluster_similarity_threshold)
+
+    # Label the points in chunks
+    labels = allocateArray((input_list_size, ), np.int32, output_dir, 'labels')
+
+    for rows, chunk_labels in iterLabels(ordering, clusters, chunk_size=chunk_size, nesting=nesting):
+
+        labels[rows] = chunk_labels
+
+        yield 'labels', (rows, chunk_labels)
+
+    yield 'done', (ordering, clusters, labels)
@@ -0,0 +1,344 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+
+# Columns of the point list format
+PROCESSED_FLAG_IND = 0
+REACHABILITY_DIST_IND = 1
+CORE_DIST_IND = 2
+COLUMNS_TOTAL = 3
+
+# Value of the processed flag for all points in the results
+PROCESSED = 1
+
+# Floating point types which the computation can be done in (the kernels are compiled for both)
+FLOAT_TYPES = (np.float32, np.float64)
+
+# Number of rows copied at once into the point list
+COPY_CHUNK_SIZE = 65536
+
+# Number of input rows hashed at once when computing the fingerprint of the input data
+FINGERPRINT_CHUNK_SIZE = 65536
+
+# Arrays of the result, each is stored in a .npy file of the same name
+RESULT_ARRAYS = ('ordering', 'reachability', 'core_distance', 'predecessor')
+
+# Name of the file with the description of a saved result, and the version of the format
+HEADER_FILE = 'header.json'
+FORMAT_VERSION = 1
+
+
+
+def allocateArray(shape, dtype, output_dir=None, name=None):
+    """ Allocates an array in memory, or as a memory-mapped .npy file if the output directory is given.
+
+    Arguments:
+        shape: [tuple] shape of the array
+        dtype: [dtype] type of the array
+
+    Keyword arguments:
+        output_dir: [str] directory in which the file is created, None to allocate the array in memory
+        name: [str] name of the file, without the .npy extension
+
+    Return:
+        [ndarray] allocated array, an np.memmap if the output directory is given
+    """
+
+    if output_dir is None:
+        return np.empty(shape, dtype=dtype)
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    return np.lib.format.open_memmap(os.path.join(output_dir, name + '.npy'), mode='w+', dtype=dtype, 
+        shape=shape)
+
+
+
+def inputFingerprint(input_list):
+    """ Computes a fingerprint of the input data, from its shape, type and values. The data is hashed in
+        chunks, so memory-mapped inputs are not loaded into memory at once.
+
+    Arguments:
+        input_list: [ndarray] numpy array containing the input data
+
+    Return:
+        [str] hex digest of the input data
+    """
+
+    input_list = np.asarray(input_list)
+
+    digest = hashlib.sha1()
+    digest.update(str((input_list.shape, input_list.dtype.str)).encode('ascii'))
+
+    for start in range(0, len(input_list), FINGERPRINT_CHUNK_SIZE):
+        digest.update(np.ascontiguousarray(input_list[start:start + FINGERPRINT_CHUNK_SIZE]).tobytes())
+
+    return digest.hexdigest()
+
+
+
+def loadInput(input_list):
+    """ Opens the input data given as a path to a .npy file as a read-only memory-mapped array, so it is not 
+        loaded into memory. Other inputs are returned unchanged.
+
+    Arguments:
+        input_list: [ndarray or str] input data or a path to it
+
+    Return:
+        [ndarray] input data
+    """
+
+    if isinstance(input_list, (str, bytes)) or hasattr(input_list, '__fspath__'):
+        return np.load(os.fspath(input_list), mmap_mode='r')
+
+    return input_list
+
+
+
+def resolveFloatType(dtype, data_dtype):
+    """ Chooses the floating point type in which the coordinates and distances are stored and computed.
+
+    Arguments:
+        dtype: [dtype] requested type, float32 or float64, None to use the type of the data
+        data_dtype: [dtype] type of the input data, float32 data stays float32 and everything else is 
+            converted to float64
+
+    Return:
+        [np.dtype] float32 or float64
+    """
+
+    if dtype is None:
+        dtype = np.float32 if data_dtype == np.float32 else np.float64
+
+    dtype = np.dtype(dtype)
+
+    if dtype not in FLOAT_TYPES:
+        raise ValueError("Unsupported dtype '{:s}', use float32 or float64!".format(str(dtype)))
+
+    return dtype
+
+
+
+def checkReturnFormat(return_format):
+    """ Raises an error if the return format is not supported. """
+
+    if return_format not in ('point_list', 'columnar'):
+        raise ValueError("Unknown return format '{:s}', use 'point_list' or 'columnar'!".format(
+            str(return_format)))
+
+
+
+def collapseDuplicates(input_list):
+    """ Collapses identical rows of the input data into unique points, which are numbered in the order of 
+        their first rows, so data without duplicates keeps its order.
+
+    Arguments:
+        input_list: [ndarray] C-ordered 2D numpy array containing the input data
+
+    Return:
+        (unique_points, inverse, counts):
+            - unique_points: [ndarray] C-ordered 2D array of the unique rows
+            - inverse: [ndarray] int32 array with the index of the unique point of every input row
+            - counts: [ndarray] int32 array with the number of rows of every unique point
+    """
+
+    input_list = np.ascontiguousarray(input_list)
+
+    # Compare whole rows as single values (rows are identical if all their bytes are identical)
+    rows = input_list.view(np.dtype((np.void, input_list.dtype.itemsize*input_list.shape[1])))
+    _, first, inverse, counts = np.unique(rows.ravel(), return_index=True, return_inverse=True, 
+        return_counts=True)
+
+    # Renumber the unique points in the order of their first rows
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+
+    unique_points = np.ascontiguousarray(input_list[first[order]])
+
+    return unique_points, rank[inverse.ravel()], counts[order].astype(np.int32)
+
+
+
+class OPTICSResult(object):
+    """ Result of the OPTICS ordering, stored as separate arrays. The input data is referenced by the indices
+        in the ordering and is not copied.
+
+        All arrays are in the OPTICS order, i.e. the k-th entry of every array belongs to the input point
+        ordering[k]:
+            - ordering: [ndarray] int32 indices of input points in the OPTICS order
+            - reachability: [ndarray] reachability distances, -1 for the first points of clusters
+            - core_distance: [ndarray] core distances, -1 for points which are not core points
+            - predecessor: [ndarray] int32 index of the input point from which the reachability distance was
+                reached, -1 if the reachability distance is undefined
+
+        The parameters of the run (eps, min_pts, metric, ...) are stored in the header dictionary.
+    """
+
+    def __init__(self, ordering, reachability, core_distance, predecessor, header=None):
+        """ Initilization function for the result.
+
+        Arguments:
+            ordering: [ndarray] indices of input points in the OPTICS order
+            reachability: [ndarray] reachability distances in the OPTICS order
+            core_distance: [ndarray] core distances in the OPTICS order
+            predecessor: [ndarray] indices of predecessors in the OPTICS order
+
+        Keyword arguments:
+            header: [dict] parameters of the run, values have to be JSON serializable
+
+        """
+
+        self.ordering = ordering
+        self.reachability = reachability
+        self.core_distance = core_distance
+        self.predecessor = predecessor
+
+        self.header = dict(header or {})
+
+
+    def __len__(self):
+
+        return len(self.ordering)
+
+
+    def toPointList(self, input_list, output_dir=None):
+        """ Converts the result to the point list format returned by runOPTICS.
+
+        Arguments:
+            input_list: [ndarray] 2D numpy array containing the input data which was clustered
+
+        Keyword arguments:
+            output_dir: [str] if given, the point list is written to point_list.npy in this directory and 
+                returned as a memory-mapped array
+
+        Return:
+            point_list: [ndarray] 2D numpy array with the processed flag, reachability distance and core
+                distance columns, followed by the input data columns, in the OPTICS order
+        """
+
+        input_list = np.asarray(input_list)
+
+        # The point list keeps the precision of both the distances and the input data
+        dtype = np.result_type(self.reachability.dtype, input_list.dtype)
+        point_list = allocateArray((len(self.ordering), COLUMNS_TOTAL + input_list.shape[1]), dtype, 
+            output_dir=output_dir, name='point_list')
+
+        point_list[:, PROCESSED_FLAG_IND] = PROCESSED
+        point_list[:, REACHABILITY_DIST_IND] = self.reachability
+        point_list[:, CORE_DIST_IND] = self.core_distance
+
+        # Copy the input data in the OPTICS order into the point list, in chunks so no temporary copy of the 
+        # whole input is made
+        for start in range(0, len(self.ordering), COPY_CHUNK_SIZE):
+            end = start + COPY_CHUNK_SIZE
+            point_list[start:end, COLUMNS_TOTAL:] = input_list[self.ordering[start:end]]
+
+        return point_list
+
+
+    def save(self, directory, input_list=None):
+        """ Saves the result to a directory, from which it can be loaded with loadResult. The arrays are 
+            written to .npy files (see RESULT_ARRAYS), and the header with the parameters, the number of points
+            and the type of distances to header.json. Arrays which are already memory-mapped from the files in
+            this directory (e.g. when runOPTICS was given the same output_dir) are not written again.
+
+        Arguments:
+            directory: [str] directory in which the result is saved
+
+        Keyword arguments:
+            input_list: [ndarray] input data which was clustered, if given, its fingerprint is stored in the
+                header as input_hash (see inputFingerprint)
+
+        """
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        for name in RESULT_ARRAYS:
+
+            array = getattr(self, name)
+            file_path = os.path.join(directory, name + '.npy')
+
+            # Flush arrays which are mapped to the target files, write the others
+            if isinstance(array, np.memmap) and (array.filename is not None) \
+                and os.path.exists(file_path) and os.path.samefile(array.filename, file_path):
+
+                array.flush()
+
+            else:
+                np.save(file_path, np.asarray(array))
+
+        header = dict(self.header)
+
+        if input_list is not None:
+            header['input_hash'] = inputFingerprint(input_list)
+
+        header.update({'format_version': FORMAT_VERSION, 'size': len(self), 
+            'dtype': np.dtype(self.reachability.dtype).name})
+
+        with open(os.path.join(directory, HEADER_FILE), 'w') as f:
+            json.dump(header, f, indent=4, sort_keys=True)
+
+        self.header = header
+
+
+
+def loadResult(directory, mmap_mode='r'):
+    """ Loads a result saved by OPTICSResult.save, or written by runOPTICS with the columnar return format 
+        and an output directory. The arrays are memory-mapped, so they are not read until they are used.
+
+    Arguments:
+        directory: [str] directory with the saved result
+
+    Keyword arguments:
+        mmap_mode: [str] memory-mapping mode of the arrays, see np.load (default 'r', read-only). None reads 
+            the arrays into memory.
+
+    Return:
+        [OPTICSResult] loaded result, with the saved parameters in its header
+    """
+
+    with open(os.path.join(directory, HEADER_FILE)) as f:
+        header = json.load(f)
+
+    if header.get('format_version') != FORMAT_VERSION:
+        raise ValueError('Unsupported format version of the saved result: {:s}'.format(
+            str(header.get('format_version'))))
+
+    arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in RESULT_ARRAYS]
+
+    # Check that the arrays belong together
+    for name, array in zip(RESULT_ARRAYS, arrays):
+        if array.shape != (header['size'], ):
+            raise ValueError('The {:s} array does not have {:d} values!'.format(name, header['size']))
+
+    return OPTICSResult(*arrays, header=header)
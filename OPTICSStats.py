@@ -0,0 +1,182 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Counters and times of the stages of a clustering run, and the cancellation of a run from its progress 
+callback.
+
+An OPTICSStats object is given as the stats keyword argument to runCyOPTICS, runCyOPTICSSparse, runOPTICS,
+gradientClustering and mergeSimilarClusters, which add their counters to it. Without it, no counters are 
+collected and the hot loops do not measure any time.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import time
+import collections
+
+
+# Counters which keep the largest recorded value, all other numbers are summed over repeated records
+MAX_COUNTERS = ('max_seeds', )
+
+# Number of ordered points between two calls of the progress callback
+PROGRESS_INTERVAL = 10000
+
+
+
+class OPTICSCancelled(Exception):
+    """ Raised when the progress callback stops the OPTICS ordering. The points ordered until then are kept 
+        in the result attribute, as an OPTICSResult.
+    """
+
+    def __init__(self, result):
+        """ Initilization function.
+
+        Arguments:
+            result: [OPTICSResult] the points ordered before the run was stopped
+
+        """
+
+        super(OPTICSCancelled, self).__init__('The OPTICS run was cancelled after {:d} ordered points!'.format(
+            len(result)))
+
+        self.result = result
+
+
+
+class OPTICSStats(object):
+    """ Counters and times (in seconds) of the stages of a clustering run. Every stage is a dictionary of 
+        values, the stages are kept in the order in which they were first recorded.
+
+        The ordering stage has these counters:
+            - points: number of ordered points
+            - queries: number of neighbor queries
+            - neighbors: total number of found neighbors, and mean_neighbors per query
+            - distance_evaluations: number of computed distances, which includes the points further than eps
+                (only counted for queries of the spatial index)
+            - max_seeds: largest number of points in the seed queue
+            - neighbor_time, core_distance_time, seed_time: times of the neighbor queries (or reading the 
+                precomputed neighborhoods), of the core distance selection and of the seed queue updates
+    """
+
+    def __init__(self):
+        """ Initilization function. """
+
+        self.stages = collections.OrderedDict()
+
+
+    def record(self, stage, **values):
+        """ Adds values to the given stage. If the stage already has a value of the same name, the numbers are 
+            summed (or the maximum is kept for MAX_COUNTERS), so a stage which runs several times is recorded 
+            as a whole.
+
+        Arguments:
+            stage: [str] name of the stage
+
+        Keyword arguments:
+            any counters or times of the stage
+
+        """
+
+        stage_values = self.stages.setdefault(stage, collections.OrderedDict())
+
+        for name, value in values.items():
+
+            if (name not in stage_values) or (value is None) or (stage_values[name] is None):
+                stage_values[name] = value
+
+            elif name in MAX_COUNTERS:
+                stage_values[name] = max(stage_values[name], value)
+
+            else:
+                stage_values[name] += value
+
+        # The mean neighborhood size follows the totals
+        if stage_values.get('queries'):
+            stage_values['mean_neighbors'] = stage_values['neighbors']/stage_values['queries']
+
+
+    def __getitem__(self, stage):
+
+        return self.stages[stage]
+
+
+    def __contains__(self, stage):
+
+        return stage in self.stages
+
+
+    def totalTime(self):
+        """ Returns the sum of times of all stages, in seconds. """
+
+        return sum(values.get('time', 0) for values in self.stages.values())
+
+
+    def report(self):
+        """ Returns a text table with the values of all stages. """
+
+        lines = []
+
+        for stage, values in self.stages.items():
+
+            lines.append(stage)
+
+            for name, value in values.items():
+
+                if isinstance(value, float):
+                    value = '{:.6g}'.format(value)
+
+                lines.append('    {:<24s} {:>16s}'.format(name, str(value)))
+
+        return '\n'.join(lines)
+
+
+    def __str__(self):
+
+        return self.report()
+
+
+
+def timeBudget(seconds, progress=None):
+    """ Returns a progress callback which stops the run after the given time. 
+
+    Arguments:
+        seconds: [float] time budget in seconds, measured from the call of this function
+
+    Keyword arguments:
+        progress: [callable] another progress callback, which is called first and can still stop the run
+            (None by default)
+
+    Return:
+        [callable] progress callback, see runCyOPTICS
+    """
+
+    deadline = time.perf_counter() + seconds
+
+    def budgetProgress(ordered_count, total):
+
+        if (progress is not None) and progress(ordered_count, total):
+            return True
+
+        return time.perf_counter() > deadline
+
+    return budgetProgress
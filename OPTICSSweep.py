@@ -0,0 +1,443 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Parameter sweeps of OPTICS and the gradient cluster extraction, which reuse the neighborhoods, core
+distances and orderings between runs.
+
+The eps-neighborhoods of all points are computed once for the largest eps of the sweep, and stored as a
+neighbor graph (see cyOPTICS.computeNeighborGraph). The neighborhoods for any smaller eps are taken from it by
+dropping the longer edges. The core distances for a given min_pts are also computed only once: a core distance
+for a smaller eps is the same if it is within that eps, and undefined otherwise. Neighbor graphs, core
+distances and orderings are kept in an LRU cache, keyed by a fingerprint of the input data and the parameters.
+By default every sweep has its own cache, which is freed with it. A cache shared by later sweeps of the same data
+can be given explicitly, or the process-wide cache can be used with cache='global' (see globalCache), which is
+bounded by the memory of its entries.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+# Compiled extension, the spatial indices are not available in the NumPy implementation
+from OPTICSExtension import loadExtension
+loadExtension('cyOPTICS', required=True)
+from cyOPTICS import computeNeighborGraph, filterNeighborGraph, coreDistancesFromGraph, runCyOPTICSSparse, \
+    resolveFloatType, loadInput
+
+from OPTICSResult import OPTICSResult, inputFingerprint
+from GradientClustering import gradientClustering, filterLargeClusters, mergeSimilarClusters
+
+
+# Default number of entries in the cache (neighbor graphs, core distances and orderings)
+CACHE_SIZE = 16
+
+# Maximum memory of the entries in the process-wide cache, in bytes
+GLOBAL_CACHE_BYTES = 512*1024**2
+
+# Value of undefined core distances
+UNDEFINED = -1
+
+
+
+def entryBytes(value):
+    """ Returns the memory of the arrays in a cached value (an array, a tuple of arrays or an OPTICSResult). """
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, OPTICSResult):
+        value = (value.ordering, value.reachability, value.core_distance, value.predecessor)
+
+    if isinstance(value, (tuple, list)):
+        return sum(entryBytes(item) for item in value)
+
+    return 0
+
+
+
+class OPTICSCache(object):
+    """ LRU cache of neighbor graphs, core distances and OPTICS orderings. A single cache can be shared among
+        several sweeps and data sets.
+    """
+
+    def __init__(self, cache_size=CACHE_SIZE, max_bytes=None):
+        """ Initilization function for the cache.
+
+        Keyword arguments:
+            cache_size: [int] maximum number of cached entries, the least recently used entries are removed
+                first (default CACHE_SIZE)
+            max_bytes: [int] maximum memory of the arrays in the cached entries. A neighbor graph holds all 
+                eps-neighborhoods of the data set, so it can be large. The least recently used entries are 
+                removed first, but the last added entry is always kept. None limits only the number of 
+                entries (default).
+
+        """
+
+        if cache_size < 1:
+            raise ValueError('The cache size must be at least 1!')
+
+        if (max_bytes is not None) and (max_bytes < 0):
+            raise ValueError('The maximum memory of the cache cannot be negative!')
+
+        self.cache_size = cache_size
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+
+        # Memory of every entry and of all entries together
+        self.entry_bytes = {}
+        self.nbytes = 0
+
+        # Number of cache hits and misses
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+
+        return len(self.entries)
+
+
+    def get(self, key):
+        """ Returns the cached value for the given key and marks it as recently used, None if not cached. """
+
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return self.entries[key]
+
+
+    def put(self, key, value):
+        """ Adds a value to the cache, removing the least recently used entries if the cache is full. """
+
+        if key in self.entries:
+            self.nbytes -= self.entry_bytes[key]
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        self.entry_bytes[key] = entryBytes(value)
+        self.nbytes += self.entry_bytes[key]
+
+        while (len(self.entries) > self.cache_size) or ((self.max_bytes is not None) 
+            and (self.nbytes > self.max_bytes) and (len(self.entries) > 1)):
+
+            removed_key, _ = self.entries.popitem(last=False)
+            self.nbytes -= self.entry_bytes.pop(removed_key)
+
+
+    def clear(self):
+        """ Removes all entries from the cache. """
+
+        self.entries.clear()
+        self.entry_bytes.clear()
+        self.nbytes = 0
+
+
+    def findNearest(self, kind, data_key, eps, *params):
+        """ Finds the cached entry of the given kind and data, computed with the smallest eps which is not 
+            smaller than the given eps.
+
+        Arguments:
+            kind: [str] kind of the entry, 'graph' or 'core'
+            data_key: [tuple] key of the data set, see OPTICSSweep
+            eps: [float] minimum eps of the entry
+            *params: other parameters of the entry, which have to match exactly
+
+        Return:
+            (entry_eps, value): [tuple] eps of the entry and its value, or None if there is no such entry
+        """
+
+        best_key = None
+
+        for key in self.entries:
+
+            # Keys are (kind, data_key, eps, *params)
+            if (key[0] == kind) and (key[1] == data_key) and (key[3:] == params) and (key[2] >= eps):
+                if (best_key is None) or (key[2] < best_key[2]):
+                    best_key = key
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        return best_key[2], self.get(best_key)
+
+
+
+# Process-wide cache, created on the first use of cache='global'
+GLOBAL_CACHE = None
+
+
+
+def globalCache():
+    """ Returns the process-wide cache, which is shared by all sweeps with cache='global'. Its entries are
+        kept until they are evicted or the cache is cleared, at most GLOBAL_CACHE_BYTES of them.
+    """
+
+    global GLOBAL_CACHE
+
+    if GLOBAL_CACHE is None:
+        GLOBAL_CACHE = OPTICSCache(max_bytes=GLOBAL_CACHE_BYTES)
+
+    return GLOBAL_CACHE
+
+
+
+class OPTICSSweep(object):
+    """ Runs OPTICS on one data set with different eps and min_pts values, and extracts clusters with
+        different gradient clustering parameters, reusing the expensive parts between runs.
+    """
+
+    def __init__(self, input_list, index='auto', metric='euclidean', n_jobs=1, dtype=None, cache=None):
+        """ Initilization function for the sweep.
+
+        Arguments:
+            input_list: [ndarray] 2D numpy array containing the input data, or a path to a .npy file with it
+
+        Keyword arguments:
+            index: [str] spatial index used for eps-range neighbor queries, see runOPTICS
+            metric: [str] distance metric, see runOPTICS
+            n_jobs: [int] number of threads used for finding neighborhoods and core distances, -1 uses all
+                cores (default 1)
+            dtype: [dtype] np.float32 or np.float64, precision of the computation, see runOPTICS
+            cache: [OPTICSCache or str] cache of the results, 'global' for the process-wide cache (see 
+                globalCache). None creates a new cache for this sweep only (default).
+
+        """
+
+        self.input_list = np.asarray(loadInput(input_list))
+
+        if self.input_list.ndim != 2:
+            raise ValueError('The input data must be a 2D array!')
+
+        self.index = index
+        self.metric = metric
+        self.n_jobs = n_jobs
+        self.dtype = resolveFloatType(dtype, self.input_list.dtype)
+
+        if cache is None:
+            cache = OPTICSCache()
+
+        elif isinstance(cache, str):
+
+            if cache != 'global':
+                raise ValueError("Unknown cache '{:s}', use an OPTICSCache, 'global' or None!".format(cache))
+
+            cache = globalCache()
+
+        self.cache = cache
+
+        # Cached values are valid for the same data, metric, index and precision
+        self.data_key = (inputFingerprint(self.input_list), metric, index, np.dtype(self.dtype).str)
+
+
+    def neighborGraph(self, eps):
+        """ Returns the eps-neighborhoods of all points, computing them if needed. If a graph with a larger eps
+            is cached, the neighborhoods are taken from it.
+
+        Arguments:
+            eps: [float] epsilon parameter - maximum distance between points
+
+        Return:
+            (indptr, indices, distances): [tuple of ndarrays] CSR arrays, see cyOPTICS.computeNeighborGraph
+        """
+
+        cached = self.cache.findNearest('graph', self.data_key, eps)
+
+        if cached is None:
+            graph = computeNeighborGraph(self.input_list, eps, index=self.index, metric=self.metric,
+                n_jobs=self.n_jobs, dtype=self.dtype)
+
+        else:
+            graph_eps, graph = cached
+
+            if graph_eps == eps:
+                return graph
+
+            # Drop the edges which are longer than eps
+            graph = filterNeighborGraph(*graph, eps=eps)
+
+        self.cache.put(('graph', self.data_key, eps), graph)
+
+        return graph
+
+
+    def coreDistances(self, eps, min_pts):
+        """ Returns the core distances of all points for the given eps and min_pts, computing them if needed. If
+            the core distances for a larger eps are cached, they are used instead.
+
+        Arguments:
+            eps: [float] epsilon parameter - maximum distance between points
+            min_pts: [int] minimum points in the cluster
+
+        Return:
+            core_distances: [ndarray] core distances, -1 for points which are not core points
+        """
+
+        cached = self.cache.findNearest('core', self.data_key, eps, min_pts)
+
+        if cached is None:
+            indptr, _, distances = self.neighborGraph(eps)
+            core_distances = coreDistancesFromGraph(indptr, distances, min_pts, n_jobs=self.n_jobs)
+            self.cache.put(('core', self.data_key, eps, min_pts), core_distances)
+
+            return core_distances
+
+        core_eps, core_distances = cached
+
+        # Core distances larger than eps are undefined with the smaller eps
+        if core_eps > eps:
+            core_distances = np.where(core_distances <= eps, core_distances, UNDEFINED)
+
+        return core_distances
+
+
+    def run(self, eps, min_pts):
+        """ Runs OPTICS with the given parameters, or returns the cached ordering.
+
+        Arguments:
+            eps: [float] epsilon parameter - maximum distance between points
+            min_pts: [int] minimum points in the cluster
+
+        Return:
+            [OPTICSResult] columnar OPTICS results, see runOPTICS
+        """
+
+        key = ('result', self.data_key, eps, min_pts)
+        result = self.cache.get(key)
+
+        if result is not None:
+            return result
+
+        core_distances = self.coreDistances(eps, min_pts)
+        indptr, indices, distances = self.neighborGraph(eps)
+
+        # Order the points on the neighbor graph
+        result = runCyOPTICSSparse(indptr, indices, distances, eps, min_pts, core_distances=core_distances,
+            n_jobs=self.n_jobs, return_format='columnar', dtype=self.dtype)
+
+        # The graph was computed from the input data, so the result can be saved with its real parameters
+        result.header.update({'metric': self.metric, 'index': self.index, 'input_hash': self.data_key[0]})
+
+        self.cache.put(key, result)
+
+        return result
+
+
+    def sweep(self, eps_values, min_pts_values, t_values=(150, ), w_values=(0.025, ),
+        max_points_ratio_values=(0.5, ), cluster_similarity_threshold_values=(0.7, )):
+        """ Runs OPTICS and the gradient cluster extraction for all combinations of the given parameters.
+            The neighborhoods are computed once for the largest eps, every ordering is computed once for all
+            extraction parameters, and the gradient clusters are found once for all filtering and merging
+            parameters.
+
+        Arguments:
+            eps_values: [list] epsilon values
+            min_pts_values: [list] min_pts values, also used as the minimum size of gradient clusters
+
+        Keyword arguments:
+            t_values: [list] gradient clustering t values in degrees, see gradientClustering
+            w_values: [list] gradient clustering w values, see gradientClustering
+            max_points_ratio_values: [list] maximum cluster sizes as a fraction of all points, see
+                filterLargeClusters
+            cluster_similarity_threshold_values: [list] similarity thresholds for merging clusters, see
+                mergeSimilarClusters
+
+        Return:
+            results: [list] a dictionary for every combination of parameters, with the parameters under the
+                keys 'eps', 'min_pts', 't', 'w', 'max_points_ratio' and 'cluster_similarity_threshold', the
+                OPTICSResult under 'result' and the final clusters under 'clusters', as an array of
+                intervals in the OPTICS ordering (see GradientClustering.clusterIntervals)
+        """
+
+        eps_values = list(eps_values)
+
+        # Compute the neighborhoods and the core distances once for the largest eps, the values for smaller eps
+        # are taken from them
+        if eps_values:
+            for min_pts in min_pts_values:
+                self.coreDistances(max(eps_values), min_pts)
+
+        results = []
+
+        for eps, min_pts in itertools.product(eps_values, min_pts_values):
+
+            result = self.run(eps, min_pts)
+            input_size = len(result)
+
+            for t, w in itertools.product(t_values, w_values):
+
+                clusters = gradientClustering(result.reachability, min_pts, t, w, intervals=True)
+
+                for max_points_ratio, cluster_similarity_threshold in itertools.product(
+                    max_points_ratio_values, cluster_similarity_threshold_values):
+
+                    filtered_clusters = filterLargeClusters(clusters, input_size, max_points_ratio)
+                    filtered_clusters = mergeSimilarClusters(filtered_clusters, cluster_similarity_threshold)
+
+                    results.append({'eps': eps, 'min_pts': min_pts, 't': t, 'w': w,
+                        'max_points_ratio': max_points_ratio,
+                        'cluster_similarity_threshold': cluster_similarity_threshold, 'result': result,
+                        'clusters': filtered_clusters})
+
+        return results
+
+
+
+def sweepOPTICS(input_list, eps_values, min_pts_values, t_values=(150, ), w_values=(0.025, ),
+    max_points_ratio_values=(0.5, ), cluster_similarity_threshold_values=(0.7, ), index='auto',
+    metric='euclidean', n_jobs=1, dtype=None, cache=None):
+    """ Runs OPTICS and the gradient cluster extraction for all combinations of the given parameters, reusing
+        the neighborhoods, core distances and orderings between runs. See
+        OPTICSSweep.sweep for the description of the parameters and the results.
+
+    Arguments:
+        input_list: [ndarray] 2D numpy array containing the input data, or a path to a .npy file with it
+        eps_values: [list] epsilon values
+        min_pts_values: [list] min_pts values
+
+    Keyword arguments:
+        t_values, w_values, max_points_ratio_values, cluster_similarity_threshold_values: [list] cluster
+            extraction parameters, see OPTICSSweep.sweep
+        index, metric, n_jobs, dtype: see runOPTICS
+        cache: [OPTICSCache or str] cache of the results, which can be reused by later sweeps of the same data,
+            or 'global' for the process-wide cache. None uses a new cache which is freed after the call
+            (default).
+
+    Return:
+        results: [list] a dictionary for every combination of parameters, see OPTICSSweep.sweep
+    """
+
+    optics_sweep = OPTICSSweep(input_list, index=index, metric=metric, n_jobs=n_jobs, dtype=dtype,
+        cache=cache)
+
+    return optics_sweep.sweep(eps_values, min_pts_values, t_values=t_values, w_values=w_values,
+        max_points_ratio_values=max_points_ratio_values,
+        cluster_similarity_threshold_values=cluster_similarity_threshold_values)
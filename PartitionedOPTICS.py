@@ -0,0 +1,383 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" OPTICS on spatial tiles of the data in a pool of processes.
+
+The data is split into slabs along its widest dimension, with equal numbers of points. Every slab gets a halo
+of the points which are within eps of it along that dimension, so the eps-neighborhoods of all points in the
+slab can be found among the points of the slab and its halo. The processes read the input data from shared
+memory, build a spatial index on their slab and its halo, and compute the neighborhoods and the core distances
+of the points in the slab, which is most of the work of OPTICS.
+
+The neighborhoods of all slabs are then stitched into one neighbor graph, and the points are ordered from it in
+the main process. The ordering itself is sequential, as every step depends on all previous ones, so stitching
+the orderings of separate tiles would not give the same result. Ordering the stitched graph does, and it only
+reads the neighborhoods from memory.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Compiled extension, the spatial indices are not available in the NumPy implementation
+from OPTICSExtension import loadExtension
+loadExtension('cyOPTICS', required=True)
+from cyOPTICS import buildIndex, queryNeighborhoods, coreDistancesFromGraph, runCyOPTICSSparse, \
+    resolveFloatType, loadInput, checkReturnFormat, METRICS, INT_TYPE
+
+
+# Metrics whose distances are never smaller than the difference of the coordinates along any dimension, so the
+# halo of a tile can be selected by one coordinate. The value converts eps to the halo width.
+PARTITION_METRICS = {
+    'euclidean': lambda eps: eps,
+    'sqeuclidean': lambda eps: np.sqrt(eps),
+    'manhattan': lambda eps: eps,
+    'chebyshev': lambda eps: eps
+}
+
+# Relative margin added to the halo width, so that no neighbors are missed due to rounding of the distances
+HALO_MARGIN = 1e-6
+
+# Number of dimensions by which the points of a tile are sorted into cells before the neighbor queries
+SORTED_DIMENSIONS = 3
+
+
+
+def tileBounds(coordinate, n_tiles):
+    """ Splits the range of values of one coordinate into tiles with equal numbers of points.
+
+    Arguments:
+        coordinate: [ndarray] values of the coordinate of all points
+        n_tiles: [int] number of tiles
+
+    Return:
+        bounds: [ndarray] n_tiles + 1 bounds of the tiles, the tile k contains the points with the coordinate
+            between bounds[k] (included) and bounds[k + 1] (not included). The outer bounds are infinite.
+    """
+
+    bounds = np.quantile(coordinate, np.linspace(0, 1, n_tiles + 1))
+    bounds[0] = -np.inf
+    bounds[-1] = np.inf
+
+    return bounds
+
+
+
+def shareArrays(arrays):
+    """ Copies arrays into a new shared memory block, so they can be passed to another process without 
+        pickling them. The block has to be unlinked by the receiving process.
+
+    Arguments:
+        arrays: [list] numpy arrays
+
+    Return:
+        (memory_name, layout): name of the shared memory block, and the (dtype, shape) of every array
+    """
+
+    memory = shared_memory.SharedMemory(create=True, size=max(sum(array.nbytes for array in arrays), 1))
+    layout = []
+
+    offset = 0
+    for array in arrays:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf, offset=offset)[...] = array
+        layout.append((array.dtype, array.shape))
+        offset += array.nbytes
+
+    memory.close()
+
+    return memory.name, layout
+
+
+
+def viewArrays(memory, layout):
+    """ Returns views of the arrays stored in a shared memory block by shareArrays.
+
+    Arguments:
+        memory: [SharedMemory] shared memory block
+        layout: [list] (dtype, shape) of every array
+
+    Return:
+        [list] numpy arrays, they have to be released before the memory block is closed
+    """
+
+    arrays = []
+
+    offset = 0
+    for dtype, shape in layout:
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset))
+        offset += arrays[-1].nbytes
+
+    return arrays
+
+
+
+def spatialOrder(points, width):
+    """ Returns the order of points sorted by cells of the given width in the first SORTED_DIMENSIONS 
+        dimensions. Points which are close together are then also close in memory, which makes the neighbor 
+        queries several times faster than in a random order.
+
+    Arguments:
+        points: [ndarray] 2D numpy array containing the coordinates of points
+        width: [float] width of the cells
+
+    Return:
+        [ndarray] indices of the points in the sorted order
+    """
+
+    cells = np.floor(points[:, :SORTED_DIMENSIONS]/width) if width > 0 else points[:, :SORTED_DIMENSIONS]
+
+    # The first dimension is the primary sort key
+    return np.lexsort(cells.T[::-1])
+
+
+
+def tileNeighborhoods(task):
+    """ Computes the eps-neighborhoods and core distances of the points in one tile. This runs in the worker
+        processes, which read the input data from shared memory.
+
+    Arguments:
+        task: [tuple] (memory_name, shape, dtype, dim, lower, upper, halo, eps, min_pts, index, metric)
+            - memory_name: [str] name of the shared memory block with the C-ordered input data
+            - shape, dtype: shape and type of the input data
+            - dim: [int] dimension along which the data is split
+            - lower, upper: [float] bounds of the tile, see tileBounds
+            - halo: [float] width of the halo around the tile
+            - eps, min_pts, index, metric: OPTICS parameters, see runOPTICS
+
+    Return:
+        (memory_name, layout): shared memory block with the arrays (rows, indptr, indices, distances,
+            core_distances), see shareArrays. These are the indices of the points of the tile in the input data
+            (sorted into cells, see spatialOrder), their neighborhoods in the CSR format with neighbor indices
+            in the input data, and their core distances.
+    """
+
+    memory_name, shape, dtype, dim, lower, upper, halo, eps, min_pts, index, metric = task
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+
+    try:
+        points = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        coordinate = points[:, dim]
+
+        # Select the points of the tile and its halo
+        local_rows = np.flatnonzero((coordinate >= lower - halo) & (coordinate <= upper + halo))
+        local_points = points[local_rows]
+
+        # The views of the shared memory have to be released before it is closed
+        del points, coordinate
+
+    finally:
+        memory.close()
+
+    # Sort the points into cells
+    order = spatialOrder(local_points, halo)
+    local_rows = local_rows[order]
+    local_points = np.ascontiguousarray(local_points[order])
+
+    # Find the points of the tile
+    local_ids = np.flatnonzero((local_points[:, dim] >= lower) & (local_points[:, dim] < upper))
+    rows = local_rows[local_ids]
+
+    if not len(rows):
+        return shareArrays([rows, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=INT_TYPE),
+            np.zeros(0, dtype=dtype), np.zeros(0, dtype=dtype)])
+
+    # Find the neighbors of the points of the tile among the points of the tile and its halo
+    spatial_index = buildIndex(local_points, eps, index=index, metric=metric)
+
+    indptr, indices, distances = queryNeighborhoods(spatial_index, local_points, local_points[local_ids],
+        skip=local_ids)
+
+    core_distances = coreDistancesFromGraph(indptr, distances, min_pts)
+
+    # The neighborhoods are returned in shared memory, as pickling them is slower than computing them
+    return shareArrays([rows, indptr, local_rows[indices].astype(INT_TYPE), distances, core_distances])
+
+
+
+def stitchNeighborhoods(size, tiles):
+    """ Joins the neighborhoods of the tiles into the neighbor graph of all points.
+
+    Arguments:
+        size: [int] number of all points
+        tiles: [list] results of tileNeighborhoods for all tiles, every point is in exactly one tile
+
+    Return:
+        (indptr, indices, distances, core_distances): neighbor graph of all points in the CSR format, and the
+            core distances of all points
+    """
+
+    rows = np.concatenate([tile[0] for tile in tiles])
+    counts = np.concatenate([np.diff(tile[1]) for tile in tiles])
+    indices = np.concatenate([tile[2] for tile in tiles])
+    distances = np.concatenate([tile[3] for tile in tiles])
+
+    core_distances = np.zeros(size, dtype=distances.dtype)
+    core_distances[rows] = np.concatenate([tile[4] for tile in tiles])
+
+    # Compute the row offsets of the graph of all points
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    indptr[rows + 1] = counts
+    np.cumsum(indptr, out=indptr)
+
+    # Move every row of the tiles to its place in the graph
+    source_offsets = np.zeros(len(rows), dtype=np.int64)
+    np.cumsum(counts[:-1], out=source_offsets[1:])
+
+    targets = np.arange(len(indices), dtype=np.int64) + np.repeat(indptr[rows] - source_offsets, counts)
+
+    graph_indices = np.zeros(len(indices), dtype=INT_TYPE)
+    graph_distances = np.zeros(len(distances), dtype=distances.dtype)
+    graph_indices[targets] = indices
+    graph_distances[targets] = distances
+
+    return indptr, graph_indices, graph_distances, core_distances
+
+
+
+def runPartitionedOPTICS(input_list, eps, min_pts, n_processes=None, n_tiles=None, index='auto',
+    metric='euclidean', return_format='point_list', output_dir=None, dtype=None):
+    """ Runs OPTICS with the neighborhoods computed on spatial tiles of the data in a pool of processes. The
+        result is identical to the result of runOPTICS with the same arguments.
+
+    Arguments:
+        input_list: [ndarray] 2D numpy array containing the input data, or a path to a .npy file with it
+        eps: [float] epsilon parameter - maximum distance between points
+        min_pts: [int] minimum points in the cluster
+
+    Keyword arguments:
+        n_processes: [int] number of processes, None uses all cores (default)
+        n_tiles: [int] number of tiles, None uses one tile per process (default)
+        index: [str] spatial index used in every tile, see runOPTICS
+        metric: [str] distance metric, one of the PARTITION_METRICS, see runOPTICS
+        return_format: [str] 'point_list' (default) or 'columnar', see runOPTICS
+        output_dir: [str] directory for memory-mapped output files, see runOPTICS
+        dtype: [dtype] np.float32 or np.float64, precision of the computation, see runOPTICS
+
+    Return:
+        The same as runOPTICS. All neighborhoods are kept in memory during the ordering, as with runOPTICS
+        with n_jobs > 1.
+    """
+
+    checkReturnFormat(return_format)
+
+    if metric not in METRICS:
+        raise ValueError("Unknown metric '{:s}', use one of: {:s}".format(str(metric), ', '.join(METRICS)))
+
+    if metric not in PARTITION_METRICS:
+        raise ValueError("The '{:s}' metric cannot be partitioned, use one of: {:s}".format(metric,
+            ', '.join(PARTITION_METRICS)))
+
+    if min_pts < 2:
+        raise ValueError('min_pts must be at least 2!')
+
+    input_list = np.asarray(loadInput(input_list))
+
+    if input_list.ndim != 2:
+        raise ValueError('The input data must be a 2D array!')
+
+    dtype = resolveFloatType(dtype, input_list.dtype)
+    input_list_size = input_list.shape[0]
+
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+
+    if n_tiles is None:
+        n_tiles = n_processes
+
+    n_tiles = max(min(n_tiles, input_list_size), 1)
+
+    # Copy the data into shared memory, from which the processes read it
+    memory = shared_memory.SharedMemory(create=True, size=max(input_list_size*input_list.shape[1]*dtype.itemsize,
+        1))
+
+    try:
+        points = np.ndarray(input_list.shape, dtype=dtype, buffer=memory.buf)
+        points[:] = input_list
+
+        # Split the data along the dimension with the largest extent
+        dim = 0
+        if input_list_size and input_list.shape[1]:
+            dim = int(np.argmax(np.max(points, axis=0) - np.min(points, axis=0)))
+
+        bounds = tileBounds(points[:, dim], n_tiles) if input_list_size else np.array([-np.inf, np.inf])
+
+        # The views of the shared memory have to be released before it is closed
+        del points
+
+        width = PARTITION_METRICS[metric](eps)
+        halo = width + abs(width)*HALO_MARGIN
+
+        tasks = [(memory.name, input_list.shape, dtype, dim, bounds[k], bounds[k + 1], halo, eps, min_pts,
+            index, metric) for k in range(len(bounds) - 1)]
+
+        # Compute the neighborhoods of the tiles
+        if n_processes > 1:
+
+            pool = multiprocessing.Pool(min(n_processes, len(tasks)))
+
+            try:
+                shared_tiles = pool.map(tileNeighborhoods, tasks, chunksize=1)
+
+            finally:
+                pool.close()
+                pool.join()
+
+        else:
+            shared_tiles = [tileNeighborhoods(task) for task in tasks]
+
+    finally:
+        memory.close()
+        memory.unlink()
+
+    memories = [shared_memory.SharedMemory(name=memory_name) for memory_name, _ in shared_tiles]
+
+    # Stitch the neighborhoods of the tiles, and free their shared memory
+    try:
+        tiles = [viewArrays(memory, layout) for memory, (_, layout) in zip(memories, shared_tiles)]
+        indptr, indices, distances, core_distances = stitchNeighborhoods(input_list_size, tiles)
+        del tiles
+
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    # Order the points from the stitched neighbor graph
+    result = runCyOPTICSSparse(indptr, indices, distances, eps, min_pts, core_distances=core_distances,
+        return_format='columnar', output_dir=output_dir if return_format == 'columnar' else None, dtype=dtype)
+
+    if return_format == 'columnar':
+
+        result.header = {'eps': eps, 'min_pts': min_pts, 'metric': metric, 'index': index}
+
+        if output_dir is not None:
+            result.save(output_dir, input_list=input_list)
+
+        return result
+
+    return result.toPointList(np.asarray(input_list, dtype=dtype), output_dir=output_dir)
@@ -0,0 +1,140 @@
+""" Benchmark of runApproximateOPTICS. Runs the exact and the approximate OPTICS on Gaussian blobs with uniform
+noise, extracts the clusters from both with the same parameters, and reports the speedup and the agreement of
+the cluster labels of the points (the adjusted Rand index, 1 for identical clusterings, about 0 for random 
+ones).
+
+    python benchmarks/benchmarkApproximate.py --sizes 100000 1000000 --resolutions 1 2 4
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Import the modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from runOPTICS import runOPTICS
+from ApproximateOPTICS import runApproximateOPTICS
+from GradientClustering import gradientClustering, filterLargeClusters, mergeSimilarClusters, clusterLabels
+
+
+# Fraction of the points which are uniform noise
+NOISE_FRACTION = 0.1
+
+
+
+def generateData(n_points, dims, n_centers, side):
+    """ Generates Gaussian blobs with different spreads and uniform noise in a box. """
+
+    n_noise = int(n_points*NOISE_FRACTION)
+    n_blobs = n_points - n_noise
+
+    centers = np.random.uniform(0, side, (n_centers, dims))
+    spreads = np.random.uniform(0.2, 1.5, n_centers)
+
+    choice = np.random.randint(0, n_centers, n_blobs)
+    blobs = centers[choice] + np.random.normal(0, 1, (n_blobs, dims))*spreads[choice, np.newaxis]
+
+    return np.vstack([blobs, np.random.uniform(0, side, (n_noise, dims))])
+
+
+
+def extractLabels(result, min_pts, args):
+    """ Extracts the clusters from the result and returns the cluster labels of the points. """
+
+    clusters = gradientClustering(result.reachability, min_pts, args.t, args.w, intervals=True)
+    clusters = filterLargeClusters(clusters, len(result), args.max_points_ratio)
+    clusters = mergeSimilarClusters(clusters, args.similarity)
+
+    return clusterLabels(clusters, result), len(clusters)
+
+
+
+def adjustedRandIndex(labels1, labels2):
+    """ Computes the adjusted Rand index of two labelings of the same points. Noise (-1) is treated as one 
+        more label.
+    """
+
+    _, labels1 = np.unique(labels1, return_inverse=True)
+    _, labels2 = np.unique(labels2, return_inverse=True)
+
+    labels1 = labels1.reshape(-1).astype(np.int64)
+    labels2 = labels2.reshape(-1).astype(np.int64)
+
+    # Contingency table of the labels, only its non-zero entries are kept
+    _, contingency = np.unique(labels1*(labels2.max() + 1) + labels2, return_counts=True)
+
+    def pairs(counts):
+        counts = np.asarray(counts, dtype=np.float64)
+        return np.sum(counts*(counts - 1)/2)
+
+    index = pairs(contingency)
+    rows = pairs(np.bincount(labels1))
+    columns = pairs(np.bincount(labels2))
+
+    expected = rows*columns/pairs([len(labels1)]) if len(labels1) > 1 else 0
+    maximum = (rows + columns)/2
+
+    if maximum == expected:
+        return 1.0
+
+    return (index - expected)/(maximum - expected)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 300000], help='Numbers of points.')
+    parser.add_argument('--dims', type=int, default=2, help='Number of dimensions.')
+    parser.add_argument('--resolutions', type=float, nargs='+', default=[1, 2, 4],
+        help='Numbers of grid cells per eps of the approximate OPTICS.')
+    parser.add_argument('--points_per_center', type=int, default=2000, help='Average size of a blob.')
+    parser.add_argument('--eps', type=float, default=0.5, help='Epsilon parameter.')
+    parser.add_argument('--min_pts', type=int, default=20, help='Minimum number of points.')
+    parser.add_argument('--t', type=float, default=150, help='Minimum inflection angle in degrees.')
+    parser.add_argument('--w', type=float, default=0.025, help='Distance between points in the plot.')
+    parser.add_argument('--max_points_ratio', type=float, default=0.5, help='Largest cluster fraction.')
+    parser.add_argument('--similarity', type=float, default=0.7, help='Cluster similarity threshold.')
+    args = parser.parse_args()
+
+    print('{:>10s} {:>11s} {:>10s} {:>10s} {:>10s} {:>9s} {:>9s} {:>10s}'.format('Points', 'Resolution',
+        'Bubbles', 'Exact [s]', 'Approx [s]', 'Speedup', 'Clusters', 'Agreement'))
+
+    for n_points in args.sizes:
+
+        np.random.seed(0)
+
+        # The blobs are spread over a box which keeps the density of the noise the same for all sizes
+        n_centers = max(n_points//args.points_per_center, 1)
+        side = 10*n_centers**(1.0/args.dims)
+        input_data = generateData(n_points, args.dims, n_centers, side)
+
+        t1 = time.perf_counter()
+        exact_result = runOPTICS(input_data, args.eps, args.min_pts, return_format='columnar')
+        exact_time = time.perf_counter() - t1
+
+        exact_labels, exact_clusters = extractLabels(exact_result, args.min_pts, args)
+
+        for resolution in args.resolutions:
+
+            t1 = time.perf_counter()
+            result = runApproximateOPTICS(input_data, args.eps, args.min_pts, resolution=resolution,
+                return_format='columnar')
+            approximate_time = time.perf_counter() - t1
+
+            labels, clusters = extractLabels(result, args.min_pts, args)
+
+            # Number of bubbles, i.e. of non-empty grid cells
+            cells = np.floor((input_data - np.min(input_data, axis=0))*resolution/args.eps).astype(np.int64)
+            bubbles = len(np.unique(cells, axis=0))
+
+            print('{:10d} {:11.2f} {:10d} {:10.3f} {:10.3f} {:9.1f} {:>9s} {:10.3f}'.format(n_points,
+                resolution, bubbles, exact_time, approximate_time, exact_time/approximate_time,
+                '{:d}/{:d}'.format(clusters, exact_clusters), adjustedRandIndex(labels, exact_labels)))
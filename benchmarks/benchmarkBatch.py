@@ -0,0 +1,94 @@
+""" Benchmark of runBatchOPTICS. Clusters many small data sets one by one with runOPTICS and the gradient 
+clustering, and with runBatchOPTICS in one thread and in a pool of threads. All labels have to be identical.
+
+    python benchmarks/benchmarkBatch.py --sets 5000 --min_size 30 --max_size 200 --workers 4
+    python benchmarks/benchmarkBatch.py --sets 300 --min_size 200 --max_size 2000 --workers 4
+
+The batch tasks run without the GIL, so the speedup of the threads needs as many cores as threads.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Import the modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from runOPTICS import runOPTICS
+from BatchOPTICS import runBatchOPTICS
+from GradientClustering import gradientClustering, filterLargeClusters, mergeSimilarClusters, clusterLabels
+
+
+
+def clusterLoop(data_sets, eps, min_pts):
+    """ Clusters the data sets one by one, and returns the labels of all points. """
+
+    labels = []
+
+    for data_set in data_sets:
+
+        result = runOPTICS(data_set, eps, min_pts, return_format='columnar')
+
+        clusters = gradientClustering(result.reachability, min_pts, 150, 0.025, intervals=True)
+        clusters = filterLargeClusters(clusters, len(data_set), 0.5)
+        clusters = mergeSimilarClusters(clusters, 0.7)
+
+        labels.append(clusterLabels(clusters, result.ordering))
+
+    return np.concatenate(labels)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sets', type=int, default=5000, help='Number of data sets.')
+    parser.add_argument('--min_size', type=int, default=30, help='Minimum number of points in a data set.')
+    parser.add_argument('--max_size', type=int, default=200, help='Maximum number of points in a data set.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, 
+        help='Number of threads.')
+    parser.add_argument('--eps', type=float, default=0.3, help='Epsilon parameter.')
+    parser.add_argument('--min_pts', type=int, default=5, help='Minimum number of points.')
+    args = parser.parse_args()
+
+    np.random.seed(0)
+
+    # Every data set has a few blobs
+    data_sets = []
+    for _ in range(args.sets):
+        size = np.random.randint(args.min_size, args.max_size + 1)
+        centers = np.random.uniform(0, 5, (3, 2))
+        data_sets.append(centers[np.random.randint(0, len(centers), size)] + np.random.normal(0, 0.3, 
+            (size, 2)))
+
+    print('{:d} data sets, {:d} points, {:d} cores'.format(len(data_sets), sum(map(len, data_sets)), 
+        os.cpu_count() or 1))
+
+    t1 = time.perf_counter()
+    expected = clusterLoop(data_sets, args.eps, args.min_pts)
+    loop_time = time.perf_counter() - t1
+
+    print('{:>20s} {:>10s} {:>10s} {:>10s}'.format('Method', 'Time [s]', 'Speedup', 'Identical'))
+    print('{:>20s} {:10.3f} {:10.2f} {:>10s}'.format('loop', loop_time, 1.0, 'True'))
+
+    runs = [('batch', {}), ('batch threads', {'n_jobs': args.workers})]
+
+    for name, kwargs in runs:
+
+        t1 = time.perf_counter()
+        batch = runBatchOPTICS(data_sets, args.eps, args.min_pts, **kwargs)
+        batch_time = time.perf_counter() - t1
+
+        identical = np.array_equal(batch.labels, expected)
+
+        print('{:>20s} {:10.3f} {:10.2f} {:>10s}'.format(name, batch_time, loop_time/batch_time, 
+            str(identical)))
+
+        if not identical:
+            sys.exit('The batch labels differ from the loop!')
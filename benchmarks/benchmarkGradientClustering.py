@@ -0,0 +1,221 @@
+""" Benchmark of the gradient cluster extraction and merging. Compares gradientClustering and 
+mergeSimilarClusters with the original pure-Python implementations, and checks that both return the same 
+clusters. The original merging is quadratic in the number of clusters, so only the first --merge_clusters
+clusters are merged.
+
+    python benchmarks/benchmarkGradientClustering.py --sizes 10000 100000 1000000
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import copy
+import time
+import argparse
+
+import numpy as np
+
+# Import the modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from GradientClustering import gradientClustering, mergeSimilarClusters, inflectionIndex, gradientDeterminant, \
+    UNDEFINED, NEW_UNDEFINED
+
+
+
+def gradientClusteringLoop(reach_list, min_pts, t, w):
+    """ The original implementation of gradientClustering, which checks one point at a time. """
+
+    reach_list = np.array(reach_list)
+    reach_list[reach_list == UNDEFINED] = NEW_UNDEFINED
+
+    t = np.cos(np.radians(t))
+
+    reach_list_size = len(reach_list)
+    last_endpoint = reach_list_size - 1
+
+    start_pts = [0]
+    set_of_clusters = []
+    curr_cluster = []
+
+    for i in range(1, reach_list_size - 1):
+
+        if inflectionIndex(reach_list, i, w) > t:
+
+            if gradientDeterminant(reach_list, i, w) > 0:
+
+                if len(curr_cluster) >= min_pts:
+                    set_of_clusters.append(curr_cluster)
+
+                curr_cluster = []
+
+                if start_pts:
+                    if reach_list[start_pts[-1]] <= reach_list[i]:
+                        start_pts.pop()
+
+                if start_pts:
+
+                    while reach_list[start_pts[-1]] < reach_list[i]:
+
+                        temp_cluster = range(start_pts[-1], last_endpoint)
+
+                        if len(temp_cluster) >= min_pts:
+                            set_of_clusters.append(temp_cluster)
+
+                        start_pts.pop()
+
+                    temp_cluster = range(start_pts[-1], last_endpoint)
+
+                    if len(temp_cluster) >= min_pts:
+                        set_of_clusters.append(temp_cluster)
+
+                if reach_list[i+1] < reach_list[i]:
+                    start_pts.append(i)
+
+            else:
+
+                if reach_list[i+1] > reach_list[i]:
+                    last_endpoint = i + 1
+                    curr_cluster = range(start_pts[-1], last_endpoint)
+
+    while start_pts:
+
+        curr_cluster = range(start_pts[-1], reach_list_size)
+
+        if (reach_list[start_pts[-1]] > reach_list[-1]) and (len(curr_cluster) >= min_pts):
+            set_of_clusters.append(curr_cluster)
+
+        start_pts.pop()
+
+    return set_of_clusters
+
+
+
+def mergeSimilarClustersLoop(clusters, similarity_threshold):
+    """ The original implementation of mergeSimilarClusters, which compares all pairs of clusters as sets. """
+
+    clusters = list(reversed(sorted(clusters, key=len)))
+
+    previous_iteration_clusters = clusters
+    merged_clusters = []
+
+    while len(previous_iteration_clusters) != len(merged_clusters):
+
+        clusters = list(reversed(sorted(clusters, key=len)))
+
+        skip_list = []
+
+        previous_iteration_clusters = copy.deepcopy(merged_clusters)
+
+        merged_clusters = []
+
+        for i, cluster1 in enumerate(clusters):
+
+            if i in skip_list:
+                continue
+
+            found_similar = False
+            for j, cluster2 in enumerate(clusters):
+
+                if j <= i:
+                    continue
+
+                if j in skip_list:
+                    continue
+
+                intersect_points = len(set(cluster1).intersection(cluster2))
+
+                if len(cluster1) > len(cluster2):
+                    bigger_size = len(cluster1)
+                else:
+                    bigger_size = len(cluster2)
+
+                if (intersect_points >= similarity_threshold*bigger_size):
+
+                    new_merged_cluster = sorted(list(set(set(cluster1) | set(cluster2))))
+
+                    merged_clusters.append(new_merged_cluster)
+
+                    skip_list.append(j)
+
+                    found_similar = True
+
+                    break
+
+            if not found_similar:
+                merged_clusters.append(cluster1)
+
+        clusters = copy.deepcopy(merged_clusters)
+
+    clusters = list(reversed(sorted(clusters, key=len)))
+
+    return clusters
+
+
+
+def generateReachability(n_points, n_valleys=50):
+    """ Generate a reachability plot with nested valleys of different depths and a noisy floor. """
+
+    np.random.seed(0)
+
+    x = np.linspace(0, n_valleys*np.pi, n_points)
+
+    reach_list = 1.0 + 0.5*np.sin(x) + 0.3*np.sin(7.3*x) + 0.05*np.random.rand(n_points)
+
+    # Mark the beginnings of a few clusters as undefined
+    reach_list[0] = UNDEFINED
+    reach_list[np.random.randint(0, n_points, n_valleys//5)] = UNDEFINED
+
+    return reach_list
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+        help='Numbers of points in the reachability plot.')
+    parser.add_argument('--min_pts', type=int, default=40, help='Minimum number of points in a cluster.')
+    parser.add_argument('--t', type=float, default=150, help='Minimum inflection angle in degrees.')
+    parser.add_argument('--w', type=float, default=0.025, help='Distance between points in the plot.')
+    parser.add_argument('--similarity', type=float, default=0.7, help='Cluster similarity threshold.')
+    parser.add_argument('--merge_clusters', type=int, default=2000, 
+        help='Number of clusters merged by both implementations.')
+    args = parser.parse_args()
+
+    print('{:>10s} {:>12s} {:>12s} {:>10s} {:>12s} {:>12s} {:>10s}'.format('Points', 'Loop [s]', 
+        'Vector [s]', 'Clusters', 'Merge [s]', 'Fast [s]', 'Identical'))
+
+    for n_points in args.sizes:
+
+        reach_list = generateReachability(n_points)
+
+        t1 = time.perf_counter()
+        loop_clusters = gradientClusteringLoop(reach_list, args.min_pts, args.t, args.w)
+        loop_time = time.perf_counter() - t1
+
+        t1 = time.perf_counter()
+        clusters = gradientClustering(reach_list, args.min_pts, args.t, args.w)
+        vector_time = time.perf_counter() - t1
+
+        # Merge the first clusters with both implementations
+        merge_clusters = clusters[:args.merge_clusters]
+
+        t1 = time.perf_counter()
+        loop_merged = mergeSimilarClustersLoop(merge_clusters, args.similarity)
+        merge_time = time.perf_counter() - t1
+
+        t1 = time.perf_counter()
+        merged = mergeSimilarClusters(merge_clusters, args.similarity)
+        fast_merge_time = time.perf_counter() - t1
+
+        # Clusters are ranges, which are compared without expanding them
+        identical = (clusters == loop_clusters) and (merged == loop_merged)
+
+        print('{:10d} {:12.4f} {:12.4f} {:10d} {:12.4f} {:12.4f} {:>10s}'.format(n_points, loop_time, 
+            vector_time, len(clusters), merge_time, fast_merge_time, str(identical)))
+
+        if not identical:
+            sys.exit('The clusters differ from the original implementation!')
@@ -0,0 +1,92 @@
+""" Benchmark of IncrementalOPTICS. Applies batches of inserted and deleted points to a base data set, and
+compares the time of every update with a full runOPTICS on the updated data. Both results have to be
+identical. Repaired is the number of points which were ordered again. The changes can be spread over all 
+clusters, or limited to a few of them with --clusters, in which case only those clusters are ordered again.
+
+    python benchmarks/benchmarkIncremental.py --size 300000 --insert 300 --delete 100 --batches 5
+    python benchmarks/benchmarkIncremental.py --size 300000 --insert 300 --delete 100 --clusters 2
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Import the modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from runOPTICS import runOPTICS
+from IncrementalOPTICS import IncrementalOPTICS
+from OPTICSResult import RESULT_ARRAYS
+
+
+
+def generateBlobs(n_points, centers, std=1.0):
+    """ Generate points around randomly chosen centers. """
+
+    return centers[np.random.randint(0, len(centers), n_points)] + np.random.normal(0, std, (n_points,
+        centers.shape[1]))
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help='Number of points in the base data set.')
+    parser.add_argument('--insert', type=int, default=300, help='Number of inserted points per batch.')
+    parser.add_argument('--delete', type=int, default=100, help='Number of deleted points per batch.')
+    parser.add_argument('--batches', type=int, default=5, help='Number of batches.')
+    parser.add_argument('--clusters', type=int, default=None, 
+        help='Number of clusters in which the points are inserted and deleted, all by default.')
+    parser.add_argument('--eps', type=float, default=0.3, help='Epsilon parameter.')
+    parser.add_argument('--min_pts', type=int, default=10, help='Minimum number of points.')
+    args = parser.parse_args()
+
+    np.random.seed(0)
+
+    centers = np.random.uniform(0, 100, (200, 2))
+    input_data = generateBlobs(args.size, centers)
+
+    # Clusters which are changed by the batches
+    changed_centers = centers[:args.clusters] if args.clusters else centers
+
+    t1 = time.perf_counter()
+    incremental = IncrementalOPTICS(input_data, args.eps, args.min_pts)
+    print('Initial run: {:.3f} s'.format(time.perf_counter() - t1))
+
+    print('{:>6s} {:>10s} {:>12s} {:>12s} {:>10s} {:>10s}'.format('Batch', 'Points', 'Update [s]', 'Full [s]',
+        'Repaired', 'Identical'))
+
+    for batch in range(args.batches):
+
+        inserted = generateBlobs(args.insert, changed_centers)
+
+        # Delete points near the changed clusters
+        nearest = np.min(np.linalg.norm(input_data[:, None] - changed_centers[None], axis=2), axis=1) \
+            if args.clusters else np.zeros(len(input_data))
+        candidates = np.flatnonzero(nearest < 2.0)
+        deleted = np.random.choice(candidates, min(args.delete, len(candidates)), replace=False)
+
+        t1 = time.perf_counter()
+        result = incremental.update(insert=inserted, delete=deleted)
+        update_time = time.perf_counter() - t1
+
+        input_data = np.concatenate([np.delete(input_data, deleted, axis=0), inserted])
+
+        t1 = time.perf_counter()
+        full_result = runOPTICS(input_data, args.eps, args.min_pts, return_format='columnar')
+        full_time = time.perf_counter() - t1
+
+        identical = all(np.array_equal(getattr(result, name), getattr(full_result, name))
+            for name in RESULT_ARRAYS)
+
+        print('{:6d} {:10d} {:12.4f} {:12.4f} {:10d} {:>10s}'.format(batch, len(input_data), update_time,
+            full_time, incremental.repaired, str(identical)))
+
+        if not identical:
+            sys.exit('The incremental result differs from the full run!')
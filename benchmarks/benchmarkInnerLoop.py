@@ -0,0 +1,117 @@
+""" Microbenchmark of the OPTICS inner loop (neighbor search, core distance and seed update). Reports the 
+wall time and the number of NumPy allocations made by cyOPTICS during a single runOPTICS call. 
+
+Run it on two revisions of cyOPTICS.pyx to compare them, e.g.:
+
+    python benchmarks/benchmarkInnerLoop.py --sizes 1000 5000 20000
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+# Import the modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from runOPTICS import runOPTICS, sampleGaussian
+from OPTICSExtension import loadExtension
+cyOPTICS = loadExtension('cyOPTICS', required=True)
+
+
+class AllocationCounter(object):
+    """ Stands in for the numpy module inside cyOPTICS and counts the calls of numpy functions. """
+
+    def __init__(self, module):
+
+        self.module = module
+        self.count = 0
+
+
+    def __getattr__(self, name):
+
+        attr = getattr(self.module, name)
+
+        # Only count function calls, pass through types and constants
+        if not callable(attr) or isinstance(attr, type):
+            return attr
+
+        def counted(*args, **kwargs):
+            self.count += 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+
+def generateData(n_points):
+    """ Generate a few Gaussian point sources with the given total number of points. """
+
+    np.random.seed(0)
+
+    sources = [(-5, 6, 2.3), (-5, 6, 0.05), (-5, 2, 0.4), (8, 5, 0.3), (4, -1, 0.1), (1, -2, 0.2), 
+        (3, -2, 2.0)]
+
+    n_source = n_points//len(sources)
+
+    data = [sampleGaussian(x, y, std, std, n_source) for x, y, std in sources]
+    data.append(sampleGaussian(0, 0, 1.0, 1.0, n_points - n_source*len(sources)))
+
+    return np.vstack(data)
+
+
+
+def benchmark(input_data, eps, min_pts, index):
+    """ Run OPTICS and return the wall time, the number of numpy calls in cyOPTICS and the peak traced 
+        memory. The time is measured on a separate run, as tracing slows down the allocations.
+    """
+
+    # Measure the wall time
+    t1 = time.perf_counter()
+    runOPTICS(input_data, eps, min_pts, index=index)
+    wall_time = time.perf_counter() - t1
+
+    counter = AllocationCounter(np)
+
+    # Replace the numpy module in cyOPTICS with the counting one and trace the memory
+    cyOPTICS.np = counter
+    tracemalloc.start()
+
+    try:
+        runOPTICS(input_data, eps, min_pts, index=index)
+        _, peak = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+        cyOPTICS.np = np
+
+    return wall_time, counter.count, peak
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000], 
+        help='Numbers of input points.')
+    parser.add_argument('--eps', type=float, default=1.0, help='OPTICS epsilon parameter.')
+    parser.add_argument('--min_pts', type=int, default=20, help='OPTICS min_pts parameter.')
+    parser.add_argument('--index', default='grid', help='Spatial index: grid, kdtree or brute.')
+    args = parser.parse_args()
+
+    # Compile and warm up the module
+    runOPTICS(generateData(100), args.eps, args.min_pts, index=args.index)
+
+    print('{:>10s} {:>12s} {:>14s} {:>14s}'.format('Points', 'Time [s]', 'Numpy calls', 'Peak mem [MB]'))
+
+    for n_points in args.sizes:
+
+        wall_time, allocations, peak = benchmark(generateData(n_points), args.eps, args.min_pts, args.index)
+
+        print('{:10d} {:12.4f} {:14d} {:14.2f}'.format(n_points, wall_time, allocations, peak/1024**2))
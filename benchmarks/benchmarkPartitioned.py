@@ -0,0 +1,70 @@
+""" Benchmark of runPartitionedOPTICS. Runs OPTICS on the benchmark data sets in a single process and on
+spatial tiles in a pool of processes, and compares the times. Both results have to be identical.
+
+    python benchmarks/benchmarkPartitioned.py --sizes 5000 20000 --processes 4
+
+The Gaussian sources get very dense with more points, so larger sizes need a lot of memory for the
+neighborhoods.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Import the modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from runOPTICS import runOPTICS
+from PartitionedOPTICS import runPartitionedOPTICS
+from OPTICSResult import RESULT_ARRAYS
+from benchmarkInnerLoop import generateData
+from benchmarkIncremental import generateBlobs
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 20000], help='Numbers of input points.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Number of processes.')
+    parser.add_argument('--tiles', type=int, default=None, help='Number of tiles, one per process by default.')
+    args = parser.parse_args()
+
+    print('{:>10s} {:>10s} {:>12s} {:>16s} {:>10s}'.format('Data', 'Points', 'Single [s]', 'Partitioned [s]',
+        'Identical'))
+
+    for n_points in args.sizes:
+
+        np.random.seed(0)
+        centers = np.random.uniform(0, 100, (200, 2))
+
+        # The Gaussian sources of the inner loop benchmark, and many small blobs
+        data_sets = [('sources', generateData(n_points), 1.0, 20),
+            ('blobs', generateBlobs(n_points, centers), 0.3, 10)]
+
+        for name, input_data, eps, min_pts in data_sets:
+
+            t1 = time.perf_counter()
+            result = runOPTICS(input_data, eps, min_pts, return_format='columnar')
+            single_time = time.perf_counter() - t1
+
+            t1 = time.perf_counter()
+            partitioned_result = runPartitionedOPTICS(input_data, eps, min_pts, n_processes=args.processes,
+                n_tiles=args.tiles, return_format='columnar')
+            partitioned_time = time.perf_counter() - t1
+
+            identical = all(np.array_equal(getattr(result, array), getattr(partitioned_result, array))
+                for array in RESULT_ARRAYS)
+
+            print('{:>10s} {:10d} {:12.4f} {:16.4f} {:>10s}'.format(name, n_points, single_time,
+                partitioned_time, str(identical)))
+
+            if not identical:
+                sys.exit('The partitioned result differs from the single process run!')
@@ -0,0 +1,336 @@
+""" Benchmark suite of the whole clustering procedure on synthetic data sets. Times every stage separately
+(runCyOPTICS, gradientClustering, filterLargeClusters and mergeSimilarClusters), records the peak memory after
+every stage, and writes the results to a JSON file, which can be compared with the results of another revision
+to find regressions, or used to plot the scaling curves.
+
+    python benchmarks/benchmarkSuite.py --sizes 1000 10000 100000 1000000 --dims 2 3 5 --output new.json
+    python benchmarks/benchmarkSuite.py --output new.json --compare old.json
+
+Every data set has an average density of one point per unit volume, and eps is chosen so that a point of
+uniform data has about --neighbors neighbors, so the work per point stays about the same for all sizes and
+dimensions:
+    - gaussian: Gaussian point sources of SOURCE_SIZE points with the spreads of the runOPTICS demo
+    - uniform: uniform noise
+    - dense: Gaussian point sources with small spreads, in which points have hundreds of neighbors
+
+Every case runs in a fresh process, so its peak memory (the maximum resident set size) is not influenced by
+the other cases. The peak memory only grows, so it is the peak of all stages up to and including the given one.
+The reported memory is the peak memory above the memory of the process after importing the modules.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import multiprocessing
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Import the modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from runOPTICS import sampleGaussian
+from OPTICSExtension import loadExtension
+runCyOPTICS = loadExtension('cyOPTICS', required=True).runCyOPTICS
+from GradientClustering import gradientClustering, filterLargeClusters, mergeSimilarClusters
+
+
+# Number of points in a Gaussian point source
+SOURCE_SIZE = 1000
+
+# Spreads of the Gaussian point sources in the runOPTICS demo, relative to eps
+SOURCE_SPREADS = [2.3, 0.05, 0.4, 0.3, 0.1, 0.2, 2.0]
+
+# Spreads of the point sources of the dense data sets, relative to eps
+DENSE_SPREADS = [0.05, 0.1, 0.2, 0.4]
+
+# Stages which run faster than this are not compared, as their times are mostly noise
+MIN_COMPARED_TIME = 0.01
+
+
+
+def ballRadius(volume, dims):
+    """ Returns the radius of a ball with the given volume in the given number of dimensions. """
+
+    return (volume*math.gamma(dims/2.0 + 1)/np.pi**(dims/2.0))**(1.0/dims)
+
+
+
+def generateSources(n_points, dims, eps, spreads):
+    """ Generates Gaussian point sources of SOURCE_SIZE points, with centers spread uniformly over a box which
+        gives the data a density of one point per unit volume.
+
+    Arguments:
+        n_points: [int] number of points
+        dims: [int] number of dimensions
+        eps: [float] eps of the data set, the spreads are relative to it
+        spreads: [list] standard deviations of the sources relative to eps, used in turns
+
+    Return:
+        [ndarray] 2D array of points
+    """
+
+    side = n_points**(1.0/dims)
+    n_sources = max(n_points//SOURCE_SIZE, 1)
+
+    centers = np.random.uniform(0, side, (n_sources, dims))
+    sizes = np.diff(np.linspace(0, n_points, n_sources + 1).astype(np.int64))
+
+    data = []
+
+    for k, (center, size) in enumerate(zip(centers, sizes)):
+
+        std = spreads[k%len(spreads)]*eps
+
+        source = np.random.normal(center, std, (size, dims))
+
+        # The first two coordinates are sampled in the same way as in the demo
+        if dims >= 2:
+            source[:, :2] = sampleGaussian(center[0], center[1], std**2, std**2, size)
+
+        data.append(source)
+
+    return np.vstack(data)
+
+
+
+def generateGaussian(n_points, dims, eps):
+    """ Gaussian point sources with the spreads of the runOPTICS demo. """
+
+    return generateSources(n_points, dims, eps, SOURCE_SPREADS)
+
+
+
+def generateUniform(n_points, dims, eps):
+    """ Uniform noise with a density of one point per unit volume. """
+
+    return np.random.uniform(0, n_points**(1.0/dims), (n_points, dims))
+
+
+
+def generateDense(n_points, dims, eps):
+    """ Gaussian point sources with small spreads, in which points have hundreds of neighbors. """
+
+    return generateSources(n_points, dims, eps, DENSE_SPREADS)
+
+
+
+GENERATORS = {
+    'gaussian': generateGaussian,
+    'uniform': generateUniform,
+    'dense': generateDense
+}
+
+
+
+def peakMemory():
+    """ Returns the peak resident set size of this process in MB, or None if it cannot be measured. """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # The peak is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak/1024.0**2
+
+    return peak/1024.0
+
+
+
+def runCase(case):
+    """ Generates a data set and runs all stages of the clustering on it.
+
+    Arguments:
+        case: [dict] parameters of the case (generator, size, dims, neighbors, min_pts, t, w, max_points_ratio,
+            similarity, index, n_jobs)
+
+    Return:
+        [list] one record per stage with the parameters of the case, the time of the stage, the peak memory
+            after it (peak_memory, and memory above the memory after importing the modules), and the number
+            of clusters after it
+    """
+
+    np.random.seed(0)
+
+    # The memory used by the modules is subtracted from the peak memory
+    base_memory = peakMemory()
+
+    eps = ballRadius(case['neighbors'], case['dims'])
+    input_data = GENERATORS[case['generator']](case['size'], case['dims'], eps)
+
+    data_memory = peakMemory()
+    records = []
+
+    def record(stage, stage_time, clusters=None):
+
+        peak_memory = peakMemory()
+
+        records.append(dict(case, eps=eps, stage=stage, time=stage_time, peak_memory=peak_memory,
+            base_memory=base_memory, data_memory=data_memory, clusters=clusters,
+            memory=peak_memory - base_memory if peak_memory is not None else None))
+
+    t1 = time.perf_counter()
+    result = runCyOPTICS(input_data, eps, case['min_pts'], index=case['index'], n_jobs=case['n_jobs'],
+        return_format='columnar')
+    record('runCyOPTICS', time.perf_counter() - t1)
+
+    t1 = time.perf_counter()
+    clusters = gradientClustering(result.reachability, case['min_pts'], case['t'], case['w'], intervals=True)
+    record('gradientClustering', time.perf_counter() - t1, len(clusters))
+
+    t1 = time.perf_counter()
+    clusters = filterLargeClusters(clusters, len(result), case['max_points_ratio'])
+    record('filterLargeClusters', time.perf_counter() - t1, len(clusters))
+
+    t1 = time.perf_counter()
+    clusters = mergeSimilarClusters(clusters, case['similarity'])
+    record('mergeSimilarClusters', time.perf_counter() - t1, len(clusters))
+
+    return records
+
+
+
+def environment():
+    """ Returns a description of the machine and the versions of the software. """
+
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+
+def compareResults(records, baseline, tolerance):
+    """ Compares the stage times with the times of the same stages in the baseline results.
+
+    Arguments:
+        records: [list] records of the current run
+        baseline: [list] records of the baseline run
+        tolerance: [float] stages which are slower than the baseline by more than this factor are regressions
+
+    Return:
+        regressions: [list] (record, baseline time) of every regression
+    """
+
+    key_names = ['generator', 'size', 'dims', 'neighbors', 'min_pts', 'index', 'n_jobs', 'stage']
+    baseline_times = {tuple(entry[name] for name in key_names): entry['time'] for entry in baseline}
+
+    print()
+    print('{:>10s} {:>10s} {:>5s} {:>22s} {:>12s} {:>12s} {:>8s}'.format('Data', 'Points', 'Dims', 'Stage',
+        'Base [s]', 'Time [s]', 'Ratio'))
+
+    regressions = []
+
+    for entry in records:
+
+        key = tuple(entry[name] for name in key_names)
+
+        if key not in baseline_times:
+            continue
+
+        base_time = baseline_times[key]
+        ratio = entry['time']/base_time if base_time > 0 else float('inf')
+
+        flag = ''
+        if (ratio > tolerance) and (max(base_time, entry['time']) >= MIN_COMPARED_TIME):
+            regressions.append((entry, base_time))
+            flag = ' SLOWER'
+
+        print('{:>10s} {:10d} {:5d} {:>22s} {:12.4f} {:12.4f} {:8.2f}{:s}'.format(entry['generator'],
+            entry['size'], entry['dims'], entry['stage'], base_time, entry['time'], ratio, flag))
+
+    return regressions
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+        help='Numbers of input points, up to 10000000.')
+    parser.add_argument('--dims', type=int, nargs='+', default=[2, 3, 5], help='Numbers of dimensions.')
+    parser.add_argument('--generators', nargs='+', default=sorted(GENERATORS), choices=sorted(GENERATORS),
+        help='Data set generators.')
+    parser.add_argument('--neighbors', type=float, default=20,
+        help='Average number of neighbors of a point in uniform data, which sets eps.')
+    parser.add_argument('--min_pts', type=int, default=20, help='OPTICS min_pts parameter.')
+    parser.add_argument('--t', type=float, default=150, help='Minimum inflection angle in degrees.')
+    parser.add_argument('--w', type=float, default=0.025, help='Distance between points in the plot.')
+    parser.add_argument('--max_points_ratio', type=float, default=0.5, help='Largest cluster fraction.')
+    parser.add_argument('--similarity', type=float, default=0.7, help='Cluster similarity threshold.')
+    parser.add_argument('--index', default='auto', help='Spatial index: auto, grid, kdtree or brute.')
+    parser.add_argument('--n_jobs', type=int, default=1, help='Number of threads of runCyOPTICS.')
+    parser.add_argument('--output', default=None, help='JSON file into which the results are written.')
+    parser.add_argument('--compare', default=None, help='JSON file with baseline results to compare with.')
+    parser.add_argument('--tolerance', type=float, default=1.2,
+        help='Stages slower than the baseline by more than this factor are reported as regressions.')
+    args = parser.parse_args()
+
+    cases = [{'generator': generator, 'size': size, 'dims': dims, 'neighbors': args.neighbors,
+        'min_pts': args.min_pts, 't': args.t, 'w': args.w, 'max_points_ratio': args.max_points_ratio,
+        'similarity': args.similarity, 'index': args.index, 'n_jobs': args.n_jobs}
+        for generator in args.generators for dims in args.dims for size in args.sizes]
+
+    # Compile the modules before the cases start in separate processes
+    runCase(dict(cases[0], size=100))
+
+    print('{:>10s} {:>10s} {:>5s} {:>22s} {:>12s} {:>14s} {:>10s}'.format('Data', 'Points', 'Dims', 'Stage',
+        'Time [s]', 'Memory [MB]', 'Clusters'))
+
+    records = []
+
+    # Run every case in a fresh process, so the peak memory is measured for that case only
+    context = multiprocessing.get_context('spawn')
+
+    for case in cases:
+
+        pool = context.Pool(1, maxtasksperchild=1)
+
+        try:
+            case_records = pool.apply(runCase, (case, ))
+
+        finally:
+            pool.close()
+            pool.join()
+
+        for entry in case_records:
+
+            print('{:>10s} {:10d} {:5d} {:>22s} {:12.4f} {:>14s} {:>10s}'.format(entry['generator'],
+                entry['size'], entry['dims'], entry['stage'], entry['time'],
+                '{:.1f}'.format(entry['memory']) if entry['memory'] is not None else '-',
+                str(entry['clusters']) if entry['clusters'] is not None else '-'))
+
+        records.extend(case_records)
+
+    if args.output is not None:
+
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': records}, f, indent=4)
+
+    if args.compare is not None:
+
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+        regressions = compareResults(records, baseline, args.tolerance)
+
+        if regressions:
+            sys.exit('{:d} stages are slower than the baseline by more than {:.2f}x!'.format(len(regressions),
+                args.tolerance))
@@ -0,0 +1,1038 @@
+#!python
+#cython: language_level=2, boundscheck=False, wraparound=False, cdivision=True
+
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+# Sequential parts of the gradient clustering and of the cluster postprocessing, see
+# GradientClustering.gradientClustering and GradientClustering.mergeSimilarClusters for the description of
+# the methods. The inflection points and the directions of the gradients are precomputed with NumPy, except in
+# gradientBatch, which runs the whole clustering of many small data sets without the GIL.
+
+
+
+# Import cython libraries
+from cython cimport floating
+import numpy as np
+cimport numpy as np
+from libc.math cimport sqrt
+from libc.stdlib cimport malloc, realloc, free, qsort
+from libc.string cimport memset
+
+
+
+# Undefined reachability distances and the value which replaces them, as in GradientClustering
+cdef double UNDEFINED = -1
+cdef double NEW_UNDEFINED = 2**31 - 1
+
+# Errors of the parts which run without the GIL, the exceptions are raised when the GIL is taken again
+cdef enum:
+    ERROR_MEMORY = -1
+    ERROR_EMPTY_STACK = -2
+    ERROR_DISJOINT_MERGE = -3
+
+
+
+cdef struct ClusterList:
+
+    # First points and ends (not included) of the clusters
+    np.int64_t *starts
+    np.int64_t *ends
+
+    # 1 for clusters which are ranges, 0 for empty lists (the current cluster of the Python implementation 
+    # starts as an empty list)
+    unsigned char *ranges
+
+    Py_ssize_t count
+    Py_ssize_t capacity
+
+
+
+cdef struct StackState:
+
+    double min_pts
+    Py_ssize_t reach_list_size
+
+    # Indices and reachability distances of start points
+    Py_ssize_t *start_pts
+    double *start_reach
+    Py_ssize_t top
+    Py_ssize_t capacity
+
+    # The last endpoint and the current cluster, which is a range from curr_start to curr_end, or an empty list
+    # if curr_range is not set
+    Py_ssize_t last_endpoint
+    bint curr_range
+    Py_ssize_t curr_start
+    Py_ssize_t curr_end
+
+
+
+cdef struct SizeKey:
+
+    # Sort key of a cluster and its position in the cluster list
+    np.int64_t key
+    Py_ssize_t index
+
+
+
+cdef void raiseError(int error) except *:
+    """ Raises the exception of an error code returned by the parts which run without the GIL. """
+
+    if error == ERROR_MEMORY:
+        raise MemoryError()
+
+    # The Python implementation fails on the empty start point list
+    elif error == ERROR_EMPTY_STACK:
+        raise IndexError('list index out of range')
+
+    elif error == ERROR_DISJOINT_MERGE:
+        raise ValueError('Clusters which do not overlap cannot be merged into an interval!')
+
+
+
+cdef int reserveClusters(ClusterList *clusters, Py_ssize_t capacity) noexcept nogil:
+    """ Grows the buffers of the cluster list so they can hold at least the given number of clusters. Returns
+        ERROR_MEMORY if they cannot be allocated.
+    """
+
+    cdef void *starts
+    cdef void *ends
+    cdef void *ranges
+
+    if capacity <= clusters.capacity:
+        return 0
+
+    capacity = max(capacity, 2*clusters.capacity, 16)
+
+    starts = realloc(clusters.starts, capacity*sizeof(np.int64_t))
+    if starts == NULL:
+        return ERROR_MEMORY
+    clusters.starts = <np.int64_t *>starts
+
+    ends = realloc(clusters.ends, capacity*sizeof(np.int64_t))
+    if ends == NULL:
+        return ERROR_MEMORY
+    clusters.ends = <np.int64_t *>ends
+
+    ranges = realloc(clusters.ranges, capacity*sizeof(unsigned char))
+    if ranges == NULL:
+        return ERROR_MEMORY
+    clusters.ranges = <unsigned char *>ranges
+
+    clusters.capacity = capacity
+
+    return 0
+
+
+
+cdef void freeClusters(ClusterList *clusters) noexcept nogil:
+    """ Releases the buffers of the cluster list. """
+
+    free(clusters.starts)
+    free(clusters.ends)
+    free(clusters.ranges)
+
+    clusters.starts = NULL
+    clusters.ends = NULL
+    clusters.ranges = NULL
+    clusters.count = 0
+    clusters.capacity = 0
+
+
+
+cdef inline int addCluster(ClusterList *clusters, Py_ssize_t start, Py_ssize_t end, bint is_range) \
+    noexcept nogil:
+    """ Appends a cluster to the list, see ClusterList. """
+
+    if reserveClusters(clusters, clusters.count + 1):
+        return ERROR_MEMORY
+
+    clusters.starts[clusters.count] = start
+    clusters.ends[clusters.count] = end
+    clusters.ranges[clusters.count] = is_range
+    clusters.count += 1
+
+    return 0
+
+
+
+cdef list clusterObjects(ClusterList *clusters):
+    """ Converts the cluster list to the ranges and empty lists which the Python implementation returns. """
+
+    return [range(clusters.starts[k], clusters.ends[k]) if clusters.ranges[k] else [] 
+        for k in range(clusters.count)]
+
+
+
+cdef inline bint isLargeEnough(Py_ssize_t start, Py_ssize_t end, double min_pts) noexcept nogil:
+    """ Checks if the cluster with points from start to end (not included) has at least min_pts points. """
+
+    # Empty ranges have a length of 0, as in Python
+    if end < start:
+        return 0 >= min_pts
+
+    return end - start >= min_pts
+
+
+
+cdef void resetStack(StackState *stack, double min_pts, Py_ssize_t reach_list_size) noexcept nogil:
+    """ Empties the stack and prepares it for a reachability plot of the given size, keeping its buffers. """
+
+    stack.min_pts = min_pts
+    stack.reach_list_size = reach_list_size
+    stack.top = 0
+    stack.last_endpoint = reach_list_size - 1
+    stack.curr_range = False
+
+
+
+cdef int pushStart(StackState *stack, Py_ssize_t i, double reach) noexcept nogil:
+    """ Pushes the point i with the given reachability distance to the stack, growing the stack if full. 
+        Returns ERROR_MEMORY if the stack cannot grow.
+    """
+
+    cdef Py_ssize_t capacity
+    cdef void *start_pts
+    cdef void *start_reach
+
+    if stack.top == stack.capacity:
+
+        capacity = max(2*stack.capacity, 16)
+
+        start_pts = realloc(stack.start_pts, capacity*sizeof(Py_ssize_t))
+        if start_pts == NULL:
+            return ERROR_MEMORY
+        stack.start_pts = <Py_ssize_t *>start_pts
+
+        start_reach = realloc(stack.start_reach, capacity*sizeof(double))
+        if start_reach == NULL:
+            return ERROR_MEMORY
+        stack.start_reach = <double *>start_reach
+
+        stack.capacity = capacity
+
+    stack.start_pts[stack.top] = i
+    stack.start_reach[stack.top] = reach
+    stack.top += 1
+
+    return 0
+
+
+
+cdef void freeStack(StackState *stack) noexcept nogil:
+    """ Releases the buffers of the stack. """
+
+    free(stack.start_pts)
+    free(stack.start_reach)
+
+    stack.start_pts = NULL
+    stack.start_reach = NULL
+    stack.top = 0
+    stack.capacity = 0
+
+
+
+cdef int runStack(StackState *stack, const floating *reach_list, Py_ssize_t offset, 
+    const Py_ssize_t *inflection_points, const unsigned char *right_turns, Py_ssize_t count, 
+    ClusterList *clusters) noexcept nogil:
+    """ Runs the stack over the inflection points in a part of the reachability plot, see 
+        StartPointStack.update for the description of arguments. The found clusters are appended to the 
+        cluster list.
+
+    Return:
+        [int] 0, or the code of the error (ERROR_EMPTY_STACK or ERROR_MEMORY)
+    """
+
+    cdef Py_ssize_t i, k, start, curr_size
+    cdef double reach_i, reach_next
+
+    for k in range(count):
+
+        i = inflection_points[k]
+        reach_i = reach_list[i - offset]
+        reach_next = reach_list[i + 1 - offset]
+
+        # Check if the next vector deviates to the right
+        if right_turns[k]:
+
+            # Check if the current cluster size is larger than the minimum number of points required
+            curr_size = max(stack.curr_end - stack.curr_start, 0) if stack.curr_range else 0
+            if curr_size >= stack.min_pts:
+                if addCluster(clusters, stack.curr_start, stack.curr_end, stack.curr_range):
+                    return ERROR_MEMORY
+
+            # Reset the current cluster
+            stack.curr_range = False
+
+            # Remove the last start point if it has a smaller reachability distance than the current point
+            if stack.top > 0 and stack.start_reach[stack.top - 1] <= reach_i:
+                stack.top -= 1
+
+            if stack.top > 0:
+
+                # While the last start point has a smaller reachability distance than the current point, 
+                # keep removing start points and add clusters which begin at them
+                while stack.start_reach[stack.top - 1] < reach_i:
+
+                    start = stack.start_pts[stack.top - 1]
+
+                    if isLargeEnough(start, stack.last_endpoint, stack.min_pts):
+                        if addCluster(clusters, start, stack.last_endpoint, True):
+                            return ERROR_MEMORY
+
+                    stack.top -= 1
+
+                    # The Python implementation fails on the empty start point list here
+                    if stack.top == 0:
+                        return ERROR_EMPTY_STACK
+
+                # Lastly, add another cluster at the end
+                start = stack.start_pts[stack.top - 1]
+
+                if isLargeEnough(start, stack.last_endpoint, stack.min_pts):
+                    if addCluster(clusters, start, stack.last_endpoint, True):
+                        return ERROR_MEMORY
+
+            # If the current point is a starting point, add it to the stack
+            if reach_next < reach_i:
+                if pushStart(stack, i, reach_i):
+                    return ERROR_MEMORY
+
+
+        # The next vector deviates to the left, marking an endpoint
+        else:
+
+            # If the endpoint goes up, take all points from the last start point to this one as the current 
+            # cluster
+            if reach_next > reach_i:
+
+                stack.last_endpoint = i + 1
+
+                if stack.top == 0:
+                    return ERROR_EMPTY_STACK
+
+                stack.curr_range = True
+                stack.curr_start = stack.start_pts[stack.top - 1]
+                stack.curr_end = stack.last_endpoint
+
+    return 0
+
+
+
+cdef int finishStack(StackState *stack, double last_reach, ClusterList *clusters) noexcept nogil:
+    """ Appends the clusters at the end of the reachability plot to the cluster list, see 
+        StartPointStack.finish.
+
+    Return:
+        [int] 0, or ERROR_MEMORY
+    """
+
+    cdef Py_ssize_t start
+
+    # Add clusters at the end of plot, while start points has any members
+    while stack.top > 0:
+
+        start = stack.start_pts[stack.top - 1]
+
+        if (stack.start_reach[stack.top - 1] > last_reach) and isLargeEnough(start, stack.reach_list_size, 
+            stack.min_pts):
+
+            if addCluster(clusters, start, stack.reach_list_size, True):
+                return ERROR_MEMORY
+
+        stack.top -= 1
+
+    return 0
+
+
+
+cdef class StartPointStack:
+    """ Start point stack of the gradient clustering, which can be run over the reachability plot in parts, 
+        as the plot is produced. Every point can be pushed only once, and the reachability distances of the 
+        start points are kept with them, so the earlier parts of the plot are not needed. The distances are 
+        kept as doubles, which represent float32 values exactly, so they compare in the same way.
+    """
+
+    cdef StackState stack
+
+    # Flag which is set when the first point of the plot was pushed to the stack
+    cdef bint started
+
+
+    def __init__(self, double min_pts, Py_ssize_t reach_list_size):
+        """ Initilization function for the stack.
+
+        Arguments:
+            min_pts: [float] minimum number of points in a cluster
+            reach_list_size: [int] number of points in the whole reachability plot
+
+        """
+
+        if reach_list_size == 0:
+            raise IndexError('Cannot cluster an empty reachability list!')
+
+        resetStack(&self.stack, min_pts, reach_list_size)
+        self.started = False
+
+
+    def __dealloc__(self):
+
+        freeStack(&self.stack)
+
+
+    def update(self, const floating[::1] reach_list, Py_ssize_t offset, 
+        const Py_ssize_t[::1] inflection_points, const unsigned char[::1] right_turns):
+        """ Runs the stack over the inflection points in a part of the reachability plot.
+
+        Arguments:
+            reach_list: [ndarray] 1D numpy array of reachability distances, with the UNDEFINED values already
+                replaced, starting at the point offset of the plot
+            offset: [int] index of the first given point in the whole plot
+            inflection_points: [ndarray] indices of inflection points in the whole plot in ascending order, 
+                the point after every inflection point has to be in the given part
+            right_turns: [ndarray] 1 if the gradient in the corresponding inflection point deviates to the right,
+                0 otherwise
+
+        Return:
+            set_of_clusters: [list] a list of clusters found in this part, each cluster is a range of point 
+                indices
+        """
+
+        cdef int error = 0
+        cdef ClusterList clusters = ClusterList(NULL, NULL, NULL, 0, 0)
+
+        # Add the first point of the plot to the start points
+        if not self.started:
+
+            if (offset != 0) or (reach_list.shape[0] == 0):
+                raise ValueError('The first part of the reachability plot has to start at its first point!')
+
+            error = pushStart(&self.stack, 0, reach_list[0])
+            self.started = True
+
+        try:
+            if not error:
+                error = runStack(&self.stack, &reach_list[0] if reach_list.shape[0] else NULL, offset, 
+                    &inflection_points[0] if inflection_points.shape[0] else NULL, 
+                    &right_turns[0] if right_turns.shape[0] else NULL, inflection_points.shape[0], &clusters)
+
+            raiseError(error)
+
+            return clusterObjects(&clusters)
+
+        finally:
+            freeClusters(&clusters)
+
+
+    def finish(self, double last_reach):
+        """ Adds the clusters at the end of the reachability plot, after all parts were given to update.
+
+        Arguments:
+            last_reach: [float] reachability distance of the last point, with UNDEFINED already replaced
+
+        Return:
+            set_of_clusters: [list] a list of the remaining clusters
+        """
+
+        cdef ClusterList clusters = ClusterList(NULL, NULL, NULL, 0, 0)
+
+        try:
+            raiseError(finishStack(&self.stack, last_reach, &clusters))
+
+            return clusterObjects(&clusters)
+
+        finally:
+            freeClusters(&clusters)
+
+
+
+def gradientStartPoints(const floating[::1] reach_list, const Py_ssize_t[::1] inflection_points,
+    const unsigned char[::1] right_turns, double min_pts):
+    """ Runs the start point stack of the gradient clustering over the given inflection points.
+
+    Arguments:
+        reach_list: [ndarray] 1D numpy array of reachability distances, with the UNDEFINED values already
+            replaced
+        inflection_points: [ndarray] indices of inflection points in ascending order
+        right_turns: [ndarray] 1 if the gradient in the corresponding inflection point deviates to the right,
+            0 otherwise
+        min_pts: [float] minimum number of points in a cluster
+
+    Return:
+        set_of_clusters: [list] a list of found clusters, each cluster is a range of point indices
+
+    """
+
+    cdef Py_ssize_t reach_list_size = reach_list.shape[0]
+
+    if reach_list_size == 0:
+        raise IndexError('Cannot cluster an empty reachability list!')
+
+    stack = StartPointStack(min_pts, reach_list_size)
+
+    set_of_clusters = stack.update(reach_list, 0, inflection_points, right_turns)
+    set_of_clusters.extend(stack.finish(reach_list[reach_list_size - 1]))
+
+    return set_of_clusters
+
+
+
+cdef int mergeOnce(const np.int64_t *starts, const np.int64_t *ends, const np.int64_t *sources, Py_ssize_t n,
+    double similarity_threshold, unsigned char *skip, np.int64_t *merged_starts, np.int64_t *merged_ends, 
+    np.int64_t *merged_sources, Py_ssize_t *merged_count) noexcept nogil:
+    """ Runs one pass of merging similar clusters, see mergeIntervalsOnce for the description of arguments.
+
+    Arguments:
+        skip: [pointer] work buffer of n flags
+        merged_starts, merged_ends, merged_sources: [pointers] arrays of n values into which the merged 
+            clusters are written (the sources can be NULL)
+        merged_count: [pointer] the number of merged clusters is written into it
+
+    Return:
+        [int] 0, or ERROR_DISJOINT_MERGE if clusters which do not overlap would be merged
+    """
+
+    cdef Py_ssize_t i, j, count = 0
+    cdef np.int64_t size_i, size_j, intersect_points
+    cdef double min_intersect
+
+    # Flags of clusters which were merged into one of the previous clusters
+    for i in range(n):
+        skip[i] = 0
+
+    for i in range(n):
+
+        # Skip if the cluster was already merged
+        if skip[i]:
+            continue
+
+        size_i = ends[i] - starts[i]
+
+        # The cluster i is the bigger one in all following pairs
+        min_intersect = similarity_threshold*size_i
+
+        # Keep the cluster as it is if no similar cluster is found
+        merged_starts[count] = starts[i]
+        merged_ends[count] = ends[i]
+        if sources != NULL:
+            merged_sources[count] = sources[i]
+
+        for j in range(i + 1, n):
+
+            size_j = ends[j] - starts[j]
+
+            # The intersection cannot be larger than the smaller cluster, so none of the following clusters can
+            # be similar enough
+            if size_j < min_intersect:
+                break
+
+            # Skip if already merged
+            if skip[j]:
+                continue
+
+            # Find the number of common points between clusters
+            intersect_points = min(ends[i], ends[j]) - max(starts[i], starts[j])
+            if intersect_points < 0:
+                intersect_points = 0
+
+            if intersect_points >= min_intersect:
+
+                skip[j] = 1
+
+                # The union of an empty cluster and another cluster is the other cluster
+                if size_j == 0:
+                    pass
+
+                elif size_i == 0:
+                    merged_starts[count] = starts[j]
+                    merged_ends[count] = ends[j]
+
+                # Clusters which are apart cannot be merged into one interval (this is only possible if the 
+                # similarity threshold is 0 or less)
+                elif max(starts[i], starts[j]) > min(ends[i], ends[j]):
+                    return ERROR_DISJOINT_MERGE
+
+                else:
+                    merged_starts[count] = min(starts[i], starts[j])
+                    merged_ends[count] = max(ends[i], ends[j])
+
+                if sources != NULL:
+                    merged_sources[count] = -1
+
+                break
+
+        count += 1
+
+    merged_count[0] = count
+
+    return 0
+
+
+
+def mergeIntervalsOnce(const np.int64_t[::1] starts, const np.int64_t[::1] ends, const np.int64_t[::1] sources,
+    double similarity_threshold):
+    """ Runs one pass of merging similar clusters, see GradientClustering.mergeSimilarClusters.
+
+    As the clusters are sorted by descending size, the cluster i can only be merged with the clusters j > i 
+    which have at least similarity_threshold*size_i points, and the search for similar clusters is stopped at 
+    the first smaller cluster.
+
+    Arguments:
+        starts: [ndarray] first points of the clusters, sorted by descending cluster size
+        ends: [ndarray] ends of the clusters (not included)
+        sources: [ndarray] indices of the clusters in the input of the merging, -1 for merged clusters
+        similarity_threshold: [float] a minimum ratio between the intersection of two clusters and the 
+            members of the larger cluster
+
+    Return:
+        (starts, ends, sources): [tuple of ndarrays] merged clusters, in the order in which they were merged
+
+    """
+
+    cdef Py_ssize_t n = starts.shape[0]
+    cdef Py_ssize_t count = 0
+    cdef int error
+
+    skip_arr = np.zeros(max(n, 1), dtype=np.uint8)
+    merged_starts_arr = np.empty(max(n, 1), dtype=np.int64)
+    merged_ends_arr = np.empty(max(n, 1), dtype=np.int64)
+    merged_sources_arr = np.empty(max(n, 1), dtype=np.int64)
+    cdef np.uint8_t[::1] skip = skip_arr
+    cdef np.int64_t[::1] merged_starts = merged_starts_arr
+    cdef np.int64_t[::1] merged_ends = merged_ends_arr
+    cdef np.int64_t[::1] merged_sources = merged_sources_arr
+
+    if n:
+        error = mergeOnce(&starts[0], &ends[0], &sources[0], n, similarity_threshold, &skip[0], 
+            &merged_starts[0], &merged_ends[0], &merged_sources[0], &count)
+        raiseError(error)
+
+    return merged_starts_arr[:count], merged_ends_arr[:count], merged_sources_arr[:count]
+
+
+
+cdef int compareSizeKeys(const void *a, const void *b) noexcept nogil:
+    """ Orders the clusters by ascending keys, and the clusters with the same key by descending position. """
+
+    cdef const SizeKey *key_a = <const SizeKey *>a
+    cdef const SizeKey *key_b = <const SizeKey *>b
+
+    if key_a.key != key_b.key:
+        return -1 if key_a.key < key_b.key else 1
+
+    if key_a.index != key_b.index:
+        return -1 if key_a.index > key_b.index else 1
+
+    return 0
+
+
+
+cdef void sizeOrder(const ClusterList *clusters, SizeKey *keys, bint descending) noexcept nogil:
+    """ Sorts the clusters by their size, and the clusters of the same size by descending position. Sorting 
+        by descending size gives the same order as GradientClustering.intervalSizeOrder.
+
+    Arguments:
+        clusters: [pointer] cluster list
+        keys: [pointer] array into which the positions of clusters are written in the sorted order
+        descending: [bool] sort by descending size if set, otherwise by ascending size
+
+    """
+
+    cdef Py_ssize_t k
+    cdef np.int64_t size
+
+    for k in range(clusters.count):
+        size = clusters.ends[k] - clusters.starts[k]
+        keys[k].key = -size if descending else size
+        keys[k].index = k
+
+    qsort(keys, clusters.count, sizeof(SizeKey), compareSizeKeys)
+
+
+
+cdef void sortClusters(ClusterList *clusters, ClusterList *work, SizeKey *keys) noexcept nogil:
+    """ Sorts the clusters by descending size (see sizeOrder), using a second cluster list of the same 
+        capacity, whose buffers are exchanged with the sorted one.
+    """
+
+    cdef Py_ssize_t k
+    cdef ClusterList sorted_clusters
+
+    sizeOrder(clusters, keys, True)
+
+    for k in range(clusters.count):
+        work.starts[k] = clusters.starts[keys[k].index]
+        work.ends[k] = clusters.ends[keys[k].index]
+
+    work.count = clusters.count
+
+    sorted_clusters = work[0]
+    work[0] = clusters[0]
+    clusters[0] = sorted_clusters
+
+
+
+cdef struct BatchWork:
+
+    # Reachability distances of a data set with the UNDEFINED values replaced, in the computation dtype
+    void *reach_list
+
+    # Inflection points and the directions of gradients in them
+    Py_ssize_t *inflection_points
+    unsigned char *right_turns
+
+    # Labels of the points in the OPTICS order
+    int *position_labels
+
+    StackState stack
+
+    # Found clusters and the work list for sorting and merging them
+    ClusterList clusters
+    ClusterList merged
+
+    # Work buffers of merging and sorting, for merge_capacity clusters
+    unsigned char *skip
+    SizeKey *keys
+    Py_ssize_t merge_capacity
+
+
+
+cdef int reserveMerge(BatchWork *work, Py_ssize_t capacity) noexcept nogil:
+    """ Grows the work buffers for sorting and merging to at least the given number of clusters. """
+
+    cdef void *skip
+    cdef void *keys
+
+    if capacity <= work.merge_capacity:
+        return 0
+
+    capacity = max(capacity, 2*work.merge_capacity, 16)
+
+    skip = realloc(work.skip, capacity*sizeof(unsigned char))
+    if skip == NULL:
+        return ERROR_MEMORY
+    work.skip = <unsigned char *>skip
+
+    keys = realloc(work.keys, capacity*sizeof(SizeKey))
+    if keys == NULL:
+        return ERROR_MEMORY
+    work.keys = <SizeKey *>keys
+
+    work.merge_capacity = capacity
+
+    # Sorting also needs the second cluster list of the same capacity
+    if reserveClusters(&work.clusters, capacity) or reserveClusters(&work.merged, capacity):
+        return ERROR_MEMORY
+
+    return 0
+
+
+
+cdef int clusterDataSet(const floating *reachability, const int *ordering, Py_ssize_t size, double min_pts, 
+    double t_cos, double w, double max_points_ratio, double similarity_threshold, bint largest, 
+    BatchWork *work, ClusterList *output, int *labels) noexcept nogil:
+    """ Extracts, filters and merges the clusters of one data set and labels its points, with the same results
+        as GradientClustering.gradientClustering, filterLargeClusters, mergeSimilarClusters and clusterLabels 
+        give for clusters as intervals. See gradientBatch for the description of arguments.
+
+    Arguments:
+        reachability: [pointer] reachability distances of the data set in the OPTICS order
+        ordering: [pointer] indices of the points of the data set in the OPTICS order
+        size: [int] number of points of the data set, at least 1
+        work: [pointer] work buffers, allocated for at least size points
+        output: [pointer] cluster list to which the clusters of the data set are appended
+        labels: [pointer] array into which the labels of points are written, in the input order
+
+    Return:
+        [int] 0, or the code of the error
+    """
+
+    cdef Py_ssize_t p, k, m, count = 0, previous_count, merged_count
+    cdef np.int64_t cluster_size
+    cdef floating *reach_list = <floating *>work.reach_list
+    cdef floating x, y, z, numerator, determinant
+    cdef floating w_value = <floating>w
+    cdef double prev_diff, next_diff, prev_abs, next_abs
+    cdef ClusterList *clusters = &work.clusters
+    cdef ClusterList *merged = &work.merged
+    cdef int error
+
+    # Replace all UNDEFINED values with infinites
+    for p in range(size):
+        reach_list[p] = reachability[p]
+        if reach_list[p] == UNDEFINED:
+            reach_list[p] = <floating>NEW_UNDEFINED
+
+    # Find the inflection points and the directions of gradients in them, in the same precision as 
+    # GradientClustering.inflectionIndices and gradientDeterminants (the first and the last point are never 
+    # checked)
+    for p in range(1, size - 1):
+
+        x = reach_list[p - 1]
+        y = reach_list[p]
+        z = reach_list[p + 1]
+
+        prev_diff = <double>(y - x)
+        next_diff = <double>(z - y)
+        prev_abs = sqrt(w*w + prev_diff*prev_diff)
+        next_abs = sqrt(w*w + next_diff*next_diff)
+        numerator = <floating>(-(w*w)) + (x - y)*(z - y)
+
+        if numerator/(prev_abs*next_abs) > t_cos:
+
+            determinant = w_value*(y - x) - w_value*(z - y)
+
+            work.inflection_points[count] = p
+            work.right_turns[count] = determinant > 0
+            count += 1
+
+    # Run the start point stack
+    clusters.count = 0
+    resetStack(&work.stack, min_pts, size)
+
+    error = pushStart(&work.stack, 0, reach_list[0])
+    if not error:
+        error = runStack(&work.stack, reach_list, 0, work.inflection_points, work.right_turns, count, clusters)
+    if not error:
+        error = finishStack(&work.stack, reach_list[size - 1], clusters)
+    if error:
+        return error
+
+    # Remove the empty clusters and the clusters which are too large
+    count = 0
+    for k in range(clusters.count):
+
+        cluster_size = clusters.ends[k] - clusters.starts[k] if clusters.ranges[k] else 0
+
+        if (cluster_size > 0) and (cluster_size < max_points_ratio*size):
+            clusters.starts[count] = clusters.starts[k]
+            clusters.ends[count] = clusters.ends[k]
+            count += 1
+
+    clusters.count = count
+
+    if reserveMerge(work, clusters.count):
+        return ERROR_MEMORY
+
+    # Merge the clusters until their number does not change, sorting them by descending size before every 
+    # iteration, as in GradientClustering.mergeSimilarIntervals
+    sortClusters(clusters, merged, work.keys)
+
+    previous_count = clusters.count
+    merged_count = 0
+
+    while previous_count != merged_count:
+
+        sortClusters(clusters, merged, work.keys)
+
+        error = mergeOnce(clusters.starts, clusters.ends, NULL, clusters.count, similarity_threshold, 
+            work.skip, merged.starts, merged.ends, NULL, &merged.count)
+        if error:
+            return error
+
+        clusters, merged = merged, clusters
+
+        previous_count = merged_count
+        merged_count = clusters.count
+
+    sortClusters(clusters, merged, work.keys)
+
+    # Label the points so that the cluster chosen by the nesting policy is written last (see 
+    # GradientClustering.intervalLabels)
+    for p in range(size):
+        work.position_labels[p] = -1
+
+    sizeOrder(clusters, work.keys, not largest)
+
+    for m in range(clusters.count):
+        k = work.keys[m].index
+        for p in range(clusters.starts[k], clusters.ends[k]):
+            work.position_labels[p] = <int>k
+
+    for p in range(size):
+        labels[ordering[p]] = work.position_labels[p]
+
+    # Add the clusters to the output
+    if reserveClusters(output, output.count + clusters.count):
+        return ERROR_MEMORY
+
+    for k in range(clusters.count):
+        output.starts[output.count] = clusters.starts[k]
+        output.ends[output.count] = clusters.ends[k]
+        output.ranges[output.count] = True
+        output.count += 1
+
+    return 0
+
+
+
+cdef int clusterDataSets(const floating *reachability, const int *ordering, const np.int64_t *offsets, 
+    Py_ssize_t start, Py_ssize_t end, double min_pts, double t_cos, double w, double max_points_ratio, 
+    double similarity_threshold, bint largest, BatchWork *work, ClusterList *output, np.int64_t *counts, 
+    int *labels) noexcept nogil:
+    """ Clusters the data sets of a packed batch one after another, see gradientBatch.
+
+    Return:
+        [int] 0, or the code of the error
+    """
+
+    cdef Py_ssize_t k, count
+    cdef np.int64_t lo, hi
+    cdef int error
+
+    for k in range(start, end):
+
+        lo = offsets[k]
+        hi = offsets[k + 1]
+        count = output.count
+
+        if hi > lo:
+            error = clusterDataSet(reachability + lo, ordering + lo, hi - lo, min_pts, t_cos, w, 
+                max_points_ratio, similarity_threshold, largest, work, output, labels + lo)
+            if error:
+                return error
+
+        counts[k - start] = output.count - count
+
+    return 0
+
+
+
+def gradientBatch(reachability, ordering, offsets, Py_ssize_t start, Py_ssize_t end, double min_pts, double t, 
+    double w, double max_points_ratio, double similarity_threshold, bint largest, labels):
+    """ Runs the gradient clustering, removes large clusters, merges similar clusters and labels the points of
+        a range of data sets of a packed batch, without the GIL. Every data set gets the same clusters and 
+        labels as gradientClustering with intervals, filterLargeClusters, mergeSimilarClusters and 
+        clusterLabels give it alone (see BatchOPTICS.runBatchOPTICS). The work buffers are allocated once for
+        the largest data set and reused for all of them.
+
+    Arguments:
+        reachability: [ndarray] C-ordered float32 or float64 array with the reachability distances of all 
+            data sets, every data set in its OPTICS order
+        ordering: [ndarray] C-ordered int32 array with the indices of the points within their data set in the 
+            OPTICS order
+        offsets: [ndarray] int64 array of size B + 1, the data set k are the rows offsets[k]:offsets[k + 1]
+        start: [int] first data set which is clustered
+        end: [int] end of the range of data sets (not included)
+        min_pts: [float] minimum number of points in a cluster
+        t: [float] angle of minimum inflection index in deg, see GradientClustering.gradientClustering
+        w: [float] distance between data points in the reachability plot, see 
+            GradientClustering.gradientClustering
+        max_points_ratio: [float] clusters with at least this fraction of the points of their data set are 
+            removed, see GradientClustering.filterLargeClusters
+        similarity_threshold: [float] minimum ratio of common points of merged clusters, see 
+            GradientClustering.mergeSimilarClusters
+        largest: [bool] if set, a point in more than one cluster gets the label of the largest one, otherwise
+            of the smallest one (see GradientClustering.intervalLabels)
+        labels: [ndarray] C-ordered int32 array into which the labels of the points are written, at the rows 
+            of their data set in the input order
+
+    Return:
+        (starts, ends, counts):
+            - starts: [ndarray] int64 first points of the clusters of all data sets, positions in the OPTICS
+                order of their data set
+            - ends: [ndarray] int64 ends of the clusters (not included)
+            - counts: [ndarray] int64 number of clusters of every data set of the range
+    """
+
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+
+    if reachability.dtype not in (np.float32, np.float64):
+        raise ValueError('The reachability distances must be of the type float32 or float64!')
+
+    for name, array, dtype in (('reachability', reachability, reachability.dtype), ('ordering', ordering, 
+        np.int32), ('labels', labels, np.int32)):
+
+        if (array.dtype != dtype) or (not array.flags.c_contiguous) or (array.shape[0] != offsets[-1]):
+            raise ValueError('The {:s} array must be a C-ordered array of the type {:s} with a value for every '
+                'point!'.format(name, str(np.dtype(dtype))))
+
+    # Covert t from degrees to cosinus value
+    cdef double t_cos = np.cos(np.radians(t))
+
+    cdef bint single_precision = (reachability.dtype == np.float32)
+    cdef const void *reachability_ptr = np.PyArray_DATA(reachability)
+    cdef const int *ordering_ptr = <const int *>np.PyArray_DATA(ordering)
+    cdef const np.int64_t *offsets_ptr = <const np.int64_t *>np.PyArray_DATA(offsets)
+    cdef int *labels_ptr = <int *>np.PyArray_DATA(labels)
+
+    counts_arr = np.zeros(max(end - start, 0), dtype=np.int64)
+    cdef np.int64_t *counts = <np.int64_t *>np.PyArray_DATA(counts_arr)
+
+    # The work buffers are allocated for the largest data set
+    cdef Py_ssize_t capacity = int(np.max(np.diff(offsets[start:end + 1]), initial=0))
+    cdef Py_ssize_t itemsize = reachability.itemsize
+    cdef BatchWork work
+    cdef ClusterList output = ClusterList(NULL, NULL, NULL, 0, 0)
+    cdef int error = 0
+
+    memset(&work, 0, sizeof(BatchWork))
+
+    try:
+
+        with nogil:
+
+            work.reach_list = malloc(max(capacity, 1)*itemsize)
+            work.inflection_points = <Py_ssize_t *>malloc(max(capacity, 1)*sizeof(Py_ssize_t))
+            work.right_turns = <unsigned char *>malloc(max(capacity, 1)*sizeof(unsigned char))
+            work.position_labels = <int *>malloc(max(capacity, 1)*sizeof(int))
+
+            if (work.reach_list == NULL) or (work.inflection_points == NULL) or (work.right_turns == NULL) \
+                or (work.position_labels == NULL):
+
+                error = ERROR_MEMORY
+
+            elif single_precision:
+                error = clusterDataSets(<const float *>reachability_ptr, ordering_ptr, offsets_ptr, start, 
+                    end, min_pts, t_cos, w, max_points_ratio, similarity_threshold, largest, &work, &output, 
+                    counts, labels_ptr)
+
+            else:
+                error = clusterDataSets(<const double *>reachability_ptr, ordering_ptr, offsets_ptr, start, 
+                    end, min_pts, t_cos, w, max_points_ratio, similarity_threshold, largest, &work, &output, 
+                    counts, labels_ptr)
+
+        raiseError(error)
+
+        starts = np.empty(output.count, dtype=np.int64)
+        ends = np.empty(output.count, dtype=np.int64)
+
+        if output.count:
+            starts[:] = <np.int64_t[:output.count]>output.starts
+            ends[:] = <np.int64_t[:output.count]>output.ends
+
+        return starts, ends, counts_arr
+
+    finally:
+        free(work.reach_list)
+        free(work.inflection_points)
+        free(work.right_turns)
+        free(work.position_labels)
+        free(work.skip)
+        free(work.keys)
+        freeStack(&work.stack)
+        freeClusters(&work.clusters)
+        freeClusters(&work.merged)
+        freeClusters(&output)
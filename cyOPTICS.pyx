@@ -1,5 +1,5 @@
 #!python
-#cython: language_level=2, boundscheck=False, wraparound=False
+#cython: language_level=2, boundscheck=False, wraparound=False, cdivision=True
 
 # MIT License
 
@@ -32,10 +32,20 @@
 
 
 # Import cython libraries
+import os
 cimport cython
+from cython cimport floating
+from cython.parallel cimport prange, threadid
 import numpy as np
 cimport numpy as np
-from libc.math cimport sqrt
+from libc.math cimport sqrt, floor, fabs, log2, sin, cos, asin, M_PI, INFINITY
+from libc.string cimport memcpy
+from libc.stdlib cimport qsort
+from cpython.time cimport PyTime_t, PyTime_PerfCounterRaw, PyTime_AsSecondsDouble
+
+from OPTICSResult import OPTICSResult, allocateArray, loadInput, resolveFloatType, checkReturnFormat, \
+    collapseDuplicates, FLOAT_TYPES
+from OPTICSStats import OPTICSCancelled, PROGRESS_INTERVAL
 
 # Define cython numpy types
 INT_TYPE = np.int32
@@ -45,332 +55,3510 @@ FLOAT_TYPE = np.float64
 ctypedef np.float64_t FLOAT_TYPE_t
 
 
+
 # Define constants
 cdef int UNPROCESSED = 0
 cdef int PROCESSED = 1
 cdef int UNDEFINED = -1
 
-# Point list column indices
-cdef int PROCESSED_FLAG_IND = 0
-cdef int REACHABILITY_DIST_IND = 1
-cdef int CORE_DIST_IND = 2
 
-# Total number not non-input data points, which are appended in the columns before the data
-cdef int COLUMNS_TOTAL = 3
 
+# Distance metrics
+cdef enum:
+    METRIC_EUCLIDEAN = 0
+    METRIC_SQEUCLIDEAN = 1
+    METRIC_MANHATTAN = 2
+    METRIC_CHEBYSHEV = 3
+    METRIC_COSINE = 4
+    METRIC_HAVERSINE = 5
 
+METRICS = {
+    'euclidean': METRIC_EUCLIDEAN,
+    'sqeuclidean': METRIC_SQEUCLIDEAN,
+    'manhattan': METRIC_MANHATTAN,
+    'chebyshev': METRIC_CHEBYSHEV,
+    'cosine': METRIC_COSINE,
+    'haversine': METRIC_HAVERSINE
+    }
 
-cdef float euclidianDistance(float x1, float y1, float x2, float y2):
-    """ Calculate the Euclidian distance between two points. """
+# Types of spatial indices
+cdef enum:
+    INDEX_BRUTE = 0
+    INDEX_GRID = 1
+    INDEX_KDTREE = 2
 
-    return sqrt((x2 - x1)**2 + (y2 - y1)**2)
+# Maximum number of dimensions supported by the grid index (a query visits 3^dimensions cells)
+cdef enum:
+    GRID_MAX_DIMENSIONS = 8
 
+# Phases of processing a point in the ordering, which are timed separately when stats are collected
+cdef enum:
+    PHASE_NEIGHBORS = 0
+    PHASE_CORE_DISTANCE = 1
+    PHASE_SEEDS = 2
+    PHASES_COUNT = 3
 
+# Maximum number of points in a leaf of the KD-tree
+cdef int KDTREE_LEAF_SIZE = 32
+
+# Size of the node stack used when traversing the KD-tree (the depth of the tree is log2(n/leaf_size))
+cdef enum:
+    KDTREE_STACK_SIZE = 128
+
+# Relative tolerance added to the search radius of the spatial indices, so the cell/node pruning never drops
+# a point which is within eps due to a rounding error
+cdef double INDEX_RADIUS_TOLERANCE = 1e-6
+
+# Number of input rows processed at once when building indices, so no temporary copies of the whole input 
+# are made (the input can be memory-mapped)
+cdef int INPUT_CHUNK_SIZE = 65536
+
+# Number of points which a thread takes at once when neighborhoods are computed in parallel
+cdef int GRAPH_CHUNK_SIZE = 64
+
+# Number of ordered points in a chunk yielded by iterCyOPTICS
+ORDERING_CHUNK_SIZE = 65536
+
+# Distance of the counters of different threads in the counter array, so they are not in the same cache line
+cdef int COUNTER_STRIDE = 8
+
+
+
+cdef inline floating rawDistance(const floating *a, const floating *b, int dims, int metric, 
+    floating norm_a, floating norm_b) noexcept nogil:
+    """ Calculates the distance between points a and b in the raw form of the given metric, which is cheaper 
+        to compute and preserves the ordering of distances (e.g. the squared Euclidean distance, without the 
+        square root). The raw distance is compared to the threshold from rawThreshold, and only converted to
+        the real distance with finishDistance for points which are within eps.
 
-def getNeighbors(np.ndarray[FLOAT_TYPE_t, ndim=2] point_list, int i, float eps):
-    """ Returns indices of all neighbors of a given point. Neighbouring points are within the distance eps. 
-    
     Arguments:
-        point_list: [ndarray] numpy 2D array which contains information about individual points
-        i: [int] index of a point we are currently processing
-        eps: [float] epsilon value, i.e. maximum distance to neighbors
+        a: [pointer] coordinates of the first point
+        b: [pointer] coordinates of the second point
+        dims: [int] number of dimensions
+        metric: [int] metric code (one of the METRIC_* constants)
+        norm_a: [floating] norm of the first point (only used by the cosine metric)
+        norm_b: [floating] norm of the second point (only used by the cosine metric)
 
     Return:
-        indices: [ndarray] numpy 1D array containing indices of neighbors
-        k: [int] number of returned neighbors
+        [floating] raw distance, in the precision of the coordinates
+    """
+
+    cdef int axis
+    cdef floating diff, dist = 0
+    cdef floating sin_lat, sin_lon
+
+    if (metric == METRIC_EUCLIDEAN) or (metric == METRIC_SQEUCLIDEAN):
+
+        # Fast paths for 2D and 3D data
+        if dims == 2:
+            return (b[0] - a[0])*(b[0] - a[0]) + (b[1] - a[1])*(b[1] - a[1])
+
+        elif dims == 3:
+            return (b[0] - a[0])*(b[0] - a[0]) + (b[1] - a[1])*(b[1] - a[1]) + (b[2] - a[2])*(b[2] - a[2])
+
+        for axis in range(dims):
+            diff = b[axis] - a[axis]
+            dist += diff*diff
+
+    elif metric == METRIC_MANHATTAN:
+
+        for axis in range(dims):
+            dist += fabs(b[axis] - a[axis])
+
+    elif metric == METRIC_CHEBYSHEV:
+
+        for axis in range(dims):
+            diff = fabs(b[axis] - a[axis])
+            if diff > dist:
+                dist = diff
+
+    elif metric == METRIC_COSINE:
+
+        # Vectors with no direction are at the distance 1 from all other vectors
+        if (norm_a == 0) or (norm_b == 0):
+            return 1.0
+
+        for axis in range(dims):
+            dist += a[axis]*b[axis]
+
+        # Rounding can give small negative distances between vectors in the same direction
+        dist = max(1.0 - dist/(norm_a*norm_b), 0.0)
+
+    elif metric == METRIC_HAVERSINE:
+
+        # Points are given as (latitude, longitude) in radians, the raw distance is the haversine of the 
+        # central angle
+        sin_lat = sin((b[0] - a[0])/2)
+        sin_lon = sin((b[1] - a[1])/2)
+        dist = sin_lat*sin_lat + cos(a[0])*cos(b[0])*sin_lon*sin_lon
+
+    return dist
+
 
+
+cdef inline double rawThreshold(double eps, int metric) noexcept nogil:
+    """ Converts eps to the raw form of the given metric (see rawDistance). """
+
+    if metric == METRIC_EUCLIDEAN:
+        return eps*eps
+
+    elif metric == METRIC_HAVERSINE:
+        if eps >= M_PI:
+            return 1.0
+        return sin(eps/2)**2
+
+    return eps
+
+
+
+cdef inline floating finishDistance(floating dist, int metric) noexcept nogil:
+    """ Converts a raw distance (see rawDistance) to the real distance in the given metric. """
+
+    if metric == METRIC_EUCLIDEAN:
+        return sqrt(dist)
+
+    elif metric == METRIC_HAVERSINE:
+        return 2*asin(sqrt(min(max(<double>dist, 0.0), 1.0)))
+
+    return dist
+
+
+
+cdef inline double boxRadius(double eps, int metric) noexcept nogil:
+    """ Returns the largest difference along any axis between two points which are within eps in the given 
+        metric. Used for pruning the cells and nodes of spatial indices.
     """
 
-    # Init used variables
-    cdef int k = 0
-    cdef int j
+    if metric == METRIC_SQEUCLIDEAN:
+        return sqrt(eps)
+
+    return eps
+
+
+
+cdef inline int addNeighbor(const floating *x, const floating *y, floating x_norm, int j, int dims, int metric, 
+    const floating *norms, floating raw_eps, int *indices, floating *distances, int k) noexcept nogil:
+    """ Adds the point j to the list of neighbors if it is within the distance eps of the query point x. The 
+        distance is stored next to the index, so it does not have to be computed again.
+
+    Arguments:
+        x: [pointer] coordinates of the query point
+        y: [pointer] coordinates of the point j
+        x_norm: [floating] norm of the query point, only used by the cosine metric
+        j: [int] index of the candidate neighbor
+        dims: [int] number of dimensions
+        metric: [int] metric code (one of the METRIC_* constants)
+        norms: [pointer] norms of all points, NULL if the metric is not cosine
+        raw_eps: [floating] eps in the raw form of the metric (see rawThreshold)
+        indices: [pointer] array into which the indices of neighbors are written, if NULL the neighbors are
+            only counted
+        distances: [pointer] array into which the distances to neighbors are written
+        k: [int] current number of neighbors
+
+    Return:
+        k: [int] updated number of neighbors
+    """
+
+    cdef floating dist
+
+    if norms != NULL:
+        dist = rawDistance(x, y, dims, metric, x_norm, norms[j])
+    else:
+        dist = rawDistance(x, y, dims, metric, 0, 0)
+
+    if dist <= raw_eps:
+
+        if indices != NULL:
+            indices[k] = j
+            distances[k] = finishDistance(dist, metric)
+
+        k += 1
+
+    return k
+
+
+
+cdef class SpatialIndex:
+    """ Base class for spatial indices used for eps-range neighbor queries. The index is built once per run 
+        and only stores the structure, the point coordinates are passed with every query (see getNeighbors).
+
+        The base class does a brute force scan over all points, and it supports all metrics.
+    """
+
+    cdef public int size
+    cdef public double eps
+
+    # Metric code and the number of dimensions
+    cdef public int metric
+    cdef public int dims
+
+    # Type of the index (one of the INDEX_* constants), used to choose the query function
+    cdef public int kind
+
+    # Number of points for which the buffers of the index are allocated, -1 if they are not allocated
+    cdef int capacity
+
+    # Norms of all points in the precision of the coordinates, only used by the cosine metric (the pointer is
+    # NULL for other metrics)
+    cdef object norms
+    cdef const void *norms_ptr
+
+
+    def __init__(self, points, double eps, metric='euclidean'):
+        """ Initilization function for the index.
+
+        Arguments:
+            points: [ndarray] numpy 2D array containing the coordinates of indexed points (1 point per row)
+            eps: [float] epsilon value, i.e. maximum distance to neighbors
+
+        Keyword arguments:
+            metric: [str] distance metric, see METRICS for supported metrics
+
+        """
+
+        if metric not in METRICS:
+            raise ValueError("Unknown metric '{:s}', use one of: {:s}".format(str(metric), 
+                ', '.join(sorted(METRICS))))
+
+        self.size = points.shape[0]
+        self.eps = eps
+        self.metric = METRICS[metric]
+        self.dims = points.shape[1]
+        self.kind = INDEX_BRUTE
+        self.capacity = -1
+
+        if (self.metric == METRIC_HAVERSINE) and (self.dims != 2):
+            raise ValueError('The haversine metric requires 2D (latitude, longitude) input data!')
+
+        # Precompute the norms for the cosine metric
+        self.norms_ptr = NULL
+        if self.metric == METRIC_COSINE:
+            self.norms = np.ascontiguousarray(np.sqrt(np.einsum('ij,ij->i', points, points)))
+            self.norms_ptr = np.PyArray_DATA(self.norms)
+
+
+    cdef void reserve(self, int capacity):
+        """ Allocates the buffers of the index for up to the given number of points, so the index can be
+            rebuilt on other points without the GIL (see rebuildIndex). The brute force scan has no buffers.
+        """
+
+        pass
+
+
+
+cdef int queryBrute(SpatialIndex index, const floating *points, const floating *x, floating x_norm, int i,
+    double eps, int *indices, floating *distances, np.int64_t *evaluated) noexcept nogil:
+    """ Finds indices of all neighbors of a given point by scanning all points. 
+
+    Arguments:
+        index: [SpatialIndex] spatial index built on the points
+        points: [pointer] C-ordered 2D array containing the coordinates of indexed points (1 point per row)
+        x: [pointer] coordinates of the query point
+        x_norm: [floating] norm of the query point, only used by the cosine metric
+        i: [int] index of the query point among the indexed points, which is skipped, or UNDEFINED if the 
+            query point is not indexed
+        eps: [double] epsilon value, i.e. maximum distance to neighbors
+        indices: [pointer] array into which the indices of neighbors are written, if NULL the neighbors are 
+            only counted
+        distances: [pointer] array into which the distances to neighbors are written
+        evaluated: [pointer] if not NULL, the number of computed distances is added to it
+
+    Return:
+        k: [int] number of found neighbors
+
+    """
+
+    cdef int j, k = 0
+    cdef floating raw_eps = <floating>rawThreshold(eps, index.metric)
+    cdef const floating *norms = <const floating *>index.norms_ptr
 
-    # Init neighbor indices array, set them all to undefined
-    cdef np.ndarray[INT_TYPE_t, ndim=1] indices = np.zeros(point_list.shape[0], dtype=INT_TYPE) + UNDEFINED
-    
     # Go through all points and find neighbors
-    for j in range(point_list.shape[0]):
-        
+    for j in range(index.size):
+
         # Skip if on the input point
         if i == j:
             continue
 
         # Check if the current point is close enough
-        if euclidianDistance(point_list[i, COLUMNS_TOTAL], point_list[i, COLUMNS_TOTAL+1], 
-            point_list[j, COLUMNS_TOTAL], point_list[j, COLUMNS_TOTAL+1]) <= eps:
+        k = addNeighbor(x, points + <Py_ssize_t>j*index.dims, x_norm, j, index.dims, index.metric, norms, 
+            raw_eps, indices, distances, k)
 
-            # Add the point to the neighbors list
-            indices[k] = j
-            k += 1
+    # Count the distances to all points except the query point
+    if evaluated != NULL:
+        evaluated[0] += index.size - (1 if 0 <= i < index.size else 0)
 
-    return indices, k
+    return k
 
 
 
-cdef float coreDistance(np.ndarray[FLOAT_TYPE_t, ndim=2] point_list, int i, 
-    np.ndarray[INT_TYPE_t, ndim=1] neighbor_indices, int neighbors_count, float eps, int min_pts):
-    """ Calculates the core distance, i.e. distance from the point to the Nth neighbor, in this case the 
-    (min_pts-1)th neighbor. 
+def checkBoxMetric(metric, index_name):
+    """ Raises an error if the metric cannot be used with indices which prune the search by bounding boxes. """
+
+    if METRICS.get(metric) in (METRIC_COSINE, METRIC_HAVERSINE):
+        raise ValueError("The '{:s}' metric is not supported by the {:s} index, use the brute index!".format(
+            metric, index_name))
+
+
+
+def dataBounds(points):
+    """ Computes the minimum and the maximum of every coordinate, in chunks of rows.
 
     Arguments:
-        point_list: [ndarray] numpy 2D array which contains information about individual points
-        i: [int] index of a point we are currently processing
-        neighbor_indices: [ndarray] numpy 1D array containing indices of neighbors
-        neighbors_count: [int] number of neighbors in the neighbors_indices list (the list is of fixed size, 
-            so this is used to track the number of points inside)
-        eps: [float] epsilon value, i.e. maximum distance to neighbors
-        min_pts: [int] minimum number of points 
+        points: [ndarray] numpy 2D array containing the coordinates of points (1 point per row)
 
     Return:
-        [float]: core distance
+        (points_min, points_max): [tuple of ndarrays] per-axis minimum and maximum, zeros for empty input
     """
 
-    cdef np.ndarray[FLOAT_TYPE_t, ndim=1] referent_point = point_list[i]
-    cdef int k
+    if points.shape[0] == 0:
+        return np.zeros(points.shape[1]), np.zeros(points.shape[1])
 
-    # # Get the number of neighbors
-    # cdef int neighbors_count = neighbor_indices.shape[0]
+    points_min = np.zeros(points.shape[1]) + np.inf
+    points_max = np.zeros(points.shape[1]) - np.inf
 
-    # Init the neighbor distances array
-    cdef np.ndarray[FLOAT_TYPE_t, ndim=1] neighbor_distances = np.zeros(neighbors_count, dtype=FLOAT_TYPE)
+    for start in range(0, points.shape[0], INPUT_CHUNK_SIZE):
+        chunk = points[start:start + INPUT_CHUNK_SIZE]
+        points_min = np.minimum(points_min, np.min(chunk, axis=0))
+        points_max = np.maximum(points_max, np.max(chunk, axis=0))
 
-    # If the core distance was already calculated, return it
-    if referent_point[CORE_DIST_IND] != UNDEFINED:
-        return referent_point[CORE_DIST_IND]
+    return points_min, points_max
 
-    # Check if there are enough neighbors to proceed
-    if neighbors_count >= min_pts-1:
 
-        # Calculate the distance to each neighbor
-        for k in range(neighbors_count):
-            neighbor_distances[k] = euclidianDistance(referent_point[COLUMNS_TOTAL], 
-                referent_point[COLUMNS_TOTAL+1], 
-                point_list[neighbor_indices[k], COLUMNS_TOTAL], 
-                point_list[neighbor_indices[k], COLUMNS_TOTAL+1])
 
-        # Sort the neighbor distance list
-        neighbor_distances = np.sort(neighbor_distances)
+cdef double pointBounds(const floating *points, int size, int dims, double *points_min, double *points_max) \
+    noexcept nogil:
+    """ Computes the minimum and the maximum of every coordinate, as dataBounds does, and the extent of the
+        data, i.e. the largest absolute value of the bounds.
 
-        # Take a next-to-last point from the min_pts
-        return neighbor_distances[min_pts-2]
+    Arguments:
+        points: [pointer] C-ordered 2D array containing the coordinates of points (1 point per row)
+        size: [int] number of points
+        dims: [int] number of dimensions
+        points_min: [pointer] array of dims values into which the minimum of every coordinate is written
+        points_max: [pointer] array of dims values into which the maximum of every coordinate is written
 
-    # If there are not enough neighbors, the core distance remains undefined
-    else:
-        return UNDEFINED
+    Return:
+        [double] extent of the data, 0 for empty input
+    """
 
-        
+    cdef int j, axis
+    cdef double value, extent = 0
 
-def update(np.ndarray[FLOAT_TYPE_t, ndim=2] point_list, int i, 
-    np.ndarray[INT_TYPE_t, ndim=1] neighbor_indices, int neighbors_count, 
-    np.ndarray[INT_TYPE_t, ndim=1] seeds, int seed_count):
-    """ Update the seeds' reachability distance if a smaller value is found. 
-    
-    Arguments:
-        point_list: [ndarray] numpy 2D array which contains information about individual points
-        i: [int] index of a point we are currently processing
-        neighbor_indices: [ndarray] numpy 1D array containing indices of neighbors
-        neighbors_count: [int] number of neighbors in the neighbors_indices array (the array is of fixed size, 
-            so this is used to track the number of points inside)
-        seeds: [ndarray] numpy 1D array containing indices of seeds 
-        seed_count: [int] number of seeds in the seeds array (the array is of fixed size, so this is used to 
-            track the number of points inside)
+    for axis in range(dims):
+        points_min[axis] = INFINITY if size else 0
+        points_max[axis] = -INFINITY if size else 0
 
-    Return:
-        point_list: [ndarray] updated point_list
-        seeds: [ndarray] updated seed indices
-        seed_count: [int] updated seeds array
+    for j in range(size):
+        for axis in range(dims):
+
+            value = points[<Py_ssize_t>j*dims + axis]
+
+            if value < points_min[axis]:
+                points_min[axis] = value
+
+            if value > points_max[axis]:
+                points_max[axis] = value
+
+    for axis in range(dims):
+        extent = max(extent, fabs(points_min[axis]), fabs(points_max[axis]))
+
+    return extent
+
+
+
+cdef int compareCellKeys(const void *a, const void *b) noexcept nogil:
+    """ Orders (cell key, point index) pairs by the key and then by the index, as a stable sort by the key. """
+
+    cdef const np.int64_t *pair_a = <const np.int64_t *>a
+    cdef const np.int64_t *pair_b = <const np.int64_t *>b
+
+    if pair_a[0] != pair_b[0]:
+        return -1 if pair_a[0] < pair_b[0] else 1
+
+    if pair_a[1] != pair_b[1]:
+        return -1 if pair_a[1] < pair_b[1] else 1
+
+    return 0
+
+
+
+cdef class GridIndex(SpatialIndex):
+    """ Uniform grid with eps-sized cells. Points are sorted by their cell, and only the cells overlapping 
+        the eps-box around the query point are scanned. Only occupied cells are stored, so the memory does not
+        depend on the extent of the data.
     """
 
-    cdef int k
-    cdef float new_reach
-    cdef np.ndarray[FLOAT_TYPE_t, ndim=1] neighbor = np.zeros(point_list.shape[1], dtype=FLOAT_TYPE)
+    # Lower corner of the grid and the cell size
+    cdef double[::1] origin
+    cdef double cell_size
 
-    # Go through all neighbors
-    for k in range(neighbors_count):
+    # Number of cells and the key stride along every axis
+    cdef np.int64_t[::1] cells_n
+    cdef np.int64_t[::1] strides
 
-        neighbor = point_list[neighbor_indices[k]]
+    # Sorted keys of occupied cells, with the range of their points in the sorted point list
+    cdef np.int64_t[::1] cell_keys
+    cdef np.int64_t[::1] cell_start
+    cdef Py_ssize_t cell_count
 
-        # Check if the neighbor is not processed
-        if neighbor[PROCESSED_FLAG_IND] == UNPROCESSED:
+    # Indices of points sorted by cells
+    cdef int[::1] sorted_points
 
-            # Find a new reachability distance, it is a max between the core distance in the distance between
-            # the point and the neighbor
-            new_reach = max(point_list[i, CORE_DIST_IND], euclidianDistance(point_list[i,COLUMNS_TOTAL], 
-                point_list[i,COLUMNS_TOTAL+1], neighbor[COLUMNS_TOTAL], neighbor[COLUMNS_TOTAL+1]))
+    # Work buffer of (cell key, point index) pairs which are sorted when the grid is built
+    cdef np.int64_t[:, ::1] point_keys
 
-            # If the reachability distance was not previously defined, set it to the new calculated value
-            if neighbor[REACHABILITY_DIST_IND] == UNDEFINED:
-                point_list[neighbor_indices[k], REACHABILITY_DIST_IND] = new_reach
+    # Tolerance added to the search radius
+    cdef double tolerance
 
-                # Add a new seed
-                seeds[seed_count] = neighbor_indices[k]
-                seed_count += 1
 
-            # If the newly calculated reachability is smaller, set it as the new reachability distance
-            elif new_reach < neighbor[REACHABILITY_DIST_IND]:
-                
-                # Set the new reachability distance
-                point_list[neighbor_indices[k], REACHABILITY_DIST_IND] = new_reach
+    def __init__(self, points, double eps, metric='euclidean'):
 
+        SpatialIndex.__init__(self, points, eps, metric=metric)
+        self.kind = INDEX_GRID
 
-    return point_list, seeds, seed_count
+        checkBoxMetric(metric, 'grid')
 
+        if eps <= 0:
+            raise ValueError('eps must be positive to build a grid index!')
 
+        if self.dims > GRID_MAX_DIMENSIONS:
+            raise ValueError('The grid index supports at most {:d} dimensions, use the kdtree index!'.format(
+                GRID_MAX_DIMENSIONS))
+
+        self.cell_size = boxRadius(eps, self.metric)
+
+        self.origin = np.zeros(self.dims, dtype=FLOAT_TYPE)
+        self.cells_n = np.zeros(self.dims, dtype=np.int64)
+        self.strides = np.zeros(self.dims, dtype=np.int64)
+
+        self.reserve(self.size)
+        buildIndexOn(self, points)
+
+
+    cdef void reserve(self, int capacity):
+
+        if capacity <= self.capacity:
+            return
+
+        self.capacity = capacity
+
+        self.cell_keys = np.zeros(capacity, dtype=np.int64)
+        self.cell_start = np.zeros(capacity + 1, dtype=np.int64)
+        self.sorted_points = np.zeros(capacity, dtype=INT_TYPE)
+        self.point_keys = np.zeros((max(capacity, 1), 2), dtype=np.int64)
 
-cdef int getUnprocessed(np.ndarray[FLOAT_TYPE_t, ndim=2] point_list):
-    """ Returns the index of the next unprocessed point. 
+
+    cdef Py_ssize_t findCell(self, np.int64_t key) noexcept nogil:
+        """ Returns the position of the cell with the given key, or -1 if the cell is empty. """
+
+        cdef Py_ssize_t lo = 0
+        cdef Py_ssize_t hi = self.cell_count
+        cdef Py_ssize_t mid
+
+        # Binary search through the sorted cell keys
+        while lo < hi:
+            mid = (lo + hi)//2
+            if self.cell_keys[mid] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < self.cell_count and self.cell_keys[lo] == key:
+            return lo
+
+        return -1
+
+
+
+cdef int buildGrid(GridIndex index, const floating *points, int size) noexcept nogil:
+    """ Sorts the points by their cells. The buffers of the index have to be reserved for the given number of 
+        points.
 
     Arguments:
-        point_list: [ndarray] numpy 2D array which contains information about individual points
+        index: [GridIndex] grid index, its cell size is already set
+        points: [pointer] C-ordered 2D array containing the coordinates of indexed points (1 point per row)
+        size: [int] number of points
 
     Return:
-        [int]: index of the next unprocessed point
+        [int] 0, or -1 if the cells cannot be addressed by a 64-bit key
     """
 
-    cdef int i
+    cdef int j, axis
+    cdef Py_ssize_t m
+    cdef np.int64_t key
+    cdef double log_cells = 0
+    cdef double points_max[GRID_MAX_DIMENSIONS]
 
-    for i in range(point_list.shape[0]):
+    index.size = size
 
-        # Choose an unprocessed point
-        if point_list[i, PROCESSED_FLAG_IND] == UNPROCESSED:
-            return i
+    # Compute the extent of the grid
+    cdef double points_extent = pointBounds(points, size, index.dims, &index.origin[0], points_max)
+    index.tolerance = INDEX_RADIUS_TOLERANCE*(index.cell_size + points_extent)
 
-    # If there is nothing to process, return UNDEFINED
-    return UNDEFINED
+    for axis in range(index.dims):
+        index.cells_n[axis] = <np.int64_t>floor((points_max[axis] - index.origin[axis])/index.cell_size) + 1
+        log_cells += log2(<double>index.cells_n[axis])
 
+    # Check that all cells can be addressed by a 64-bit key
+    if log_cells > 62:
+        return -1
 
+    # Compute the linear key of every cell (the last axis changes the fastest)
+    for axis in range(index.dims - 1, -1, -1):
+        index.strides[axis] = index.strides[axis + 1]*index.cells_n[axis + 1] if axis < index.dims - 1 else 1
+
+    # Compute the cell key of every point
+    for j in range(size):
+
+        key = 0
+        for axis in range(index.dims):
+            key += <np.int64_t>floor((points[<Py_ssize_t>j*index.dims + axis] - index.origin[axis])
+                /index.cell_size)*index.strides[axis]
+
+        index.point_keys[j, 0] = key
+        index.point_keys[j, 1] = j
+
+    # Sort the points by their cell keys and find where every cell starts
+    qsort(&index.point_keys[0, 0], size, 2*sizeof(np.int64_t), compareCellKeys)
+
+    index.cell_count = 0
+    for m in range(size):
+
+        index.sorted_points[m] = <int>index.point_keys[m, 1]
+
+        if (m == 0) or (index.point_keys[m, 0] != index.point_keys[m - 1, 0]):
+            index.cell_keys[index.cell_count] = index.point_keys[m, 0]
+            index.cell_start[index.cell_count] = m
+            index.cell_count += 1
+
+    index.cell_start[index.cell_count] = size
+
+    return 0
+
+
+
+cdef int queryGrid(GridIndex index, const floating *points, const floating *x, floating x_norm, int i, 
+    double eps, int *indices, floating *distances, np.int64_t *evaluated) noexcept nogil:
+    """ Finds indices of all neighbors of a given point by scanning the grid cells around it. See queryBrute
+        for the description of arguments. 
+    """
+
+    cdef int j, k = 0, axis
+    cdef Py_ssize_t cell, m
+    cdef np.int64_t key
+    cdef floating raw_eps = <floating>rawThreshold(eps, index.metric)
+    cdef const floating *norms = <const floating *>index.norms_ptr
+    cdef double radius = boxRadius(eps, index.metric) + index.tolerance
+    cdef np.int64_t cell_lo[GRID_MAX_DIMENSIONS]
+    cdef np.int64_t cell_hi[GRID_MAX_DIMENSIONS]
+    cdef np.int64_t cell_curr[GRID_MAX_DIMENSIONS]
+
+    # Find the range of cells which overlap the eps-box around the point
+    for axis in range(index.dims):
+
+        cell_lo[axis] = <np.int64_t>floor((x[axis] - radius - index.origin[axis])/index.cell_size)
+        cell_hi[axis] = <np.int64_t>floor((x[axis] + radius - index.origin[axis])/index.cell_size)
+
+        # Clip the range to the grid
+        if cell_lo[axis] < 0:
+            cell_lo[axis] = 0
+        if cell_hi[axis] > index.cells_n[axis] - 1:
+            cell_hi[axis] = index.cells_n[axis] - 1
+
+        # Skip the search if the box does not overlap the grid
+        if cell_lo[axis] > cell_hi[axis]:
+            return 0
+
+        cell_curr[axis] = cell_lo[axis]
+
+    # Go through all cells in the range
+    while True:
+
+        # Compute the key of the current cell
+        key = 0
+        for axis in range(index.dims):
+            key += cell_curr[axis]*index.strides[axis]
+
+        cell = index.findCell(key)
+
+        # Check all points in the cell
+        if cell >= 0:
+
+            # Count the distances to all points in the cell, the query point is subtracted at the end
+            if evaluated != NULL:
+                evaluated[0] += index.cell_start[cell + 1] - index.cell_start[cell]
+
+            for m in range(index.cell_start[cell], index.cell_start[cell + 1]):
+
+                j = index.sorted_points[m]
+
+                # Skip if on the input point
+                if i == j:
+                    continue
+
+                k = addNeighbor(x, points + <Py_ssize_t>j*index.dims, x_norm, j, index.dims, index.metric, 
+                    norms, raw_eps, indices, distances, k)
+
+        # Move to the next cell in the range
+        axis = index.dims - 1
+        while axis >= 0:
+            cell_curr[axis] += 1
+            if cell_curr[axis] <= cell_hi[axis]:
+                break
+            cell_curr[axis] = cell_lo[axis]
+            axis -= 1
+
+        # Stop when all cells were visited
+        if axis < 0:
+            break
+
+    # An indexed query point is always in one of the visited cells
+    if (evaluated != NULL) and (i != UNDEFINED):
+        evaluated[0] -= 1
+
+    return k
+
+
+
+cdef class KDTreeIndex(SpatialIndex):
+    """ Static KD-tree split at the median of the widest axis. Every node keeps the bounding box of its points
+        which is used to prune the eps-range search.
+    """
+
+    # Indices of points, ordered so the points of every node are contiguous
+    cdef int[::1] tree_points
+
+    # Range of the node in tree_points and indices of child nodes (-1 for leaves)
+    cdef int[::1] node_start
+    cdef int[::1] node_end
+    cdef int[::1] node_left
+    cdef int[::1] node_right
+
+    # Bounding boxes of nodes
+    cdef double[:, ::1] node_lo
+    cdef double[:, ::1] node_hi
+
+    # Tolerance added to the search radius
+    cdef double tolerance
+
+    # Work buffer of nodes which are still to be split when the tree is built
+    cdef int[::1] node_stack
+
+
+    def __init__(self, points, double eps, metric='euclidean'):
+
+        SpatialIndex.__init__(self, points, eps, metric=metric)
+        self.kind = INDEX_KDTREE
+
+        checkBoxMetric(metric, 'kdtree')
+
+        self.reserve(self.size)
+        buildIndexOn(self, points)
+
+
+    cdef void reserve(self, int capacity):
+
+        if capacity <= self.capacity:
+            return
+
+        self.capacity = capacity
+
+        # Allocate the nodes (a tree with leaves of at least leaf_size/2 points cannot have more nodes)
+        cdef int max_nodes = 2*(2*capacity//KDTREE_LEAF_SIZE + 1)
+        self.node_start = np.zeros(max_nodes, dtype=INT_TYPE)
+        self.node_end = np.zeros(max_nodes, dtype=INT_TYPE)
+        self.node_left = np.zeros(max_nodes, dtype=INT_TYPE) + UNDEFINED
+        self.node_right = np.zeros(max_nodes, dtype=INT_TYPE) + UNDEFINED
+        self.node_lo = np.zeros((max_nodes, max(self.dims, 1)), dtype=FLOAT_TYPE)
+        self.node_hi = np.zeros((max_nodes, max(self.dims, 1)), dtype=FLOAT_TYPE)
+        self.node_stack = np.zeros(max_nodes, dtype=INT_TYPE)
+        self.tree_points = np.zeros(capacity, dtype=INT_TYPE)
+
+
+
+cdef void selectPoints(const floating *points, int dims, int axis, int *items, int count, int k) \
+    noexcept nogil:
+    """ Reorders the points so the one with the k-th smallest coordinate along the axis is on the position k,
+        with no larger coordinates before it and no smaller ones after it (as numpy.argpartition).
 
-def runCyOPTICS(np.ndarray[FLOAT_TYPE_t, ndim=2] input_list, float eps, int min_pts):
-    """ Runs the OPTICS algorithm on the given data.
-        
     Arguments:
-        input_list: [ndarray] 2D numpy array containing the input data (1 datum per row)
-        eps: [float] epsilon parameter - maximum distance between points
-        min_pts: [int] minimum points in the cluster
-        
-    Return:
-        point_list: [ndarray] 2D numpy array containing information about every processed point, the columns
-            of the array are:
-            - processed: 0 for not processed, 1 for processed - upon returning, processed values of all 
-                entries should be 1
-            - reachability distance: -1 for first points in the cluster, positive for all others
-            - core distance: -1 for noise, positive otherwise (the notion of noise can change with regard to 
-                the different input values eps and min_pts)
-            - input data points (the input data colums are appended to the right)
+        points: [pointer] C-ordered 2D array containing the coordinates of points (1 point per row)
+        dims: [int] number of dimensions
+        axis: [int] axis along which the points are compared
+        items: [pointer] indices of the reordered points
+        count: [int] number of the reordered points
+        k: [int] position which is selected
+
     """
 
-    cdef int i, neighbor
-    cdef int input_list_size = input_list.shape[0]
+    cdef int lo = 0, hi = count - 1, i, j, item
+    cdef floating pivot
 
-    # Add the processed flag, reachability distance and core distance columns in the points list
-    cdef np.ndarray[FLOAT_TYPE_t, ndim=2] point_list = np.hstack((np.zeros(shape=(input_list_size, 
-        COLUMNS_TOTAL)), input_list))
+    while hi > lo:
 
-    # Set all points as unprocessed
-    point_list[:,PROCESSED_FLAG_IND] = UNPROCESSED
+        # Partition the range around the coordinate of its middle point
+        pivot = points[<Py_ssize_t>items[(lo + hi)//2]*dims + axis]
+        i = lo
+        j = hi
 
-    # Set the reachability and core distance to -1 (value for undefined)
-    point_list[:,REACHABILITY_DIST_IND] = UNDEFINED
-    point_list[:,CORE_DIST_IND] = UNDEFINED
+        while i <= j:
 
-    # Init the ordered list
-    cdef np.ndarray[INT_TYPE_t, ndim=1] ordered_list = np.zeros(input_list_size, dtype=INT_TYPE)
-    cdef int ordered_count = 0
+            while points[<Py_ssize_t>items[i]*dims + axis] < pivot:
+                i += 1
 
-    # Init the seeds list
-    cdef np.ndarray[INT_TYPE_t, ndim=1] seeds = np.zeros(input_list_size, dtype=INT_TYPE)
-    cdef int seed_count = 0
+            while points[<Py_ssize_t>items[j]*dims + axis] > pivot:
+                j -= 1
 
-    # Init neighbor indices
-    cdef np.ndarray[INT_TYPE_t, ndim=1] neighbor_indices = np.zeros(input_list_size, dtype=INT_TYPE)
-    cdef int neighbors_count = 0
+            if i <= j:
+                item = items[i]
+                items[i] = items[j]
+                items[j] = item
+                i += 1
+                j -= 1
 
-    # Set the unprocessed counter
-    cdef int unprocessed_count = input_list_size
+        # Continue in the part which contains the position k, the points between the parts are equal to the
+        # pivot
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            break
 
-    # Repeat while there are unprocessed points
-    while unprocessed_count:
 
-        # Get the index of the unprocessed point
-        i = getUnprocessed(point_list)
 
-        # Get the neighboring points
-        neighbor_indices, neighbors_count = getNeighbors(point_list, i, eps)
+cdef void buildKDTree(KDTreeIndex index, const floating *points, int size) noexcept nogil:
+    """ Splits the points into the nodes of the tree. The buffers of the index have to be reserved for the 
+        given number of points.
 
-        # Mark the point as processed and add to ordered list
-        point_list[i, PROCESSED_FLAG_IND] = PROCESSED
-        ordered_list[ordered_count] = i
-        ordered_count += 1
-        unprocessed_count -= 1
+    Arguments:
+        index: [KDTreeIndex] KD-tree index
+        points: [pointer] C-ordered 2D array containing the coordinates of indexed points (1 point per row)
+        size: [int] number of points
 
-        # Get the core distance
-        point_list[i, CORE_DIST_IND] = coreDistance(point_list, i, neighbor_indices, neighbors_count, 
-            eps, min_pts)
+    """
 
+    cdef int j, m, node, start, end, mid, axis, widest, stack_count
+    cdef int nodes_count = 1
+    cdef double width, widest_width, value
 
-        # If the core distance is not undefined
-        if point_list[i, CORE_DIST_IND] != UNDEFINED:
+    index.size = size
 
-            # Reset the seed list
-            seeds[:] = UNDEFINED
-            seed_count = 0
+    # The bounding box of the root are the bounds of all points
+    cdef double points_extent = pointBounds(points, size, index.dims, &index.node_lo[0, 0], 
+        &index.node_hi[0, 0])
+    index.tolerance = INDEX_RADIUS_TOLERANCE*(boxRadius(index.eps, index.metric) + points_extent)
 
-            # Update reachability distance for each unprocessed neighbor
-            point_list, seeds, seed_count = update(point_list, i, neighbor_indices, neighbors_count, seeds, 
-                seed_count)
+    for j in range(size):
+        index.tree_points[j] = j
 
-            # Go through seeds while there are any
-            while seeds[0] != UNDEFINED:
+    # Split the nodes, starting from the root
+    index.node_start[0] = 0
+    index.node_end[0] = size
+    index.node_stack[0] = 0
+    stack_count = 1
 
-                ### Sort seeds by reachability
+    while stack_count:
 
-                # Set the last seeds to UNDEFINED
-                seeds[seed_count:] = UNDEFINED
+        stack_count -= 1
+        node = index.node_stack[stack_count]
+        start = index.node_start[node]
+        end = index.node_end[node]
 
-                # Find all seeds that have values and sort them
-                seeds_sort_indices = seeds[point_list[seeds[seeds > UNDEFINED]][:,REACHABILITY_DIST_IND].argsort()]
-                seeds[:seed_count] = seeds_sort_indices
+        index.node_left[node] = UNDEFINED
+        index.node_right[node] = UNDEFINED
 
-                ###
-                
+        # Compute the bounding box of the node
+        if (node > 0) and (end > start):
+
+            for axis in range(index.dims):
+                index.node_lo[node, axis] = INFINITY
+                index.node_hi[node, axis] = -INFINITY
+
+            for m in range(start, end):
+                for axis in range(index.dims):
+
+                    value = points[<Py_ssize_t>index.tree_points[m]*index.dims + axis]
+
+                    if value < index.node_lo[node, axis]:
+                        index.node_lo[node, axis] = value
+
+                    if value > index.node_hi[node, axis]:
+                        index.node_hi[node, axis] = value
+
+        # Leave small nodes as leaves
+        if end - start <= KDTREE_LEAF_SIZE:
+            continue
 
-                # Take the first point in seeds as the neighbor
-                neighbor = seeds[0]
+        # Split the node at the median of the widest axis
+        widest = 0
+        widest_width = -INFINITY
+        for axis in range(index.dims):
 
-                # Mark the neighbor as processed and add to the ordered list
-                point_list[neighbor, PROCESSED_FLAG_IND] = PROCESSED
-                ordered_list[ordered_count] = neighbor
-                ordered_count += 1
-                unprocessed_count -= 1
+            width = index.node_hi[node, axis] - index.node_lo[node, axis]
 
+            if width > widest_width:
+                widest = axis
+                widest_width = width
 
-                # Remove the taken neighbor from the seed list and shift all seeds after one index down
-                seeds[0 : input_list_size-2] = seeds[1 : input_list_size-1]
+        mid = (start + end)//2
+        selectPoints(points, index.dims, widest, &index.tree_points[start], end - start, mid - start)
 
-                # Set the last element to UNDEFINED
-                seeds[input_list_size-1] = UNDEFINED
+        # Add the children
+        index.node_start[nodes_count] = start
+        index.node_end[nodes_count] = mid
+        index.node_start[nodes_count + 1] = mid
+        index.node_end[nodes_count + 1] = end
+        index.node_left[node] = nodes_count
+        index.node_right[node] = nodes_count + 1
+        index.node_stack[stack_count] = nodes_count
+        index.node_stack[stack_count + 1] = nodes_count + 1
+        stack_count += 2
+        nodes_count += 2
 
-                # Decrement the seed count
-                seed_count -= 1
 
 
-                # Find neighbors of the chosen neighbor
-                neighbor_indices_mark, neighbors_count_mark = getNeighbors(point_list, neighbor, eps)
+cdef int rebuildIndex(SpatialIndex index, const floating *points, int size, const floating *norms) \
+    noexcept nogil:
+    """ Builds the index on the given points, without the GIL, reusing its buffers. The buffers have to be 
+        reserved for at least the given number of points (see SpatialIndex.reserve), and the eps, metric and
+        the number of dimensions stay the same.
 
-                # Update the core distance for the neighbor
-                point_list[neighbor, CORE_DIST_IND] = coreDistance(point_list, neighbor, 
-                    neighbor_indices_mark, neighbors_count_mark, eps, min_pts)
+    Arguments:
+        index: [SpatialIndex] spatial index
+        points: [pointer] C-ordered 2D array containing the coordinates of indexed points (1 point per row)
+        size: [int] number of points
+        norms: [pointer] norms of the points, used by the cosine metric (NULL for other metrics)
+
+    Return:
+        [int] 0, or -1 if the grid cells cannot be addressed by a 64-bit key
+    """
 
-                # If the neighbor as a core distance
-                if point_list[neighbor, CORE_DIST_IND] != UNDEFINED:
+    index.size = size
+    index.norms_ptr = norms
 
-                    # Update the reachability distance of each entry in neighbor_indices_mark
-                    point_list, seeds, seed_count = update(point_list, neighbor, neighbor_indices_mark, 
-                        neighbors_count_mark, seeds, seed_count)
+    if index.kind == INDEX_GRID:
+        return buildGrid(<GridIndex>index, points, size)
 
+    elif index.kind == INDEX_KDTREE:
+        buildKDTree(<KDTreeIndex>index, points, size)
 
-    return point_list[ordered_list[:ordered_count]]
+    return 0
 
 
 
+def buildIndexOn(SpatialIndex index, points):
+    """ Builds the structure of the index on the points, once its buffers are reserved (see rebuildIndex).
+
+    Arguments:
+        index: [SpatialIndex] spatial index
+        points: [ndarray] numpy 2D array containing the coordinates of indexed points (1 point per row), the 
+            structure is built in float32 for float32 data and in float64 otherwise
+
+    """
+
+    cdef int error
+
+    # The coordinates are read in their own precision, without copying C-ordered arrays of float types
+    points = np.ascontiguousarray(points, dtype=resolveFloatType(None, points.dtype))
+    cdef const void *points_ptr = np.PyArray_DATA(points)
+    cdef bint single_precision = (points.dtype == np.float32)
+
+    with nogil:
+        if single_precision:
+            error = rebuildIndex(index, <const float *>points_ptr, index.size, <const float *>index.norms_ptr)
+        else:
+            error = rebuildIndex(index, <const double *>points_ptr, index.size, 
+                <const double *>index.norms_ptr)
+
+    if error:
+        raise ValueError('The grid index has too many cells for the given eps, use the kdtree index!')
+
+
+
+cdef bint isNodeFar(KDTreeIndex index, const floating *x, int node, double radius) noexcept nogil:
+    """ Checks if the bounding box of the node is farther than the search radius from the point x. """
+
+    cdef int axis
+    cdef double gap, box_dist = 0
+
+    for axis in range(index.dims):
+
+        # Compute the distance between the point and the box along the axis
+        gap = 0
+        if x[axis] < index.node_lo[node, axis]:
+            gap = index.node_lo[node, axis] - x[axis]
+        elif x[axis] > index.node_hi[node, axis]:
+            gap = x[axis] - index.node_hi[node, axis]
+
+        # Combine the gaps in the given metric
+        if index.metric == METRIC_MANHATTAN:
+            box_dist += gap
+        elif index.metric == METRIC_CHEBYSHEV:
+            if gap > box_dist:
+                box_dist = gap
+        else:
+            box_dist += gap*gap
+
+    if (index.metric == METRIC_MANHATTAN) or (index.metric == METRIC_CHEBYSHEV):
+        return box_dist > radius
+
+    return box_dist > radius*radius
+
+
+
+cdef int queryKDTree(KDTreeIndex index, const floating *points, const floating *x, floating x_norm, int i,
+    double eps, int *indices, floating *distances, np.int64_t *evaluated) noexcept nogil:
+    """ Finds indices of all neighbors of a given point by descending into the KD-tree nodes close to it. 
+        See queryBrute for the description of arguments. 
+    """
+
+    cdef int j, k = 0, m, node, stack_count
+    cdef floating raw_eps = <floating>rawThreshold(eps, index.metric)
+    cdef const floating *norms = <const floating *>index.norms_ptr
+    cdef double radius = boxRadius(eps, index.metric) + index.tolerance
+    cdef int stack[KDTREE_STACK_SIZE]
+
+    if index.size == 0:
+        return 0
+
+    # Start from the root
+    stack[0] = 0
+    stack_count = 1
+
+    while stack_count:
+
+        stack_count -= 1
+        node = stack[stack_count]
+
+        # Skip the node if it is too far away
+        if isNodeFar(index, x, node, radius):
+            continue
+
+        # Check all points in leaves
+        if index.node_left[node] == UNDEFINED:
+
+            # Count the distances to all points in the leaf, the query point is subtracted at the end
+            if evaluated != NULL:
+                evaluated[0] += index.node_end[node] - index.node_start[node]
+
+            for m in range(index.node_start[node], index.node_end[node]):
+
+                j = index.tree_points[m]
+
+                # Skip if on the input point
+                if i == j:
+                    continue
+
+                k = addNeighbor(x, points + <Py_ssize_t>j*index.dims, x_norm, j, index.dims, index.metric, 
+                    norms, raw_eps, indices, distances, k)
+
+        # Otherwise descend into children
+        else:
+            stack[stack_count] = index.node_left[node]
+            stack[stack_count + 1] = index.node_right[node]
+            stack_count += 2
+
+    # An indexed query point is always in one of the visited leaves
+    if (evaluated != NULL) and (i != UNDEFINED):
+        evaluated[0] -= 1
+
+    return k
+
+
+
+def buildIndex(points, double eps, index='auto', metric='euclidean'):
+    """ Builds a spatial index used for eps-range neighbor queries.
+
+    Arguments:
+        points: [ndarray] numpy 2D array containing the coordinates of points (1 point per row)
+        eps: [float] epsilon value, i.e. maximum distance to neighbors
+
+    Keyword arguments:
+        index: [str] type of the index:
+            - 'auto': grid for data with up to 3 dimensions, kdtree for more dimensions, and brute for 
+                metrics which the other indices do not support or if eps is not positive (default)
+            - 'grid': uniform grid with eps-sized cells
+            - 'kdtree': KD-tree
+            - 'brute': no index, every query scans all points
+        metric: [str] distance metric, see METRICS for supported metrics
+
+    Return:
+        [SpatialIndex] spatial index object
+
+    """
+
+    if index == 'auto':
+
+        if METRICS.get(metric) in (METRIC_COSINE, METRIC_HAVERSINE):
+            index = 'brute'
+
+        # The grid cannot have cells of zero size, only duplicate points are neighbors in that case
+        elif eps <= 0:
+            index = 'brute'
+
+        elif points.shape[1] <= 3:
+            index = 'grid'
+
+        else:
+            index = 'kdtree'
+
+
+    if index == 'grid':
+        return GridIndex(points, eps, metric=metric)
+
+    elif index == 'kdtree':
+        return KDTreeIndex(points, eps, metric=metric)
+
+    elif index == 'brute':
+        return SpatialIndex(points, eps, metric=metric)
+
+    raise ValueError("Unknown index type '{:s}', use 'auto', 'grid', 'kdtree' or 'brute'!".format(
+        str(index)))
+
+
+
+def checkIndexedPoints(SpatialIndex spatial_index, points, double eps, metric):
+    """ Checks that the spatial index was built on the given points with the given eps and metric.
+
+    Arguments:
+        spatial_index: [SpatialIndex] spatial index, see buildIndex
+        points: [ndarray] 2D numpy array containing the coordinates of points
+        eps: [float] epsilon value of the neighbor queries
+        metric: [str] distance metric, see METRICS
+
+    """
+
+    if (spatial_index.size != points.shape[0]) or (spatial_index.dims != points.shape[1]) \
+        or (spatial_index.eps != eps) or (spatial_index.metric != METRICS.get(metric)):
+        raise ValueError('The spatial index was not built on the input data with the same eps and metric!')
+
+
+
+cdef inline int queryPoint(SpatialIndex index, const floating *points, const floating *x, floating x_norm, 
+    int i, double eps, int *indices, floating *distances, np.int64_t *evaluated) noexcept nogil:
+    """ Finds indices of all indexed points within the distance eps of the query point x, which does not have
+        to be one of the indexed points. See queryBrute for the description of arguments.
+    """
+
+    if index.kind == INDEX_GRID:
+        return queryGrid(<GridIndex>index, points, x, x_norm, i, eps, indices, distances, evaluated)
+
+    elif index.kind == INDEX_KDTREE:
+        return queryKDTree(<KDTreeIndex>index, points, x, x_norm, i, eps, indices, distances, evaluated)
+
+    return queryBrute(index, points, x, x_norm, i, eps, indices, distances, evaluated)
+
+
+
+cdef inline int getNeighbors(SpatialIndex index, const floating *points, int i, double eps, int *indices, 
+    floating *distances, np.int64_t *evaluated) noexcept nogil:
+    """ Finds indices of all neighbors of a given point. Neighbouring points are within the distance eps. 
+    
+    Arguments:
+        index: [SpatialIndex] spatial index built on the input points
+        points: [pointer] C-ordered 2D array containing the input data coordinates (1 point per row)
+        i: [int] index of a point we are currently processing
+        eps: [double] epsilon value, i.e. maximum distance to neighbors
+        indices: [pointer] preallocated array into which the indices of neighbors are written, if NULL the 
+            neighbors are only counted
+        distances: [pointer] preallocated array into which the distances to neighbors are written
+        evaluated: [pointer] if not NULL, the number of computed distances is added to it
+
+    Return:
+        k: [int] number of found neighbors
+
+    """
+
+    cdef floating x_norm = 0
+
+    if index.norms_ptr != NULL:
+        x_norm = (<const floating *>index.norms_ptr)[i]
+
+    return queryPoint(index, points, points + <Py_ssize_t>i*index.dims, x_norm, i, eps, indices, distances, 
+        evaluated)
+
+
+
+cdef inline floating partitionRange(floating *distances, int *indices, int lo, int hi, int *left_end, 
+    int *right_start) noexcept nogil:
+    """ Partitions the distances between lo and hi (included) around the median of the first, middle and the
+        last one. The neighbor indices are moved together with the distances.
+
+    Arguments:
+        distances: [pointer] array containing distances to neighbors
+        indices: [pointer] array containing indices of neighbors, NULL if only the distances are reordered
+        lo: [int] first position of the range
+        hi: [int] last position of the range
+        left_end: [pointer] the last position of the part with distances which are not larger than the pivot
+            is written into it
+        right_start: [pointer] the first position of the part with distances which are not smaller than the
+            pivot is written into it, positions between the two parts hold the pivot
+
+    Return:
+        [floating] pivot
+    """
+
+    cdef int mid, left, right, tmp_ind
+    cdef floating pivot, tmp_dist
+
+    # Choose the median of the first, middle and the last distance as the pivot
+    mid = lo + (hi - lo)//2
+    pivot = distances[mid]
+    if distances[lo] > distances[hi]:
+        if pivot > distances[lo]:
+            pivot = distances[lo]
+        elif pivot < distances[hi]:
+            pivot = distances[hi]
+    else:
+        if pivot > distances[hi]:
+            pivot = distances[hi]
+        elif pivot < distances[lo]:
+            pivot = distances[lo]
+
+    # Partition the range around the pivot
+    left = lo
+    right = hi
+    while left <= right:
+
+        while distances[left] < pivot:
+            left += 1
+
+        while distances[right] > pivot:
+            right -= 1
+
+        if left <= right:
+
+            # Swap the distances and the indices
+            tmp_dist = distances[left]
+            distances[left] = distances[right]
+            distances[right] = tmp_dist
+
+            if indices != NULL:
+                tmp_ind = indices[left]
+                indices[left] = indices[right]
+                indices[right] = tmp_ind
+
+            left += 1
+            right -= 1
+
+    left_end[0] = right
+    right_start[0] = left
+
+    return pivot
+
+
+
+cdef floating selectKth(floating *distances, int *indices, int count, int k) noexcept nogil:
+    """ Finds the k-th smallest distance (0-based) with quickselect, in O(count) on average. The distances 
+        are partially reordered in place, and the neighbor indices are moved together with them.
+
+    Arguments:
+        distances: [pointer] array containing distances to neighbors
+        indices: [pointer] array containing indices of neighbors, NULL if only the distances are reordered
+        count: [int] number of neighbors in the arrays
+        k: [int] rank of the distance to find
+
+    Return:
+        [floating] k-th smallest distance
+    """
+
+    cdef int lo = 0
+    cdef int hi = count - 1
+    cdef int left, right
+
+    while lo < hi:
+
+        partitionRange(distances, indices, lo, hi, &right, &left)
+
+        # Continue in the part which contains the k-th element
+        if k <= right:
+            hi = right
+        elif k >= left:
+            lo = left
+        else:
+            break
+
+    return distances[k]
+
+
+
+cdef floating coreDistance(int *neighbor_indices, floating *neighbor_distances, int neighbors_count, 
+    int min_pts) noexcept nogil:
+    """ Calculates the core distance, i.e. distance from the point to the Nth neighbor, in this case the 
+    (min_pts-1)th neighbor. 
+
+    Arguments:
+        neighbor_indices: [pointer] array containing indices of neighbors, or NULL
+        neighbor_distances: [pointer] array containing distances to neighbors, which were computed during 
+            the neighbor search
+        neighbors_count: [int] number of neighbors in the neighbors_indices list (the list is of fixed size, 
+            so this is used to track the number of points inside)
+        min_pts: [int] minimum number of points 
+
+    Return:
+        [floating]: core distance
+    """
+
+    # Check if there are enough neighbors to proceed
+    if neighbors_count >= min_pts-1:
+
+        # Take a next-to-last point from the min_pts
+        return selectKth(neighbor_distances, neighbor_indices, neighbors_count, min_pts-2)
+
+    # If there are not enough neighbors, the core distance remains undefined
+    else:
+        return UNDEFINED
+
+
+
+cdef floating weightedCoreDistance(int *neighbor_indices, floating *neighbor_distances, int neighbors_count, 
+    const int *weights, int weight, int min_pts) noexcept nogil:
+    """ Calculates the core distance of a point which stands for several copies of itself, when every 
+        neighbor also stands for the given number of copies. The copies of the point are at the distance 0, 
+        so the core distance is the smallest distance at which the copies of the point and of its neighbors
+        add up to min_pts. The distances are partially reordered in place, as in selectKth.
+
+    Arguments:
+        neighbor_indices: [pointer] array containing indices of neighbors
+        neighbor_distances: [pointer] array containing distances to neighbors
+        neighbors_count: [int] number of neighbors in the arrays
+        weights: [pointer] number of copies of every point, indexed by the point index
+        weight: [int] number of copies of the point
+        min_pts: [int] minimum number of points 
+
+    Return:
+        [floating]: core distance
+    """
+
+    cdef np.int64_t needed = min_pts - weight
+    cdef np.int64_t total = 0, low_weight, pivot_weight
+    cdef int lo = 0
+    cdef int hi = neighbors_count - 1
+    cdef int k, left, right
+    cdef floating pivot
+
+    # The copies of the point are enough by themselves
+    if needed <= 0:
+        return 0
+
+    # Check if there are enough neighbors to proceed
+    for k in range(neighbors_count):
+        total += weights[neighbor_indices[k]]
+
+    if total < needed:
+        return UNDEFINED
+
+    # Select the distance at which the weights add up, the weights of the range are never smaller than the 
+    # weight still needed
+    while lo < hi:
+
+        pivot = partitionRange(neighbor_distances, neighbor_indices, lo, hi, &right, &left)
+
+        low_weight = 0
+        for k in range(lo, right + 1):
+            low_weight += weights[neighbor_indices[k]]
+
+        # Continue in the part of the distances up to the pivot
+        if low_weight >= needed:
+            hi = right
+            continue
+
+        pivot_weight = 0
+        for k in range(right + 1, left):
+            pivot_weight += weights[neighbor_indices[k]]
+
+        if low_weight + pivot_weight >= needed:
+            return pivot
+
+        # Continue in the part of the distances from the pivot, with the weight of the skipped neighbors
+        needed -= low_weight + pivot_weight
+        lo = left
+
+    return neighbor_distances[lo]
+
+
+
+def numThreads(n_jobs):
+    """ Converts the n_jobs parameter into the number of threads. 
+
+    Arguments:
+        n_jobs: [int] number of parallel jobs, -1 uses all cores, -2 all cores but one, etc. None is the same 
+            as 1
+
+    Return:
+        [int] number of threads
+    """
+
+    if n_jobs is None:
+        return 1
+
+    n_jobs = int(n_jobs)
+
+    if n_jobs == 0:
+        raise ValueError('n_jobs cannot be 0, use a positive number of jobs or -1 for all cores!')
+
+    # Count negative values from the number of cores
+    if n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+
+    return n_jobs
+
+
+
+cdef void fillNeighborGraph(SpatialIndex index, const floating *points, double eps, np.int64_t *indptr, 
+    int *indices, floating *distances, np.int64_t *evaluated, int threads) noexcept nogil:
+    """ Finds neighbors of all points in parallel. If indices are NULL, the number of neighbors of the point
+        i is written to indptr[i + 1], otherwise the neighbors are written to the rows starting at indptr[i].
+
+    Arguments:
+        index: [SpatialIndex] spatial index built on the input points
+        points: [pointer] C-ordered 2D array containing the input data coordinates (1 point per row)
+        eps: [double] epsilon value, i.e. maximum distance to neighbors
+        indptr: [pointer] row offsets, of size N + 1
+        indices: [pointer] array of neighbor indices, or NULL to count neighbors
+        distances: [pointer] array of distances to neighbors
+        evaluated: [pointer] if not NULL, every thread adds the number of computed distances to its counter, 
+            the counters are COUNTER_STRIDE apart
+        threads: [int] number of threads
+
+    """
+
+    cdef Py_ssize_t i
+    cdef np.int64_t *thread_evaluated
+
+    for i in prange(index.size, num_threads=threads, schedule='dynamic', chunksize=GRAPH_CHUNK_SIZE):
+
+        thread_evaluated = NULL
+        if evaluated != NULL:
+            thread_evaluated = evaluated + threadid()*COUNTER_STRIDE
+
+        if indices == NULL:
+            indptr[i + 1] = getNeighbors(index, points, <int>i, eps, NULL, distances, thread_evaluated)
+
+        else:
+            getNeighbors(index, points, <int>i, eps, indices + indptr[i], distances + indptr[i], 
+                thread_evaluated)
+
+
+
+def computeNeighborGraph(input_list, double eps, index='auto', metric='euclidean', n_jobs=1, dtype=None, 
+    stats=None, SpatialIndex spatial_index=None):
+    """ Finds eps-neighborhoods of all points in parallel and stores them in the CSR (compressed sparse row)
+        format. Neighbors of the point i are indices[indptr[i]:indptr[i + 1]] and the distances to them are 
+        distances[indptr[i]:indptr[i + 1]]. The point itself is not included in its neighborhood.
+
+        Neighborhoods are found in two passes over the spatial index, the first one only counts neighbors so 
+        the arrays can be allocated exactly, and the second one fills them in. Both passes are split among 
+        threads.
+
+    Arguments:
+        input_list: [ndarray] 2D numpy array containing the input data (1 datum per row, all columns are used
+            as coordinates)
+        eps: [float] epsilon parameter - maximum distance between points
+
+    Keyword arguments:
+        index: [str] spatial index used for neighbor queries (see buildIndex for more information)
+        metric: [str] distance metric, see METRICS for supported metrics
+        n_jobs: [int] number of threads, -1 uses all cores (default 1)
+        dtype: [dtype] float32 or float64, precision of the coordinates and distances. None keeps float32 
+            data in float32 and uses float64 otherwise (default).
+        stats: [OPTICSStats] if given, the times of the index and neighbor_graph stages and the counters of 
+            the neighbor queries are recorded in it (None by default)
+        spatial_index: [SpatialIndex] spatial index already built on the input data with the same eps, index
+            and metric, which is then not built again (default None)
+
+    Return:
+        (indptr, indices, distances): 
+            - indptr: [ndarray] int64 array of row offsets, of size N + 1
+            - indices: [ndarray] int32 array of neighbor indices
+            - distances: [ndarray] array of distances to neighbors, of the given dtype
+    """
+
+    cdef int threads = numThreads(n_jobs)
+
+    input_list = np.asarray(input_list)
+    dtype = resolveFloatType(dtype, input_list.dtype)
+    input_list = np.ascontiguousarray(input_list, dtype=dtype)
+    cdef int input_list_size = input_list.shape[0]
+
+    # Build the spatial index on the input data
+    cdef PyTime_t tic = PyTime_PerfCounterRaw()
+    if spatial_index is None:
+        spatial_index = buildIndex(input_list, eps, index=index, metric=metric)
+
+    else:
+        checkIndexedPoints(spatial_index, input_list, eps, metric)
+
+    if stats is not None:
+        stats.record('index', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic))
+        tic = PyTime_PerfCounterRaw()
+
+    cdef bint single_precision = (dtype == np.float32)
+    cdef const void *points = np.PyArray_DATA(input_list)
+
+    # Distance evaluation counters of all threads, only used with stats
+    evaluated_arr = np.zeros(threads*COUNTER_STRIDE, dtype=np.int64)
+    cdef np.int64_t *evaluated = <np.int64_t *>np.PyArray_DATA(evaluated_arr) if stats is not None else NULL
+
+    # Count the neighbors of every point
+    indptr_arr = np.zeros(input_list_size + 1, dtype=np.int64)
+    cdef np.int64_t *indptr = <np.int64_t *>np.PyArray_DATA(indptr_arr)
+
+    with nogil:
+        if single_precision:
+            fillNeighborGraph(spatial_index, <const float *>points, eps, indptr, NULL, <float *>NULL, evaluated,
+                threads)
+        else:
+            fillNeighborGraph(spatial_index, <const double *>points, eps, indptr, NULL, <double *>NULL, 
+                evaluated, threads)
+
+    # Convert the counts to row offsets
+    np.cumsum(indptr_arr, out=indptr_arr)
+
+    # Allocate the neighborhoods
+    indices_arr = np.zeros(indptr_arr[input_list_size], dtype=INT_TYPE)
+    distances_arr = np.zeros(indptr_arr[input_list_size], dtype=dtype)
+
+    cdef int *indices = <int *>np.PyArray_DATA(indices_arr)
+    cdef void *distances = np.PyArray_DATA(distances_arr)
+
+    # Write the neighbors of every point into its row
+    with nogil:
+        if single_precision:
+            fillNeighborGraph(spatial_index, <const float *>points, eps, indptr, indices, <float *>distances, 
+                evaluated, threads)
+        else:
+            fillNeighborGraph(spatial_index, <const double *>points, eps, indptr, indices, 
+                <double *>distances, evaluated, threads)
+
+    # The distance evaluations include both passes
+    if stats is not None:
+        stats.record('neighbor_graph', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic), 
+            queries=input_list_size, neighbors=int(indptr_arr[input_list_size]), 
+            distance_evaluations=int(np.sum(evaluated_arr)))
+
+    return indptr_arr, indices_arr, distances_arr
+
+
+
+cdef void fillQueryGraph(SpatialIndex index, const floating *points, const floating *queries, 
+    const floating *query_norms, const int *skip, int queries_count, np.int64_t *indptr, int *indices, 
+    floating *distances, int threads) noexcept nogil:
+    """ Finds the indexed neighbors of all query points in parallel, see fillNeighborGraph.
+
+    Arguments:
+        index: [SpatialIndex] spatial index built on the points
+        points: [pointer] C-ordered 2D array containing the coordinates of indexed points (1 point per row)
+        queries: [pointer] C-ordered 2D array containing the coordinates of query points
+        query_norms: [pointer] norms of query points, NULL if the metric is not cosine
+        skip: [pointer] index of every query point among the indexed points, or UNDEFINED
+        queries_count: [int] number of query points
+        indptr: [pointer] row offsets, of size queries_count + 1
+        indices: [pointer] array of neighbor indices, or NULL to count neighbors
+        distances: [pointer] array of distances to neighbors
+        threads: [int] number of threads
+
+    """
+
+    cdef Py_ssize_t q
+    cdef int count
+
+    for q in prange(queries_count, num_threads=threads, schedule='dynamic', chunksize=GRAPH_CHUNK_SIZE):
+
+        if indices == NULL:
+            count = queryPoint(index, points, queries + q*index.dims, 
+                query_norms[q] if query_norms != NULL else 0, skip[q], index.eps, NULL, distances, NULL)
+            indptr[q + 1] = count
+
+        else:
+            queryPoint(index, points, queries + q*index.dims, query_norms[q] if query_norms != NULL else 0, 
+                skip[q], index.eps, indices + indptr[q], distances + indptr[q], NULL)
+
+
+
+def queryNeighborhoods(SpatialIndex spatial_index, points, queries, skip=None, n_jobs=1):
+    """ Finds the eps-neighborhoods of query points among the points of an existing spatial index, in the CSR
+        format (see computeNeighborGraph). The query points do not have to be indexed, so the index can be 
+        reused for points which were added to the data after it was built. The distances are computed in the 
+        same way as by computeNeighborGraph, with the query point as the first point.
+
+    Arguments:
+        spatial_index: [SpatialIndex] spatial index built on the points (see buildIndex), its eps is used
+        points: [ndarray] C-ordered 2D numpy array containing the coordinates of indexed points, of the type
+            in which the distances are computed
+        queries: [ndarray] 2D numpy array containing the coordinates of query points
+
+    Keyword arguments:
+        skip: [ndarray] index of every query point among the indexed points, which is left out of its 
+            neighborhood, or -1 for query points which are not indexed. None if no query points are indexed
+            (default).
+        n_jobs: [int] number of threads, -1 uses all cores (default 1)
+
+    Return:
+        (indptr, indices, distances): neighborhoods of the query points, the indices refer to the indexed 
+            points
+    """
+
+    cdef int threads = numThreads(n_jobs)
+
+    dtype = resolveFloatType(None, points.dtype)
+
+    if (points.dtype != dtype) or (not points.flags.c_contiguous) or (points.ndim != 2) \
+        or (points.shape[0] != spatial_index.size):
+        raise ValueError('The points must be a C-ordered array of the indexed points!')
+
+    queries = np.ascontiguousarray(queries, dtype=dtype)
+
+    if (queries.ndim != 2) or (queries.shape[1] != spatial_index.dims):
+        raise ValueError('The query points must have the same number of dimensions as the indexed points!')
+
+    cdef int queries_count = queries.shape[0]
+
+    if skip is None:
+        skip = np.zeros(queries_count, dtype=INT_TYPE) + UNDEFINED
+
+    skip = np.ascontiguousarray(skip, dtype=INT_TYPE)
+
+    if skip.shape != (queries_count, ):
+        raise ValueError('skip must have one value per query point!')
+
+    # Compute the norms of the query points in the same way as the norms of the indexed points
+    query_norms = None
+    if spatial_index.metric == METRIC_COSINE:
+        query_norms = np.ascontiguousarray(np.sqrt(np.einsum('ij,ij->i', queries, queries)))
+
+    cdef bint single_precision = (dtype == np.float32)
+    cdef const void *points_ptr = np.PyArray_DATA(points)
+    cdef const void *queries_ptr = np.PyArray_DATA(queries)
+    cdef const void *norms_ptr = np.PyArray_DATA(query_norms) if query_norms is not None else NULL
+    cdef const int *skip_ptr = <const int *>np.PyArray_DATA(skip)
+
+    # Count the neighbors of every query point
+    indptr_arr = np.zeros(queries_count + 1, dtype=np.int64)
+    cdef np.int64_t *indptr = <np.int64_t *>np.PyArray_DATA(indptr_arr)
+
+    with nogil:
+        if single_precision:
+            fillQueryGraph(spatial_index, <const float *>points_ptr, <const float *>queries_ptr, 
+                <const float *>norms_ptr, skip_ptr, queries_count, indptr, NULL, <float *>NULL, threads)
+        else:
+            fillQueryGraph(spatial_index, <const double *>points_ptr, <const double *>queries_ptr, 
+                <const double *>norms_ptr, skip_ptr, queries_count, indptr, NULL, <double *>NULL, threads)
+
+    np.cumsum(indptr_arr, out=indptr_arr)
+
+    indices_arr = np.zeros(indptr_arr[queries_count], dtype=INT_TYPE)
+    distances_arr = np.zeros(indptr_arr[queries_count], dtype=dtype)
+
+    cdef int *indices = <int *>np.PyArray_DATA(indices_arr)
+    cdef void *distances = np.PyArray_DATA(distances_arr)
+
+    # Write the neighbors of every query point into its row
+    with nogil:
+        if single_precision:
+            fillQueryGraph(spatial_index, <const float *>points_ptr, <const float *>queries_ptr, 
+                <const float *>norms_ptr, skip_ptr, queries_count, indptr, indices, <float *>distances, 
+                threads)
+        else:
+            fillQueryGraph(spatial_index, <const double *>points_ptr, <const double *>queries_ptr, 
+                <const double *>norms_ptr, skip_ptr, queries_count, indptr, indices, <double *>distances, 
+                threads)
+
+    return indptr_arr, indices_arr, distances_arr
+
+
+
+cdef void fillNearestCore(SpatialIndex index, const floating *points, const floating *queries, 
+    const floating *query_norms, const floating *core_distances, const int *priority, int queries_count, 
+    int *indices, floating *distances, Py_ssize_t buffer_size, int *nearest, floating *reachability, 
+    int threads) noexcept nogil:
+    """ Finds the indexed core point with the smallest reachability distance of every query point in parallel, 
+        see nearestCorePoints.
+
+    Arguments:
+        index: [SpatialIndex] spatial index built on the points
+        points: [pointer] C-ordered 2D array containing the coordinates of indexed points (1 point per row)
+        queries: [pointer] C-ordered 2D array containing the coordinates of query points
+        query_norms: [pointer] norms of query points, NULL if the metric is not cosine
+        core_distances: [pointer] core distances of indexed points, UNDEFINED for points which are not core
+        priority: [pointer] rank of every indexed point, by which equal reachability distances are decided, 
+            NULL to use the index of the point
+        queries_count: [int] number of query points
+        indices: [pointer] neighbor index buffers of all threads
+        distances: [pointer] neighbor distance buffers of all threads
+        buffer_size: [int] size of the buffers of one thread, large enough for all indexed points
+        nearest: [pointer] array into which the index of the nearest core point is written, or UNDEFINED
+        reachability: [pointer] array into which the reachability distances are written, or UNDEFINED
+        threads: [int] number of threads
+
+    """
+
+    cdef Py_ssize_t q
+    cdef int k, j, count, best
+    cdef floating reach, best_reach
+    cdef int *thread_indices
+    cdef floating *thread_distances
+
+    for q in prange(queries_count, num_threads=threads, schedule='dynamic', chunksize=GRAPH_CHUNK_SIZE):
+
+        thread_indices = indices + threadid()*buffer_size
+        thread_distances = distances + threadid()*buffer_size
+
+        count = queryPoint(index, points, queries + q*index.dims, query_norms[q] if query_norms != NULL else 0,
+            UNDEFINED, index.eps, thread_indices, thread_distances, NULL)
+
+        best = UNDEFINED
+        best_reach = UNDEFINED
+
+        # Only the core points reach other points, the reachability distance is the larger of the core 
+        # distance and the distance to the query point
+        for k in range(count):
+
+            j = thread_indices[k]
+
+            if core_distances[j] == UNDEFINED:
+                continue
+
+            reach = max(core_distances[j], thread_distances[k])
+
+            # Of equal distances, take the point with the lowest rank
+            if (best == UNDEFINED) or (reach < best_reach) or ((reach == best_reach) 
+                and ((priority[j] < priority[best]) if priority != NULL else (j < best))):
+                best = j
+                best_reach = reach
+
+        nearest[q] = best
+        reachability[q] = best_reach
+
+
+
+def nearestCorePoints(SpatialIndex spatial_index, points, queries, core_distances, n_jobs=1, priority=None):
+    """ Finds the core point from which every query point is reached with the smallest reachability distance,
+        i.e. the larger of the core distance and the distance between the points. Only the core points within
+        eps of the query point are considered, and the neighborhoods are not stored.
+
+    Arguments:
+        spatial_index: [SpatialIndex] spatial index built on the points (see buildIndex), its eps is used
+        points: [ndarray] C-ordered 2D numpy array containing the coordinates of indexed points, of the type
+            in which the distances are computed
+        queries: [ndarray] 2D numpy array containing the coordinates of query points
+        core_distances: [ndarray] core distances of the indexed points, -1 for points which are not core points
+
+    Keyword arguments:
+        n_jobs: [int] number of threads, -1 uses all cores (default 1)
+        priority: [ndarray] rank of every indexed point, of equal reachability distances the point with the
+            lowest rank is taken, e.g. the position in the OPTICS ordering, as OPTICS keeps the predecessor 
+            which was processed first. None takes the lowest index (default).
+
+    Return:
+        (nearest, reachability):
+            - nearest: [ndarray] int32 index of the nearest core point of every query point, or -1 if there 
+                is no core point within eps
+            - reachability: [ndarray] reachability distance of every query point from its nearest core point, 
+                or -1
+    """
+
+    cdef int threads = numThreads(n_jobs)
+
+    dtype = resolveFloatType(None, points.dtype)
+
+    if (points.dtype != dtype) or (not points.flags.c_contiguous) or (points.ndim != 2) \
+        or (points.shape[0] != spatial_index.size):
+        raise ValueError('The points must be a C-ordered array of the indexed points!')
+
+    queries = np.ascontiguousarray(queries, dtype=dtype)
+
+    if (queries.ndim != 2) or (queries.shape[1] != spatial_index.dims):
+        raise ValueError('The query points must have the same number of dimensions as the indexed points!')
+
+    core_distances = np.ascontiguousarray(core_distances, dtype=dtype)
+
+    if core_distances.shape != (spatial_index.size, ):
+        raise ValueError('core_distances must have one value per indexed point!')
+
+    if priority is not None:
+
+        priority = np.ascontiguousarray(priority, dtype=INT_TYPE)
+
+        if priority.shape != (spatial_index.size, ):
+            raise ValueError('priority must have one value per indexed point!')
+
+    cdef int queries_count = queries.shape[0]
+
+    # Compute the norms of the query points in the same way as the norms of the indexed points
+    query_norms = None
+    if spatial_index.metric == METRIC_COSINE:
+        query_norms = np.ascontiguousarray(np.sqrt(np.einsum('ij,ij->i', queries, queries)))
+
+    # Allocate neighbor buffers for every thread, large enough for all indexed points
+    cdef Py_ssize_t buffer_size = max(spatial_index.size, 1)
+    indices_arr = np.zeros((threads, buffer_size), dtype=INT_TYPE)
+    distances_arr = np.zeros((threads, buffer_size), dtype=dtype)
+
+    nearest_arr = np.zeros(queries_count, dtype=INT_TYPE)
+    reachability_arr = np.zeros(queries_count, dtype=dtype)
+
+    cdef bint single_precision = (dtype == np.float32)
+    cdef const void *points_ptr = np.PyArray_DATA(points)
+    cdef const void *queries_ptr = np.PyArray_DATA(queries)
+    cdef const void *norms_ptr = np.PyArray_DATA(query_norms) if query_norms is not None else NULL
+    cdef const void *core_ptr = np.PyArray_DATA(core_distances)
+    cdef const int *priority_ptr = <const int *>np.PyArray_DATA(priority) if priority is not None else NULL
+    cdef int *indices = <int *>np.PyArray_DATA(indices_arr)
+    cdef void *distances = np.PyArray_DATA(distances_arr)
+    cdef int *nearest = <int *>np.PyArray_DATA(nearest_arr)
+    cdef void *reachability = np.PyArray_DATA(reachability_arr)
+
+    with nogil:
+        if single_precision:
+            fillNearestCore(spatial_index, <const float *>points_ptr, <const float *>queries_ptr, 
+                <const float *>norms_ptr, <const float *>core_ptr, priority_ptr, queries_count, indices, 
+                <float *>distances, buffer_size, nearest, <float *>reachability, threads)
+        else:
+            fillNearestCore(spatial_index, <const double *>points_ptr, <const double *>queries_ptr, 
+                <const double *>norms_ptr, <const double *>core_ptr, priority_ptr, queries_count, indices, 
+                <double *>distances, buffer_size, nearest, <double *>reachability, threads)
+
+    return nearest_arr, reachability_arr
+
+
+
+cdef np.int64_t filterGraph(const np.int64_t *indptr, const int *indices, const floating *distances, int size,
+    double eps, np.int64_t *new_indptr, int *new_indices, floating *new_distances) noexcept nogil:
+    """ Copies the edges of the graph which are not longer than eps and are not self loops. If new_indices
+        are NULL, the edges are only counted.
+
+    Arguments:
+        indptr: [pointer] row offsets of the graph, of size N + 1
+        indices: [pointer] neighbor indices
+        distances: [pointer] distances to neighbors
+        size: [int] number of points N
+        eps: [double] maximum length of edges which are kept
+        new_indptr: [pointer] row offsets of the filtered graph, of size N + 1
+        new_indices: [pointer] neighbor indices of the filtered graph, or NULL to only count the edges
+        new_distances: [pointer] distances of the filtered graph
+
+    Return:
+        count: [int] number of kept edges
+    """
+
+    cdef int i
+    cdef np.int64_t k, count = 0
+
+    # Distances are compared to eps in their own precision, as in the neighbor queries
+    cdef floating max_distance = <floating>eps
+
+    new_indptr[0] = 0
+
+    for i in range(size):
+        for k in range(indptr[i], indptr[i + 1]):
+
+            if (distances[k] <= max_distance) and (indices[k] != i):
+
+                if new_indices != NULL:
+                    new_indices[count] = indices[k]
+                    new_distances[count] = distances[k]
+
+                count += 1
+
+        new_indptr[i + 1] = count
+
+    return count
+
+
+
+def filterNeighborGraph(indptr, indices, distances, double eps):
+    """ Removes edges longer than eps and self loops from a neighbor graph in the CSR format (see 
+        computeNeighborGraph), e.g. to get the eps-neighborhoods from a graph computed with a larger eps.
+
+    Arguments:
+        indptr: [ndarray] int64 array of row offsets, of size N + 1
+        indices: [ndarray] int32 array of neighbor indices
+        distances: [ndarray] float32 or float64 array of distances to neighbors
+        eps: [float] maximum length of edges which are kept
+
+    Return:
+        (indptr, indices, distances): [tuple of ndarrays] the filtered graph, the input arrays are returned
+            if no edge is removed
+    """
+
+    indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+    indices = np.ascontiguousarray(indices, dtype=INT_TYPE)
+    distances = np.asarray(distances)
+    distances = np.ascontiguousarray(distances, dtype=resolveFloatType(None, distances.dtype))
+    cdef int input_list_size = indptr.shape[0] - 1
+
+    cdef bint single_precision = (distances.dtype == np.float32)
+    cdef const np.int64_t *indptr_ptr = <const np.int64_t *>np.PyArray_DATA(indptr)
+    cdef const int *indices_ptr = <const int *>np.PyArray_DATA(indices)
+    cdef const void *distances_ptr = np.PyArray_DATA(distances)
+
+    new_indptr_arr = np.zeros(input_list_size + 1, dtype=np.int64)
+    cdef np.int64_t *new_indptr = <np.int64_t *>np.PyArray_DATA(new_indptr_arr)
+    cdef np.int64_t count
+
+    # Count the kept edges
+    with nogil:
+        if single_precision:
+            count = filterGraph(indptr_ptr, indices_ptr, <const float *>distances_ptr, input_list_size, eps, 
+                new_indptr, NULL, <float *>NULL)
+        else:
+            count = filterGraph(indptr_ptr, indices_ptr, <const double *>distances_ptr, input_list_size, eps, 
+                new_indptr, NULL, <double *>NULL)
+
+    if count == indices.shape[0]:
+        return indptr, indices, distances
+
+    new_indices_arr = np.zeros(count, dtype=INT_TYPE)
+    new_distances_arr = np.zeros(count, dtype=distances.dtype)
+    cdef int *new_indices = <int *>np.PyArray_DATA(new_indices_arr)
+    cdef void *new_distances = np.PyArray_DATA(new_distances_arr)
+
+    # Copy the kept edges
+    with nogil:
+        if single_precision:
+            filterGraph(indptr_ptr, indices_ptr, <const float *>distances_ptr, input_list_size, eps, new_indptr, 
+                new_indices, <float *>new_distances)
+        else:
+            filterGraph(indptr_ptr, indices_ptr, <const double *>distances_ptr, input_list_size, eps, 
+                new_indptr, new_indices, <double *>new_distances)
+
+    return new_indptr_arr, new_indices_arr, new_distances_arr
+
+
+
+cdef void spliceGraph(const np.int64_t *indptr, const int *indices, const floating *distances, 
+    const np.int64_t *sources, const int *remap, const np.int64_t *rows_indptr, const int *rows_indices, 
+    const floating *rows_distances, int size, const np.int64_t *new_indptr, int *new_indices, 
+    floating *new_distances) noexcept nogil:
+    """ Copies the rows of the new graph from the old graph or from the replacement rows, see 
+        spliceNeighborGraph for the description of arguments. The row offsets of the new graph have to be 
+        already computed.
+    """
+
+    cdef Py_ssize_t i, k, out
+    cdef np.int64_t row = 0
+
+    for i in range(size):
+
+        out = new_indptr[i]
+
+        # Copy the old row, with the neighbor indices changed to the new ones
+        if sources[i] != UNDEFINED:
+
+            for k in range(indptr[sources[i]], indptr[sources[i] + 1]):
+                new_indices[out] = remap[indices[k]]
+                new_distances[out] = distances[k]
+                out += 1
+
+        # Take the next replacement row
+        else:
+
+            for k in range(rows_indptr[row], rows_indptr[row + 1]):
+                new_indices[out] = rows_indices[k]
+                new_distances[out] = rows_distances[k]
+                out += 1
+
+            row += 1
+
+
+
+def spliceNeighborGraph(graph, sources, remap, rows):
+    """ Builds a neighbor graph in the CSR format (see computeNeighborGraph) from the rows of an old graph and
+        from new rows, e.g. after points were added to the data or removed from it and only the neighborhoods
+        of the points near them were computed again.
+
+    Arguments:
+        graph: [tuple] (indptr, indices, distances) of the old graph
+        sources: [ndarray] for every point of the new graph, the index of the old row which is copied, or -1 if
+            the row is taken from the replacement rows (in order)
+        remap: [ndarray] index in the new graph of every point of the old graph, only used for the neighbors 
+            in copied rows, so it can be -1 for points which are not in the new graph
+        rows: [tuple] (indptr, indices, distances) replacement rows, with neighbor indices of the new graph
+
+    Return:
+        (indptr, indices, distances): [tuple of ndarrays] the new graph
+    """
+
+    indptr, indices, distances = graph
+    rows_indptr, rows_indices, rows_distances = rows
+
+    indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+    indices = np.ascontiguousarray(indices, dtype=INT_TYPE)
+    distances = np.asarray(distances)
+    dtype = resolveFloatType(None, distances.dtype)
+    distances = np.ascontiguousarray(distances, dtype=dtype)
+
+    sources = np.ascontiguousarray(sources, dtype=np.int64)
+    remap = np.ascontiguousarray(remap, dtype=INT_TYPE)
+    rows_indptr = np.ascontiguousarray(rows_indptr, dtype=np.int64)
+    rows_indices = np.ascontiguousarray(rows_indices, dtype=INT_TYPE)
+    rows_distances = np.ascontiguousarray(rows_distances, dtype=dtype)
+
+    cdef int input_list_size = sources.shape[0]
+    replaced = (sources == UNDEFINED)
+
+    if np.count_nonzero(replaced) != rows_indptr.shape[0] - 1:
+        raise ValueError('The number of replacement rows does not match the number of replaced points!')
+
+    # Compute the row offsets of the new graph
+    counts = np.zeros(input_list_size, dtype=np.int64)
+    counts[~replaced] = np.diff(indptr)[sources[~replaced]]
+    counts[replaced] = np.diff(rows_indptr)
+
+    new_indptr_arr = np.zeros(input_list_size + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_indptr_arr[1:])
+
+    new_indices_arr = np.zeros(new_indptr_arr[input_list_size], dtype=INT_TYPE)
+    new_distances_arr = np.zeros(new_indptr_arr[input_list_size], dtype=dtype)
+
+    cdef bint single_precision = (dtype == np.float32)
+    cdef const np.int64_t *indptr_ptr = <const np.int64_t *>np.PyArray_DATA(indptr)
+    cdef const int *indices_ptr = <const int *>np.PyArray_DATA(indices)
+    cdef const void *distances_ptr = np.PyArray_DATA(distances)
+    cdef const np.int64_t *sources_ptr = <const np.int64_t *>np.PyArray_DATA(sources)
+    cdef const int *remap_ptr = <const int *>np.PyArray_DATA(remap)
+    cdef const np.int64_t *rows_indptr_ptr = <const np.int64_t *>np.PyArray_DATA(rows_indptr)
+    cdef const int *rows_indices_ptr = <const int *>np.PyArray_DATA(rows_indices)
+    cdef const void *rows_distances_ptr = np.PyArray_DATA(rows_distances)
+    cdef const np.int64_t *new_indptr = <const np.int64_t *>np.PyArray_DATA(new_indptr_arr)
+    cdef int *new_indices = <int *>np.PyArray_DATA(new_indices_arr)
+    cdef void *new_distances = np.PyArray_DATA(new_distances_arr)
+
+    with nogil:
+        if single_precision:
+            spliceGraph(indptr_ptr, indices_ptr, <const float *>distances_ptr, sources_ptr, remap_ptr, 
+                rows_indptr_ptr, rows_indices_ptr, <const float *>rows_distances_ptr, input_list_size, 
+                new_indptr, new_indices, <float *>new_distances)
+        else:
+            spliceGraph(indptr_ptr, indices_ptr, <const double *>distances_ptr, sources_ptr, remap_ptr, 
+                rows_indptr_ptr, rows_indices_ptr, <const double *>rows_distances_ptr, input_list_size, 
+                new_indptr, new_indices, <double *>new_distances)
+
+    return new_indptr_arr, new_indices_arr, new_distances_arr
+
+
+
+def checkWeights(weights, int size):
+    """ Converts the weights of points to a contiguous int32 array and checks them.
+
+    Arguments:
+        weights: [ndarray] number of copies of every point
+        size: [int] number of points
+
+    Return:
+        [ndarray] int32 weights
+    """
+
+    weights = np.ascontiguousarray(weights, dtype=INT_TYPE)
+
+    if weights.shape != (size, ):
+        raise ValueError('The weights must have one value per point!')
+
+    if size and (np.min(weights) < 1):
+        raise ValueError('The weights must be at least 1!')
+
+    return weights
+
+
+
+cdef void fillCoreDistances(const np.int64_t *indptr, const int *indices, const floating *distances, 
+    const int *weights, int size, int min_pts, floating *work, int *work_indices, Py_ssize_t work_size, 
+    floating *core_distances, int threads) noexcept nogil:
+    """ Computes core distances of all points from the rows of the CSR graph in parallel.
+
+    Arguments:
+        indptr: [pointer] row offsets, of size N + 1
+        indices: [pointer] array of neighbor indices, only used with weights
+        distances: [pointer] array of distances to neighbors
+        weights: [pointer] number of copies of every point (see weightedCoreDistance), or NULL if every point
+            is one point
+        size: [int] number of points N
+        min_pts: [int] minimum points in the cluster
+        work: [pointer] work buffers of all threads, the selection reorders the distances so every thread 
+            copies rows into its own buffer
+        work_indices: [pointer] work buffers of all threads for the neighbor indices, only used with weights
+        work_size: [int] size of the work buffer of one thread
+        core_distances: [pointer] array into which the core distances are written
+        threads: [int] number of threads
+
+    """
+
+    cdef Py_ssize_t i
+    cdef int neighbors_count
+    cdef floating *thread_work
+    cdef int *thread_indices
+
+    for i in prange(size, num_threads=threads, schedule='dynamic', chunksize=GRAPH_CHUNK_SIZE):
+
+        thread_work = work + threadid()*work_size
+        neighbors_count = <int>(indptr[i + 1] - indptr[i])
+
+        if weights != NULL:
+
+            thread_indices = work_indices + threadid()*work_size
+
+            memcpy(thread_work, distances + indptr[i], neighbors_count*sizeof(floating))
+            memcpy(thread_indices, indices + indptr[i], neighbors_count*sizeof(int))
+            core_distances[i] = weightedCoreDistance(thread_indices, thread_work, neighbors_count, weights, 
+                weights[i], min_pts)
+
+        elif neighbors_count >= min_pts - 1:
+
+            memcpy(thread_work, distances + indptr[i], neighbors_count*sizeof(floating))
+            core_distances[i] = coreDistance(NULL, thread_work, neighbors_count, min_pts)
+
+
+
+def coreDistancesFromGraph(indptr, distances, int min_pts, n_jobs=1, indices=None, weights=None):
+    """ Computes core distances of all points from the neighborhoods stored in the CSR format. The input 
+        arrays are not modified.
+
+    Arguments:
+        indptr: [ndarray] int64 array of row offsets, of size N + 1
+        distances: [ndarray] float32 or float64 array of distances to neighbors
+        min_pts: [int] minimum points in the cluster
+
+    Keyword arguments:
+        n_jobs: [int] number of threads, -1 uses all cores (default 1)
+        indices: [ndarray] int32 array of neighbor indices, needed with weights
+        weights: [ndarray] number of copies of every point, e.g. of duplicates collapsed into one point (see
+            collapseDuplicates). None counts every point once (default).
+
+    Return:
+        core_distances: [ndarray] array of core distances (of the same type as distances), -1 for points 
+            which are not core points
+    """
+
+    cdef int threads = numThreads(n_jobs)
+
+    distances = np.asarray(distances)
+    dtype = resolveFloatType(None, distances.dtype)
+
+    indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+    distances = np.ascontiguousarray(distances, dtype=dtype)
+    cdef int input_list_size = indptr.shape[0] - 1
+
+    core_distances_arr = np.zeros(input_list_size, dtype=dtype) + UNDEFINED
+
+    # Allocate a work buffer for every thread, large enough for the largest neighborhood
+    max_count = int(np.max(np.diff(indptr))) if input_list_size else 0
+    work_arr = np.zeros((threads, max(max_count, 1)), dtype=dtype)
+
+    # The weights of neighbors are looked up by their indices, which are reordered together with the distances
+    if weights is not None:
+
+        if indices is None:
+            raise ValueError('The neighbor indices are needed to compute weighted core distances!')
+
+        weights = checkWeights(weights, input_list_size)
+        indices = np.ascontiguousarray(indices, dtype=INT_TYPE)
+        work_indices_arr = np.zeros(work_arr.shape, dtype=INT_TYPE)
+
+    cdef bint single_precision = (dtype == np.float32)
+    cdef const np.int64_t *indptr_ptr = <const np.int64_t *>np.PyArray_DATA(indptr)
+    cdef const int *indices_ptr = <const int *>np.PyArray_DATA(indices) if weights is not None else NULL
+    cdef const void *distances_ptr = np.PyArray_DATA(distances)
+    cdef const int *weights_ptr = <const int *>np.PyArray_DATA(weights) if weights is not None else NULL
+    cdef void *work = np.PyArray_DATA(work_arr)
+    cdef int *work_indices = <int *>np.PyArray_DATA(work_indices_arr) if weights is not None else NULL
+    cdef Py_ssize_t work_size = work_arr.shape[1]
+    cdef void *core_distances = np.PyArray_DATA(core_distances_arr)
+
+    with nogil:
+        if single_precision:
+            fillCoreDistances(indptr_ptr, indices_ptr, <const float *>distances_ptr, weights_ptr, 
+                input_list_size, min_pts, <float *>work, work_indices, work_size, <float *>core_distances, 
+                threads)
+        else:
+            fillCoreDistances(indptr_ptr, indices_ptr, <const double *>distances_ptr, weights_ptr, 
+                input_list_size, min_pts, <double *>work, work_indices, work_size, <double *>core_distances, 
+                threads)
+
+    return core_distances_arr
+
+
+
+cdef class NeighborGraph:
+    """ Precomputed eps-neighborhoods and core distances of all points, consumed by the ordering phase instead
+        of querying the spatial index. See computeNeighborGraph for the description of the CSR format.
+    """
+
+    cdef const np.int64_t[::1] indptr
+    cdef const int[::1] indices
+    cdef const double[::1] core_distances
+
+    # Distances to neighbors, stored in float32 or float64
+    cdef object distances
+    cdef const void *distances_data
+    cdef public bint single_precision
+
+
+    def __init__(self, indptr, indices, distances, core_distances):
+        """ Initilization function for the graph.
+
+        Arguments:
+            indptr: [ndarray] int64 array of row offsets, of size N + 1
+            indices: [ndarray] int32 array of neighbor indices
+            distances: [ndarray] float32 or float64 array of distances to neighbors
+            core_distances: [ndarray] array of core distances
+
+        """
+
+        self.indptr = indptr
+        self.indices = indices
+        self.core_distances = np.ascontiguousarray(core_distances, dtype=FLOAT_TYPE)
+
+        self.distances = np.ascontiguousarray(distances, dtype=resolveFloatType(None, distances.dtype))
+        self.distances_data = np.PyArray_DATA(self.distances)
+        self.single_precision = (self.distances.dtype == np.float32)
+
+
+
+cdef class SeedHeap:
+    """ Indexed binary min-heap of seed points, ordered by their reachability distance. The position of every
+        point in the heap is tracked, so the reachability of a seed can be decreased in O(log n). Seeds with 
+        the same reachability distance are ordered by their index, or by their tie keys if they are set.
+    """
+
+    # Indices of points in the heap
+    cdef int[::1] heap
+
+    # Position of every point in the heap, UNDEFINED if the point is not in the heap
+    cdef int[::1] position
+
+    # Reachability distance of every point, used as the heap key
+    cdef double[::1] keys
+
+    # Keys which order the seeds with the same reachability distance instead of their index, NULL if not used
+    cdef const int *ties
+
+    # Number of seeds in the heap
+    cdef public int count
+
+
+    def __init__(self, int size):
+        """ Initilization function for the heap.
+
+        Arguments:
+            size: [int] total number of points, i.e. the maximum number of seeds
+
+        """
+
+        self.heap = np.zeros(size, dtype=INT_TYPE)
+        self.position = np.zeros(size, dtype=INT_TYPE) + UNDEFINED
+        self.keys = np.zeros(size, dtype=FLOAT_TYPE)
+        self.count = 0
+
+
+    cdef inline bint less(self, int a, int b) noexcept nogil:
+        """ Checks if the point a should be popped before the point b. """
+
+        if self.keys[a] != self.keys[b]:
+            return self.keys[a] < self.keys[b]
+
+        if self.ties != NULL:
+            return self.ties[a] < self.ties[b]
+
+        return a < b
+
+
+    cdef inline void place(self, int point, int pos) noexcept nogil:
+        """ Puts the point on the given position in the heap. """
+
+        self.heap[pos] = point
+        self.position[point] = pos
+
+
+    cdef void siftUp(self, int pos) noexcept nogil:
+        """ Moves the seed on the given position up the heap until the heap property is restored. """
+
+        cdef int point = self.heap[pos]
+        cdef int parent
+
+        while pos > 0:
+
+            parent = (pos - 1)//2
+
+            if not self.less(point, self.heap[parent]):
+                break
+
+            # Move the parent down
+            self.place(self.heap[parent], pos)
+            pos = parent
+
+        self.place(point, pos)
+
+
+    cdef void siftDown(self, int pos) noexcept nogil:
+        """ Moves the seed on the given position down the heap until the heap property is restored. """
+
+        cdef int point = self.heap[pos]
+        cdef int child
+
+        while True:
+
+            child = 2*pos + 1
+
+            if child >= self.count:
+                break
+
+            # Choose the smaller child
+            if (child + 1 < self.count) and self.less(self.heap[child + 1], self.heap[child]):
+                child += 1
+
+            if not self.less(self.heap[child], point):
+                break
+
+            # Move the child up
+            self.place(self.heap[child], pos)
+            pos = child
+
+        self.place(point, pos)
+
+
+    cdef void push(self, int point, double key) noexcept nogil:
+        """ Adds a new seed to the heap. """
+
+        self.keys[point] = key
+        self.place(point, self.count)
+        self.count += 1
+        self.siftUp(self.count - 1)
+
+
+    cdef void decrease(self, int point, double key) noexcept nogil:
+        """ Decreases the reachability distance of a seed which is already in the heap. """
+
+        self.keys[point] = key
+        self.siftUp(self.position[point])
+
+
+    cdef int pop(self) noexcept nogil:
+        """ Removes and returns the seed with the smallest reachability distance. """
+
+        cdef int point = self.heap[0]
+
+        self.count -= 1
+        self.position[point] = UNDEFINED
+
+        # Move the last seed to the top and restore the heap
+        if self.count > 0:
+            self.place(self.heap[self.count], 0)
+            self.siftDown(0)
+
+        return point
+
+
+
+cdef class OrderingState:
+    """ Working state of the OPTICS ordering. The bookkeeping of every point is stored in separate arrays 
+        indexed by the input point index, so the input data does not have to be copied.
+    """
+
+    # Input data coordinates, the spatial index and the precomputed neighborhoods (one of the two is None)
+    cdef object points
+    cdef const void *points_data
+    cdef SpatialIndex spatial_index
+    cdef NeighborGraph graph
+    cdef const void *graph_distances_data
+
+    cdef double eps
+    cdef int min_pts
+
+    # Number of copies of every point, NULL if every point is one point (see collapseDuplicates)
+    cdef object weights
+    cdef const int *weights_data
+
+    # If the ordering is expanded to all rows of collapsed duplicates, the rows of the point i are 
+    # rows[row_starts[i]:row_starts[i] + weights[i]] in the increasing order
+    cdef public bint expand
+    cdef int[::1] rows
+    cdef int[::1] row_starts
+
+    # Number of ordered rows of every point, and the next row of every point, by which the seeds with the same
+    # reachability distance are ordered, as OPTICS orders the rows without collapsing
+    cdef int[::1] ordered_copies
+    cdef int[::1] next_row
+
+    # Reachability distance (INFINITY if undefined) and predecessor of the remaining rows of ordered points
+    cdef double[::1] copy_reachability
+    cdef int[::1] copy_predecessor
+
+    # Point, reachability distance and predecessor row of every ordered row
+    cdef int[::1] ordered_points
+    cdef double[::1] ordered_reachability
+    cdef int[::1] ordered_predecessor
+
+    # Number of entries in the ordering, i.e. the number of points, or of rows if the ordering is expanded
+    cdef public int total
+
+    # Type of coordinates and distances, float32 or float64
+    cdef public object dtype
+    cdef bint single_precision
+
+    # Processed flag, reachability distance, core distance and predecessor of every point
+    cdef unsigned char[::1] processed
+    cdef double[::1] reachability
+    cdef double[::1] core_distances
+    cdef int[::1] predecessor
+
+    # Indices of points in the OPTICS order
+    cdef int[::1] ordered_list
+    cdef public int ordered_count
+
+    # Index from which the next unprocessed point is searched for
+    cdef int next_start
+
+    # Priority queue of seeds
+    cdef SeedHeap seeds
+
+    # Work buffers for neighbor indices and distances, which are reused for every point
+    cdef int[::1] neighbor_indices
+    cdef object neighbor_distances
+    cdef void *neighbor_distances_data
+
+    # Counters and times of the ordering phases, which are only collected if collect_stats is set (see 
+    # recordStats)
+    cdef public bint collect_stats
+    cdef np.int64_t query_count
+    cdef np.int64_t neighbor_count
+    cdef np.int64_t distance_count
+    cdef int max_seeds
+    cdef PyTime_t phase_times[PHASES_COUNT]
+
+
+    def __init__(self, int size, double eps, int min_pts, dtype=FLOAT_TYPE, points=None, 
+        SpatialIndex spatial_index=None, NeighborGraph graph=None, weights=None, rows=None):
+        """ Initilization function for the ordering state.
+
+        Arguments:
+            size: [int] number of points
+            eps: [float] epsilon parameter - maximum distance between points
+            min_pts: [int] minimum points in the cluster
+
+        Keyword arguments:
+            dtype: [dtype] float32 or float64, type of the coordinates and distances (default float64)
+            points: [ndarray] C-ordered 2D numpy array of the given dtype containing the input data 
+                coordinates, only used together with the spatial index
+            spatial_index: [SpatialIndex] spatial index built on the input points
+            graph: [NeighborGraph] precomputed neighborhoods and core distances
+            weights: [ndarray] number of copies of every point, used for the core distances computed with the
+                spatial index (the core distances of the graph have to be computed with the same weights). 
+                None counts every point once (default).
+            rows: [ndarray] input rows of the copies of all points, grouped by the point and increasing within 
+                the groups. If given, every row is ordered as OPTICS would order it without collapsing the 
+                duplicates, and the ordering contains the rows instead of the points. None orders the points
+                (default).
+
+        """
+
+        self.eps = eps
+        self.min_pts = min_pts
+
+        self.weights = checkWeights(weights, size) if weights is not None else None
+        self.weights_data = <const int *>np.PyArray_DATA(self.weights) if weights is not None else NULL
+
+        self.dtype = np.dtype(dtype)
+        self.single_precision = (self.dtype == np.float32)
+
+        self.spatial_index = spatial_index
+        self.graph = graph
+
+        # Set all points as unprocessed, with undefined reachability and core distances
+        self.processed = np.zeros(size, dtype=np.uint8) + UNPROCESSED
+        self.reachability = np.zeros(size, dtype=FLOAT_TYPE) + UNDEFINED
+        self.core_distances = np.zeros(size, dtype=FLOAT_TYPE) + UNDEFINED
+        self.predecessor = np.zeros(size, dtype=INT_TYPE) + UNDEFINED
+
+        self.ordered_count = 0
+        self.next_start = 0
+
+        self.seeds = SeedHeap(size)
+
+        self.expand = rows is not None
+        self.total = size
+
+        # The copies of every point are ordered as separate rows
+        if self.expand:
+
+            if weights is None:
+                raise ValueError('The weights are needed to order the rows of collapsed duplicates!')
+
+            self.rows = np.ascontiguousarray(rows, dtype=INT_TYPE)
+            self.total = self.rows.shape[0]
+
+            if self.total != np.sum(self.weights, dtype=np.int64):
+                raise ValueError('The rows must have one value per copy of every point!')
+
+            self.row_starts = (np.cumsum(self.weights) - self.weights).astype(INT_TYPE)
+            self.ordered_copies = np.zeros(size, dtype=INT_TYPE)
+            self.next_row = np.asarray(self.rows)[np.asarray(self.row_starts)]
+            self.copy_reachability = np.zeros(size, dtype=FLOAT_TYPE) + INFINITY
+            self.copy_predecessor = np.zeros(size, dtype=INT_TYPE) + UNDEFINED
+
+            self.ordered_points = np.zeros(self.total, dtype=INT_TYPE)
+            self.ordered_reachability = np.zeros(self.total, dtype=FLOAT_TYPE)
+            self.ordered_predecessor = np.zeros(self.total, dtype=INT_TYPE)
+
+            if size:
+                self.seeds.ties = &self.next_row[0]
+
+        self.ordered_list = np.zeros(self.total, dtype=INT_TYPE)
+
+        self.collect_stats = False
+        self.resetStats()
+
+        # Neighbors are taken from the graph
+        if graph is not None:
+
+            if graph.single_precision != self.single_precision:
+                raise ValueError('The distances in the neighbor graph must be of the type {:s}!'.format(
+                    str(self.dtype)))
+
+            self.graph_distances_data = graph.distances_data
+
+        # Neighbors are found with the spatial index, so the work buffers are needed
+        else:
+
+            if (points.dtype != self.dtype) or (not points.flags.c_contiguous):
+                raise ValueError('The points must be a C-ordered array of the type {:s}!'.format(
+                    str(self.dtype)))
+
+            self.points = points
+            self.points_data = np.PyArray_DATA(points)
+            self.neighbor_indices = np.zeros(max(size, 1), dtype=INT_TYPE)
+            self.neighbor_distances = np.zeros(max(size, 1), dtype=self.dtype)
+            self.neighbor_distances_data = np.PyArray_DATA(self.neighbor_distances)
+
+
+    cdef void reset(self, const void *points_data, int size) noexcept nogil:
+        """ Prepares the state for ordering other points with its spatial index, reusing all buffers, e.g. 
+            for the next data set of a batch (see orderBatch). The state has to be created with at least the
+            given number of points, and the previous ordering has to be finished, so no seeds are left. The
+            points after the given number are never reached, as the ordering stops when all given points are 
+            ordered.
+
+        Arguments:
+            points_data: [pointer] C-ordered 2D array with the coordinates of the points, of the dtype of the
+                state, on which the spatial index is built
+            size: [int] number of points
+
+        """
+
+        cdef int i
+
+        self.points_data = points_data
+        self.total = size
+        self.ordered_count = 0
+        self.next_start = 0
+
+        for i in range(size):
+            self.processed[i] = UNPROCESSED
+            self.reachability[i] = UNDEFINED
+            self.core_distances[i] = UNDEFINED
+            self.predecessor[i] = UNDEFINED
+
+
+    def restorePrefix(self, prefix):
+        """ Marks the points of an already computed beginning of the ordering as processed and restores their
+            values, so the ordering continues after them. The prefix has to end where the seed list is empty,
+            i.e. right before a point with an undefined reachability distance.
+
+        Arguments:
+            prefix: [OPTICSResult] ordering, reachability distances, core distances and predecessors of the 
+                first ordered points
+
+        """
+
+        if self.expand:
+            raise ValueError('A prefix cannot be restored in an ordering of collapsed duplicates!')
+
+        ordering = np.asarray(prefix.ordering, dtype=INT_TYPE)
+        cdef int count = ordering.shape[0]
+
+        if count and ((np.min(ordering) < 0) or (np.max(ordering) >= self.processed.shape[0])):
+            raise ValueError('The prefix refers to points which do not exist!')
+
+        np.asarray(self.ordered_list)[:count] = ordering
+        np.asarray(self.processed)[ordering] = PROCESSED
+        np.asarray(self.reachability)[ordering] = prefix.reachability
+        np.asarray(self.core_distances)[ordering] = prefix.core_distance
+        np.asarray(self.predecessor)[ordering] = prefix.predecessor
+        self.ordered_count = count
+
+
+    def resetStats(self):
+        """ Sets all counters and phase times to zero. """
+
+        cdef int phase
+
+        self.query_count = 0
+        self.neighbor_count = 0
+        self.distance_count = 0
+        self.max_seeds = 0
+
+        for phase in range(PHASES_COUNT):
+            self.phase_times[phase] = 0
+
+
+    def recordStats(self, stats, stage='ordering'):
+        """ Adds the counters and phase times collected since the last reset to the stats, and resets them.
+
+        Arguments:
+            stats: [OPTICSStats] stats into which the values are recorded
+
+        Keyword arguments:
+            stage: [str] name of the stage (default 'ordering')
+
+        """
+
+        # Distances are only computed when the neighbors are queried from the spatial index
+        stats.record(stage, queries=self.query_count, neighbors=self.neighbor_count, 
+            distance_evaluations=self.distance_count if self.graph is None else 0, max_seeds=self.max_seeds,
+            neighbor_time=PyTime_AsSecondsDouble(self.phase_times[PHASE_NEIGHBORS]),
+            core_distance_time=PyTime_AsSecondsDouble(self.phase_times[PHASE_CORE_DISTANCE]),
+            seed_time=PyTime_AsSecondsDouble(self.phase_times[PHASE_SEEDS]))
+
+        self.resetStats()
+
+
+    def orderNext(self, int count):
+        """ Orders the next points, the ordering can be continued with another call.
+
+        Arguments:
+            count: [int] maximum number of points to order
+
+        Return:
+            [OPTICSResult] the newly ordered points, empty if all points were already ordered
+        """
+
+        cdef int start = self.ordered_count
+        cdef int limit = min(start + max(count, 0), self.total)
+
+        with nogil:
+            orderPoints(self, limit)
+
+        return self.getResult(start=start)
+
+
+    def getResult(self, output_dir=None, int start=0):
+        """ Returns the ordered points in the columnar format.
+
+        Keyword arguments:
+            output_dir: [str] if given, the result arrays are written to ordering.npy, reachability.npy, 
+                core_distance.npy and predecessor.npy in this directory, and returned as memory-mapped arrays
+            start: [int] position in the ordering of the first returned point, the points before it are left 
+                out (default 0)
+
+        Return:
+            [OPTICSResult] ordering, reachability distances, core distances and predecessors of the points
+                ordered so far, the distances are of the type of the coordinates
+        """
+
+        ordering = allocateArray((self.ordered_count - start, ), INT_TYPE, output_dir, 'ordering')
+        ordering[:] = np.asarray(self.ordered_list)[start:self.ordered_count]
+
+        # Take the values of ordered points (distances are kept in float64 during the ordering, which 
+        # represents float32 values exactly)
+        if self.expand:
+            points = np.asarray(self.ordered_points)[start:self.ordered_count]
+            values = (np.asarray(self.ordered_reachability)[start:self.ordered_count], 
+                np.asarray(self.core_distances)[points], 
+                np.asarray(self.ordered_predecessor)[start:self.ordered_count])
+
+        else:
+            values = (np.asarray(self.reachability)[ordering], np.asarray(self.core_distances)[ordering], 
+                np.asarray(self.predecessor)[ordering])
+
+        columns = []
+        for name, column_values, dtype in zip(('reachability', 'core_distance', 'predecessor'), values, 
+            (self.dtype, self.dtype, INT_TYPE)):
+
+            column = allocateArray((self.ordered_count - start, ), dtype, output_dir, name)
+            column[:] = column_values
+            columns.append(column)
+
+        return OPTICSResult(ordering, *columns)
+
+
+
+cdef void update(OrderingState state, int i, const int *neighbor_indices, const floating *neighbor_distances, 
+    int neighbors_count) noexcept nogil:
+    """ Update the seeds' reachability distance if a smaller value is found. 
+    
+    Arguments:
+        state: [OrderingState] ordering state, new seeds are pushed to its seeds queue and the reachability 
+            of existing seeds is decreased in place
+        i: [int] index of a point we are currently processing
+        neighbor_indices: [pointer] array containing indices of neighbors
+        neighbor_distances: [pointer] array containing distances to neighbors
+        neighbors_count: [int] number of neighbors in the neighbors_indices array (the array is of fixed size, 
+            so this is used to track the number of points inside)
+
+    """
+
+    cdef int k, neighbor
+    cdef floating new_reach
+
+    # Go through all neighbors
+    for k in range(neighbors_count):
+
+        neighbor = neighbor_indices[k]
+
+        # Check if the neighbor is not processed
+        if state.processed[neighbor] == UNPROCESSED:
+
+            # Find a new reachability distance, it is a max between the core distance in the distance between
+            # the point and the neighbor
+            new_reach = max(<floating>state.core_distances[i], neighbor_distances[k])
+
+            # If the reachability distance was not previously defined, set it to the new calculated value
+            if state.reachability[neighbor] == UNDEFINED:
+                state.reachability[neighbor] = new_reach
+                state.predecessor[neighbor] = i
+
+                # Add a new seed
+                state.seeds.push(neighbor, new_reach)
+
+            # If the newly calculated reachability is smaller, set it as the new reachability distance
+            elif new_reach < state.reachability[neighbor]:
+                
+                # Set the new reachability distance
+                state.reachability[neighbor] = new_reach
+                state.predecessor[neighbor] = i
+
+                # Move the seed up the queue
+                state.seeds.decrease(neighbor, new_reach)
+
+
+
+cdef void updateCopies(OrderingState state, int i, const int *neighbor_indices, 
+    const floating *neighbor_distances, int neighbors_count) noexcept nogil:
+    """ Updates the reachability distance of the remaining rows of ordered neighbors, which are seeds of 
+        their own if the ordering is expanded to all rows of collapsed duplicates (see queueCopies). See update
+        for the description of arguments.
+    """
+
+    cdef int k, neighbor
+    cdef floating new_reach
+
+    for k in range(neighbors_count):
+
+        neighbor = neighbor_indices[k]
+
+        if (state.processed[neighbor] == PROCESSED) \
+            and (state.ordered_copies[neighbor] < state.weights_data[neighbor]):
+
+            new_reach = max(<floating>state.core_distances[i], neighbor_distances[k])
+
+            if new_reach < state.copy_reachability[neighbor]:
+                state.copy_reachability[neighbor] = new_reach
+                state.copy_predecessor[neighbor] = i
+                state.seeds.decrease(neighbor, new_reach)
+
+
+
+cdef int getUnprocessed(OrderingState state, int start) noexcept nogil:
+    """ Returns the index of the next unprocessed point. 
+
+    Arguments:
+        state: [OrderingState] ordering state
+        start: [int] index from which to start the search, all points before it have to be processed
+
+    Return:
+        [int]: index of the next unprocessed point
+    """
+
+    cdef int i
+
+    for i in range(start, state.processed.shape[0]):
+
+        # Choose an unprocessed point
+        if state.processed[i] == UNPROCESSED:
+            return i
+
+    # If there is nothing to process, return UNDEFINED
+    return UNDEFINED
+
+
+
+cdef inline PyTime_t lapTime(OrderingState state, int phase, PyTime_t tic) noexcept nogil:
+    """ Adds the time since tic to the time of the given phase of the ordering, and returns the current time.
+    """
+
+    cdef PyTime_t toc = PyTime_PerfCounterRaw()
+
+    state.phase_times[phase] += toc - tic
+
+    return toc
+
+
+
+cdef void processNeighbors(OrderingState state, int i, const floating *points, floating *work_distances, 
+    const floating *graph_distances) noexcept nogil:
+    """ Computes the core distance of the point, and if it is a core point, updates the reachability distance 
+        of its unprocessed neighbors.
+
+    Arguments:
+        state: [OrderingState] ordering state
+        i: [int] index of a point we are currently processing
+        points: [pointer] input data coordinates, used with the spatial index
+        work_distances: [pointer] work buffer for neighbor distances, used with the spatial index
+        graph_distances: [pointer] distances in the precomputed neighbor graph, used with the graph
+
+    """
+
+    cdef int neighbors_count
+    cdef np.int64_t start
+    cdef const int *neighbor_indices
+    cdef const floating *neighbor_distances
+    cdef PyTime_t tic = 0
+
+    if state.collect_stats:
+        tic = PyTime_PerfCounterRaw()
+
+    # Take the neighbors and the core distance from the precomputed graph
+    if state.graph is not None:
+
+        start = state.graph.indptr[i]
+        neighbors_count = <int>(state.graph.indptr[i + 1] - start)
+        neighbor_indices = &state.graph.indices[start]
+        neighbor_distances = graph_distances + start
+
+        if state.collect_stats:
+            tic = lapTime(state, PHASE_NEIGHBORS, tic)
+
+        state.core_distances[i] = state.graph.core_distances[i]
+
+    else:
+
+        # Get the neighboring points and distances to them
+        neighbors_count = getNeighbors(state.spatial_index, points, i, state.eps, &state.neighbor_indices[0], 
+            work_distances, &state.distance_count if state.collect_stats else NULL)
+        neighbor_indices = &state.neighbor_indices[0]
+        neighbor_distances = work_distances
+
+        if state.collect_stats:
+            tic = lapTime(state, PHASE_NEIGHBORS, tic)
+
+        # Get the core distance
+        if state.weights_data != NULL:
+            state.core_distances[i] = weightedCoreDistance(&state.neighbor_indices[0], work_distances, 
+                neighbors_count, state.weights_data, state.weights_data[i], state.min_pts)
+
+        else:
+            state.core_distances[i] = coreDistance(&state.neighbor_indices[0], work_distances, 
+                neighbors_count, state.min_pts)
+
+    if state.collect_stats:
+        tic = lapTime(state, PHASE_CORE_DISTANCE, tic)
+        state.query_count += 1
+        state.neighbor_count += neighbors_count
+
+    # If the core distance is not undefined, update reachability distance for each unprocessed neighbor
+    if state.core_distances[i] != UNDEFINED:
+        update(state, i, neighbor_indices, neighbor_distances, neighbors_count)
+
+        if state.expand:
+            updateCopies(state, i, neighbor_indices, neighbor_distances, neighbors_count)
+
+    if state.collect_stats:
+        lapTime(state, PHASE_SEEDS, tic)
+        state.max_seeds = max(state.max_seeds, state.seeds.count)
+
+
+
+cdef void orderRow(OrderingState state, int i, double reach, int predecessor) noexcept nogil:
+    """ Adds the next row of the point to the ordered list, if the ordering is expanded to all rows of 
+        collapsed duplicates.
+
+    Arguments:
+        state: [OrderingState] ordering state
+        i: [int] index of the point
+        reach: [float] reachability distance of the row
+        predecessor: [int] point from which the row was reached, its first row is the predecessor of the row
+
+    """
+
+    cdef int k = state.ordered_count
+
+    state.ordered_list[k] = state.rows[state.row_starts[i] + state.ordered_copies[i]]
+    state.ordered_points[k] = i
+    state.ordered_reachability[k] = reach
+    state.ordered_predecessor[k] = state.rows[state.row_starts[predecessor]] if predecessor != UNDEFINED \
+        else UNDEFINED
+
+    state.ordered_copies[i] += 1
+    state.ordered_count += 1
+
+
+
+cdef void queueCopies(OrderingState state, int i) noexcept nogil:
+    """ Adds the remaining rows of a processed point to the seeds. They are at zero distance from its first 
+        row, so OPTICS reaches them from it with its core distance, unless they already have a reachability 
+        distance which is not larger, i.e. the one of the first row. Processing them does not change any 
+        other seed, so they are only ordered, one row at a time.
+
+    Arguments:
+        state: [OrderingState] ordering state
+        i: [int] index of the processed point
+
+    """
+
+    cdef double reach = state.reachability[i]
+    cdef double core_distance = state.core_distances[i]
+
+    if (core_distance != UNDEFINED) and ((reach == UNDEFINED) or (core_distance < reach)):
+        state.copy_reachability[i] = core_distance
+        state.copy_predecessor[i] = i
+
+    elif reach != UNDEFINED:
+        state.copy_reachability[i] = reach
+        state.copy_predecessor[i] = state.predecessor[i]
+
+    # Rows which cannot be reached are ordered as new starting points
+    else:
+        state.copy_reachability[i] = INFINITY
+        state.copy_predecessor[i] = UNDEFINED
+
+    queueNextRow(state, i)
+
+
+
+cdef inline void queueNextRow(OrderingState state, int i) noexcept nogil:
+    """ Adds the next row of an ordered point to the seeds, ordered by its index among the seeds with the
+        same reachability distance.
+    """
+
+    state.next_row[i] = state.rows[state.row_starts[i] + state.ordered_copies[i]]
+    state.seeds.push(i, state.copy_reachability[i])
+
+
+
+cdef void orderCopy(OrderingState state, int i) noexcept nogil:
+    """ Orders the next remaining row of a processed point, taken from the seeds (see queueCopies).
+
+    Arguments:
+        state: [OrderingState] ordering state
+        i: [int] index of the point
+
+    """
+
+    if state.copy_reachability[i] == INFINITY:
+        orderRow(state, i, UNDEFINED, UNDEFINED)
+
+    else:
+        orderRow(state, i, state.copy_reachability[i], state.copy_predecessor[i])
+
+    if state.ordered_copies[i] < state.weights_data[i]:
+        queueNextRow(state, i)
+
+
+
+cdef void processPoint(OrderingState state, int i) noexcept nogil:
+    """ Marks the point as processed and adds it to the ordered list, then processes its neighbors in the 
+        precision of the input data (see processNeighbors).
+
+    Arguments:
+        state: [OrderingState] ordering state
+        i: [int] index of a point we are currently processing
+
+    """
+
+    # Mark the point as processed and add to ordered list
+    state.processed[i] = PROCESSED
+
+    if state.expand:
+        orderRow(state, i, state.reachability[i], state.predecessor[i])
+
+    else:
+        state.ordered_list[state.ordered_count] = i
+        state.ordered_count += 1
+
+    if state.single_precision:
+        processNeighbors(state, i, <const float *>state.points_data, <float *>state.neighbor_distances_data, 
+            <const float *>state.graph_distances_data)
+
+    else:
+        processNeighbors(state, i, <const double *>state.points_data, <double *>state.neighbor_distances_data,
+            <const double *>state.graph_distances_data)
+
+    # The other rows of a collapsed duplicate are ordered after it
+    if state.expand and (state.weights_data[i] > 1):
+        queueCopies(state, i)
+
+
+
+cdef int orderPoints(OrderingState state, int limit) noexcept nogil:
+    """ Runs the OPTICS ordering, using either the spatial index or the precomputed neighborhoods (see 
+        processPoint). The ordering stops when the given number of points is ordered, and it can be continued
+        from there with another call.
+
+    Arguments:
+        state: [OrderingState] ordering state
+        limit: [int] number of ordered points at which the ordering stops, at most the number of all points
+
+    Return:
+        ordered_count: [int] number of ordered points
+    """
+
+    cdef int i
+    cdef PyTime_t tic
+
+    # Repeat while there are points to order
+    while state.ordered_count < limit:
+
+        # Go through seeds while there are any, taking the seed with the smallest reachability distance (rows 
+        # of collapsed duplicates which cannot be reached are not real seeds, see queueCopies)
+        if state.seeds.count and not (state.expand and (state.seeds.keys[state.seeds.heap[0]] == INFINITY)):
+
+            if state.collect_stats:
+                tic = PyTime_PerfCounterRaw()
+                i = state.seeds.pop()
+                lapTime(state, PHASE_SEEDS, tic)
+
+            else:
+                i = state.seeds.pop()
+
+        # Otherwise get the index of the unprocessed point, compute its core distance and update the seeds
+        else:
+            i = getUnprocessed(state, state.next_start)
+
+            if i != UNDEFINED:
+                state.next_start = i
+
+            # Rows which cannot be reached are started in the order of the rows, as other points
+            if state.expand and state.seeds.count and ((i == UNDEFINED) 
+                or (state.next_row[state.seeds.heap[0]] < state.next_row[i])):
+
+                i = state.seeds.pop()
+
+        # Order the next row of a processed point, or process a new point
+        if state.expand and (state.processed[i] == PROCESSED):
+            orderCopy(state, i)
+
+        else:
+            processPoint(state, i)
+
+    return state.ordered_count
+
+
+
+def prepareOrdering(input_list, double eps, int min_pts, index='auto', metric='euclidean', n_jobs=1, 
+    dtype=None, stats=None, weights=None, rows=None, spatial_index=None):
+    """ Converts the input data to the computation dtype and creates the ordering state, either with a spatial
+        index or with precomputed neighborhoods. See runCyOPTICS for the description of arguments.
+
+    Keyword arguments:
+        weights: [ndarray] number of copies of every point, see collapseDuplicates. None counts every point 
+            once (default).
+        rows: [ndarray] input rows of the copies of all points, if they are ordered as separate rows, see 
+            OrderingState (default None)
+        spatial_index: [SpatialIndex] spatial index already built on the input data with the same eps, index 
+            and metric, e.g. to keep it after the ordering. None builds a new one (default).
+
+    Return:
+        (input_list, state): 
+            - input_list: [ndarray] C-ordered input data of the computation dtype
+            - state: [OrderingState] state from which the points can be ordered
+    """
+
+    if min_pts < 2:
+        raise ValueError('min_pts must be at least 2!')
+
+    input_list = np.asarray(loadInput(input_list))
+    dtype = resolveFloatType(dtype, input_list.dtype)
+
+    # The rows of the input data have to be contiguous, this does not copy C-ordered arrays of the given type
+    input_list = np.ascontiguousarray(input_list, dtype=dtype)
+
+    if input_list.ndim != 2:
+        raise ValueError('The input data must be a 2D array!')
+
+    cdef int input_list_size = input_list.shape[0]
+    cdef PyTime_t tic
+
+    # Precompute all neighborhoods and core distances in parallel
+    cdef int threads = numThreads(n_jobs)
+    if threads > 1:
+
+        indptr, indices, distances = computeNeighborGraph(input_list, eps, index=index, metric=metric, 
+            n_jobs=threads, dtype=dtype, stats=stats, spatial_index=spatial_index)
+
+        tic = PyTime_PerfCounterRaw()
+        core_distances = coreDistancesFromGraph(indptr, distances, min_pts, n_jobs=threads, indices=indices, 
+            weights=weights)
+
+        if stats is not None:
+            stats.record('core_distances', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic))
+
+        state = OrderingState(input_list_size, eps, min_pts, dtype=dtype, graph=NeighborGraph(indptr, indices, 
+            distances, core_distances), weights=weights, rows=rows)
+
+    # Otherwise find the neighbors with the spatial index during the ordering
+    else:
+
+        tic = PyTime_PerfCounterRaw()
+        if spatial_index is None:
+            spatial_index = buildIndex(input_list, eps, index=index, metric=metric)
+
+        else:
+            checkIndexedPoints(spatial_index, input_list, eps, metric)
+
+        if stats is not None:
+            stats.record('index', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic))
+
+        state = OrderingState(input_list_size, eps, min_pts, dtype=dtype, points=input_list, 
+            spatial_index=spatial_index, weights=weights, rows=rows)
+
+    return input_list, state
+
+
+
+def runOrdering(OrderingState state, stats=None, progress=None, progress_interval=PROGRESS_INTERVAL):
+    """ Orders all remaining points. Without stats and the progress callback, the whole ordering runs in one
+        call without the GIL, and no counters are collected.
+
+    Arguments:
+        state: [OrderingState] ordering state
+
+    Keyword arguments:
+        stats: [OPTICSStats] if given, the time and the counters of the ordering stage are recorded in it, also
+            if the run is cancelled (None by default)
+        progress: [callable] function called as progress(ordered_count, total) after every progress_interval 
+            ordered points and at the end. If it returns True, the ordering stops and OPTICSCancelled is 
+            raised with the points ordered so far, exceptions raised by it stop the ordering in the same way 
+            (None by default)
+        progress_interval: [int] number of ordered points between the calls of the progress callback 
+            (default PROGRESS_INTERVAL)
+
+    """
+
+    if progress_interval < 1:
+        raise ValueError('The progress interval must be at least 1!')
+
+    cdef int size = state.total
+    cdef int start = state.ordered_count
+    cdef int limit
+    cdef PyTime_t tic = PyTime_PerfCounterRaw()
+
+    state.collect_stats = stats is not None
+
+    try:
+
+        # Order all points at once
+        if progress is None:
+            with nogil:
+                orderPoints(state, size)
+
+        # Order the points in parts, and report the progress after every part
+        else:
+            while state.ordered_count < size:
+
+                limit = min(state.ordered_count + progress_interval, size)
+
+                with nogil:
+                    orderPoints(state, limit)
+
+                if progress(state.ordered_count, size):
+                    raise OPTICSCancelled(state.getResult())
+
+    finally:
+
+        if stats is not None:
+            stats.record('ordering', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic), 
+                points=state.ordered_count - start)
+            state.recordStats(stats)
+
+        state.collect_stats = False
+
+
+
+def runCyOPTICS(input_list, double eps, int min_pts, index='auto', metric='euclidean', n_jobs=1, 
+    return_format='point_list', output_dir=None, dtype=None, stats=None, progress=None, 
+    progress_interval=PROGRESS_INTERVAL, collapse_duplicates=False):
+    """ Runs the OPTICS algorithm on the given data.
+        
+    Arguments:
+        input_list: [ndarray] 2D numpy array containing the input data (1 datum per row, all columns are used
+            as coordinates), or a path to a .npy file with it. Files and np.memmap arrays of C-ordered values 
+            of the computation dtype are read in place, without copying them into memory.
+        eps: [float] epsilon parameter - maximum distance between points
+        min_pts: [int] minimum points in the cluster
+
+    Keyword arguments:
+        index: [str] spatial index used for neighbor queries, 'auto' (default), 'grid', 'kdtree' or 'brute' 
+            (see buildIndex for more information)
+        metric: [str] distance metric, 'euclidean' (default), 'sqeuclidean', 'manhattan', 'chebyshev', 
+            'cosine' or 'haversine' (latitude and longitude in radians, distances in radians)
+        n_jobs: [int] number of threads, -1 uses all cores (default 1). If not 1, neighborhoods and core 
+            distances of all points are first computed in parallel (see computeNeighborGraph) and the 
+            sequential ordering then reads them from memory. This needs memory for all neighborhoods at once.
+        return_format: [str] 'point_list' (default) or 'columnar', see the return values
+        output_dir: [str] if given, the results are written to memory-mapped .npy files in this directory 
+            (point_list.npy, or ordering.npy, reachability.npy, core_distance.npy and predecessor.npy for the 
+            columnar format), and the returned arrays are memory-mapped. For the columnar format, a 
+            header.json file with the parameters is also written, so the result can be loaded with 
+            OPTICSResult.loadResult.
+        dtype: [dtype] float32 or float64, precision of the coordinates, distances and returned values. None 
+            keeps float32 input in float32 and computes everything else in float64 (default).
+        stats: [OPTICSStats] if given, the times of the stages (index, or neighbor_graph and core_distances 
+            with more threads, then ordering and result) and the counters of the ordering are recorded in it, 
+            see OPTICSStats. None collects nothing (default).
+        progress: [callable] function called as progress(ordered_count, total) after every progress_interval
+            ordered points. If it returns True, the run stops and raises OPTICSCancelled, which keeps the 
+            points ordered so far (see runOrdering and OPTICSStats.timeBudget). None by default.
+        progress_interval: [int] number of ordered points between the calls of the progress callback (default
+            PROGRESS_INTERVAL)
+        collapse_duplicates: [bool] if True, identical rows are collapsed into one point which counts as many 
+            times as it occurs, so data with many duplicates is ordered much faster. The neighborhoods and 
+            core distances are only computed for the unique points, while every row is ordered as a separate
+            point (see OrderingState), so the results are the same as without collapsing. False by default.
+        
+    Return:
+        if return_format == 'point_list':
+            point_list: [ndarray] 2D numpy array containing information about every processed point, the 
+                columns of the array are:
+                - processed: 0 for not processed, 1 for processed - upon returning, processed values of all 
+                    entries should be 1
+                - reachability distance: -1 for first points in the cluster, positive for all others
+                - core distance: -1 for noise, positive otherwise (the notion of noise can change with regard 
+                    to the different input values eps and min_pts)
+                - input data points (the input data colums are appended to the right)
+        if return_format == 'columnar':
+            [OPTICSResult] ordering, reachability distances, core distances and predecessors as separate 
+                arrays, the input data is not copied
+    """
+
+    cdef OrderingState state
+    cdef PyTime_t tic
+
+    checkReturnFormat(return_format)
+
+    weights = None
+    rows = None
+
+    # Order the unique points, weighted with the number of their rows
+    if collapse_duplicates:
+
+        input_list = np.asarray(loadInput(input_list))
+        input_list = np.ascontiguousarray(input_list, dtype=resolveFloatType(dtype, input_list.dtype))
+
+        if input_list.ndim != 2:
+            raise ValueError('The input data must be a 2D array!')
+
+        tic = PyTime_PerfCounterRaw()
+        unique_points, inverse, weights = collapseDuplicates(input_list)
+
+        if stats is not None:
+            stats.record('collapse_duplicates', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic), 
+                points=input_list.shape[0], unique_points=unique_points.shape[0])
+
+        # Without duplicates, the input data is ordered directly
+        if unique_points.shape[0] < input_list.shape[0]:
+
+            # Rows of every unique point, in the increasing order
+            rows = np.argsort(inverse, kind='stable').astype(INT_TYPE)
+
+            _, state = prepareOrdering(unique_points, eps, min_pts, index=index, metric=metric, n_jobs=n_jobs, 
+                dtype=input_list.dtype, stats=stats, weights=weights, rows=rows)
+
+    if rows is None:
+        input_list, state = prepareOrdering(input_list, eps, min_pts, index=index, metric=metric, 
+            n_jobs=n_jobs, dtype=dtype, stats=stats)
+
+    # Order all points
+    runOrdering(state, stats=stats, progress=progress, progress_interval=progress_interval)
+
+    tic = PyTime_PerfCounterRaw()
+
+    if return_format == 'columnar':
+        result = state.getResult(output_dir=output_dir)
+
+    else:
+        result = state.getResult()
+
+    if return_format == 'columnar':
+
+        result.header = {'eps': eps, 'min_pts': min_pts, 'metric': metric, 'index': index}
+
+        # Write the header next to the arrays, so the result can be loaded with loadResult
+        if output_dir is not None:
+            result.save(output_dir, input_list=input_list)
+
+    else:
+        result = result.toPointList(input_list, output_dir=output_dir)
+
+    if stats is not None:
+        stats.record('result', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic))
+
+    return result
+
+
+
+def iterCyOPTICS(input_list, double eps, int min_pts, index='auto', metric='euclidean', n_jobs=1, dtype=None, 
+    chunk_size=ORDERING_CHUNK_SIZE):
+    """ Runs the OPTICS algorithm on the given data and yields the ordered points in chunks, as soon as they 
+        are ordered. The values of ordered points do not change later, so the consumers of the chunks can 
+        start before the ordering is finished. See runCyOPTICS for the description of arguments.
+
+    Keyword arguments:
+        chunk_size: [int] number of points in a chunk, the last chunk can be smaller (default 
+            ORDERING_CHUNK_SIZE)
+
+    Return:
+        [generator] OPTICSResult objects with the next chunk_size points of the ordering
+    """
+
+    if chunk_size < 1:
+        raise ValueError('The chunk size must be at least 1!')
+
+    input_list, state = prepareOrdering(input_list, eps, min_pts, index=index, metric=metric, n_jobs=n_jobs, 
+        dtype=dtype)
+
+    while state.ordered_count < input_list.shape[0]:
+        yield state.orderNext(chunk_size)
+
+
+
+cdef int orderDataSets(OrderingState state, SpatialIndex spatial_index, const floating *points, 
+    const floating *norms, const np.int64_t *offsets, int start, int end, int *ordering, floating *reachability,
+    floating *core_distance, int *predecessor) noexcept nogil:
+    """ Orders the data sets of a packed batch one after another, rebuilding the spatial index and resetting
+        the ordering state for every data set, and writes the results into the packed result arrays. See 
+        orderBatch for the description of arguments.
+
+    Return:
+        [int] 0, or -1 if the spatial index of a data set could not be built (see rebuildIndex)
+    """
+
+    cdef int k, p, i, size
+    cdef np.int64_t lo
+
+    for k in range(start, end):
+
+        lo = offsets[k]
+        size = <int>(offsets[k + 1] - lo)
+
+        if size == 0:
+            continue
+
+        # The rows of a data set are contiguous in the packed points
+        if rebuildIndex(spatial_index, points + lo*spatial_index.dims, size, norms + lo if norms != NULL 
+            else NULL):
+
+            return -1
+
+        state.reset(points + lo*spatial_index.dims, size)
+        orderPoints(state, size)
+
+        # Take the values of the points in the OPTICS order (the distances are kept in float64 during the 
+        # ordering, which represents float32 values exactly)
+        for p in range(size):
+
+            i = state.ordered_list[p]
+
+            ordering[lo + p] = i
+            reachability[lo + p] = <floating>state.reachability[i]
+            core_distance[lo + p] = <floating>state.core_distances[i]
+            predecessor[lo + p] = state.predecessor[i]
+
+    return 0
+
+
+
+def orderBatch(points, offsets, int start, int end, double eps, int min_pts, index, metric, ordering, 
+    reachability, core_distance, predecessor):
+    """ Runs the OPTICS ordering on a range of data sets of a packed batch, and writes the results into the 
+        packed result arrays. The spatial index and the ordering state are allocated once for the largest data
+        set of the range and reused for all of them, and the whole range is ordered without the GIL, so 
+        threads can order different ranges at the same time (see BatchOPTICS.runBatchOPTICS).
+
+    Arguments:
+        points: [ndarray] C-ordered 2D array with the points of all data sets, of the computation dtype
+        offsets: [ndarray] int64 array of size B + 1, the data set k are the rows offsets[k]:offsets[k + 1]
+        start: [int] first data set which is ordered
+        end: [int] end of the range of data sets (not included)
+        eps: [float] epsilon parameter - maximum distance between points
+        min_pts: [int] minimum points in the cluster
+        index: [str] spatial index used for neighbor queries, see runCyOPTICS
+        metric: [str] distance metric, see runCyOPTICS
+        ordering: [ndarray] int32 array into which the indices of points within their data set are written in
+            the OPTICS order, at the rows of the data set
+        reachability: [ndarray] array of the computation dtype for the reachability distances
+        core_distance: [ndarray] array of the computation dtype for the core distances
+        predecessor: [ndarray] int32 array for the predecessors, as indices within the data set
+
+    """
+
+    cdef int error
+    cdef bint single_precision = (points.dtype == np.float32)
+
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+
+    for name, array, dtype in (('ordering', ordering, INT_TYPE), ('reachability', reachability, points.dtype),
+        ('core_distance', core_distance, points.dtype), ('predecessor', predecessor, INT_TYPE)):
+
+        if (array.dtype != dtype) or (not array.flags.c_contiguous) or (array.shape[0] != points.shape[0]):
+            raise ValueError('The {:s} array must be a C-ordered array of the type {:s} with a value for every '
+                'point!'.format(name, str(np.dtype(dtype))))
+
+    # The buffers are allocated for the largest data set
+    cdef int capacity = int(np.max(np.diff(offsets[start:end + 1]), initial=0))
+
+    if capacity == 0:
+        return
+
+    # Build the index on no points and reserve its buffers, it is rebuilt on every data set
+    cdef SpatialIndex spatial_index = buildIndex(points[:0], eps, index=index, metric=metric)
+    spatial_index.reserve(capacity)
+
+    cdef OrderingState state = OrderingState(capacity, eps, min_pts, dtype=points.dtype, points=points, 
+        spatial_index=spatial_index)
+
+    # The norms of all points of the range for the cosine metric, computed as SpatialIndex does
+    norms = None
+    if spatial_index.metric == METRIC_COSINE:
+        norms = np.zeros(points.shape[0], dtype=points.dtype)
+        norms[offsets[start]:offsets[end]] = np.sqrt(np.einsum('ij,ij->i', points[offsets[start]:offsets[end]], 
+            points[offsets[start]:offsets[end]]))
+
+    cdef const void *points_ptr = np.PyArray_DATA(points)
+    cdef const void *norms_ptr = np.PyArray_DATA(norms) if norms is not None else NULL
+    cdef const np.int64_t *offsets_ptr = <const np.int64_t *>np.PyArray_DATA(offsets)
+    cdef int *ordering_ptr = <int *>np.PyArray_DATA(ordering)
+    cdef void *reachability_ptr = np.PyArray_DATA(reachability)
+    cdef void *core_distance_ptr = np.PyArray_DATA(core_distance)
+    cdef int *predecessor_ptr = <int *>np.PyArray_DATA(predecessor)
+
+    with nogil:
+
+        if single_precision:
+            error = orderDataSets(state, spatial_index, <const float *>points_ptr, <const float *>norms_ptr,
+                offsets_ptr, start, end, ordering_ptr, <float *>reachability_ptr, <float *>core_distance_ptr,
+                predecessor_ptr)
+
+        else:
+            error = orderDataSets(state, spatial_index, <const double *>points_ptr, <const double *>norms_ptr,
+                offsets_ptr, start, end, ordering_ptr, <double *>reachability_ptr, <double *>core_distance_ptr,
+                predecessor_ptr)
+
+    if error:
+        raise ValueError('The grid index has too many cells for the given eps, use the kdtree index!')
+
+
+
+def runCyOPTICSSparse(indptr, indices, distances, double eps, int min_pts, core_distances=None, n_jobs=1, 
+    return_format='point_list', output_dir=None, dtype=None, prefix=None, stats=None, progress=None, 
+    progress_interval=PROGRESS_INTERVAL, weights=None):
+    """ Runs the OPTICS algorithm on a precomputed neighbor graph instead of point coordinates, so no 
+        distances are computed. The ordering runs in O(E log N), where E is the number of edges.
+        
+    Arguments:
+        indptr: [ndarray] row offsets of the graph in the CSR format, of size N + 1
+        indices: [ndarray] neighbor indices, neighbors of the point i are indices[indptr[i]:indptr[i + 1]]
+        distances: [ndarray] distances to neighbors, in the same order as the indices
+        eps: [float] epsilon parameter - maximum distance between points, edges longer than eps are ignored
+        min_pts: [int] minimum points in the cluster
+
+    Keyword arguments:
+        core_distances: [ndarray] core distances of all points, e.g. from a previous run with the same eps and
+            min_pts. They are computed from the graph if not given (default).
+        n_jobs: [int] number of threads used for computing core distances, -1 uses all cores (default 1)
+        return_format: [str] 'point_list' (default) or 'columnar', see runCyOPTICS
+        output_dir: [str] directory for memory-mapped output files, see runCyOPTICS
+        dtype: [dtype] float32 or float64, precision of the distances and returned values. None keeps float32
+            distances in float32 and uses float64 otherwise (default).
+        prefix: [OPTICSResult] beginning of the ordering which is already known, e.g. the part of a previous 
+            run which does not reach any changed point. The ordering continues after it, so it has to end 
+            right before a point with an undefined reachability distance (see OrderingState.restorePrefix). 
+            None orders all points (default).
+        stats: [OPTICSStats] stats into which the times and counters are recorded, see runCyOPTICS
+        progress: [callable] progress callback, which can cancel the ordering, see runCyOPTICS
+        progress_interval: [int] number of ordered points between the calls of the progress callback (default
+            PROGRESS_INTERVAL)
+        weights: [ndarray] number of copies of every point, e.g. of duplicates collapsed into one point, which
+            are counted in the core distances (see collapseDuplicates). Given core distances have to be 
+            computed with the same weights. None counts every point once (default).
+        
+    Return:
+        point_list: [ndarray] 2D numpy array containing information about every processed point, the columns
+            are the same as for runCyOPTICS, except that the only input data column is the index of the 
+            point in the graph. An OPTICSResult is returned instead for the 'columnar' return format.
+    """
+
+    indptr = np.asarray(indptr)
+    indices = np.asarray(indices)
+    distances = np.asarray(distances)
+    dtype = resolveFloatType(dtype, distances.dtype)
+
+    if min_pts < 2:
+        raise ValueError('min_pts must be at least 2!')
+
+    checkReturnFormat(return_format)
+
+    # Check the graph
+    if (indptr.ndim != 1) or (indptr.shape[0] < 1):
+        raise ValueError('indptr must be a 1D array of size N + 1!')
+
+    cdef int input_list_size = indptr.shape[0] - 1
+
+    if (indices.shape[0] != distances.shape[0]) or (indptr[input_list_size] != indices.shape[0]) \
+        or np.any(np.diff(indptr) < 0):
+        raise ValueError('indptr, indices and distances do not describe a valid CSR graph!')
+
+    if indices.shape[0] and ((np.min(indices) < 0) or (np.max(indices) >= input_list_size)):
+        raise ValueError('Neighbor indices must be between 0 and N - 1!')
+
+    # Negative or NaN distances would break the order of the seed heap and the core distances
+    if distances.shape[0] and not np.all(np.isfinite(distances) & (distances >= 0)):
+        raise ValueError('The distances in the neighbor graph must be finite and non-negative!')
+
+    # Remove self loops and edges longer than eps, which are not a part of eps-neighborhoods
+    indptr, indices, distances = filterNeighborGraph(indptr, indices, np.asarray(distances, dtype=dtype), eps)
+
+    # Compute core distances
+    cdef PyTime_t tic = PyTime_PerfCounterRaw()
+    if core_distances is None:
+        core_distances = coreDistancesFromGraph(indptr, distances, min_pts, n_jobs=n_jobs, indices=indices, 
+            weights=weights)
+
+        if stats is not None:
+            stats.record('core_distances', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic))
+
+    else:
+        core_distances = np.ascontiguousarray(core_distances, dtype=FLOAT_TYPE)
+
+        if core_distances.shape != (input_list_size, ):
+            raise ValueError('core_distances must have one value per point!')
+
+    cdef OrderingState state = OrderingState(input_list_size, eps, min_pts, dtype=dtype, 
+        graph=NeighborGraph(indptr, indices, distances, core_distances), weights=weights)
+
+    # Continue after the known part of the ordering
+    if prefix is not None:
+        state.restorePrefix(prefix)
+
+    # Order all points
+    runOrdering(state, stats=stats, progress=progress, progress_interval=progress_interval)
+
+    tic = PyTime_PerfCounterRaw()
+
+    if return_format == 'columnar':
+
+        result = state.getResult(output_dir=output_dir)
+        result.header = {'eps': eps, 'min_pts': min_pts, 'metric': 'precomputed'}
+
+        # Write the header next to the arrays, so the result can be loaded with loadResult
+        if output_dir is not None:
+            result.save(output_dir)
+
+    # The index of every point in the graph is used as its input data
+    else:
+        result = state.getResult().toPointList(np.arange(input_list_size).reshape(-1, 1), output_dir=output_dir)
+
+    if stats is not None:
+        stats.record('result', time=PyTime_AsSecondsDouble(PyTime_PerfCounterRaw() - tic))
 
+    return result
@@ -0,0 +1,280 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Pure Python implementation of the cyGradientClustering extension, which is used by GradientClustering
+when the compiled extension is not available (see OPTICSExtension). See cyGradientClustering.pyx for the
+description of the methods, the results are identical.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+
+
+
+def isLargeEnough(start, end, min_pts):
+    """ Checks if the cluster with points from start to end (not included) has at least min_pts points. """
+
+    # Empty ranges have a length of 0, as in Python
+    return max(end - start, 0) >= min_pts
+
+
+
+class StartPointStack(object):
+    """ Start point stack of the gradient clustering, see cyGradientClustering.StartPointStack. """
+
+    def __init__(self, min_pts, reach_list_size):
+        """ Initilization function for the stack.
+
+        Arguments:
+            min_pts: [float] minimum number of points in a cluster
+            reach_list_size: [int] number of points in the whole reachability plot
+
+        """
+
+        if reach_list_size == 0:
+            raise IndexError('Cannot cluster an empty reachability list!')
+
+        self.min_pts = float(min_pts)
+        self.reach_list_size = reach_list_size
+
+        # Indices and reachability distances of start points
+        self.start_pts = []
+        self.start_reach = []
+
+        self.last_endpoint = reach_list_size - 1
+        self.started = False
+
+        self.curr_cluster = []
+
+
+    def update(self, reach_list, offset, inflection_points, right_turns):
+        """ Runs the stack over the inflection points in a part of the reachability plot, see
+            cyGradientClustering.StartPointStack.update.
+
+        Return:
+            set_of_clusters: [list] a list of clusters found in this part, each cluster is a range of point
+                indices
+        """
+
+        set_of_clusters = []
+
+        # Reachability distances are compared as doubles, as in the extension
+        reach_list = np.asarray(reach_list, dtype=np.float64)
+
+        # Add the first point of the plot to the start points
+        if not self.started:
+
+            if (offset != 0) or (reach_list.shape[0] == 0):
+                raise ValueError('The first part of the reachability plot has to start at its first point!')
+
+            self.start_pts.append(0)
+            self.start_reach.append(reach_list[0])
+            self.started = True
+
+        for i, right_turn in zip(np.asarray(inflection_points).tolist(), np.asarray(right_turns).tolist()):
+
+            reach_i = reach_list[i - offset]
+            reach_next = reach_list[i + 1 - offset]
+
+            # Check if the next vector deviates to the right
+            if right_turn:
+
+                # Check if the current cluster size is larger than the minimum number of points required
+                if len(self.curr_cluster) >= self.min_pts:
+                    set_of_clusters.append(self.curr_cluster)
+
+                # Reset the current cluster
+                self.curr_cluster = []
+
+                # Remove the last start point if it has a smaller reachability distance than the current point
+                if self.start_reach and self.start_reach[-1] <= reach_i:
+                    self.start_pts.pop()
+                    self.start_reach.pop()
+
+                if self.start_pts:
+
+                    # While the last start point has a smaller reachability distance than the current point,
+                    # keep removing start points and add clusters which begin at them
+                    while self.start_reach[-1] < reach_i:
+
+                        start = self.start_pts.pop()
+                        self.start_reach.pop()
+
+                        if isLargeEnough(start, self.last_endpoint, self.min_pts):
+                            set_of_clusters.append(range(start, self.last_endpoint))
+
+                        if not self.start_pts:
+                            raise IndexError('list index out of range')
+
+                    # Lastly, add another cluster at the end
+                    start = self.start_pts[-1]
+
+                    if isLargeEnough(start, self.last_endpoint, self.min_pts):
+                        set_of_clusters.append(range(start, self.last_endpoint))
+
+                # If the current point is a starting point, add it to the stack
+                if reach_next < reach_i:
+                    self.start_pts.append(i)
+                    self.start_reach.append(reach_i)
+
+            # The next vector deviates to the left, marking an endpoint
+            else:
+
+                # If the endpoint goes up, take all points from the last start point to this one as the
+                # current cluster
+                if reach_next > reach_i:
+
+                    self.last_endpoint = i + 1
+
+                    if not self.start_pts:
+                        raise IndexError('list index out of range')
+
+                    self.curr_cluster = range(self.start_pts[-1], self.last_endpoint)
+
+        return set_of_clusters
+
+
+    def finish(self, last_reach):
+        """ Adds the clusters at the end of the reachability plot, after all parts were given to update.
+
+        Arguments:
+            last_reach: [float] reachability distance of the last point, with UNDEFINED already replaced
+
+        Return:
+            set_of_clusters: [list] a list of the remaining clusters
+        """
+
+        set_of_clusters = []
+
+        # Add clusters at the end of plot, while start points has any members
+        while self.start_pts:
+
+            start = self.start_pts.pop()
+            start_reach = self.start_reach.pop()
+
+            if (start_reach > float(last_reach)) and isLargeEnough(start, self.reach_list_size, self.min_pts):
+                set_of_clusters.append(range(start, self.reach_list_size))
+
+        return set_of_clusters
+
+
+
+def gradientStartPoints(reach_list, inflection_points, right_turns, min_pts):
+    """ Runs the start point stack of the gradient clustering over the given inflection points, see
+        cyGradientClustering.gradientStartPoints.
+
+    Return:
+        set_of_clusters: [list] a list of found clusters, each cluster is a range of point indices
+    """
+
+    reach_list_size = len(reach_list)
+
+    if reach_list_size == 0:
+        raise IndexError('Cannot cluster an empty reachability list!')
+
+    stack = StartPointStack(min_pts, reach_list_size)
+
+    set_of_clusters = stack.update(reach_list, 0, inflection_points, right_turns)
+    set_of_clusters.extend(stack.finish(reach_list[reach_list_size - 1]))
+
+    return set_of_clusters
+
+
+
+def mergeIntervalsOnce(starts, ends, sources, similarity_threshold):
+    """ Runs one pass of merging similar clusters, see cyGradientClustering.mergeIntervalsOnce.
+
+    Return:
+        (starts, ends, sources): [tuple of ndarrays] merged clusters, in the order in which they were merged
+    """
+
+    starts = np.asarray(starts, dtype=np.int64).tolist()
+    ends = np.asarray(ends, dtype=np.int64).tolist()
+    sources = np.asarray(sources, dtype=np.int64).tolist()
+    n = len(starts)
+
+    # Flags of clusters which were merged into one of the previous clusters
+    skip = [False]*n
+
+    merged_starts = []
+    merged_ends = []
+    merged_sources = []
+
+    for i in range(n):
+
+        # Skip if the cluster was already merged
+        if skip[i]:
+            continue
+
+        size_i = ends[i] - starts[i]
+
+        # The cluster i is the bigger one in all following pairs
+        min_intersect = similarity_threshold*size_i
+
+        # Keep the cluster as it is if no similar cluster is found
+        merged_start, merged_end, merged_source = starts[i], ends[i], sources[i]
+
+        for j in range(i + 1, n):
+
+            size_j = ends[j] - starts[j]
+
+            # None of the following clusters can be similar enough
+            if size_j < min_intersect:
+                break
+
+            # Skip if already merged
+            if skip[j]:
+                continue
+
+            # Find the number of common points between clusters
+            intersect_points = max(min(ends[i], ends[j]) - max(starts[i], starts[j]), 0)
+
+            if intersect_points >= min_intersect:
+
+                skip[j] = True
+
+                # The union of an empty cluster and another cluster is the other cluster
+                if size_j == 0:
+                    pass
+
+                elif size_i == 0:
+                    merged_start, merged_end = starts[j], ends[j]
+
+                # Clusters which are apart cannot be merged into one interval
+                elif max(starts[i], starts[j]) > min(ends[i], ends[j]):
+                    raise ValueError('Clusters which do not overlap cannot be merged into an interval!')
+
+                else:
+                    merged_start, merged_end = min(starts[i], starts[j]), max(ends[i], ends[j])
+
+                merged_source = -1
+
+                break
+
+        merged_starts.append(merged_start)
+        merged_ends.append(merged_end)
+        merged_sources.append(merged_source)
+
+    return np.array(merged_starts, dtype=np.int64), np.array(merged_ends, dtype=np.int64), \
+        np.array(merged_sources, dtype=np.int64)
@@ -0,0 +1,783 @@
+# MIT License
+
+# Copyright (c) 2016 Denis Vida
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+""" Pure NumPy implementation of runCyOPTICS and runCyOPTICSSparse, which is used by runOPTICS when the
+compiled cyOPTICS extension is not available (see OPTICSExtension).
+
+The ordering is the same as the ordering of the extension: distances are computed in the same precision and
+in the same order of operations (only the trigonometric functions of the haversine metric can round 
+differently), and seeds with the same reachability distance are taken by their index.
+Neighbors are found by computing the distances from every point to all points, so the run takes O(N^2) time,
+and the parameters which only make the extension faster (index and n_jobs) are ignored.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import time
+import heapq
+
+import numpy as np
+
+from OPTICSResult import OPTICSResult, allocateArray, loadInput, resolveFloatType, checkReturnFormat, \
+    collapseDuplicates
+from OPTICSStats import OPTICSCancelled, PROGRESS_INTERVAL
+
+
+# Value of undefined distances and predecessors
+UNDEFINED = -1
+
+# Type of point indices
+INT_TYPE = np.int32
+
+# Spatial indices and metrics accepted by the extension
+INDICES = ('auto', 'grid', 'kdtree', 'brute')
+METRICS = ('euclidean', 'sqeuclidean', 'manhattan', 'chebyshev', 'cosine', 'haversine')
+
+
+
+def rawDistances(points, x, metric, norms=None, x_norm=0):
+    """ Calculates the distances from the point x to all points in the raw form of the metric, see
+        cyOPTICS.rawDistance.
+
+    Arguments:
+        points: [ndarray] 2D array of points
+        x: [ndarray] coordinates of the query point, of the type of the points
+        metric: [str] distance metric
+
+    Keyword arguments:
+        norms: [ndarray] norms of all points, only used by the cosine metric
+        x_norm: [float] norm of the query point, only used by the cosine metric
+
+    Return:
+        [ndarray] raw distances, of the type of the points
+    """
+
+    dtype = points.dtype
+
+    if metric in ('euclidean', 'sqeuclidean'):
+
+        dist = np.square(points[:, 0] - x[0])
+        for axis in range(1, points.shape[1]):
+            dist += np.square(points[:, axis] - x[axis])
+
+    elif metric == 'manhattan':
+
+        dist = np.abs(points[:, 0] - x[0])
+        for axis in range(1, points.shape[1]):
+            dist += np.abs(points[:, axis] - x[axis])
+
+    elif metric == 'chebyshev':
+
+        dist = np.abs(points[:, 0] - x[0])
+        for axis in range(1, points.shape[1]):
+            np.maximum(dist, np.abs(points[:, axis] - x[axis]), out=dist)
+
+    elif metric == 'cosine':
+
+        dist = points[:, 0]*x[0]
+        for axis in range(1, points.shape[1]):
+            dist += points[:, axis]*x[axis]
+
+        # Vectors with no direction are at the distance 1 from all other vectors (the subtraction is done in
+        # double precision, as in C, and rounding errors below zero are clamped)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = np.maximum(1.0 - (dist/(norms*x_norm)).astype(np.float64), 0.0).astype(dtype)
+
+        dist[(norms == 0) | (x_norm == 0)] = 1.0
+
+    else:
+
+        # Points are given as (latitude, longitude) in radians, the raw distance is the haversine of the
+        # central angle (the trigonometric functions are computed in double precision, as in C)
+        sin_lat = np.sin(((points[:, 0] - x[0])/dtype.type(2)).astype(np.float64)).astype(dtype)
+        sin_lon = np.sin(((points[:, 1] - x[1])/dtype.type(2)).astype(np.float64)).astype(dtype)
+        dist = (sin_lat*sin_lat + np.cos(float(x[0]))*np.cos(points[:, 0].astype(np.float64))*sin_lon
+            *sin_lon).astype(dtype)
+
+    return dist
+
+
+
+def rawThreshold(eps, metric):
+    """ Converts eps to the raw form of the given metric (see rawDistances). """
+
+    if metric == 'euclidean':
+        return eps*eps
+
+    elif metric == 'haversine':
+        if eps >= np.pi:
+            return 1.0
+        return np.sin(eps/2)**2
+
+    return eps
+
+
+
+def finishDistances(dist, metric):
+    """ Converts raw distances (see rawDistances) to the real distances in the given metric. """
+
+    if metric == 'euclidean':
+        return np.sqrt(dist)
+
+    elif metric == 'haversine':
+        return (2*np.arcsin(np.sqrt(np.clip(dist.astype(np.float64), 0.0, 1.0)))).astype(dist.dtype)
+
+    return dist
+
+
+
+class BruteForceNeighbors(object):
+    """ Finds the eps-neighborhood of a point by computing the distances to all points. """
+
+    def __init__(self, points, eps, metric='euclidean'):
+        """ Initilization function, which checks the metric.
+
+        Arguments:
+            points: [ndarray] C-ordered 2D array of points of the computation dtype
+            eps: [float] epsilon parameter - maximum distance between points
+
+        Keyword arguments:
+            metric: [str] distance metric, see runNumpyOPTICS
+
+        """
+
+        if metric not in METRICS:
+            raise ValueError("Unknown metric '{:s}', use one of: {:s}!".format(str(metric), ', '.join(METRICS)))
+
+        if (metric == 'haversine') and (points.shape[1] != 2):
+            raise ValueError('The haversine metric needs 2 columns, latitude and longitude in radians!')
+
+        self.points = points
+        self.metric = metric
+
+        # Distances are compared to eps in their own precision, as in the extension
+        self.raw_eps = points.dtype.type(rawThreshold(eps, metric))
+
+        self.norms = None
+        if metric == 'cosine':
+            self.norms = np.sqrt(np.einsum('ij,ij->i', points, points))
+
+        # Number of computed distances
+        self.distance_count = 0
+
+
+    def query(self, i):
+        """ Returns the neighbors of the point i within eps, without the point itself.
+
+        Arguments:
+            i: [int] index of the query point
+
+        Return:
+            (indices, distances): [tuple of ndarrays] indices of neighbors in ascending order and the distances
+                to them
+        """
+
+        dist = rawDistances(self.points, self.points[i], self.metric, norms=self.norms,
+            x_norm=self.norms[i] if self.norms is not None else 0)
+
+        self.distance_count += len(dist) - 1
+
+        within = dist <= self.raw_eps
+        within[i] = False
+
+        indices = np.flatnonzero(within).astype(INT_TYPE)
+
+        return indices, finishDistances(dist[indices], self.metric)
+
+
+
+class GraphNeighbors(object):
+    """ Takes the eps-neighborhoods of points from a neighbor graph in the CSR format. """
+
+    def __init__(self, indptr, indices, distances):
+        """ Initilization function.
+
+        Arguments:
+            indptr: [ndarray] row offsets, of size N + 1
+            indices: [ndarray] neighbor indices
+            distances: [ndarray] distances to neighbors
+
+        """
+
+        self.indptr = indptr
+        self.indices = indices
+        self.distances = distances
+        self.distance_count = 0
+
+
+    def query(self, i):
+        """ Returns the neighbors of the point i and the distances to them. """
+
+        return self.indices[self.indptr[i]:self.indptr[i + 1]], \
+            self.distances[self.indptr[i]:self.indptr[i + 1]]
+
+
+
+def coreDistance(indices, distances, min_pts, weights=None, weight=1):
+    """ Calculates the core distance from the distances to the neighbors, see cyOPTICS.coreDistance and
+        cyOPTICS.weightedCoreDistance.
+
+    Arguments:
+        indices: [ndarray] indices of neighbors
+        distances: [ndarray] distances to neighbors
+        min_pts: [int] minimum number of points
+
+    Keyword arguments:
+        weights: [ndarray] number of copies of every point, None counts every point once (default)
+        weight: [int] number of copies of the point (default 1)
+
+    Return:
+        [float] core distance, UNDEFINED if there are not enough neighbors
+    """
+
+    # The (min_pts-1)th neighbor, the point itself is the first point
+    if weights is None:
+
+        if len(distances) < min_pts - 1:
+            return UNDEFINED
+
+        return np.partition(distances, min_pts - 2)[min_pts - 2]
+
+    # The copies of the point are at the distance 0
+    needed = min_pts - weight
+    if needed <= 0:
+        return 0
+
+    order = np.argsort(distances, kind='stable')
+    cumulative = np.cumsum(weights[indices[order]])
+
+    if (len(cumulative) == 0) or (cumulative[-1] < needed):
+        return UNDEFINED
+
+    return distances[order[np.searchsorted(cumulative, needed)]]
+
+
+
+class OrderingState(object):
+    """ Working state of the OPTICS ordering, see cyOPTICS.OrderingState. Seeds are kept in a heap of
+        (reachability distance, tie key, index) entries, in which the outdated entries are skipped when popped.
+    """
+
+    def __init__(self, size, min_pts, neighbors, dtype, core_distances=None, weights=None, rows=None):
+        """ Initilization function for the ordering state.
+
+        Arguments:
+            size: [int] number of points
+            min_pts: [int] minimum points in the cluster
+            neighbors: [object] BruteForceNeighbors or GraphNeighbors
+            dtype: [dtype] float32 or float64, type of the distances
+
+        Keyword arguments:
+            core_distances: [ndarray] precomputed core distances of all points, computed during the ordering if
+                not given (default)
+            weights: [ndarray] number of copies of every point, None counts every point once (default)
+            rows: [ndarray] input rows of the copies of all points, if every row is ordered as a separate 
+                point, see cyOPTICS.OrderingState (default None)
+
+        """
+
+        self.min_pts = min_pts
+        self.neighbors = neighbors
+        self.dtype = np.dtype(dtype)
+        self.given_core_distances = core_distances
+        self.weights = weights
+
+        # Processed flag, reachability distance, core distance and predecessor of every point
+        self.processed = np.zeros(size, dtype=bool)
+        self.reachability = np.zeros(size, dtype=np.float64) + UNDEFINED
+        self.core_distances = np.zeros(size, dtype=np.float64) + UNDEFINED
+        self.predecessor = np.zeros(size, dtype=INT_TYPE) + UNDEFINED
+
+        self.ordered_count = 0
+        self.next_start = 0
+
+        self.seeds = []
+        self.seeds_count = 0
+
+        # Seeds with the same reachability distance are ordered by their index, or by the next row of their 
+        # point if the copies of points are ordered as separate rows
+        self.next_row = np.arange(size)
+        self.expand = rows is not None
+        self.total = size
+
+        if self.expand:
+
+            if weights is None:
+                raise ValueError('The weights are needed to order the rows of collapsed duplicates!')
+
+            self.rows = np.asarray(rows, dtype=INT_TYPE)
+            self.total = self.rows.shape[0]
+
+            if self.total != np.sum(weights, dtype=np.int64):
+                raise ValueError('The rows must have one value per copy of every point!')
+
+            self.row_starts = np.cumsum(weights) - weights
+            self.next_row = self.rows[self.row_starts]
+            self.ordered_copies = np.zeros(size, dtype=INT_TYPE)
+            self.copy_reachability = np.zeros(size, dtype=np.float64) + np.inf
+            self.copy_predecessor = np.zeros(size, dtype=INT_TYPE) + UNDEFINED
+
+            self.ordered_points = np.zeros(self.total, dtype=INT_TYPE)
+            self.ordered_reachability = np.zeros(self.total, dtype=np.float64)
+            self.ordered_predecessor = np.zeros(self.total, dtype=INT_TYPE)
+
+        self.ordered_list = np.zeros(self.total, dtype=INT_TYPE)
+
+        # Counters of the ordering
+        self.query_count = 0
+        self.neighbor_count = 0
+        self.max_seeds = 0
+
+
+    def restorePrefix(self, prefix):
+        """ Restores an already computed beginning of the ordering, see cyOPTICS.OrderingState.restorePrefix.
+        """
+
+        if self.expand:
+            raise ValueError('A prefix cannot be restored in an ordering of collapsed duplicates!')
+
+        ordering = np.asarray(prefix.ordering, dtype=INT_TYPE)
+        count = ordering.shape[0]
+
+        if count and ((np.min(ordering) < 0) or (np.max(ordering) >= self.processed.shape[0])):
+            raise ValueError('The prefix refers to points which do not exist!')
+
+        self.ordered_list[:count] = ordering
+        self.processed[ordering] = True
+        self.reachability[ordering] = prefix.reachability
+        self.core_distances[ordering] = prefix.core_distance
+        self.predecessor[ordering] = prefix.predecessor
+        self.ordered_count = count
+
+
+    def processPoint(self, i):
+        """ Adds the point to the ordered list, computes its core distance, and if it is a core point, updates
+            the reachability distances of its unprocessed neighbors.
+
+        Arguments:
+            i: [int] index of a point we are currently processing
+
+        """
+
+        self.processed[i] = True
+
+        if self.expand:
+            self.orderRow(i, self.reachability[i], self.predecessor[i])
+
+        else:
+            self.ordered_list[self.ordered_count] = i
+            self.ordered_count += 1
+
+        indices, distances = self.neighbors.query(i)
+
+        self.query_count += 1
+        self.neighbor_count += len(indices)
+
+        if self.given_core_distances is not None:
+            self.core_distances[i] = self.given_core_distances[i]
+
+        else:
+            self.core_distances[i] = coreDistance(indices, distances, self.min_pts, weights=self.weights,
+                weight=self.weights[i] if self.weights is not None else 1)
+
+        if self.core_distances[i] != UNDEFINED:
+            self.updateSeeds(i, indices, distances)
+
+        self.max_seeds = max(self.max_seeds, self.seeds_count)
+
+        # The other rows of a collapsed duplicate are ordered after it
+        if self.expand and (self.weights[i] > 1):
+            self.queueCopies(i)
+
+
+    def updateSeeds(self, i, indices, distances):
+        """ Updates the reachability distances of the neighbors of a core point, see cyOPTICS.update. """
+
+        new_reach = np.maximum(distances, self.dtype.type(self.core_distances[i]))
+
+        # The remaining rows of ordered points are seeds of their own (see queueCopies)
+        if self.expand:
+
+            copies = self.processed[indices] & (self.ordered_copies[indices] < self.weights[indices])
+            copies_reach = new_reach[copies]
+            copies = indices[copies]
+
+            smaller = copies_reach < self.copy_reachability[copies]
+            copies = copies[smaller]
+            copies_reach = copies_reach[smaller]
+
+            self.copy_reachability[copies] = copies_reach
+            self.copy_predecessor[copies] = i
+
+            for reach, neighbor in zip(copies_reach.tolist(), copies.tolist()):
+                heapq.heappush(self.seeds, (reach, self.next_row[neighbor], neighbor))
+
+        # Take the unprocessed neighbors which get a smaller reachability distance
+        unprocessed = ~self.processed[indices]
+        indices = indices[unprocessed]
+        new_reach = new_reach[unprocessed]
+
+        old_reach = self.reachability[indices]
+        smaller = (old_reach == UNDEFINED) | (new_reach < old_reach)
+
+        self.seeds_count += int(np.count_nonzero(old_reach[smaller] == UNDEFINED))
+        indices = indices[smaller]
+        new_reach = new_reach[smaller]
+
+        self.reachability[indices] = new_reach
+        self.predecessor[indices] = i
+
+        # The outdated entries of the decreased seeds stay in the heap
+        for reach, neighbor in zip(new_reach.tolist(), indices.tolist()):
+            heapq.heappush(self.seeds, (reach, self.next_row[neighbor], neighbor))
+
+
+    def orderRow(self, i, reach, predecessor):
+        """ Adds the next row of the point to the ordered list, see cyOPTICS.orderRow. """
+
+        k = self.ordered_count
+
+        self.ordered_list[k] = self.rows[self.row_starts[i] + self.ordered_copies[i]]
+        self.ordered_points[k] = i
+        self.ordered_reachability[k] = reach
+        self.ordered_predecessor[k] = self.rows[self.row_starts[predecessor]] if predecessor != UNDEFINED \
+            else UNDEFINED
+
+        self.ordered_copies[i] += 1
+        self.ordered_count += 1
+
+
+    def queueCopies(self, i):
+        """ Adds the remaining rows of a processed point to the seeds, see cyOPTICS.queueCopies. """
+
+        reach = self.reachability[i]
+        core_distance = self.core_distances[i]
+
+        if (core_distance != UNDEFINED) and ((reach == UNDEFINED) or (core_distance < reach)):
+            self.copy_reachability[i] = core_distance
+            self.copy_predecessor[i] = i
+
+        elif reach != UNDEFINED:
+            self.copy_reachability[i] = reach
+            self.copy_predecessor[i] = self.predecessor[i]
+
+        # Rows which cannot be reached are ordered as new starting points
+        else:
+            self.copy_reachability[i] = np.inf
+            self.copy_predecessor[i] = UNDEFINED
+
+        self.queueNextRow(i)
+
+
+    def queueNextRow(self, i):
+        """ Adds the next row of an ordered point to the seeds. """
+
+        self.next_row[i] = self.rows[self.row_starts[i] + self.ordered_copies[i]]
+        self.seeds_count += 1
+
+        heapq.heappush(self.seeds, (self.copy_reachability[i], self.next_row[i], i))
+
+
+    def orderCopy(self, i):
+        """ Orders the next remaining row of a processed point, see cyOPTICS.orderCopy. """
+
+        if self.copy_reachability[i] == np.inf:
+            self.orderRow(i, UNDEFINED, UNDEFINED)
+
+        else:
+            self.orderRow(i, self.copy_reachability[i], self.copy_predecessor[i])
+
+        if self.ordered_copies[i] < self.weights[i]:
+            self.queueNextRow(i)
+
+
+    def isSeed(self, entry):
+        """ Checks if the heap entry is up to date. """
+
+        reach, row, point = entry
+
+        if not self.processed[point]:
+            return reach == self.reachability[point]
+
+        # Remaining rows of an ordered point
+        return self.expand and (self.ordered_copies[point] < self.weights[point]) \
+            and (reach == self.copy_reachability[point]) and (row == self.next_row[point])
+
+
+    def orderPoints(self, limit):
+        """ Runs the OPTICS ordering until the given number of points is ordered.
+
+        Arguments:
+            limit: [int] number of ordered points at which the ordering stops
+
+        """
+
+        while self.ordered_count < limit:
+
+            # Remove the outdated entries from the top of the heap
+            while self.seeds and not self.isSeed(self.seeds[0]):
+                heapq.heappop(self.seeds)
+
+            # Take the seed with the smallest reachability distance (rows of collapsed duplicates which cannot 
+            # be reached are not real seeds, see queueCopies)
+            if self.seeds and (self.seeds[0][0] != np.inf):
+                i = heapq.heappop(self.seeds)[2]
+                self.seeds_count -= 1
+
+            # Otherwise take the next unprocessed point
+            else:
+
+                while (self.next_start < self.processed.shape[0]) and self.processed[self.next_start]:
+                    self.next_start += 1
+
+                i = self.next_start if self.next_start < self.processed.shape[0] else UNDEFINED
+
+                # Rows which cannot be reached are started in the order of the rows, as other points
+                if self.seeds and ((i == UNDEFINED) or (self.seeds[0][1] < self.next_row[i])):
+                    i = heapq.heappop(self.seeds)[2]
+                    self.seeds_count -= 1
+
+            # Order the next row of a processed point, or process a new point
+            if self.processed[i]:
+                self.orderCopy(i)
+
+            else:
+                self.processPoint(i)
+
+
+    def getResult(self, output_dir=None, start=0):
+        """ Returns the ordered points in the columnar format, see cyOPTICS.OrderingState.getResult. """
+
+        ordering = allocateArray((self.ordered_count - start, ), INT_TYPE, output_dir, 'ordering')
+        ordering[:] = self.ordered_list[start:self.ordered_count]
+
+        if self.expand:
+            values = (self.ordered_reachability[start:self.ordered_count],
+                self.core_distances[self.ordered_points[start:self.ordered_count]],
+                self.ordered_predecessor[start:self.ordered_count])
+
+        else:
+            values = (self.reachability[ordering], self.core_distances[ordering], self.predecessor[ordering])
+
+        columns = []
+        for name, column_values, dtype in zip(('reachability', 'core_distance', 'predecessor'), values,
+            (self.dtype, self.dtype, INT_TYPE)):
+
+            column = allocateArray((self.ordered_count - start, ), dtype, output_dir, name)
+            column[:] = column_values
+            columns.append(column)
+
+        return OPTICSResult(ordering, *columns)
+
+
+
+def runOrdering(state, stats=None, progress=None, progress_interval=PROGRESS_INTERVAL):
+    """ Orders all remaining points, see cyOPTICS.runOrdering. """
+
+    if progress_interval < 1:
+        raise ValueError('The progress interval must be at least 1!')
+
+    size = state.total
+    start = state.ordered_count
+    t1 = time.perf_counter()
+
+    try:
+
+        # Order the points in parts, and report the progress after every part
+        while state.ordered_count < size:
+
+            state.orderPoints(min(state.ordered_count + progress_interval, size))
+
+            if (progress is not None) and progress(state.ordered_count, size):
+                raise OPTICSCancelled(state.getResult())
+
+    finally:
+
+        if stats is not None:
+            stats.record('ordering', time=time.perf_counter() - t1, points=state.ordered_count - start,
+                queries=state.query_count, neighbors=state.neighbor_count,
+                distance_evaluations=state.neighbors.distance_count, max_seeds=state.max_seeds)
+
+
+
+def runNumpyOPTICS(input_list, eps, min_pts, index='auto', metric='euclidean', n_jobs=1,
+    return_format='point_list', output_dir=None, dtype=None, stats=None, progress=None,
+    progress_interval=PROGRESS_INTERVAL, collapse_duplicates=False):
+    """ Runs the OPTICS algorithm on the given data, see cyOPTICS.runCyOPTICS for the description of
+        arguments and return values. The index and n_jobs arguments are ignored, distances to all points are
+        computed for every point.
+    """
+
+    checkReturnFormat(return_format)
+
+    if index not in INDICES:
+        raise ValueError("Unknown index '{:s}', use one of: {:s}!".format(str(index), ', '.join(INDICES)))
+
+    if min_pts < 2:
+        raise ValueError('min_pts must be at least 2!')
+
+    input_list = np.asarray(loadInput(input_list))
+    input_list = np.ascontiguousarray(input_list, dtype=resolveFloatType(dtype, input_list.dtype))
+
+    if input_list.ndim != 2:
+        raise ValueError('The input data must be a 2D array!')
+
+    points = input_list
+    weights = None
+    rows = None
+
+    # Order the unique points, weighted with the number of their rows
+    if collapse_duplicates:
+
+        t1 = time.perf_counter()
+        unique_points, inverse, weights = collapseDuplicates(input_list)
+
+        if stats is not None:
+            stats.record('collapse_duplicates', time=time.perf_counter() - t1, points=input_list.shape[0],
+                unique_points=unique_points.shape[0])
+
+        # Without duplicates, the input data is ordered directly
+        if unique_points.shape[0] < input_list.shape[0]:
+            points = unique_points
+            rows = np.argsort(inverse, kind='stable').astype(INT_TYPE)
+
+        else:
+            weights = None
+
+    state = OrderingState(points.shape[0], min_pts, BruteForceNeighbors(points, eps, metric=metric),
+        points.dtype, weights=weights, rows=rows)
+
+    # Order all points
+    runOrdering(state, stats=stats, progress=progress, progress_interval=progress_interval)
+
+    t1 = time.perf_counter()
+
+    result = state.getResult(output_dir=output_dir if return_format == 'columnar' else None)
+
+    if return_format == 'columnar':
+
+        result.header = {'eps': eps, 'min_pts': min_pts, 'metric': metric, 'index': index}
+
+        # Write the header next to the arrays, so the result can be loaded with loadResult
+        if output_dir is not None:
+            result.save(output_dir, input_list=input_list)
+
+    else:
+        result = result.toPointList(input_list, output_dir=output_dir)
+
+    if stats is not None:
+        stats.record('result', time=time.perf_counter() - t1)
+
+    return result
+
+
+
+def runNumpyOPTICSSparse(indptr, indices, distances, eps, min_pts, core_distances=None, n_jobs=1,
+    return_format='point_list', output_dir=None, dtype=None, prefix=None, stats=None, progress=None,
+    progress_interval=PROGRESS_INTERVAL, weights=None):
+    """ Runs the OPTICS algorithm on a precomputed neighbor graph, see cyOPTICS.runCyOPTICSSparse for the
+        description of arguments and return values. The n_jobs argument is ignored.
+    """
+
+    indptr = np.asarray(indptr)
+    indices = np.asarray(indices)
+    distances = np.asarray(distances)
+    dtype = resolveFloatType(dtype, distances.dtype)
+
+    if min_pts < 2:
+        raise ValueError('min_pts must be at least 2!')
+
+    checkReturnFormat(return_format)
+
+    # Check the graph
+    if (indptr.ndim != 1) or (indptr.shape[0] < 1):
+        raise ValueError('indptr must be a 1D array of size N + 1!')
+
+    input_list_size = indptr.shape[0] - 1
+
+    if (indices.shape[0] != distances.shape[0]) or (indptr[input_list_size] != indices.shape[0]) \
+        or np.any(np.diff(indptr) < 0):
+        raise ValueError('indptr, indices and distances do not describe a valid CSR graph!')
+
+    if indices.shape[0] and ((np.min(indices) < 0) or (np.max(indices) >= input_list_size)):
+        raise ValueError('Neighbor indices must be between 0 and N - 1!')
+
+    # Negative or NaN distances would break the order of the seed heap and the core distances
+    if distances.shape[0] and not np.all(np.isfinite(distances) & (distances >= 0)):
+        raise ValueError('The distances in the neighbor graph must be finite and non-negative!')
+
+    # Remove self loops and edges longer than eps, which are not a part of eps-neighborhoods
+    distances = distances.astype(dtype, copy=False)
+    rows = np.repeat(np.arange(input_list_size), np.diff(indptr))
+    kept = (distances <= dtype.type(eps)) & (indices != rows)
+
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows[kept], minlength=input_list_size))])
+    indices = indices[kept].astype(INT_TYPE)
+    distances = distances[kept]
+
+    if weights is not None:
+
+        weights = np.asarray(weights, dtype=INT_TYPE)
+
+        if weights.shape != (input_list_size, ):
+            raise ValueError('The weights must have one value per point!')
+
+        if input_list_size and (np.min(weights) < 1):
+            raise ValueError('The weights must be at least 1!')
+
+    if core_distances is not None:
+
+        core_distances = np.asarray(core_distances, dtype=np.float64)
+
+        if core_distances.shape != (input_list_size, ):
+            raise ValueError('core_distances must have one value per point!')
+
+    state = OrderingState(input_list_size, min_pts, GraphNeighbors(indptr, indices, distances), dtype,
+        core_distances=core_distances, weights=weights)
+
+    # Continue after the known part of the ordering
+    if prefix is not None:
+        state.restorePrefix(prefix)
+
+    # Order all points
+    runOrdering(state, stats=stats, progress=progress, progress_interval=progress_interval)
+
+    t1 = time.perf_counter()
+
+    if return_format == 'columnar':
+
+        result = state.getResult(output_dir=output_dir)
+        result.header = {'eps': eps, 'min_pts': min_pts, 'metric': 'precomputed'}
+
+        # Write the header next to the arrays, so the result can be loaded with loadResult
+        if output_dir is not None:
+            result.save(output_dir)
+
+    # The index of every point in the graph is used as its input data
+    else:
+        result = state.getResult().toPointList(np.arange(input_list_size).reshape(-1, 1), output_dir=output_dir)
+
+    if stats is not None:
+        stats.record('result', time=time.perf_counter() - t1)
+
+    return result
@@ -24,19 +24,72 @@ from __future__ import print_function, division, absolute_import
 
 import numpy as np
 
-# Cython init
-import pyximport
-pyximport.install(setup_args={'include_dirs':[np.get_include()]})
-from cyOPTICS import runCyOPTICS
-
-
-def runOPTICS(input_list, eps, min_pts):
+# Compiled extension, or the NumPy implementation if it is not available (see OPTICSExtension)
+from OPTICSExtension import loadExtension
+if loadExtension('cyOPTICS') is not None:
+    from cyOPTICS import runCyOPTICS, runCyOPTICSSparse
+else:
+    from npOPTICS import runNumpyOPTICS as runCyOPTICS, runNumpyOPTICSSparse as runCyOPTICSSparse
+from OPTICSStats import PROGRESS_INTERVAL
+
+
+def runOPTICS(input_list, eps, min_pts, index='auto', metric='euclidean', n_jobs=1, 
+    return_format='point_list', output_dir=None, dtype=None, stats=None, progress=None, 
+    progress_interval=PROGRESS_INTERVAL, collapse_duplicates=False):
     """ A wrapper funtion for the OPTICS clustering Cython implementation.
     Arguments:
-        input_list: [ndarray] 2D numpy array containing the input data (1 datum per row)
+        input_list: [ndarray] 2D numpy array containing the input data (1 datum per row, all columns are used
+            as coordinates). It can also be a path to a .npy file or an np.memmap, which are read in place 
+            without loading the data into memory (if it is already of the computation dtype). A precomputed
+            neighbor graph can be given instead, either as a square SciPy sparse matrix of distances (missing
+            entries are not neighbors) or as a tuple of CSR arrays (indptr, indices, distances). In that case 
+            no distances are computed, and index and metric are ignored.
         eps: [float] epsilon parameter - maximum distance between points
         min_pts: [int] minimum points in the cluster
 
+    Keyword arguments:
+        index: [str] spatial index used for eps-range neighbor queries:
+            - 'auto': grid for up to 3 dimensions, kdtree for more, brute for the cosine and haversine 
+                metrics or if eps is not positive (default)
+            - 'grid': uniform grid with eps-sized cells
+            - 'kdtree': KD-tree
+            - 'brute': brute force scan of all points for every query
+        metric: [str] distance metric:
+            - 'euclidean': Euclidean distance (default)
+            - 'sqeuclidean': squared Euclidean distance (eps is also given as a squared distance)
+            - 'manhattan': sum of absolute differences
+            - 'chebyshev': maximum absolute difference
+            - 'cosine': 1 - cosine of the angle between the vectors
+            - 'haversine': great circle distance on a unit sphere, input columns are latitude and longitude
+                in radians (multiply eps in km with 1/6371.0 to get radians on Earth)
+        n_jobs: [int] number of threads used for finding neighborhoods and core distances, -1 uses all cores
+            (default 1). With more than 1 thread, neighborhoods of all points are computed in parallel before
+            the ordering, and they are all kept in memory during the run.
+        return_format: [str] format of the results:
+            - 'point_list': 2D array described below (default)
+            - 'columnar': OPTICSResult object with separate ordering, reachability, core_distance and 
+                predecessor arrays, which refers to the input data by index instead of copying it
+        output_dir: [str] if given, the results are written to memory-mapped .npy files in this directory
+            instead of being kept in memory (point_list.npy, or ordering.npy, reachability.npy, 
+            core_distance.npy and predecessor.npy for the columnar format). A columnar result also gets a
+            header.json file with the parameters, and can be loaded again with OPTICSResult.loadResult.
+        dtype: [dtype] np.float32 or np.float64, precision in which coordinates and distances are stored and 
+            computed, and of the returned values. None keeps float32 input in float32, and computes everything 
+            else in float64 (default). float32 halves the memory traffic, at the cost of precision.
+        stats: [OPTICSStats] if given, the times of the stages and the counters of the ordering (neighbor 
+            queries, mean neighborhood size, distance evaluations, largest seed queue) are recorded in it. 
+            Nothing is measured without it (default).
+        progress: [callable] function called as progress(ordered_count, total) every progress_interval 
+            ordered points. Returning True stops the run with OPTICSCancelled, which keeps the points ordered 
+            so far, e.g. OPTICSStats.timeBudget(seconds) stops the run after the given time. None by default.
+        progress_interval: [int] number of ordered points between the calls of the progress callback (default
+            PROGRESS_INTERVAL)
+        collapse_duplicates: [bool] if True, the neighborhoods and core distances of identical rows are 
+            computed once for a single point which counts as many times as it occurs. This is much faster on 
+            data with many duplicates, e.g. rounded or gridded coordinates. Every row is still ordered 
+            separately, so the results are the same as without collapsing. Ignored for a neighbor graph 
+            input. False by default.
+
     Return:
         point_list: [ndarray] 2D numpy array containing information about every processed point, the columns
             of the array are:
@@ -45,10 +98,33 @@ def runOPTICS(input_list, eps, min_pts):
             - reachability distance: -1 for first points in the cluster, positive for all others
             - core distance: -1 for noise, positive otherwise (the notion of noise can change with regard to 
                 the different input values eps and min_pts)
-            - input data points (the input data colums are appended to the right)
+            - input data points (the input data colums are appended to the right), for a neighbor graph input
+                this is the index of the point in the graph
     """
 
-    return runCyOPTICS(input_list, eps, min_pts)
+    # Convert a SciPy sparse matrix to CSR arrays
+    if hasattr(input_list, 'tocsr'):
+
+        graph = input_list.tocsr()
+
+        if graph.shape[0] != graph.shape[1]:
+            raise ValueError('The sparse neighbor graph must be a square matrix!')
+
+        input_list = (graph.indptr, graph.indices, graph.data)
+
+    # Run OPTICS on the neighbor graph
+    if isinstance(input_list, tuple):
+
+        indptr, indices, distances = input_list
+
+        return runCyOPTICSSparse(indptr, indices, distances, eps, min_pts, n_jobs=n_jobs, 
+            return_format=return_format, output_dir=output_dir, dtype=dtype, stats=stats, progress=progress, 
+            progress_interval=progress_interval)
+
+
+    return runCyOPTICS(input_list, eps, min_pts, index=index, metric=metric, n_jobs=n_jobs, 
+        return_format=return_format, output_dir=output_dir, dtype=dtype, stats=stats, progress=progress, 
+        progress_interval=progress_interval, collapse_duplicates=collapse_duplicates)
 
 
 
@@ -178,12 +254,12 @@ if __name__ == '__main__':
     plotPoints(input_data, title='Input data')
 
 
-    t1 = time.clock()
+    t1 = time.perf_counter()
 
     # Run OPTICS ordering
     ordered_list = runOPTICS(input_data, epsilon, min_points)
 
-    print('Total time for processing', time.clock() - t1, 's')
+    print('Total time for processing', time.perf_counter() - t1, 's')
 
     print('Ordered list')
     print('Point index [Processed, reachability dist, code dist, input data ... ]')
@@ -0,0 +1,141 @@
+""" Build configuration, which compiles the Cython extensions ahead of time, so they are not compiled on import.
+
+    pip install .
+    python setup.py build_ext --inplace
+
+OpenMP is used for the parallel parts of cyOPTICS (the n_jobs parameter) if the compiler supports it, otherwise
+the parallel loops run on a single thread. Set the environment variable OPTICS_NO_OPENMP to 1 to build without
+it.
+
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+import shutil
+import tempfile
+
+from setuptools import setup, Extension
+from setuptools.command.build_ext import build_ext
+
+
+# Pure Python modules of the package
+PY_MODULES = ['runOPTICS', 'GradientClustering', 'OPTICSResult', 'OPTICSStats', 'OPTICSExtension', 'OPTICSModel',
+    'OPTICSPipeline', 'OPTICSSweep', 'IncrementalOPTICS', 'PartitionedOPTICS', 'ApproximateOPTICS', 'npOPTICS',
+    'npGradientClustering', 'BatchOPTICS']
+
+# Cython extensions
+EXTENSIONS = ['cyOPTICS', 'cyGradientClustering']
+
+# Cython compiler directives, the same as in the headers of the .pyx files
+COMPILER_DIRECTIVES = {'language_level': 2, 'boundscheck': False, 'wraparound': False, 'cdivision': True}
+
+# Optimization and OpenMP flags by compiler type
+OPTIMIZATION_FLAGS = {'msvc': ['/O2'], 'unix': ['-O3']}
+OPENMP_COMPILE_FLAGS = {'msvc': ['/openmp'], 'unix': ['-fopenmp']}
+OPENMP_LINK_FLAGS = {'msvc': [], 'unix': ['-fopenmp']}
+
+# Program which only compiles if OpenMP is supported
+OPENMP_TEST_PROGRAM = """
+#include <omp.h>
+int main(void) { return omp_get_max_threads() > 0 ? 0 : 1; }
+"""
+
+
+
+def supportsOpenMP(compiler, compile_flags, link_flags):
+    """ Checks if the compiler can build a program with OpenMP.
+
+    Arguments:
+        compiler: [CCompiler] compiler of the build
+        compile_flags: [list] OpenMP compiler flags
+        link_flags: [list] OpenMP linker flags
+
+    Return:
+        [bool] True if the test program was compiled and linked
+    """
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+
+        source = os.path.join(temp_dir, 'test_openmp.c')
+        with open(source, 'w') as f:
+            f.write(OPENMP_TEST_PROGRAM)
+
+        objects = compiler.compile([source], output_dir=temp_dir, extra_postargs=compile_flags)
+        compiler.link_executable(objects, 'test_openmp', output_dir=temp_dir, extra_postargs=link_flags)
+
+    except Exception:
+        return False
+
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return True
+
+
+
+class OptimizedBuildExt(build_ext):
+    """ Adds the optimization flags of the compiler to the extensions, and the OpenMP flags if OpenMP is
+        supported.
+    """
+
+    def build_extensions(self):
+
+        compiler_type = 'msvc' if self.compiler.compiler_type == 'msvc' else 'unix'
+
+        compile_flags = list(OPTIMIZATION_FLAGS[compiler_type])
+        link_flags = []
+
+        # Enable OpenMP where it is available (e.g. the default Apple compiler does not support it)
+        if os.environ.get('OPTICS_NO_OPENMP', '0') in ('', '0'):
+
+            if supportsOpenMP(self.compiler, OPENMP_COMPILE_FLAGS[compiler_type],
+                OPENMP_LINK_FLAGS[compiler_type]):
+
+                compile_flags += OPENMP_COMPILE_FLAGS[compiler_type]
+                link_flags += OPENMP_LINK_FLAGS[compiler_type]
+
+            else:
+                print('OpenMP is not supported by the compiler, the parallel loops will run on a single thread',
+                    file=sys.stderr)
+
+        for extension in self.extensions:
+            extension.extra_compile_args = compile_flags + extension.extra_compile_args
+            extension.extra_link_args = link_flags + extension.extra_link_args
+
+        build_ext.build_extensions(self)
+
+
+
+def extensions():
+    """ Returns the Cython extensions, compiled from the .pyx sources. """
+
+    import numpy as np
+    from Cython.Build import cythonize
+
+    return cythonize([Extension(name, sources=[name + '.pyx'], include_dirs=[np.get_include()])
+        for name in EXTENSIONS], compiler_directives=COMPILER_DIRECTIVES)
+
+
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'README.md')) as f:
+    long_description = f.read()
+
+setup(
+    name='CyOPTICS',
+    version='1.0.0',
+    description='Fast OPTICS clustering with Cython, and the gradient clustering of the reachability plot',
+    long_description=long_description,
+    long_description_content_type='text/markdown',
+    author='Denis Vida',
+    license='MIT',
+    py_modules=PY_MODULES,
+    ext_modules=extensions(),
+    cmdclass={'build_ext': OptimizedBuildExt},
+    install_requires=['numpy'],
+    extras_require={'plot': ['matplotlib']},
+    zip_safe=False
+)
@@ -0,0 +1,13 @@
+""" Test configuration, makes the modules in the root of the repository importable. In a checkout without a
+build, the Cython extensions are compiled on import (see OPTICSExtension), so the tests do not silently run only
+the NumPy fallback.
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import os
+import sys
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPTICS_USE_PYXIMPORT', '1')
@@ -0,0 +1,103 @@
+""" Tests of the approximate OPTICS on data bubbles. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+
+from runOPTICS import runOPTICS
+from ApproximateOPTICS import runApproximateOPTICS, binPoints, bubbleDistances, bubbleCoreDistances, \
+    nnDistance, UNDEFINED
+from OPTICSResult import RESULT_ARRAYS
+from cyOPTICS import computeNeighborGraph, filterNeighborGraph
+
+
+
+def samplePoints(seed=0):
+    """ Returns a Gaussian cluster with uniform noise. """
+
+    state = np.random.RandomState(seed)
+
+    return np.r_[state.normal(0, 1, (1000, 2)), state.uniform(-5, 5, (200, 2))]
+
+
+
+def test_bubbles_of_one_point_give_exact_result():
+
+    points = samplePoints()
+
+    expected = runOPTICS(points, 0.5, 10, return_format='columnar')
+
+    # Cells much smaller than the distances between points
+    result = runApproximateOPTICS(points, 0.5, 10, resolution=1e5, return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+
+
+def test_core_distances_count_neighbors_by_distance():
+
+    # Rounded coordinates give bubbles at equal distances
+    points = np.round(samplePoints(1), 1)
+    eps = 0.5
+    dims = points.shape[1]
+
+    for resolution in (1, 4):
+
+        _, counts, representatives, extents = binPoints(points, eps/resolution)
+        indptr, indices, distances = computeNeighborGraph(representatives, eps + 2*np.max(extents),
+            dtype=np.float64)
+        distances = bubbleDistances(indptr, indices, distances, counts, extents, dims)
+        indptr, indices, distances = filterNeighborGraph(indptr, indices, distances, eps)
+
+        for min_pts in (2, 10, 40):
+
+            core_distances = bubbleCoreDistances(indptr, indices, distances, counts, extents, dims, min_pts)
+
+            # Count the points of the neighbors one bubble at a time, equal distances by the index
+            for i in range(len(counts)):
+
+                expected = UNDEFINED
+
+                if counts[i] >= min_pts:
+                    expected = nnDistance(min_pts - 1, counts[i], extents[i], dims)
+
+                else:
+
+                    neighbors = indices[indptr[i]:indptr[i + 1]]
+                    neighbor_distances = distances[indptr[i]:indptr[i + 1]]
+                    total = counts[i]
+
+                    for j in np.lexsort((neighbors, neighbor_distances)):
+
+                        bubble = neighbors[j]
+
+                        if total + counts[bubble] >= min_pts:
+                            expected = neighbor_distances[j] + nnDistance(min_pts - total - 1, counts[bubble],
+                                extents[bubble], dims)
+                            break
+
+                        total += counts[bubble]
+
+                assert core_distances[i] == expected
+
+
+
+def test_points_inside_bubbles_are_not_reached_further_than_the_bubble():
+
+    points = samplePoints(2)
+    result = runApproximateOPTICS(points, 0.5, 10, resolution=1, return_format='columnar')
+
+    bubbles, _, _, _ = binPoints(points, 0.5)
+    ordered_bubbles = bubbles[result.ordering]
+
+    # Position of the first point of the bubble of every point in the ordering
+    starts = np.r_[True, ordered_bubbles[1:] != ordered_bubbles[:-1]]
+    first = np.maximum.accumulate(np.where(starts, np.arange(len(points)), 0))
+    inner = np.flatnonzero(~starts)
+    first = first[inner]
+
+    # The points after the first point of a bubble are reached at most as far as the first point
+    defined = result.reachability[first] != UNDEFINED
+    assert np.all(result.reachability[inner[defined]] <= result.reachability[first[defined]])
+    assert np.array_equal(np.sort(result.ordering), np.arange(len(points)))
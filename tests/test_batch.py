@@ -0,0 +1,149 @@
+""" Tests of the batch OPTICS against clustering every data set alone. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+from BatchOPTICS import runBatchOPTICS
+from cyGradientClustering import gradientBatch
+from OPTICSResult import RESULT_ARRAYS
+from GradientClustering import gradientClustering, filterLargeClusters, mergeSimilarClusters, clusterLabels
+
+
+
+def generateDataSets(seed=0, n_sets=40, dims=2):
+    """ Returns data sets of different sizes with a few blobs, and an empty one. """
+
+    state = np.random.RandomState(seed)
+    data_sets = []
+
+    for _ in range(n_sets):
+        size = state.randint(1, 150)
+        centers = state.uniform(0, 5, (3, dims))
+        data_sets.append(centers[state.randint(0, 3, size)] + state.normal(0, 0.3, (size, dims)))
+
+    data_sets.append(np.zeros((0, dims)))
+
+    return data_sets
+
+
+
+def clusterAlone(reachability, ordering, min_pts, max_points_ratio=0.5, similarity_threshold=0.7, 
+    nesting='smallest'):
+    """ Runs the gradient clustering pipeline on one data set, as the batch does. """
+
+    clusters = gradientClustering(reachability, min_pts, 150, 0.025, intervals=True)
+    clusters = filterLargeClusters(clusters, len(reachability), max_points_ratio)
+    clusters = mergeSimilarClusters(clusters, similarity_threshold)
+
+    return clusters, clusterLabels(clusters, ordering, nesting=nesting)
+
+
+
+@pytest.mark.parametrize('workers', [{}, {'n_jobs': 2}, {'n_jobs': 3}])
+@pytest.mark.parametrize('index, metric, dims, dtype, nesting', [
+    ('grid', 'euclidean', 2, np.float64, 'smallest'),
+    ('kdtree', 'manhattan', 4, np.float32, 'largest'),
+    ('brute', 'cosine', 3, np.float64, 'smallest')])
+def test_batch_matches_data_sets_alone(workers, index, metric, dims, dtype, nesting):
+
+    data_sets = generateDataSets(dims=dims)
+    eps = 0.05 if metric == 'cosine' else 0.3*np.sqrt(dims)
+    batch = runBatchOPTICS(data_sets, eps, 5, index=index, metric=metric, dtype=dtype, nesting=nesting, 
+        **workers)
+
+    assert len(batch) == len(data_sets)
+    assert batch.reachability.dtype == dtype
+
+    for k, data_set in enumerate(data_sets):
+
+        if not len(data_set):
+            assert len(batch.getLabels(k)) == 0
+            continue
+
+        expected = runOPTICS(data_set, eps, 5, index=index, metric=metric, dtype=dtype, 
+            return_format='columnar')
+        result = batch.getResult(k)
+
+        for name in RESULT_ARRAYS:
+            assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+        clusters, labels = clusterAlone(expected.reachability, expected.ordering, 5, nesting=nesting)
+
+        assert np.array_equal(batch.getClusters(k), clusters)
+        assert np.array_equal(batch.getLabels(k), labels)
+
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+@pytest.mark.parametrize('seed', range(5))
+def test_gradient_batch_matches_pipeline(dtype, seed):
+
+    state = np.random.RandomState(seed)
+
+    # Stepped reachability plots with undefined values give many nested clusters, every plot starts with an 
+    # undefined value as an OPTICS ordering
+    sizes = state.randint(1, 300, 30)
+    offsets = np.r_[0, np.cumsum(sizes)].astype(np.int64)
+    reachability = np.repeat(state.uniform(0, 1, offsets[-1]), state.randint(1, 8, offsets[-1]))[:offsets[-1]]
+    reachability = (reachability + state.uniform(0, 0.02, offsets[-1])).astype(dtype)
+    reachability[state.uniform(0, 1, offsets[-1]) < 0.03] = -1
+    reachability[offsets[:-1]] = -1
+    ordering = np.concatenate([state.permutation(size) for size in sizes]).astype(np.int32)
+
+    min_pts = state.randint(2, 10)
+    max_points_ratio = state.choice([0.3, 0.5, 1.0])
+    threshold = state.choice([0.3, 0.5, 0.7, 0.9, 1.0])
+
+    for nesting in ('smallest', 'largest'):
+
+        labels = np.zeros(offsets[-1], dtype=np.int32)
+        starts, ends, counts = gradientBatch(reachability, ordering, offsets, 0, len(sizes), min_pts, 150, 
+            0.025, max_points_ratio, threshold, nesting == 'largest', labels)
+
+        cluster_offsets = np.r_[0, np.cumsum(counts)]
+
+        for k in range(len(sizes)):
+
+            lo, hi = offsets[k], offsets[k + 1]
+            clusters, expected_labels = clusterAlone(reachability[lo:hi], ordering[lo:hi], min_pts, 
+                max_points_ratio, threshold, nesting)
+
+            assert np.array_equal(starts[cluster_offsets[k]:cluster_offsets[k + 1]], clusters['start'])
+            assert np.array_equal(ends[cluster_offsets[k]:cluster_offsets[k + 1]], clusters['end'])
+            assert np.array_equal(labels[lo:hi], expected_labels)
+
+
+
+def test_gradient_batch_disjoint_merge():
+
+    # Two separate valleys are only merged with a threshold of 0, which cannot give an interval
+    reachability = np.r_[1.0, np.zeros(10), 1.0, 1.0, np.zeros(10), 1.0, 1.0]
+    ordering = np.arange(len(reachability), dtype=np.int32)
+    offsets = np.array([0, len(reachability)], dtype=np.int64)
+    labels = np.zeros(len(reachability), dtype=np.int32)
+
+    with pytest.raises(ValueError):
+        clusterAlone(reachability, ordering, 2, similarity_threshold=0)
+
+    with pytest.raises(ValueError):
+        gradientBatch(reachability, ordering, offsets, 0, 1, 2, 150, 0.025, 0.5, 0, False, labels)
+
+
+
+def test_packed_input_with_offsets():
+
+    data_sets = generateDataSets(1, 10)
+    offsets = np.r_[0, np.cumsum([len(data_set) for data_set in data_sets])]
+
+    batch = runBatchOPTICS(np.concatenate(data_sets), 0.3, 5, offsets=offsets, n_jobs=2)
+    expected = runBatchOPTICS(data_sets, 0.3, 5)
+
+    assert np.array_equal(batch.labels, expected.labels)
+    assert np.array_equal(batch.clusters, expected.clusters)
+    assert np.array_equal(batch.cluster_offsets, expected.cluster_offsets)
+
+    empty = runBatchOPTICS([], 0.3, 5)
+    assert (len(empty) == 0) and (len(empty.clusters) == 0)
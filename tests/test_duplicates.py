@@ -0,0 +1,63 @@
+""" Tests of collapsing duplicate rows (the collapse_duplicates option). """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+from npOPTICS import runNumpyOPTICS
+
+
+
+def duplicatedLattice(seed, jitter):
+    """ Returns a jittered 20x20 lattice with a spacing of 0.2, and 400 more copies of random lattice points. """
+
+    state = np.random.RandomState(seed)
+
+    lattice = np.mgrid[0:20, 0:20].reshape(2, -1).T*0.2 + state.normal(0, jitter, (400, 2))
+
+    return np.r_[lattice, lattice[state.choice(400, 200)], lattice[state.choice(400, 200)]]
+
+
+
+def rowValues(result, values):
+    """ Returns the values of the result in the order of the input rows. """
+
+    row_values = np.empty_like(values)
+    row_values[result.ordering] = values
+
+    return row_values
+
+
+
+@pytest.mark.parametrize('run_optics', [runOPTICS, runNumpyOPTICS])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('seed, jitter', [(0, 0.02), (1, 0.02), (2, 0.0)])
+@pytest.mark.parametrize('eps, min_pts', [(0.55, 5), (0.25, 4), (0.15, 3), (0.3, 12)])
+def test_collapsed_rows_match_uncollapsed(run_optics, dtype, seed, jitter, eps, min_pts):
+
+    points = duplicatedLattice(seed, jitter)
+
+    expected = run_optics(points, eps, min_pts, return_format='columnar', dtype=dtype)
+    result = run_optics(points, eps, min_pts, return_format='columnar', dtype=dtype, collapse_duplicates=True)
+
+    # The reachability distance of every row is the same as without collapsing
+    assert np.array_equal(rowValues(result, result.reachability), rowValues(expected, expected.reachability))
+    assert np.array_equal(rowValues(result, result.core_distance), rowValues(expected, expected.core_distance))
+
+    # The rows are also ordered in the same way
+    assert np.array_equal(result.ordering, expected.ordering)
+    assert np.array_equal(result.predecessor, expected.predecessor)
+
+
+
+def test_collapsed_rows_with_threads():
+
+    points = duplicatedLattice(0, 0.02)
+
+    expected = runOPTICS(points, 0.55, 5, return_format='columnar')
+    result = runOPTICS(points, 0.55, 5, return_format='columnar', n_jobs=2, collapse_duplicates=True)
+
+    assert np.array_equal(result.ordering, expected.ordering)
+    assert np.array_equal(result.reachability, expected.reachability)
@@ -0,0 +1,47 @@
+""" Tests of loading the compiled extensions. """
+
+from __future__ import print_function, division, absolute_import
+
+import pytest
+
+import OPTICSExtension
+
+
+
+@pytest.fixture
+def unbuiltExtension(tmp_path, monkeypatch):
+    """ Returns the name of an extension which has a .pyx source, but no built module. """
+
+    (tmp_path / 'unbuiltOPTICS.pyx').write_text(u'')
+    monkeypatch.setattr(OPTICSExtension, 'SOURCE_DIR', str(tmp_path))
+    monkeypatch.setattr(OPTICSExtension, 'LOAD_ERRORS', {})
+
+    # Compiling on import must not be attempted
+    def installPyximport():
+        raise AssertionError('pyximport was installed without being enabled!')
+
+    monkeypatch.setattr(OPTICSExtension, 'installPyximport', installPyximport)
+
+    return 'unbuiltOPTICS'
+
+
+
+@pytest.mark.parametrize('value', [None, '0', ''])
+def test_pyximport_is_opt_in(unbuiltExtension, monkeypatch, value):
+
+    if value is None:
+        monkeypatch.delenv(OPTICSExtension.USE_PYXIMPORT_VARIABLE, raising=False)
+    else:
+        monkeypatch.setenv(OPTICSExtension.USE_PYXIMPORT_VARIABLE, value)
+
+    with pytest.warns(RuntimeWarning):
+        assert OPTICSExtension.loadExtension(unbuiltExtension) is None
+
+
+
+def test_required_extension_raises(unbuiltExtension, monkeypatch):
+
+    monkeypatch.delenv(OPTICSExtension.USE_PYXIMPORT_VARIABLE, raising=False)
+
+    with pytest.raises(ImportError):
+        OPTICSExtension.loadExtension(unbuiltExtension, required=True)
@@ -0,0 +1,215 @@
+""" Tests of the gradient clustering against the original implementation, which checks one point at a time. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+import GradientClustering
+import npGradientClustering
+from GradientClustering import gradientClustering, inflectionIndex, gradientDeterminant, inflectionIndices, \
+    gradientDeterminants, iterGradientClustering, clusterIntervals, UNDEFINED, NEW_UNDEFINED
+from OPTICSExtension import loadExtension
+
+
+# Implementations of the start point stack, the NumPy one is always available
+STACK_MODULES = [npGradientClustering]
+
+if loadExtension('cyGradientClustering') is not None:
+    import cyGradientClustering
+    STACK_MODULES.append(cyGradientClustering)
+
+
+
+def gradientClusteringLoop(reach_list, min_pts, t, w):
+    """ The original implementation of gradientClustering, which checks one point at a time. """
+
+    reach_list = np.array(reach_list)
+    reach_list[reach_list == UNDEFINED] = NEW_UNDEFINED
+
+    t = np.cos(np.radians(t))
+
+    reach_list_size = len(reach_list)
+    last_endpoint = reach_list_size - 1
+
+    start_pts = [0]
+    set_of_clusters = []
+    curr_cluster = []
+
+    for i in range(1, reach_list_size - 1):
+
+        if inflectionIndex(reach_list, i, w) > t:
+
+            if gradientDeterminant(reach_list, i, w) > 0:
+
+                if len(curr_cluster) >= min_pts:
+                    set_of_clusters.append(curr_cluster)
+
+                curr_cluster = []
+
+                if start_pts:
+                    if reach_list[start_pts[-1]] <= reach_list[i]:
+                        start_pts.pop()
+
+                if start_pts:
+
+                    while reach_list[start_pts[-1]] < reach_list[i]:
+
+                        temp_cluster = range(start_pts[-1], last_endpoint)
+
+                        if len(temp_cluster) >= min_pts:
+                            set_of_clusters.append(temp_cluster)
+
+                        start_pts.pop()
+
+                    temp_cluster = range(start_pts[-1], last_endpoint)
+
+                    if len(temp_cluster) >= min_pts:
+                        set_of_clusters.append(temp_cluster)
+
+                if reach_list[i+1] < reach_list[i]:
+                    start_pts.append(i)
+
+            else:
+
+                if reach_list[i+1] > reach_list[i]:
+                    last_endpoint = i + 1
+                    curr_cluster = range(start_pts[-1], last_endpoint)
+
+    while start_pts:
+
+        curr_cluster = range(start_pts[-1], reach_list_size)
+
+        if (reach_list[start_pts[-1]] > reach_list[-1]) and (len(curr_cluster) >= min_pts):
+            set_of_clusters.append(curr_cluster)
+
+        start_pts.pop()
+
+    return set_of_clusters
+
+
+
+def runLoop(function, *args):
+    """ Returns the result of the function, or the type of the exception it raised. """
+
+    try:
+        return function(*args)
+
+    except Exception as e:
+        return type(e)
+
+
+
+def reachabilityPlots():
+    """ Returns reachability plots of different shapes and lengths, with their names. """
+
+    state = np.random.RandomState(0)
+
+    x = np.linspace(0, 10*np.pi, 2000)
+    valleys = 1.0 + 0.5*np.sin(x) + 0.3*np.sin(7.3*x) + 0.05*state.rand(len(x))
+
+    # The first point of the OPTICS ordering has an undefined reachability
+    valleys[0] = UNDEFINED
+
+    # Some other clusters start with an undefined reachability as well
+    undefined = valleys.copy()
+    undefined[state.randint(0, len(x), 10)] = UNDEFINED
+
+    # Few distinct values give many equal neighbors and equal start points
+    ties = np.round(valleys*4)/4
+    ties[0] = UNDEFINED
+
+    # Long runs of the same value between the valleys
+    flat = np.repeat(state.rand(40), state.randint(1, 60, 40))
+    flat[0] = UNDEFINED
+
+    # Integer distances are compared as doubles
+    integer = np.round(valleys*10).astype(np.int64)
+    integer[0] = UNDEFINED
+
+    return [
+        ('valleys', valleys),
+        ('undefined', undefined),
+        ('ties', ties),
+        ('integer', integer),
+        ('float32', valleys.astype(np.float32)),
+        ('flat', flat),
+        ('constant', np.full(100, 0.5)),
+        ('all_undefined', np.full(50, UNDEFINED, dtype=np.float64)),
+        # Without an undefined first point the start point stack can run empty
+        ('random', state.rand(500)),
+        ('empty', np.zeros(0)),
+        ('one', np.array([0.5])),
+        ('two', np.array([UNDEFINED, 0.5])),
+        ('three', np.array([UNDEFINED, 0.2, 0.9])),
+    ]
+
+
+
+PLOTS = reachabilityPlots()
+PLOT_IDS = [name for name, _ in PLOTS]
+
+
+
+@pytest.mark.parametrize('reach_list', [plot for _, plot in PLOTS], ids=PLOT_IDS)
+def test_vectors_match_point_functions(reach_list):
+
+    reach_list = np.array(reach_list)
+    reach_list[reach_list == UNDEFINED] = NEW_UNDEFINED
+
+    for w in (0.025, 1.0):
+
+        points = range(1, len(reach_list) - 1)
+
+        inflection = [inflectionIndex(reach_list, i, w) for i in points]
+        determinants = [gradientDeterminant(reach_list, i, w) for i in points]
+
+        # The magnitudes of the vectors are not computed with a dot product, so the last bits can differ
+        assert np.allclose(inflectionIndices(reach_list, w), np.array(inflection, dtype=np.float64), rtol=1e-12, 
+            atol=0)
+        assert np.array_equal(gradientDeterminants(reach_list, w), np.array(determinants))
+
+
+
+@pytest.mark.parametrize('module', STACK_MODULES, ids=lambda module: module.__name__)
+@pytest.mark.parametrize('reach_list', [plot for _, plot in PLOTS], ids=PLOT_IDS)
+def test_clusters_match_loop(reach_list, module, monkeypatch):
+
+    monkeypatch.setattr(GradientClustering, 'gradientStartPoints', module.gradientStartPoints)
+
+    for min_pts, t, w in ((5, 150, 0.025), (20, 120, 0.025), (1, 160, 1.0)):
+
+        expected = runLoop(gradientClusteringLoop, reach_list, min_pts, t, w)
+        clusters = runLoop(gradientClustering, reach_list, min_pts, t, w)
+
+        assert clusters == expected
+
+
+
+@pytest.mark.parametrize('reach_list', [plot for _, plot in PLOTS if len(plot) >= 10],
+    ids=[name for name, plot in PLOTS if len(plot) >= 10])
+def test_stream_matches_loop(reach_list):
+
+    expected = runLoop(gradientClusteringLoop, reach_list, 5, 150, 0.025)
+
+    # Parts of different sizes, including ones shorter than the inflection index window
+    chunks = np.split(reach_list, [1, 2, 7, len(reach_list)//2, len(reach_list)//2 + 1])
+
+    if expected is IndexError:
+        with pytest.raises(IndexError):
+            list(iterGradientClustering(chunks, len(reach_list), 5, 150, 0.025))
+
+    else:
+        intervals = list(iterGradientClustering(chunks, len(reach_list), 5, 150, 0.025))
+        assert np.array_equal(np.concatenate([clusterIntervals([])] + intervals), clusterIntervals(expected))
+
+
+
+def test_input_is_not_modified():
+
+    reach_list = dict(PLOTS)['undefined']
+    original = reach_list.copy()
+
+    gradientClustering(reach_list, 5, 150, 0.025)
+
+    assert np.array_equal(reach_list, original)
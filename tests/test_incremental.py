@@ -0,0 +1,67 @@
+""" Tests of the incremental OPTICS against full runs on the updated data. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+
+from runOPTICS import runOPTICS
+from IncrementalOPTICS import IncrementalOPTICS
+from OPTICSResult import RESULT_ARRAYS
+
+
+
+def generateBlobs(state, n_points, centers):
+    """ Returns points around randomly chosen centers. """
+
+    return centers[state.randint(0, len(centers), n_points)] + state.normal(0, 1, (n_points, centers.shape[1]))
+
+
+
+def assertSameResult(result, input_data, eps, min_pts):
+    """ Checks that the result is identical to a full run on the data. """
+
+    expected = runOPTICS(input_data, eps, min_pts, return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+
+
+def test_updates_match_full_runs():
+
+    state = np.random.RandomState(0)
+    centers = state.uniform(0, 40, (20, 2))
+    input_data = generateBlobs(state, 3000, centers)
+
+    incremental = IncrementalOPTICS(input_data, 0.5, 8)
+
+    for batch in range(4):
+
+        # Alternate between changes spread over all clusters and changes in one cluster
+        changed_centers = centers if batch%2 else centers[:1]
+        inserted = generateBlobs(state, 50, changed_centers)
+
+        near = np.flatnonzero(np.linalg.norm(input_data - changed_centers[0], axis=1) < 2.0)
+        deleted = near[:20] if batch%2 == 0 else state.choice(len(input_data), 20, replace=False)
+
+        result = incremental.update(insert=inserted, delete=deleted)
+        input_data = np.concatenate([np.delete(input_data, deleted, axis=0), inserted])
+
+        assertSameResult(result, input_data, 0.5, 8)
+        assert np.array_equal(incremental.points, input_data)
+
+
+
+def test_local_changes_keep_other_clusters():
+
+    state = np.random.RandomState(1)
+    centers = state.uniform(0, 40, (20, 2))
+    input_data = generateBlobs(state, 3000, centers)
+
+    incremental = IncrementalOPTICS(input_data, 0.5, 8)
+
+    result = incremental.insert(generateBlobs(state, 20, centers[:1]))
+
+    # Only the changed cluster and the points around it are ordered again
+    assert 0 < incremental.repaired < len(incremental)//4
+    assertSameResult(result, incremental.points, 0.5, 8)
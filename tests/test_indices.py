@@ -0,0 +1,53 @@
+""" Tests of the spatial indices used for eps-range neighbor queries. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+
+
+
+def duplicatedPoints(dims, seed=0):
+    """ Returns points on a small integer lattice, so many of them are identical. """
+
+    return np.round(np.random.RandomState(seed).rand(300, dims)*3)
+
+
+
+@pytest.mark.parametrize('index', ['grid', 'kdtree', 'brute'])
+@pytest.mark.parametrize('eps', [0.5, 1.0, 2.5])
+def test_indices_match_brute_force(index, eps):
+
+    points = np.random.RandomState(1).rand(400, 2)*5
+
+    expected = runOPTICS(points, eps, 5, index='brute', return_format='columnar')
+    result = runOPTICS(points, eps, 5, index=index, return_format='columnar')
+
+    assert np.array_equal(result.ordering, expected.ordering)
+    assert np.array_equal(result.reachability, expected.reachability)
+    assert np.array_equal(result.core_distance, expected.core_distance)
+
+
+
+@pytest.mark.parametrize('dims', [2, 5])
+def test_auto_index_accepts_zero_eps(dims):
+
+    points = duplicatedPoints(dims)
+
+    expected = runOPTICS(points, 0.0, 3, index='brute', return_format='columnar')
+    result = runOPTICS(points, 0.0, 3, return_format='columnar')
+
+    assert np.array_equal(result.ordering, expected.ordering)
+    assert np.array_equal(result.reachability, expected.reachability)
+
+    # Only identical points are neighbors, so every defined core distance is 0
+    assert np.all(result.core_distance[result.core_distance >= 0] == 0)
+
+
+
+def test_grid_index_rejects_zero_eps():
+
+    with pytest.raises(ValueError):
+        runOPTICS(duplicatedPoints(2), 0.0, 3, index='grid')
@@ -0,0 +1,60 @@
+""" Tests of the two-phase mode which precomputes the neighborhoods in parallel (n_jobs > 1). """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+from OPTICSResult import RESULT_ARRAYS
+from cyOPTICS import computeNeighborGraph
+
+
+
+def clusteredPoints(dims, seed=0):
+    """ Returns Gaussian clusters with uniform noise. """
+
+    state = np.random.RandomState(seed)
+    centers = state.uniform(0, 10, (5, dims))
+
+    return np.r_[centers[state.randint(0, 5, 1500)] + state.normal(0, 0.5, (1500, dims)),
+        state.uniform(0, 10, (300, dims))]
+
+
+
+@pytest.mark.parametrize('n_jobs', [2, 3, -1])
+@pytest.mark.parametrize('index, metric, dims', [('grid', 'euclidean', 2), ('kdtree', 'manhattan', 4),
+    ('brute', 'cosine', 3)])
+def test_parallel_run_matches_single_thread(n_jobs, index, metric, dims):
+
+    points = clusteredPoints(dims)
+    eps = 0.02 if metric == 'cosine' else 1.0
+
+    expected = runOPTICS(points, eps, 10, index=index, metric=metric, return_format='columnar')
+    result = runOPTICS(points, eps, 10, index=index, metric=metric, n_jobs=n_jobs, return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+    # The point list has the same rows
+    assert np.array_equal(runOPTICS(points, eps, 10, index=index, metric=metric, n_jobs=n_jobs),
+        runOPTICS(points, eps, 10, index=index, metric=metric))
+
+
+
+def test_neighbor_graph_does_not_depend_on_threads():
+
+    points = clusteredPoints(2, 1)
+
+    expected = computeNeighborGraph(points, 1.0, n_jobs=1)
+
+    for n_jobs in (2, 4):
+        for array, expected_array in zip(computeNeighborGraph(points, 1.0, n_jobs=n_jobs), expected):
+            assert np.array_equal(array, expected_array)
+
+
+
+def test_zero_jobs_are_rejected():
+
+    with pytest.raises(ValueError):
+        runOPTICS(clusteredPoints(2), 1.0, 10, n_jobs=0)
@@ -0,0 +1,189 @@
+""" Tests of merging similar clusters against the original implementation, which compares all pairs of 
+clusters as sets.
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import copy
+
+import numpy as np
+import pytest
+
+import GradientClustering
+import npGradientClustering
+from GradientClustering import mergeSimilarClusters, clusterIntervals
+from OPTICSExtension import loadExtension
+
+
+# Implementations of the interval merging, the NumPy one is always available
+MERGE_MODULES = [npGradientClustering]
+
+if loadExtension('cyGradientClustering') is not None:
+    import cyGradientClustering
+    MERGE_MODULES.append(cyGradientClustering)
+
+# Similarity thresholds of the compared merges
+THRESHOLDS = [0.3, 0.5, 0.7, 0.9, 1.0]
+
+
+
+def mergeSimilarClustersLoop(clusters, similarity_threshold):
+    """ The original implementation of mergeSimilarClusters. """
+
+    clusters = list(reversed(sorted(clusters, key=len)))
+
+    previous_iteration_clusters = clusters
+    merged_clusters = []
+
+    while len(previous_iteration_clusters) != len(merged_clusters):
+
+        clusters = list(reversed(sorted(clusters, key=len)))
+
+        skip_list = []
+
+        previous_iteration_clusters = copy.deepcopy(merged_clusters)
+
+        merged_clusters = []
+
+        for i, cluster1 in enumerate(clusters):
+
+            if i in skip_list:
+                continue
+
+            found_similar = False
+            for j, cluster2 in enumerate(clusters):
+
+                if j <= i:
+                    continue
+
+                if j in skip_list:
+                    continue
+
+                intersect_points = len(set(cluster1).intersection(cluster2))
+
+                if len(cluster1) > len(cluster2):
+                    bigger_size = len(cluster1)
+                else:
+                    bigger_size = len(cluster2)
+
+                if (intersect_points >= similarity_threshold*bigger_size):
+
+                    merged_clusters.append(sorted(list(set(set(cluster1) | set(cluster2)))))
+                    skip_list.append(j)
+                    found_similar = True
+
+                    break
+
+            if not found_similar:
+                merged_clusters.append(cluster1)
+
+        clusters = copy.deepcopy(merged_clusters)
+
+    return list(reversed(sorted(clusters, key=len)))
+
+
+
+def nestedClusters(seed, n_clusters=60, size=300):
+    """ Returns clusters of consecutive points, nested in and overlapping each other, some of them with the 
+        same bounds or the same size.
+    """
+
+    state = np.random.RandomState(seed)
+    clusters = []
+
+    while len(clusters) < n_clusters:
+
+        start = state.randint(0, size - 1)
+        end = state.randint(start + 1, size + 1)
+        clusters.append(list(range(start, end)))
+
+        # A cluster nested in the previous one, and one shifted by a few points
+        if state.rand() < 0.5:
+            inner_start = state.randint(start, end)
+            clusters.append(list(range(inner_start, state.randint(inner_start + 1, end + 1))))
+
+        if state.rand() < 0.3:
+            shift = state.randint(1, 5)
+            clusters.append(list(range(start + shift, end + shift)))
+
+        if state.rand() < 0.1:
+            clusters.append(list(range(start, end)))
+
+    return clusters[:n_clusters]
+
+
+
+def scatteredClusters(seed, n_clusters=40, size=200):
+    """ Returns clusters of points which are not consecutive. """
+
+    state = np.random.RandomState(seed)
+    clusters = []
+
+    for _ in range(n_clusters):
+        base = clusters[state.randint(len(clusters))] if clusters and (state.rand() < 0.5) else range(size)
+        members = np.unique(state.choice(base, state.randint(1, len(base) + 1)))
+        clusters.append(members.tolist())
+
+    return clusters
+
+
+
+def asLists(clusters):
+    """ Converts clusters to lists of points, intervals to lists of consecutive points. """
+
+    if GradientClustering.isClusterIntervals(clusters):
+        return [list(range(start, end)) for start, end in zip(clusters['start'], clusters['end'])]
+
+    return [list(cluster) for cluster in clusters]
+
+
+
+@pytest.mark.parametrize('module', MERGE_MODULES, ids=lambda module: module.__name__)
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('similarity_threshold', THRESHOLDS)
+def test_nested_clusters_match_original(monkeypatch, module, seed, similarity_threshold):
+
+    monkeypatch.setattr(GradientClustering, 'mergeIntervalsOnce', module.mergeIntervalsOnce)
+
+    clusters = nestedClusters(seed)
+    expected = mergeSimilarClustersLoop(copy.deepcopy(clusters), similarity_threshold)
+
+    # Clusters given as lists, as ranges and as intervals
+    for given in (clusters, [range(cluster[0], cluster[-1] + 1) for cluster in clusters], 
+        clusterIntervals(clusters)):
+
+        merged = mergeSimilarClusters(given, similarity_threshold)
+        assert asLists(merged) == expected
+
+    # The input is not modified
+    assert clusters == nestedClusters(seed)
+
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('similarity_threshold', THRESHOLDS + [0.0, -0.5])
+def test_scattered_clusters_match_original(seed, similarity_threshold):
+
+    clusters = scatteredClusters(seed)
+    expected = mergeSimilarClustersLoop(copy.deepcopy(clusters), similarity_threshold)
+
+    assert asLists(mergeSimilarClusters(clusters, similarity_threshold)) == expected
+
+
+
+def test_nested_clusters_with_zero_threshold():
+
+    clusters = nestedClusters(0, n_clusters=20)
+
+    # Lists merge clusters which are apart, as the original does
+    for threshold in (0.0, -1.0):
+        expected = mergeSimilarClustersLoop(clusters, threshold)
+        assert asLists(mergeSimilarClusters(clusters, threshold)) == expected
+
+    # Their union is not an interval
+    with pytest.raises(ValueError):
+        mergeSimilarClusters(clusterIntervals([range(0, 10), range(20, 30)]), 0.0)
+
+    # Overlapping intervals can still be merged
+    merged = mergeSimilarClusters(clusterIntervals([range(0, 10), range(5, 30)]), 0.0)
+    assert asLists(merged) == [list(range(0, 30))]
@@ -0,0 +1,120 @@
+""" Tests of the distance metrics against SciPy and NumPy references. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from runOPTICS import runOPTICS
+from IncrementalOPTICS import IncrementalOPTICS
+from OPTICSResult import RESULT_ARRAYS
+from npOPTICS import BruteForceNeighbors
+from cyOPTICS import computeNeighborGraph
+
+
+
+def haversineDistances(points):
+    """ Returns the central angles between all pairs of (latitude, longitude) points in radians. """
+
+    lat, lon = points[:, :1], points[:, 1:]
+    h = np.sin((lat.T - lat)/2)**2 + np.cos(lat)*np.cos(lat.T)*np.sin((lon.T - lon)/2)**2
+
+    return 2*np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+
+def referenceDistances(points, metric):
+    """ Returns the distances between all pairs of points computed by SciPy, or by NumPy for haversine. """
+
+    if metric == 'haversine':
+        return haversineDistances(points)
+
+    return cdist(points, points, metric={'manhattan': 'cityblock'}.get(metric, metric))
+
+
+
+def referenceData(metric):
+    """ Returns points for the metric, with a few vectors in the same direction for cosine. """
+
+    state = np.random.RandomState(0)
+
+    if metric == 'haversine':
+        return np.c_[state.uniform(-1.5, 1.5, 200), state.uniform(-3, 3, 200)], 0.3
+
+    points = state.uniform(-1, 1, (200, 3))
+
+    if metric == 'cosine':
+        points[:20] = points[20:40]*3
+        return points, 0.05
+
+    return points, {'sqeuclidean': 0.1}.get(metric, 0.4)
+
+
+
+METRICS = ['euclidean', 'sqeuclidean', 'manhattan', 'chebyshev', 'cosine', 'haversine']
+
+
+
+@pytest.mark.parametrize('metric', METRICS)
+def test_neighbor_distances_match_reference(metric):
+
+    points, eps = referenceData(metric)
+    expected = referenceDistances(points, metric)
+    np.fill_diagonal(expected, np.inf)
+
+    indptr, indices, distances = computeNeighborGraph(points, eps, index='brute', metric=metric,
+        dtype=np.float64)
+    brute_force = BruteForceNeighbors(points, eps, metric=metric)
+
+    for i in range(len(points)):
+
+        # Pairs right at eps can fall on either side by rounding
+        clear = np.abs(expected[i] - eps) > 1e-9
+        expected_neighbors = np.flatnonzero(expected[i] <= eps)
+
+        graph_row = (indices[indptr[i]:indptr[i + 1]], distances[indptr[i]:indptr[i + 1]])
+
+        for neighbors, neighbor_distances in [graph_row, brute_force.query(i)]:
+
+            assert np.array_equal(np.intersect1d(neighbors, np.flatnonzero(clear)),
+                np.intersect1d(expected_neighbors, np.flatnonzero(clear)))
+            assert np.allclose(neighbor_distances, expected[i][neighbors], rtol=1e-9, atol=1e-12)
+            assert np.all(neighbor_distances >= 0)
+
+
+
+def collinearPoints():
+    """ Returns integer points, many of which lie on the same line through the origin. """
+
+    return np.round(np.random.RandomState(3).rand(50, 2)*10, 0)
+
+
+
+def test_cosine_distances_of_collinear_points_are_not_negative():
+
+    result = runOPTICS(np.array([[9.0, 9.0], [3.0, 3.0], [1.0, 2.0]]), 0.5, 2, metric='cosine',
+        return_format='columnar')
+
+    assert np.all(result.core_distance[result.core_distance != -1] >= 0)
+    assert np.all(result.reachability[result.reachability != -1] >= 0)
+    assert result.core_distance[np.flatnonzero(result.ordering == 0)[0]] == 0
+
+    result = runOPTICS(collinearPoints(), 0.5, 3, metric='cosine', return_format='columnar')
+
+    assert np.all(result.core_distance[result.core_distance != -1] >= 0)
+    assert np.all(result.reachability[result.reachability != -1] >= 0)
+
+
+
+def test_cosine_incremental_updates():
+
+    points = collinearPoints()
+
+    incremental = IncrementalOPTICS(points, 0.5, 3, metric='cosine')
+    result = incremental.update(insert=np.array([[4.0, 4.0], [2.0, 6.0]]), delete=[0, 1])
+
+    expected = runOPTICS(incremental.points, 0.5, 3, metric='cosine', return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
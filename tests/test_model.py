@@ -0,0 +1,88 @@
+""" Tests of OPTICSModel and the assignment of new points to its clusters. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from OPTICSModel import OPTICSModel
+from runOPTICS import runOPTICS
+
+
+
+def samplePoints(seed):
+    """ Returns two Gaussian clusters with uniform noise, and copies of some of the points. """
+
+    state = np.random.RandomState(seed)
+
+    points = np.r_[state.normal(0, 0.3, (300, 2)), state.normal(3, 0.3, (300, 2)), 
+        state.uniform(-2, 5, (100, 2))]
+
+    return np.r_[points, points[state.choice(len(points), 50)]]
+
+
+
+def bruteForceLabels(model, new_points):
+    """ Assigns the labels of the core points with the smallest reachability distance, of equal distances 
+        the one which comes first in the OPTICS ordering.
+    """
+
+    labels = np.zeros(len(new_points), dtype=np.int32) - 1
+    core = model.core_distances >= 0
+
+    for i, point in enumerate(new_points):
+
+        distances = np.sqrt(np.sum((model.points - point)**2, axis=1))
+        candidates = np.flatnonzero(core & (distances <= model.eps))
+
+        if len(candidates):
+            best = min(candidates, key=lambda j: (np.maximum(model.core_distances[j], distances[j]), 
+                model.positions[j]))
+            labels[i] = model.labels[best]
+
+    return labels
+
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_fitted_points_keep_their_labels(seed, n_jobs):
+
+    points = samplePoints(seed)
+    model = OPTICSModel(points, 0.5, 10, n_jobs=n_jobs)
+
+    # Copies of a point can be in different clusters, the first copy gives the label
+    _, first, inverse = np.unique(points, axis=0, return_index=True, return_inverse=True)
+
+    assert np.array_equal(model.predict(points), model.labels[first[inverse.ravel()]])
+
+
+
+def test_model_ordering_matches_runOPTICS():
+
+    points = samplePoints(0)
+    model = OPTICSModel(points, 0.5, 10)
+    expected = runOPTICS(points, 0.5, 10, return_format='columnar')
+
+    assert np.array_equal(model.result.ordering, expected.ordering)
+    assert np.array_equal(model.result.reachability, expected.reachability)
+
+
+
+def test_ties_follow_the_ordering():
+
+    # On a lattice most new points are at the same reachability distance from several core points
+    lattice = np.mgrid[0:12, 0:12].reshape(2, -1).T.astype(np.float64)
+    model = OPTICSModel(lattice, 1.5, 4, max_points_ratio=1.0)
+
+    new_points = np.r_[lattice[::3] + 0.5, lattice[1::3] + [0.5, 0], lattice[2::3] + [0, 0.5]]
+
+    assert np.array_equal(model.predict(new_points), bruteForceLabels(model, new_points))
+
+
+
+def test_empty_model_predicts_noise():
+
+    model = OPTICSModel(np.zeros((0, 2)), 0.5, 5)
+
+    assert np.array_equal(model.predict(np.zeros((3, 2))), [-1, -1, -1])
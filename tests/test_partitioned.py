@@ -0,0 +1,70 @@
+""" Tests of the partitioned OPTICS against a run in a single process. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+from PartitionedOPTICS import runPartitionedOPTICS, tileBounds
+from OPTICSResult import RESULT_ARRAYS
+
+
+
+def clusteredPoints(seed=0):
+    """ Returns clusters spread along the x axis, so every tiling cuts through some of them, with noise. """
+
+    state = np.random.RandomState(seed)
+    centers = np.c_[np.linspace(0, 20, 8), state.uniform(0, 3, 8)]
+
+    return np.r_[centers[state.randint(0, 8, 2000)] + state.normal(0, 0.7, (2000, 2)), 
+        state.uniform(-2, 22, (300, 2))]
+
+
+
+@pytest.mark.parametrize('n_processes, n_tiles', [(1, 1), (1, 3), (2, None), (2, 5), (3, 7)])
+def test_partitioned_matches_single_process(n_processes, n_tiles):
+
+    points = clusteredPoints()
+
+    expected = runOPTICS(points, 0.5, 10, return_format='columnar')
+    result = runPartitionedOPTICS(points, 0.5, 10, n_processes=n_processes, n_tiles=n_tiles, 
+        return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+    # The point list has the same rows
+    assert np.array_equal(runPartitionedOPTICS(points, 0.5, 10, n_processes=n_processes, n_tiles=n_tiles),
+        runOPTICS(points, 0.5, 10))
+
+
+
+@pytest.mark.parametrize('metric', ['manhattan', 'chebyshev'])
+def test_clusters_crossing_tiles(metric):
+
+    points = clusteredPoints(1)
+    bounds = tileBounds(points[:, 0], 4)
+
+    # Some clusters have points on both sides of an inner tile boundary, within eps of it
+    crossing = [np.sum(np.abs(points[:, 0] - bound) < 0.5) for bound in bounds[1:-1]]
+    assert min(crossing) > 10
+
+    expected = runOPTICS(points, 0.5, 10, metric=metric, return_format='columnar')
+    result = runPartitionedOPTICS(points, 0.5, 10, n_processes=2, n_tiles=4, metric=metric, 
+        return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+
+
+def test_more_tiles_than_points():
+
+    points = clusteredPoints(2)[:5]
+
+    expected = runOPTICS(points, 0.5, 2, return_format='columnar')
+    result = runPartitionedOPTICS(points, 0.5, 2, n_processes=2, n_tiles=20, return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
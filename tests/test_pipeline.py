@@ -0,0 +1,94 @@
+""" Tests of the streaming pipeline against the whole-array functions. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+from OPTICSPipeline import streamOPTICS
+from OPTICSResult import RESULT_ARRAYS
+from GradientClustering import gradientClustering, filterLargeClusters, mergeSimilarClusters, clusterLabels
+from cyOPTICS import iterCyOPTICS
+
+
+
+def clusteredPoints(seed=0):
+    """ Returns Gaussian clusters of different densities with uniform noise. """
+
+    state = np.random.RandomState(seed)
+
+    return np.r_[state.normal(0, 1, (600, 2)), state.normal(6, 0.3, (300, 2)), 
+        state.normal(-4, 0.5, (300, 2)), state.uniform(-8, 10, (200, 2))]
+
+
+
+@pytest.mark.parametrize('chunk_size', [1, 97, 5000])
+def test_ordering_chunks_match_full_run(chunk_size):
+
+    points = clusteredPoints()
+    expected = runOPTICS(points, 1.0, 10, return_format='columnar')
+
+    chunks = list(iterCyOPTICS(points, 1.0, 10, chunk_size=chunk_size))
+
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= chunk_size
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(np.concatenate([getattr(chunk, name) for chunk in chunks]), 
+            getattr(expected, name)), name
+
+    with pytest.raises(ValueError):
+        next(iterCyOPTICS(points, 1.0, 10, chunk_size=0))
+
+
+
+@pytest.mark.parametrize('chunk_size', [64, 5000])
+def test_stream_matches_whole_arrays(tmp_path, chunk_size):
+
+    points = clusteredPoints(1)
+
+    expected = runOPTICS(points, 1.0, 10, return_format='columnar')
+    expected_found = gradientClustering(expected.reachability, 10, 150, 0.025, intervals=True)
+    expected_clusters = mergeSimilarClusters(filterLargeClusters(expected_found, len(points), 0.5), 0.7)
+    expected_labels = clusterLabels(expected_clusters, expected.ordering)
+
+    stages = list(streamOPTICS(points, 1.0, 10, chunk_size=chunk_size, output_dir=str(tmp_path)))
+    names = [name for name, _ in stages]
+
+    # The labels follow the whole ordering, and the final results come last
+    assert names[-1] == 'done'
+    assert max(i for i, name in enumerate(names) if name == 'ordering') < names.index('labels')
+
+    ordering, clusters, labels = stages[-1][1]
+
+    assert np.array_equal(ordering, expected.ordering)
+    assert np.array_equal(clusters, expected_clusters)
+    assert np.array_equal(labels, expected_labels)
+    assert isinstance(labels, np.memmap)
+
+    # The found clusters are the clusters of the whole reachability plot
+    found = [value for name, value in stages if name == 'clusters']
+    assert np.array_equal(np.sort(np.concatenate(found), order=['start', 'end']), 
+        np.sort(expected_found, order=['start', 'end']))
+
+    # Every label chunk gives the labels of its rows
+    for name, value in stages:
+        if name == 'labels':
+            rows, chunk_labels = value
+            assert len(rows) <= chunk_size
+            assert np.array_equal(expected_labels[rows], chunk_labels)
+
+
+
+def test_stream_yields_before_ordering_is_finished():
+
+    points = clusteredPoints(2)
+
+    stream = streamOPTICS(points, 1.0, 10, chunk_size=100)
+    name, chunk = next(stream)
+
+    assert name == 'ordering'
+    assert len(chunk) == 100
+
+    stream.close()
@@ -0,0 +1,84 @@
+""" Tests of the float32 and float64 precision of the computation (dtype). """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from runOPTICS import runOPTICS
+from OPTICSResult import RESULT_ARRAYS
+
+
+
+def clusteredPoints(seed=0):
+    """ Returns Gaussian clusters with uniform noise. """
+
+    state = np.random.RandomState(seed)
+
+    return np.r_[state.normal(0, 1, (800, 2)), state.normal(5, 0.5, (400, 2)), 
+        state.uniform(-5, 10, (200, 2))]
+
+
+
+@pytest.mark.parametrize('input_dtype, dtype, expected_dtype', [(np.float32, None, np.float32),
+    (np.float64, None, np.float64), (np.float64, np.float32, np.float32), 
+    (np.float32, np.float64, np.float64), (np.int64, None, np.float64)])
+def test_result_dtype(input_dtype, dtype, expected_dtype):
+
+    points = np.round(clusteredPoints()*4).astype(input_dtype)
+    result = runOPTICS(points, 2.0, 10, dtype=dtype, return_format='columnar')
+
+    assert result.reachability.dtype == expected_dtype
+    assert result.core_distance.dtype == expected_dtype
+    assert runOPTICS(points, 2.0, 10, dtype=dtype).dtype == expected_dtype
+
+
+
+@pytest.mark.parametrize('index', ['grid', 'kdtree', 'brute'])
+def test_exact_distances_are_the_same_in_both_precisions(index):
+
+    # Multiples of 1/4 with the Manhattan metric have exact distances in float32
+    points = np.round(clusteredPoints(1)*4)/4
+
+    expected = runOPTICS(points, 0.5, 10, index=index, metric='manhattan', return_format='columnar')
+    result = runOPTICS(points, 0.5, 10, index=index, metric='manhattan', dtype=np.float32, 
+        return_format='columnar')
+
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+
+
+def test_float32_core_distances_are_close_to_float64():
+
+    points = clusteredPoints(2)
+
+    expected = runOPTICS(points, 0.5, 10, return_format='columnar')
+    result = runOPTICS(points, 0.5, 10, dtype=np.float32, return_format='columnar')
+
+    # Core distances do not depend on the ordering, compare them per input point
+    expected_core = np.empty(len(points))
+    expected_core[expected.ordering] = expected.core_distance
+    core = np.empty(len(points))
+    core[result.ordering] = result.core_distance
+
+    defined = (expected_core != -1) & (core != -1)
+    assert np.mean(defined) > 0.8
+    assert np.allclose(core[defined], expected_core[defined], rtol=1e-5, atol=1e-6)
+
+
+
+def test_float64_keeps_the_full_precision():
+
+    # Points far from the origin with small differences, which float32 cannot represent
+    state = np.random.RandomState(3)
+    points = 1e6 + state.uniform(0, 1e-3, (200, 2))
+
+    result = runOPTICS(points, 2e-4, 5, return_format='columnar')
+
+    # The 4th nearest neighbor distance, the point itself not counted
+    distances = np.sort(cdist(points, points), axis=1)
+    expected_core = np.where(distances[:, 4] <= 2e-4, distances[:, 4], -1)
+
+    assert np.allclose(result.core_distance, expected_core[result.ordering], rtol=1e-9, atol=0)
@@ -0,0 +1,110 @@
+""" Tests of saving and loading columnar results. """
+
+from __future__ import print_function, division, absolute_import
+
+import json
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+from OPTICSResult import OPTICSResult, loadResult, inputFingerprint, RESULT_ARRAYS, HEADER_FILE
+
+
+
+def clusteredPoints(seed=0):
+    """ Returns a Gaussian cluster with uniform noise. """
+
+    state = np.random.RandomState(seed)
+
+    return np.r_[state.normal(0, 1, (500, 2)), state.uniform(-5, 5, (100, 2))]
+
+
+
+def assertSameArrays(result, expected):
+    """ Checks that all arrays of the results are identical, including their types. """
+
+    for name in RESULT_ARRAYS:
+        assert getattr(result, name).dtype == getattr(expected, name).dtype, name
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_save_and_load_round_trip(tmp_path, dtype):
+
+    points = clusteredPoints()
+    result = runOPTICS(points, 0.5, 10, dtype=dtype, return_format='columnar')
+    result.save(str(tmp_path), input_list=points)
+
+    loaded = loadResult(str(tmp_path))
+
+    assertSameArrays(loaded, result)
+    assert all(isinstance(getattr(loaded, name), np.memmap) for name in RESULT_ARRAYS)
+
+    assert loaded.header['eps'] == 0.5
+    assert loaded.header['min_pts'] == 10
+    assert loaded.header['size'] == len(points)
+    assert loaded.header['dtype'] == np.dtype(dtype).name
+    assert loaded.header['input_hash'] == inputFingerprint(points)
+
+    # The loaded result gives the same point list
+    assert np.array_equal(loaded.toPointList(points.astype(dtype)), runOPTICS(points, 0.5, 10, dtype=dtype))
+
+    # Without memory-mapping the arrays are read into memory
+    in_memory = loadResult(str(tmp_path), mmap_mode=None)
+    assertSameArrays(in_memory, result)
+    assert not isinstance(in_memory.reachability, np.memmap)
+
+
+
+def test_output_dir_is_memory_mapped(tmp_path):
+
+    points = clusteredPoints(1)
+    expected = runOPTICS(points, 0.5, 10, return_format='columnar')
+
+    output_dir = str(tmp_path / 'run')
+    result = runOPTICS(points, 0.5, 10, return_format='columnar', output_dir=output_dir)
+
+    assert all(isinstance(getattr(result, name), np.memmap) for name in RESULT_ARRAYS)
+    assertSameArrays(loadResult(output_dir), expected)
+
+    # Saving into the directory of the mapped files keeps them
+    result.save(output_dir, input_list=points)
+
+    assertSameArrays(loadResult(output_dir), expected)
+    assert loadResult(output_dir).header['input_hash'] == inputFingerprint(points)
+
+    # Opening the files for writing allows changes
+    writable = loadResult(output_dir, mmap_mode='r+')
+    writable.reachability[0] = 123.0
+    writable.reachability.flush()
+    assert loadResult(output_dir).reachability[0] == 123.0
+
+
+
+def test_invalid_saved_results_are_rejected(tmp_path):
+
+    result = OPTICSResult(np.arange(3, dtype=np.int32), np.zeros(3), np.zeros(3), np.zeros(3, dtype=np.int32))
+    result.save(str(tmp_path))
+
+    # Arrays of different sizes
+    np.save(str(tmp_path / 'reachability.npy'), np.zeros(4))
+
+    with pytest.raises(ValueError):
+        loadResult(str(tmp_path))
+
+    # Unknown version of the format
+    result.save(str(tmp_path))
+    header_path = str(tmp_path / HEADER_FILE)
+
+    with open(header_path) as f:
+        header = json.load(f)
+
+    header['format_version'] = -1
+
+    with open(header_path, 'w') as f:
+        json.dump(header, f)
+
+    with pytest.raises(ValueError):
+        loadResult(str(tmp_path))
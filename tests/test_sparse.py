@@ -0,0 +1,50 @@
+""" Tests of OPTICS on a precomputed sparse neighbor graph. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from OPTICSExtension import loadExtension
+from runOPTICS import runOPTICS
+from npOPTICS import runNumpyOPTICSSparse
+
+cyOPTICS = loadExtension('cyOPTICS', required=True)
+computeNeighborGraph = cyOPTICS.computeNeighborGraph
+runCyOPTICSSparse = cyOPTICS.runCyOPTICSSparse
+
+
+
+def neighborGraph(eps, seed=0):
+    """ Returns random points and their eps-neighbor graph in the CSR format. """
+
+    points = np.random.RandomState(seed).rand(300, 2)*4
+
+    return points, computeNeighborGraph(points, eps)
+
+
+
+@pytest.mark.parametrize('run_sparse', [runCyOPTICSSparse, runNumpyOPTICSSparse])
+def test_sparse_matches_dense(run_sparse):
+
+    points, (indptr, indices, distances) = neighborGraph(0.5)
+
+    expected = runOPTICS(points, 0.5, 5, return_format='columnar')
+    result = run_sparse(indptr, indices, distances, 0.5, 5, return_format='columnar')
+
+    assert np.array_equal(result.ordering, expected.ordering)
+    assert np.allclose(result.reachability, expected.reachability)
+
+
+
+@pytest.mark.parametrize('run_sparse', [runCyOPTICSSparse, runNumpyOPTICSSparse])
+@pytest.mark.parametrize('bad_value', [-0.1, np.nan, np.inf])
+def test_sparse_rejects_invalid_distances(run_sparse, bad_value):
+
+    _, (indptr, indices, distances) = neighborGraph(0.5)
+
+    distances = np.array(distances)
+    distances[len(distances)//2] = bad_value
+
+    with pytest.raises(ValueError):
+        run_sparse(indptr, indices, distances, 0.5, 5)
@@ -0,0 +1,124 @@
+""" Tests of the run statistics and of the progress callback. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+import pytest
+
+from runOPTICS import runOPTICS
+from OPTICSStats import OPTICSStats, OPTICSCancelled, timeBudget
+from OPTICSResult import RESULT_ARRAYS
+from GradientClustering import gradientClustering, mergeSimilarClusters
+from cyOPTICS import computeNeighborGraph
+
+
+
+def clusteredPoints(seed=0):
+    """ Returns a Gaussian cluster with uniform noise. """
+
+    state = np.random.RandomState(seed)
+
+    return np.r_[state.normal(0, 1, (1500, 2)), state.uniform(-5, 5, (300, 2))]
+
+
+
+@pytest.mark.parametrize('index, n_jobs', [('brute', 1), ('grid', 1), ('grid', 2)])
+def test_counters_match_the_run(index, n_jobs):
+
+    points = clusteredPoints()
+    size = len(points)
+    stats = OPTICSStats()
+
+    result = runOPTICS(points, 0.5, 10, index=index, n_jobs=n_jobs, stats=stats, return_format='columnar')
+    expected = runOPTICS(points, 0.5, 10, index=index, return_format='columnar')
+
+    # Collecting the counters does not change the result
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
+
+    indptr, _, _ = computeNeighborGraph(points, 0.5)
+    ordering = stats['ordering']
+
+    assert ordering['points'] == size
+    assert ordering['queries'] == size
+    assert ordering['neighbors'] == indptr[-1]
+    assert ordering['mean_neighbors'] == indptr[-1]/size
+    assert 0 < ordering['max_seeds'] < size
+    assert stats.totalTime() > 0
+
+    # Every query of the brute force index computes the distances to all other points
+    if index == 'brute':
+        assert ordering['distance_evaluations'] == size*(size - 1)
+
+    # With more threads the neighborhoods are precomputed
+    if n_jobs > 1:
+        assert stats['neighbor_graph']['neighbors'] == indptr[-1]
+        assert ordering['distance_evaluations'] == 0
+
+    clusters = gradientClustering(result.reachability, 10, 150, 0.025, stats=stats)
+    merged = mergeSimilarClusters(clusters, 0.7, stats=stats)
+
+    assert stats['gradient_clustering']['points'] == size
+    assert stats['gradient_clustering']['clusters'] == len(clusters)
+    assert stats['merge_clusters']['input_clusters'] == len(clusters)
+    assert stats['merge_clusters']['clusters'] == len(merged)
+    assert 'ordering' in str(stats)
+
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_cancelled_run_keeps_the_ordered_points(n_jobs):
+
+    points = clusteredPoints(1)
+    expected = runOPTICS(points, 0.5, 10, return_format='columnar')
+
+    calls = []
+
+    def progress(ordered_count, total):
+        calls.append((ordered_count, total))
+        return ordered_count >= 300
+
+    stats = OPTICSStats()
+
+    with pytest.raises(OPTICSCancelled) as cancelled:
+        runOPTICS(points, 0.5, 10, n_jobs=n_jobs, stats=stats, progress=progress, progress_interval=100)
+
+    result = cancelled.value.result
+
+    assert calls == [(100, len(points)), (200, len(points)), (300, len(points))]
+    assert len(result) == 300
+    assert stats['ordering']['points'] == 300
+
+    # The partial result is the beginning of the full ordering
+    for name in RESULT_ARRAYS:
+        assert np.array_equal(getattr(result, name), getattr(expected, name)[:300]), name
+
+
+
+def test_progress_reaches_the_end():
+
+    points = clusteredPoints(2)
+    calls = []
+
+    def progress(ordered_count, total):
+        calls.append(ordered_count)
+        return False
+
+    runOPTICS(points, 0.5, 10, progress=progress, progress_interval=500)
+
+    assert calls == [500, 1000, 1500, len(points)]
+
+    with pytest.raises(ValueError):
+        runOPTICS(points, 0.5, 10, progress=progress, progress_interval=0)
+
+
+
+def test_time_budget_cancels_sparse_run():
+
+    points = clusteredPoints(3)
+    indptr, indices, distances = computeNeighborGraph(points, 0.5)
+
+    with pytest.raises(OPTICSCancelled) as cancelled:
+        runOPTICS((indptr, indices, distances), 0.5, 10, progress=timeBudget(-1.0), progress_interval=50)
+
+    assert len(cancelled.value.result) == 50
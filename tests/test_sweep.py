@@ -0,0 +1,81 @@
+""" Tests of the parameter sweeps and their cache. """
+
+from __future__ import print_function, division, absolute_import
+
+import numpy as np
+
+import OPTICSSweep
+from OPTICSSweep import OPTICSCache, sweepOPTICS, entryBytes
+from runOPTICS import runOPTICS
+
+
+
+def samplePoints(seed=0):
+    """ Returns two Gaussian clusters with uniform noise. """
+
+    state = np.random.RandomState(seed)
+
+    return np.r_[state.normal(0, 0.3, (150, 2)), state.normal(3, 0.3, (150, 2)), state.uniform(-2, 5, (50, 2))]
+
+
+
+def test_sweep_matches_separate_runs():
+
+    points = samplePoints()
+    results = sweepOPTICS(points, [1.0, 0.5], [5, 10])
+
+    for entry in results:
+
+        expected = runOPTICS(points, entry['eps'], entry['min_pts'], return_format='columnar')
+
+        assert np.array_equal(entry['result'].ordering, expected.ordering)
+        assert np.allclose(entry['result'].reachability, expected.reachability)
+
+
+
+def test_sweep_does_not_keep_a_global_cache():
+
+    OPTICSSweep.GLOBAL_CACHE = None
+    sweepOPTICS(samplePoints(), [1.0], [5])
+
+    assert OPTICSSweep.GLOBAL_CACHE is None
+
+
+
+def test_global_cache_is_shared():
+
+    OPTICSSweep.GLOBAL_CACHE = None
+    points = samplePoints()
+
+    sweepOPTICS(points, [1.0], [5], cache='global')
+    cache = OPTICSSweep.globalCache()
+    hits = cache.hits
+
+    sweepOPTICS(points, [1.0], [5], cache='global')
+
+    assert cache.hits > hits
+    assert cache.nbytes <= OPTICSSweep.GLOBAL_CACHE_BYTES
+
+    OPTICSSweep.GLOBAL_CACHE = None
+
+
+
+def test_cache_is_bounded_by_bytes():
+
+    cache = OPTICSCache(max_bytes=2500)
+
+    for i in range(5):
+        cache.put(('core', i), np.zeros(100))
+
+    # Every entry has 800 bytes, so only the 3 most recent ones fit
+    assert list(cache.entries) == [('core', 2), ('core', 3), ('core', 4)]
+    assert cache.nbytes == 3*800
+
+    # An entry larger than the limit is still kept alone
+    cache.put(('graph', 0), (np.zeros(500), np.zeros(500)))
+
+    assert list(cache.entries) == [('graph', 0)]
+    assert cache.nbytes == entryBytes(cache.entries[('graph', 0)]) == 8000
+
+    cache.clear()
+    assert (len(cache) == 0) and (cache.nbytes == 0)